@@ -10,12 +10,16 @@ from pydantic import BaseModel, Field
 from app.database import get_db
 from app.models.player import Player
 from app.core.security import get_current_user_id
+from app.core.cache import get_cache
+from app.core.single_flight import get_single_flight
+from app.core.http_pool import get_http_pool
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.services.emotion import EmotionAnalyzer, get_emotion_analyzer
 from app.services.crisis import CrisisDetector, CrisisHandler, get_crisis_detector, get_crisis_handler
 from app.services.ai import LLMRouter, get_llm_router, get_health_checker, get_cost_tracker
+from app.services.llm.semantic_cache import get_semantic_cache
 
 
 router = APIRouter()
@@ -236,6 +240,51 @@ async def get_health_status(
     }
 
 
+@router.get("/llm/pool")
+async def get_pool_stats(
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    获取上游连接池状态
+
+    返回各上游的连接数（在用/空闲）、在途请求数和排队等待时间，用于调整并发上限
+    """
+    _ = await get_player_from_user_id(user_id, db)  # 验证用户身份
+
+    return {
+        "code": 0,
+        "message": "success",
+        "data": get_http_pool().stats()
+    }
+
+
+@router.get("/llm/cache")
+async def get_cache_stats(
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    获取响应缓存状态
+
+    返回缓存后端、容量占用，按 key 前缀的命中 / 未命中 / 淘汰计数，
+    未命中合并（single-flight）的 leader / follower 计数，以及语义缓存（开启时）的命中率
+    """
+    _ = await get_player_from_user_id(user_id, db)  # 验证用户身份
+
+    flights = get_single_flight()
+    semantic = get_semantic_cache()
+    return {
+        "code": 0,
+        "message": "success",
+        "data": {
+            **get_cache().stats(),
+            "single_flight": flights.stats() if flights is not None else None,
+            "semantic": semantic.stats() if semantic is not None else None,
+        }
+    }
+
+
 @router.post("/llm/select")
 async def select_model(
     npc_id: str,
@@ -322,7 +371,7 @@ async def get_daily_report(
     """
     _ = await get_player_from_user_id(user_id, db)  # 验证用户身份
     tracker = get_cost_tracker()
-    report = tracker.get_daily_report()
+    report = await tracker.load_daily_report()
 
     return {
         "code": 0,
@@ -16,6 +16,7 @@ from app.models import Player, NPCAffinity, DialogueSession, DialogueMessage
 from app.schemas import ChatRequest, APIResponse
 from app.core.security import get_current_user_id
 from app.services.llm import get_llm_router
+from app.services.llm.tokenizer import TokenUsage, get_token_estimator
 from app.services.npc import get_npc_manager
 
 # Phase 3A 增强服务
@@ -159,14 +160,26 @@ async def chat(
     # 获取适合该NPC的LLM服务
     llm_service = llm_router.get_service_for_npc(request.npc_id)
 
+    # 用量：调用前按估算预留配额，结束后按上游报告的真实用量结算
+    llm_usage = TokenUsage()
+    reservation_id = enhanced_processor.reserve_usage(
+        dialogue_context,
+        get_token_estimator().count_messages(
+            messages, dialogue_context.enhanced_system_prompt, llm_service.provider
+        ) + 500,
+    )
+
     # 调用LLM生成回复（使用增强的系统提示）
+    llm_ok = False
     try:
         ai_response = await llm_service.chat(
             messages=messages,
             system_prompt=dialogue_context.enhanced_system_prompt,
             temperature=0.8 if not dialogue_context.is_crisis_mode else 0.5,
             max_tokens=500,
+            usage=llm_usage,
         )
+        llm_ok = True
     except Exception as e:
         ai_response = f"抱歉，我现在有点恍惚...能再说一遍吗？（系统提示：{str(e)[:50]}）"
 
@@ -186,10 +199,14 @@ async def chat(
     # 存储对话记忆
     await enhanced_processor.store_conversation_memory(dialogue_context, ai_response)
 
-    # 记录使用量（估算token）
-    input_tokens = len(request.message) * 2 + len(dialogue_context.enhanced_system_prompt)
-    output_tokens = len(ai_response) * 2
-    usage = enhanced_processor.record_usage(dialogue_context, input_tokens, output_tokens)
+    # 记录使用量（上游报告了的按真实值，否则按估算；调用失败只释放预留）
+    if llm_ok:
+        input_tokens, output_tokens = get_token_estimator().reconcile(
+            llm_service.provider, llm_usage, messages, dialogue_context.enhanced_system_prompt, ai_response
+        )
+        enhanced_processor.record_usage(dialogue_context, input_tokens, output_tokens, reservation_id)
+    else:
+        enhanced_processor.release_usage(reservation_id)
 
     # 更新会话统计
     session.message_count += 2
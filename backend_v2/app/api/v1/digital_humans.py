@@ -9,6 +9,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, desc
 from datetime import datetime
 from typing import Optional
+import asyncio
+import os
 import uuid
 import json
 
@@ -28,17 +30,35 @@ from app.core.cache import (
     get_cache,
     llm_cache_key,
     should_skip_cache,
-    fake_stream_from_cache,
+    replay_cached_stream,
+    select_replay_strategy,
+    llm_timing_key,
+    StreamRecorder,
+    encode_timings,
+    decode_timings,
 )
+from app.core.single_flight import Flight, get_single_flight
 from app.core.minor_mode import get_minor_mode_guard
 from app.services.personality_engine import get_personality_engine
 from app.services.llm import get_llm_router
+from app.services.llm.semantic_cache import get_semantic_cache, prompt_fingerprint
+from app.services.llm.streaming import PrefetchedStream
+from app.services.llm.tokenizer import TokenUsage, get_token_estimator
 from app.services.dialogue import get_enhanced_processor
 from app.services.memory import get_memory_retriever
 from app.services.moderation import get_moderator, SAFE_FALLBACK_REPLY
+from app.services.lexicon import get_lexicon_scanner
 
 router = APIRouter()
 
+# 流式对话的投机模式：危机/审核门禁通过后立即发起 LLM 请求，
+# 记忆检索只等待 CHAT_MEMORY_BUDGET_MS，超出预算则不带记忆继续
+SPECULATIVE_CHAT = os.getenv("CHAT_SPECULATIVE_MODE", "true").lower() != "false"
+SPECULATIVE_MEMORY_BUDGET_MS = float(os.getenv("CHAT_MEMORY_BUDGET_MS", "150"))
+
+# 单次回复的输出上限（也是预留配额时的输出估算）
+CHAT_MAX_TOKENS = 500
+
 
 def _dh_context_key(dh_id: int) -> str:
     """将 DigitalHuman ID 映射成 enhanced_processor 所需的 npc_id 形式。
@@ -447,9 +467,12 @@ async def chat_with_dh(
     if not guard.check():
         raise guard.as_http_402()
 
+    # 情感 / 危机 / 审核词一次扫描，审核与预处理共用
+    lexicon_scan = get_lexicon_scanner().scan(body.message)
+
     # === 内容审核：用户输入过滤（P3-2）===
     moderator = get_moderator()
-    mod_input = await moderator.check(body.message, scene="user_input")
+    mod_input = await moderator.check(body.message, scene="user_input", scan=lexicon_scan)
     if mod_input.blocked:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -461,6 +484,9 @@ async def chat_with_dh(
             }
         )
 
+    # 记忆检索只依赖消息文本：通过拒绝类检查后提前启动，与下面的会话/历史 DB 查询重叠
+    processor.prefetch_memories(user_id, npc_key, body.message)
+
     # 获取或创建会话
     session_id = body.session_id or str(uuid.uuid4())
 
@@ -513,6 +539,7 @@ async def chat_with_dh(
         affinity_value=0,
         base_system_prompt=base_prompt,
         history_messages=history_dicts,
+        scan=lexicon_scan,
     )
 
     # 危机处理
@@ -538,6 +565,13 @@ async def chat_with_dh(
     temperature = 0.5 if dialogue_context.is_crisis_mode else 0.8
     system_prompt = dialogue_context.enhanced_system_prompt or base_prompt
 
+    # 用量：调用前按估算预留配额，结束后按上游报告的真实用量结算
+    llm_usage = TokenUsage()
+    reservation_id = processor.reserve_usage(
+        dialogue_context,
+        get_token_estimator().count_messages(messages, system_prompt, llm_service.provider) + CHAT_MAX_TOKENS,
+    )
+
     cache = get_cache()
     skip_reason = should_skip_cache(
         is_crisis=dialogue_context.is_crisis_mode,
@@ -558,25 +592,48 @@ async def chat_with_dh(
         except Exception:
             cached_text = None
 
+    # 语义缓存（可选）：同人设同上下文下，换个说法的相近问题复用已有回复
+    semantic = get_semantic_cache() if not skip_reason else None
+    fingerprint = None
+    if semantic is not None:
+        fingerprint = prompt_fingerprint(
+            model=llm_service.get_model_name(),
+            history=history_dicts,
+            system_prompt=system_prompt,
+            temperature=temperature,
+        )
+        if not cached_text:
+            semantic_hit = await semantic.lookup(fingerprint, body.message)
+            if semantic_hit:
+                cached_text = semantic_hit.response
+
     ai_response = cached_text
     cache_hit = bool(cached_text)
+    llm_ok = False
     if not cache_hit:
-        try:
-            ai_response = await llm_service.chat(
+        def call_llm():
+            return llm_service.chat(
                 messages=messages,
                 system_prompt=system_prompt,
                 temperature=temperature,
-                max_tokens=500,
+                max_tokens=CHAT_MAX_TOKENS,
+                usage=llm_usage,
             )
+
+        # 同一 key 的并发未命中合并为一次上游调用，follower 共享 leader 的结果
+        flights = get_single_flight() if cache_key else None
+        flight_leader = True
+        try:
+            if flights is not None:
+                flight, flight_leader = flights.call(cache_key, call_llm)
+                ai_response = await flight.result()
+            else:
+                ai_response = await call_llm()
+            llm_ok = True
         except Exception:
             ai_response = "抱歉，我现在有点恍惚...能再说一遍吗？"
 
-        # 写入缓存（仅真实调用 + 无 skip 条件）
-        if ai_response and cache_key and not skip_reason:
-            try:
-                await cache.set(cache_key, ai_response)
-            except Exception:
-                pass
+    generated_text = ai_response or ""
 
     # === 内容审核：LLM 输出过滤（P3-2，非流式）===
     mod_output = await moderator.check(ai_response or "", scene="llm_output")
@@ -585,6 +642,16 @@ async def chat_with_dh(
         # 替换为安全兜底文案，不把违规内容写回前端或数据库
         ai_response = mod_output.user_message or SAFE_FALLBACK_REPLY
 
+    # 写入缓存（仅真实调用成功、输出审核通过 + 无 skip 条件；合并的请求只由 leader 写）
+    if not cache_hit and not output_blocked and generated_text and llm_ok \
+            and cache_key and not skip_reason and flight_leader:
+        try:
+            await cache.set(cache_key, generated_text)
+        except Exception:
+            pass
+        if semantic is not None:
+            await semantic.store(fingerprint, body.message, generated_text)
+
     # 保存 AI 回复（含情感标记）
     ai_msg = DHMessage(
         session_id=session_id,
@@ -608,12 +675,14 @@ async def chat_with_dh(
         dh.total_conversations += 1
     dh.last_conversation_at = datetime.utcnow()
 
-    # 记录成本（估算）
-    processor.record_usage(
-        dialogue_context,
-        input_tokens=sum(len(m["content"]) for m in messages) // 3,
-        output_tokens=len(ai_response) // 3,
-    )
+    # 记录成本：上游报告了用量的按真实值，缓存命中 / 合并的请求按估算；调用失败不计费
+    if cache_hit or llm_ok:
+        input_tokens, output_tokens = get_token_estimator().reconcile(
+            llm_service.provider, llm_usage, messages, system_prompt, generated_text
+        )
+        processor.record_usage(dialogue_context, input_tokens, output_tokens, reservation_id)
+    else:
+        processor.release_usage(reservation_id)
 
     await db.commit()
 
@@ -661,6 +730,7 @@ async def chat_stream_with_dh(
       event: start    data: {session_id, dh_id, emotion, crisis_detected, model}
       event: crisis   data: {resources, level}    [仅危机模式]
       event: delta    data: {content}             [多次，每个 chunk 一帧]
+      event: moderation data: {category, replaced, truncated}  [输出命中审核时，流在命中处截断]
       event: done     data: {full_response, emotion, emotion_intensity,
                              crisis_detected, memories_used, model_used}
       event: error    data: {error, reason}       [quota 超限等]
@@ -703,8 +773,18 @@ async def chat_stream_with_dh(
         return StreamingResponse(quota_error_stream(), media_type="text/event-stream")
 
     # === 内容审核：用户输入过滤（P3-2，流式）===
+    # 审核与青少年模式检查（只读查询）互不依赖：并发执行，结果仍按 审核 → 人格 → 时段 → 时长 的顺序判定
+    lexicon_scan = get_lexicon_scanner().scan(body.message)
     moderator = get_moderator()
-    mod_input = await moderator.check(body.message, scene="user_input")
+    minor_guard = get_minor_mode_guard()
+    mod_task = asyncio.ensure_future(moderator.check(body.message, scene="user_input", scan=lexicon_scan))
+    try:
+        personality_check = await minor_guard.check_personality(user_id, dh.personality, db)
+        time_check = await minor_guard.check_time_window(user_id, db)
+        quota_check = await minor_guard.check_daily_quota(user_id, db)
+    finally:
+        mod_input = await mod_task
+
     if mod_input.blocked:
         err_payload = {
             "error": "content_blocked",
@@ -718,8 +798,6 @@ async def chat_stream_with_dh(
         return StreamingResponse(blocked_stream(), media_type="text/event-stream")
 
     # === 青少年模式守卫（GAP-5）===
-    minor_guard = get_minor_mode_guard()
-    personality_check = await minor_guard.check_personality(user_id, dh.personality, db)
     if not personality_check.allowed:
         err_payload = {
             "error": "minor_mode_blocked",
@@ -731,7 +809,6 @@ async def chat_stream_with_dh(
             yield f"event: error\ndata: {json.dumps(err_payload, ensure_ascii=False)}\n\n"
         return StreamingResponse(mm_blocked(), media_type="text/event-stream")
 
-    time_check = await minor_guard.check_time_window(user_id, db)
     if not time_check.allowed:
         err_payload = {
             "error": "minor_mode_blocked",
@@ -743,7 +820,6 @@ async def chat_stream_with_dh(
             yield f"event: error\ndata: {json.dumps(err_payload, ensure_ascii=False)}\n\n"
         return StreamingResponse(tm_blocked(), media_type="text/event-stream")
 
-    quota_check = await minor_guard.check_daily_quota(user_id, db)
     if not quota_check.allowed:
         err_payload = {
             "error": "minor_mode_blocked",
@@ -759,6 +835,9 @@ async def chat_stream_with_dh(
     # 记录使用时长（近似：每次对话 1 分钟）
     await minor_guard.record_usage(user_id, minutes_used=1)
 
+    # 记忆检索只依赖消息文本：通过拒绝类检查后提前启动，与下面的会话/历史 DB 查询重叠
+    processor.prefetch_memories(user_id, npc_key, body.message)
+
     # 获取或创建会话
     session_id = body.session_id or str(uuid.uuid4())
 
@@ -809,12 +888,10 @@ async def chat_stream_with_dh(
         affinity_value=0,
         base_system_prompt=base_prompt,
         history_messages=history_dicts,
+        memory_budget_ms=SPECULATIVE_MEMORY_BUDGET_MS if SPECULATIVE_CHAT else None,
+        scan=lexicon_scan,
     )
 
-    crisis_response = None
-    if dialogue_context.is_crisis_mode:
-        crisis_response = await processor.handle_crisis_if_needed(dialogue_context)
-
     # 回填用户消息情感到 DHMessage
     if dialogue_context.emotion_result:
         user_msg.emotion = dialogue_context.emotion_result.dominant.value
@@ -833,6 +910,13 @@ async def chat_stream_with_dh(
     system_prompt = dialogue_context.enhanced_system_prompt or base_prompt
     temperature = 0.5 if dialogue_context.is_crisis_mode else 0.8
 
+    # 用量：调用前按估算预留配额，流结束后按上游报告的真实用量结算
+    llm_usage = TokenUsage()
+    reservation_id = processor.reserve_usage(
+        dialogue_context,
+        get_token_estimator().count_messages(chat_messages, system_prompt, llm_service.provider) + CHAT_MAX_TOKENS,
+    )
+
     # 响应缓存（P1-4）: 危机模式/高温/过短过长 skip
     cache = get_cache()
     skip_reason = should_skip_cache(
@@ -842,6 +926,9 @@ async def chat_stream_with_dh(
     )
     cache_key = None
     cached_text: Optional[str] = None
+    cached_timings = None
+    # 命中缓存时的回放方式由客户端声明（只渲染最终结果的客户端选 instant）
+    replay_strategy = select_replay_strategy(body.stream_replay)
     if not skip_reason:
         cache_key = llm_cache_key(
             model=llm_service.get_model_name(),
@@ -850,14 +937,100 @@ async def chat_stream_with_dh(
             temperature=temperature,
         )
         try:
-            cached_text = await cache.get(cache_key)
+            if replay_strategy == "recorded":
+                cached_text, raw_timings = await cache.mget([cache_key, llm_timing_key(cache_key)])
+                cached_timings = decode_timings(raw_timings)
+            else:
+                cached_text = await cache.get(cache_key)
         except Exception:
             cached_text = None  # 缓存故障降级为未命中
 
-    # commit 当前用户消息+情感，避免流式过程中事务悬挂
-    await db.commit()
+    # 语义缓存（可选）：同人设同上下文下，换个说法的相近问题复用已有回复
+    semantic = get_semantic_cache() if not skip_reason else None
+    fingerprint = None
+    semantic_hit = None
+    if semantic is not None:
+        fingerprint = prompt_fingerprint(
+            model=llm_service.get_model_name(),
+            history=history_dicts,
+            system_prompt=system_prompt,
+            temperature=temperature,
+        )
+        if not cached_text:
+            semantic_hit = await semantic.lookup(fingerprint, body.message)
+            if semantic_hit:
+                cached_text = semantic_hit.response
+
+    def open_llm_stream():
+        return llm_service.chat_stream(
+            messages=chat_messages,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=CHAT_MAX_TOKENS,
+            usage=llm_usage,
+        )
+
+    # 同一 key 的并发未命中合并（single-flight）：leader 的上游立即在后台开始拉取，
+    # follower 订阅同一份输出，实时收到相同的 delta
+    flight: Optional[Flight] = None
+    flight_leader = True
+    flights = get_single_flight() if cache_key and not cached_text else None
+    if flights is not None:
+        flight, flight_leader = flights.stream(cache_key, open_llm_stream)
+
+    # 投机模式：prompt 已确定且未命中缓存时立即发起 LLM 请求，
+    # 危机处理落库、事务提交、响应头发送都与 LLM 首包等待重叠
+    # （走 single-flight 时上游已在后台拉取，不再需要预取）
+    llm_stream: Optional[PrefetchedStream] = None
+    if SPECULATIVE_CHAT and not cached_text and flight is None:
+        llm_stream = PrefetchedStream(open_llm_stream())
+    if semantic_hit:
+        turn_path = "semantic_cache_hit"
+    elif cached_text:
+        turn_path = "cache_hit"
+    elif not flight_leader:
+        turn_path = "coalesced"
+    else:
+        turn_path = dialogue_context.context_path
+
+    try:
+        crisis_response = None
+        if dialogue_context.is_crisis_mode:
+            crisis_response = await processor.handle_crisis_if_needed(dialogue_context)
+
+        # commit 当前用户消息+情感，避免流式过程中事务悬挂
+        await db.commit()
+    except BaseException:
+        if llm_stream is not None:
+            llm_stream.cancel()
+        if flight is not None:
+            flight.release()
+        processor.release_usage(reservation_id)
+        raise
+
+    # 本请求订阅 single-flight 的输出流（generate 走到订阅前客户端就断开时为 None）
+    flight_stream = None
+    generated_text = ""  # 上游实际输出（审核截断 / 替换前），估算输出用量用
+    llm_failed = False
+    usage_settled = False
+
+    def settle_usage():
+        """结算预留（只执行一次）：上游报告了用量的按真实值，没报告的按已收到的输出估算；
+        调用失败或还没收到任何输出时只释放预留，不计费"""
+        nonlocal usage_settled
+        if usage_settled:
+            return
+        usage_settled = True
+        if llm_failed or not generated_text:
+            processor.release_usage(reservation_id)
+            return
+        input_tokens, output_tokens = get_token_estimator().reconcile(
+            llm_service.provider, llm_usage, chat_messages, system_prompt, generated_text
+        )
+        processor.record_usage(dialogue_context, input_tokens, output_tokens, reservation_id)
 
     async def generate():
+        nonlocal flight_stream, generated_text, llm_failed
         full_response = ""
         cache_hit = bool(cached_text)
 
@@ -872,6 +1045,7 @@ async def chat_stream_with_dh(
             "crisis_level": metadata["crisis"]["level"],
             "model": metadata["model"],
             "cache_hit": cache_hit,
+            "path": turn_path,
         }
         yield f"event: start\ndata: {json.dumps(start_data, ensure_ascii=False)}\n\n"
 
@@ -885,28 +1059,48 @@ async def chat_stream_with_dh(
             yield f"event: crisis\ndata: {json.dumps(crisis_data, ensure_ascii=False)}\n\n"
 
         # delta 帧：缓存命中走 fake-stream，否则真实 LLM 流式
+        # === 内容审核：LLM 输出逐段过审，命中即截断（敏感词本身不会发给前端）===
+        output_guard = moderator.stream(scene="llm_output")
+        truncated = False
+        recorder = None
         try:
             if cache_hit and cached_text:
                 # 从缓存回放（省一次真实 LLM 调用）
-                full_response = cached_text
-                async for chunk in fake_stream_from_cache(cached_text):
-                    yield f"event: delta\ndata: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
+                stream = replay_cached_stream(cached_text, replay_strategy, cached_timings)
+            elif flight is not None:
+                stream = flight_stream = flight.stream()
             else:
-                async for chunk in llm_service.chat_stream(
-                    messages=chat_messages,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    max_tokens=500,
-                ):
-                    full_response += chunk
-                    yield f"event: delta\ndata: {json.dumps({'content': chunk}, ensure_ascii=False)}\n\n"
+                stream = llm_stream or open_llm_stream()
+            if not cache_hit:
+                recorder = StreamRecorder()
+            async for chunk in stream:
+                generated_text += chunk
+                if recorder is not None:
+                    recorder.record(chunk)
+                safe = output_guard.feed(chunk)
+                if safe:
+                    full_response += safe
+                    yield f"event: delta\ndata: {json.dumps({'content': safe}, ensure_ascii=False)}\n\n"
+                if output_guard.blocked:
+                    # 不再消费后续输出，停止上游生成
+                    truncated = True
+                    if isinstance(stream, PrefetchedStream):
+                        stream.cancel()
+                    else:
+                        await stream.aclose()
+                    break
         except Exception:
             fallback = "抱歉，我现在有点恍惚...能再说一遍吗？"
             full_response = fallback
+            llm_failed = True
+            output_guard = moderator.stream(scene="llm_output")  # 固定兜底文案，无需审核
             yield f"event: delta\ndata: {json.dumps({'content': fallback}, ensure_ascii=False)}\n\n"
 
-        # === 内容审核：LLM 输出过滤（流式，在 done 帧前终审）===
-        output_mod = await moderator.check(full_response or "", scene="llm_output")
+        # 放出暂缓的尾部；未启用云审时这里不再重扫全文
+        tail, output_mod = await output_guard.finish()
+        if tail:
+            full_response += tail
+            yield f"event: delta\ndata: {json.dumps({'content': tail}, ensure_ascii=False)}\n\n"
         output_blocked = output_mod.blocked
         persisted_response = full_response
         if output_blocked:
@@ -915,6 +1109,7 @@ async def chat_stream_with_dh(
             mod_payload = json.dumps({
                 "category": output_mod.category.value,
                 "replaced": True,
+                "truncated": truncated,
                 "reason": output_mod.reason,
             }, ensure_ascii=False)
             yield f"event: moderation\ndata: {mod_payload}\n\n"
@@ -926,13 +1121,19 @@ async def chat_stream_with_dh(
             yield f"event: delta\ndata: {delta_payload}\n\n"
             full_response = persisted_response
 
-        # 写入缓存（只在真实生成 + 无 skip + 未被 moderation 替换时写）
-        if (not cache_hit and cache_key and full_response
+        # 写入缓存（只在真实生成成功 + 无 skip + 未被 moderation 替换时写；合并的请求只由 leader 写）
+        if (not cache_hit and not llm_failed and cache_key and full_response and flight_leader
                 and not skip_reason and not output_blocked):
             try:
-                await cache.set(cache_key, full_response)
+                items = {cache_key: full_response}
+                # 原始 chunk 时序（与最终文本逐字对得上时才存），供 recorded 回放
+                if recorder is not None and recorder.total_chars() == len(full_response):
+                    items[llm_timing_key(cache_key)] = encode_timings(recorder.timings)
+                await cache.mset(items)
             except Exception:
                 pass  # 缓存写入失败不影响主链路
+            if semantic is not None:
+                await semantic.store(fingerprint, body.message, full_response)
 
         # done 帧前：保存 AI 消息 + 记忆 + 统计 + 用量
         try:
@@ -956,11 +1157,8 @@ async def chat_stream_with_dh(
 
             await processor.store_conversation_memory(dialogue_context, full_response)
 
-            processor.record_usage(
-                dialogue_context,
-                input_tokens=sum(len(m["content"]) for m in chat_messages) // 3,
-                output_tokens=len(full_response) // 3,
-            )
+            # 流被截断时没有结束事件，按已收到的输出估算
+            settle_usage()
 
             await db.commit()
         except Exception:
@@ -986,6 +1184,7 @@ async def chat_stream_with_dh(
             "memories_used": metadata["memories_used"],
             "top_memory": top_memory,  # V4
             "model_used": metadata["model"],
+            "pipeline": {**metadata["pipeline"], "path": turn_path},
             "generated_metadata": {
                 "generated_by": "MindPal AI",
                 "model": llm_service.get_model_name(),
@@ -997,8 +1196,26 @@ async def chat_stream_with_dh(
         }
         yield f"event: done\ndata: {json.dumps(done_data, ensure_ascii=False)}\n\n"
 
+    async def generate_guarded():
+        # 客户端中途断开时停止已预取的 LLM 请求
+        try:
+            async for frame in generate():
+                yield frame
+        finally:
+            if llm_stream is not None:
+                llm_stream.cancel()
+            # 客户端中途断开（或持久化出错）时 generate 没走到结算：按已生成的部分结算，
+            # 否则预留会占着配额直到过期，已生成的 token 也不计费
+            settle_usage()
+            if flight is not None:
+                if flight_stream is None:
+                    # 还没订阅就断开：交还引用（没有其他参与者时取消上游）
+                    flight.release()
+                else:
+                    await flight_stream.aclose()  # 订阅中断开：立即退订，不等 GC
+
     return StreamingResponse(
-        generate(),
+        generate_guarded(),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
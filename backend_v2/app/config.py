@@ -27,6 +27,8 @@ class Settings(BaseSettings):
 
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 1.0
 
     # Qdrant配置
     QDRANT_HOST: str = "localhost"
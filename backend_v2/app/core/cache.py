@@ -6,8 +6,16 @@ MindPal Backend V2 - Response Cache Layer
 设计原则:
 - 可选增强（fallback safe）: Redis 不可用自动降级到无缓存，不阻塞主链路
 - 双后端: Redis（生产）/ In-Memory（开发、低流量 fallback）
+  In-Memory 用 cache_engine.py 的 W-TinyLFU（或 LRU），按条数 + 字节预算限制，
+  后台任务定期清理过期条目，按 key 前缀统计命中 / 未命中 / 淘汰
+- Redis 前面默认再挂一层进程内近端缓存（NearCache，短 TTL）：热 key 不必每次走网络；
+  可选用 Redis 客户端缓存失效通知（CLIENT TRACKING BCAST）让近端条目在别处改写时立即失效
+- 批量接口 mget / mset（Redis 用 MGET / pipeline），计数器 incr（Redis INCRBY）
 - 智能 skip: 危机模式 / 高温 / 极短/极长文本 不缓存
-- 流式兼容: 缓存命中时把完整响应分段 yield，保持打字机效果
+- 流式兼容: 缓存命中时按客户端选的方式回放（replay_cached_stream）:
+  instant 一帧发完 / adaptive 前几段保持打字机节奏、其余一次发完 /
+  recorded 按原始生成时记录的 chunk 间隔回放（间隔压缩后存在 mp:llmt:<hash>，总时长有上限）
+  缓存回放不花生成成本，没必要像原来那样 4000 字按 20ms/16 字慢放 5 秒、一直占着连接
 
 缓存 key = sha256(model + system_prompt + messages_json + temperature)
 内容 = LLM 返回的完整文本字符串
@@ -16,12 +24,17 @@ TTL = 默认 24 小时，可在 .env 调整
 
 from __future__ import annotations
 
+import array
 import asyncio
+import base64
 import hashlib
 import json
 import os
 import time
-from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+import zlib
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence, Tuple
+
+from app.core.cache_engine import CacheEngine
 
 
 # ==================== 配置 ====================
@@ -37,6 +50,27 @@ NO_CACHE_TEMP_THRESHOLD = 0.9
 MIN_CACHEABLE_CHARS = 10
 MAX_CACHEABLE_CHARS = 4000
 
+# 进程内缓存：条数 / 字节预算 / 淘汰策略（tinylfu | lru）/ 过期清理间隔（秒，0 = 不清理）
+MEMORY_CACHE_MAX_ITEMS = int(os.getenv("CACHE_MEMORY_MAX_ITEMS", "10000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+MEMORY_CACHE_POLICY = os.getenv("CACHE_MEMORY_POLICY", "tinylfu").lower()
+MEMORY_CACHE_SWEEP_SECONDS = float(os.getenv("CACHE_MEMORY_SWEEP_SECONDS", "60"))
+
+# Redis 前的近端缓存：开关 / TTL（秒）/ 容量 / 只缓存这些前缀（逗号分隔，空 = 全部）
+# 失效通知: none（只靠 TTL）| tracking（Redis 6+ CLIENT TRACKING BCAST）
+NEAR_CACHE_ENABLED = os.getenv("CACHE_NEAR_ENABLED", "true").lower() != "false"
+NEAR_CACHE_TTL_SECONDS = float(os.getenv("CACHE_NEAR_TTL_SECONDS", "2"))
+NEAR_CACHE_MAX_ITEMS = int(os.getenv("CACHE_NEAR_MAX_ITEMS", "5000"))
+NEAR_CACHE_MAX_BYTES = int(os.getenv("CACHE_NEAR_MAX_BYTES", str(16 * 1024 * 1024)))
+NEAR_CACHE_PREFIXES = [p.strip() for p in os.getenv("CACHE_NEAR_PREFIXES", "").split(",") if p.strip()]
+NEAR_CACHE_INVALIDATION = os.getenv("CACHE_NEAR_INVALIDATION", "none").lower()
+
+# 缓存命中的流式回放：默认方式 / adaptive 保持节奏的段数 / 回放总时长上限（秒）
+REPLAY_STRATEGIES = ("instant", "adaptive", "recorded")
+REPLAY_STRATEGY = os.getenv("CACHE_REPLAY_STRATEGY", "adaptive").lower()
+REPLAY_PACED_CHUNKS = int(os.getenv("CACHE_REPLAY_PACED_CHUNKS", "8"))
+REPLAY_MAX_SECONDS = float(os.getenv("CACHE_REPLAY_MAX_SECONDS", "2"))
+
 
 # ==================== 后端抽象 ====================
 
@@ -50,9 +84,33 @@ class CacheBackend:
     async def delete(self, key: str) -> None:
         raise NotImplementedError
 
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        """批量读取，结果与 keys 一一对应（默认逐个 get）"""
+        return list(await asyncio.gather(*(self.get(k) for k in keys)))
+
+    async def mset(self, items: Dict[str, str], ttl: int = DEFAULT_TTL_SECONDS) -> None:
+        """批量写入（默认逐个 set）"""
+        await asyncio.gather(*(self.set(k, v, ttl) for k, v in items.items()))
+
+    async def incr(self, key: str, amount: int = 1, ttl: int = DEFAULT_TTL_SECONDS) -> Optional[int]:
+        """计数器加 amount，返回新值；key 不存在时从 0 开始并设置 ttl。
+
+        默认实现是读后写（非原子），后端有原子操作的应覆盖。
+        """
+        current = await self.get(key)
+        value = int(current or 0) + amount
+        await self.set(key, str(value), ttl)
+        return value
+
     async def ping(self) -> bool:
         return True
 
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+    async def aclose(self) -> None:
+        return None
+
 
 class NullCache(CacheBackend):
     """永远不命中的缓存 — 用于 Redis 不可用时的 fallback。"""
@@ -65,45 +123,129 @@ class NullCache(CacheBackend):
     async def delete(self, key: str) -> None:
         return None
 
+    async def incr(self, key: str, amount: int = 1, ttl: int = DEFAULT_TTL_SECONDS) -> Optional[int]:
+        return None
+
     async def ping(self) -> bool:
         return False
 
 
+def key_prefix(key: str) -> str:
+    """统计用的 key 前缀：前两段（mp:llm:<hash> → mp:llm，minor:usage:<uid>:<date> → minor:usage）"""
+    first = key.find(":")
+    if first < 0:
+        return key
+    second = key.find(":", first + 1)
+    return key[:second] if second > 0 else key[:first]
+
+
 class InMemoryCache(CacheBackend):
-    """简单内存缓存 — 单进程、开发用。"""
+    """进程内缓存 — 单节点 / 开发 / Redis 不可用时的 fallback。"""
+
+    def __init__(
+        self,
+        max_items: int = MEMORY_CACHE_MAX_ITEMS,
+        max_bytes: int = MEMORY_CACHE_MAX_BYTES,
+        policy: str = MEMORY_CACHE_POLICY,
+        sweep_interval: float = MEMORY_CACHE_SWEEP_SECONDS,
+    ):
+        self._engine = CacheEngine(max_items, max_bytes, policy, on_remove=self._on_remove)
+        self._sweep_interval = sweep_interval
+        self._sweeper: Optional[asyncio.Task] = None
+        self._prefix_stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, field: str):
+        prefix = key_prefix(key)
+        stats = self._prefix_stats.get(prefix)
+        if stats is None:
+            stats = self._prefix_stats[prefix] = {
+                "hits": 0, "misses": 0, "sets": 0, "evictions": 0, "rejections": 0, "expirations": 0,
+            }
+        stats[field] += 1
+
+    def _on_remove(self, key: str, reason: str):
+        self._count(key, {"evicted": "evictions", "rejected": "rejections", "expired": "expirations"}[reason])
+
+    def _ensure_sweeper(self):
+        """定期清理过期条目（任务挂在当前事件循环上，换了循环就重建）"""
+        if self._sweep_interval <= 0:
+            return
+        if self._sweeper is not None and not self._sweeper.done():
+            if self._sweeper.get_loop() is asyncio.get_running_loop():
+                return
+        self._sweeper = asyncio.ensure_future(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            self.sweep()
 
-    def __init__(self, max_items: int = 1000):
-        self._store: Dict[str, Tuple[str, float]] = {}  # key → (value, expires_at)
-        self._max = max_items
+    def sweep(self) -> int:
+        """清理已过期条目，返回清理数"""
+        return self._engine.sweep(time.monotonic())
 
     async def get(self, key: str) -> Optional[str]:
-        item = self._store.get(key)
-        if not item:
-            return None
-        value, expires = item
-        if time.time() > expires:
-            self._store.pop(key, None)
-            return None
+        self._ensure_sweeper()
+        value = self._engine.get(key, time.monotonic())
+        self._count(key, "hits" if value is not None else "misses")
         return value
 
     async def set(self, key: str, value: str, ttl: int = DEFAULT_TTL_SECONDS) -> None:
-        if len(self._store) >= self._max:
-            # 简单 LRU 替代：随机淘汰一个
-            self._store.pop(next(iter(self._store)), None)
-        self._store[key] = (value, time.time() + ttl)
+        self._ensure_sweeper()
+        self._count(key, "sets")
+        self._engine.set(key, value, time.monotonic() + ttl)
 
     async def delete(self, key: str) -> None:
-        self._store.pop(key, None)
+        self._engine.delete(key)
+
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        return [await self.get(k) for k in keys]
+
+    async def mset(self, items: Dict[str, str], ttl: int = DEFAULT_TTL_SECONDS) -> None:
+        for k, v in items.items():
+            await self.set(k, v, ttl)
+
+    async def incr(self, key: str, amount: int = 1, ttl: int = DEFAULT_TTL_SECONDS) -> Optional[int]:
+        now = time.monotonic()
+        current = self._engine.get(key, now)
+        # 已存在的计数器保持原来的过期时刻
+        expires = self._engine.deadline(key) if current is not None else now + ttl
+        value = int(current or 0) + amount
+        self._count(key, "sets")
+        self._engine.set(key, str(value), expires)
+        return value
 
     async def ping(self) -> bool:
         return True
 
+    def stats(self) -> Dict[str, Any]:
+        prefixes = {}
+        for prefix, counts in sorted(self._prefix_stats.items()):
+            lookups = counts["hits"] + counts["misses"]
+            prefixes[prefix] = {**counts, "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0}
+        return {
+            "backend": "InMemoryCache",
+            "policy": self._engine.policy,
+            "items": len(self._engine),
+            "bytes": self._engine.bytes,
+            "max_items": self._engine.max_items,
+            "max_bytes": self._engine.max_bytes,
+            "prefixes": prefixes,
+        }
+
+    async def aclose(self) -> None:
+        if self._sweeper is not None and not self._sweeper.get_loop().is_closed():
+            self._sweeper.cancel()
+        self._sweeper = None
+
 
 class RedisCache(CacheBackend):
-    """基于 redis.asyncio 的后端。"""
+    """基于 redis.asyncio 的后端（连接池大小 / 超时来自 settings）。"""
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, max_connections: int = 50, socket_timeout: float = 1.0):
         self.url = url
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
         self._client = None
         self._available = True
 
@@ -112,7 +254,13 @@ class RedisCache(CacheBackend):
             try:
                 from redis import asyncio as aioredis  # redis>=4.2
                 self._client = aioredis.from_url(
-                    self.url, encoding="utf-8", decode_responses=True
+                    self.url,
+                    encoding="utf-8",
+                    decode_responses=True,
+                    max_connections=self.max_connections,
+                    socket_timeout=self.socket_timeout,
+                    socket_connect_timeout=self.socket_timeout,
+                    health_check_interval=30,
                 )
             except ImportError:
                 self._available = False
@@ -146,6 +294,44 @@ class RedisCache(CacheBackend):
         except Exception:
             pass
 
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        client = self._get_client()
+        if not client or not keys:
+            return [None] * len(keys)
+        try:
+            return await client.mget(list(keys))
+        except Exception:
+            return [None] * len(keys)
+
+    async def mset(self, items: Dict[str, str], ttl: int = DEFAULT_TTL_SECONDS) -> None:
+        client = self._get_client()
+        if not client or not items:
+            return
+        try:
+            # MSET 不能带过期时间：用非事务 pipeline，一次往返
+            async with client.pipeline(transaction=False) as pipe:
+                for k, v in items.items():
+                    pipe.set(k, v, ex=ttl)
+                await pipe.execute()
+        except Exception:
+            pass
+
+    async def incr(self, key: str, amount: int = 1, ttl: int = DEFAULT_TTL_SECONDS) -> Optional[int]:
+        client = self._get_client()
+        if not client:
+            return None
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.incrby(key, amount)
+                pipe.ttl(key)
+                value, remaining = await pipe.execute()
+            if remaining < 0:
+                # 新建的计数器（或此前没设过期）：补上 TTL
+                await client.expire(key, ttl)
+            return int(value)
+        except Exception:
+            return None
+
     async def ping(self) -> bool:
         client = self._get_client()
         if not client:
@@ -156,6 +342,220 @@ class RedisCache(CacheBackend):
         except Exception:
             return False
 
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"backend": "RedisCache", "max_connections": self.max_connections}
+        pool = getattr(self._client, "connection_pool", None)
+        if pool is not None:
+            stats["in_use"] = len(getattr(pool, "_in_use_connections", ()))
+            stats["idle"] = len(getattr(pool, "_available_connections", ()))
+        return stats
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            try:
+                await self._client.aclose()
+            except Exception:
+                pass
+            self._client = None
+
+
+class NearCache(CacheBackend):
+    """进程内近端缓存 + 远端后端（Redis）
+
+    读：近端命中直接返回，否则读远端并以 ttl（秒级）填入近端。
+    写：写穿远端，同时更新近端。其他进程的写入在近端 TTL 内可能读到旧值；
+    invalidation="tracking" 时订阅 Redis 的失效通知（CLIENT TRACKING BCAST，Redis 6+），
+    别处改写的 key 立即从近端删除，断线期间整个近端清空、自动重连。
+    """
+
+    INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+    def __init__(
+        self,
+        remote: CacheBackend,
+        ttl: float = NEAR_CACHE_TTL_SECONDS,
+        max_items: int = NEAR_CACHE_MAX_ITEMS,
+        max_bytes: int = NEAR_CACHE_MAX_BYTES,
+        prefixes: Sequence[str] = (),
+        invalidation: str = "none",
+    ):
+        self.remote = remote
+        self.ttl = ttl
+        self.prefixes = tuple(prefixes)
+        self.invalidation = invalidation if isinstance(remote, RedisCache) else "none"
+        self._engine = CacheEngine(max_items, max_bytes, "lru")
+        # 每次失效递增；读远端期间若发生过失效，读到的值不填入近端（可能已过时）
+        self._epoch = 0
+        self._listener: Optional[asyncio.Task] = None
+        self._listener_state = "off"
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _cacheable(self, key: str) -> bool:
+        return not self.prefixes or key.startswith(self.prefixes)
+
+    def _fill(self, key: str, value: Optional[str], epoch: int):
+        if value is not None and epoch == self._epoch and self._cacheable(key):
+            self._engine.set(key, value, time.monotonic() + self.ttl)
+
+    def invalidate(self, keys: Optional[Sequence[str]]):
+        """失效通知：keys 为 None 表示远端被清空（FLUSHDB 等）"""
+        self._epoch += 1
+        if keys is None:
+            self._engine.clear()
+            self._stats["invalidations"] += 1
+            return
+        for key in keys:
+            if self._engine.delete(key):
+                self._stats["invalidations"] += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        self._ensure_listener()
+        if self._cacheable(key):
+            value = self._engine.get(key, time.monotonic())
+            if value is not None:
+                self._stats["hits"] += 1
+                return value
+        self._stats["misses"] += 1
+        epoch = self._epoch
+        value = await self.remote.get(key)
+        self._fill(key, value, epoch)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int = DEFAULT_TTL_SECONDS) -> None:
+        self._ensure_listener()
+        epoch = self._epoch
+        await self.remote.set(key, value, ttl)
+        self._engine.delete(key)
+        self._fill(key, value, epoch)
+
+    async def delete(self, key: str) -> None:
+        # 前后各递增一次：删除前已发出、删除期间发出的远端读取都不会把旧值填回近端
+        self._epoch += 1
+        self._engine.delete(key)
+        await self.remote.delete(key)
+        self._epoch += 1
+        self._engine.delete(key)
+
+    async def mget(self, keys: Sequence[str]) -> List[Optional[str]]:
+        self._ensure_listener()
+        now = time.monotonic()
+        values: List[Optional[str]] = [
+            self._engine.get(k, now) if self._cacheable(k) else None for k in keys
+        ]
+        missing = [i for i, v in enumerate(values) if v is None]
+        self._stats["hits"] += len(keys) - len(missing)
+        self._stats["misses"] += len(missing)
+        if missing:
+            epoch = self._epoch
+            fetched = await self.remote.mget([keys[i] for i in missing])
+            for i, value in zip(missing, fetched):
+                values[i] = value
+                self._fill(keys[i], value, epoch)
+        return values
+
+    async def mset(self, items: Dict[str, str], ttl: int = DEFAULT_TTL_SECONDS) -> None:
+        self._ensure_listener()
+        epoch = self._epoch
+        await self.remote.mset(items, ttl)
+        for k, v in items.items():
+            self._engine.delete(k)
+            self._fill(k, v, epoch)
+
+    async def incr(self, key: str, amount: int = 1, ttl: int = DEFAULT_TTL_SECONDS) -> Optional[int]:
+        self._ensure_listener()
+        self._engine.delete(key)
+        epoch = self._epoch
+        value = await self.remote.incr(key, amount, ttl)
+        if value is not None:
+            self._fill(key, str(value), epoch)
+        return value
+
+    async def ping(self) -> bool:
+        return await self.remote.ping()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "backend": "NearCache",
+            "near": {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "items": len(self._engine),
+                "bytes": self._engine.bytes,
+                "ttl_seconds": self.ttl,
+                "invalidation": self.invalidation,
+                "listener": self._listener_state,
+            },
+            "remote": self.remote.stats(),
+        }
+
+    async def aclose(self) -> None:
+        if self._listener is not None and not self._listener.get_loop().is_closed():
+            self._listener.cancel()
+        self._listener = None
+        await self.remote.aclose()
+
+    # ==================== 失效通知 ====================
+
+    def _ensure_listener(self):
+        if self.invalidation != "tracking":
+            return
+        if self._listener is not None and not self._listener.done():
+            if self._listener.get_loop() is asyncio.get_running_loop():
+                return
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        """订阅失效通知；任何异常都清空近端后重连（断线期间的改写收不到通知）"""
+        while True:
+            client = self.remote._get_client()
+            if client is None:
+                self._listener_state = "unavailable"
+                return
+            pool = client.connection_pool
+            subscriber = tracker = None
+            try:
+                subscriber = pool.make_connection()
+                await subscriber.connect()
+                await subscriber.send_command("CLIENT", "ID")
+                subscriber_id = await subscriber.read_response()
+                await subscriber.send_command("SUBSCRIBE", self.INVALIDATE_CHANNEL)
+                await subscriber.read_response()
+
+                # BCAST 模式：任何客户端改写匹配前缀的 key，都通知到 subscriber
+                tracker = pool.make_connection()
+                await tracker.connect()
+                args = ["CLIENT", "TRACKING", "ON", "REDIRECT", subscriber_id, "BCAST"]
+                for prefix in self.prefixes:
+                    args += ["PREFIX", prefix]
+                await tracker.send_command(*args)
+                await tracker.read_response()
+
+                self.invalidate(None)
+                self._listener_state = "active"
+                while True:
+                    message = await subscriber.read_response(timeout=30)
+                    if message is None:
+                        # 空闲：确认 tracker 连接还在（它断了通知就停了）
+                        await tracker.send_command("PING")
+                        await tracker.read_response()
+                        continue
+                    if isinstance(message, list) and len(message) == 3 and message[0] == "message":
+                        self.invalidate(message[2])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._listener_state = "reconnecting"
+                self.invalidate(None)
+            finally:
+                for conn in (subscriber, tracker):
+                    if conn is not None:
+                        try:
+                            await conn.disconnect()
+                        except Exception:
+                            pass
+            await asyncio.sleep(5)
+
 
 # ==================== 工厂 ====================
 
@@ -165,7 +565,7 @@ _cache_instance: Optional[CacheBackend] = None
 def get_cache() -> CacheBackend:
     """获取全局缓存实例（单例）。
 
-    优先级: CACHE_ENABLED=false 禁用 → REDIS_URL 走 Redis → 默认 InMemory
+    优先级: CACHE_ENABLED=false 禁用 → REDIS_URL 走 Redis（默认前挂近端缓存）→ 默认 InMemory
     """
     global _cache_instance
     if _cache_instance is not None:
@@ -174,7 +574,20 @@ def get_cache() -> CacheBackend:
     if not CACHE_ENABLED:
         _cache_instance = NullCache()
     elif REDIS_URL:
-        _cache_instance = RedisCache(REDIS_URL)
+        from app.config import settings
+        redis_cache = RedisCache(
+            REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+        if NEAR_CACHE_ENABLED:
+            _cache_instance = NearCache(
+                redis_cache,
+                prefixes=NEAR_CACHE_PREFIXES,
+                invalidation=NEAR_CACHE_INVALIDATION,
+            )
+        else:
+            _cache_instance = redis_cache
     else:
         _cache_instance = InMemoryCache()
 
@@ -259,16 +672,125 @@ async def fake_stream_from_cache(
             await asyncio.sleep(chunk_delay_ms / 1000.0)
 
 
+# ==================== 回放策略 ====================
+
+def select_replay_strategy(requested: Optional[str] = None) -> str:
+    """客户端声明的回放方式（不认识的忽略），否则用 CACHE_REPLAY_STRATEGY"""
+    for candidate in (requested, REPLAY_STRATEGY):
+        if candidate and candidate.lower() in REPLAY_STRATEGIES:
+            return candidate.lower()
+    return "adaptive"
+
+
+def llm_timing_key(cache_key: str) -> str:
+    """与 LLM 响应缓存 key 对应的 chunk 时序 key（mp:llm:<hash> → mp:llmt:<hash>）"""
+    return "mp:llmt:" + cache_key.rsplit(":", 1)[-1]
+
+
+class StreamRecorder:
+    """记录真实流式输出每个 chunk 的长度和与上一个 chunk 的间隔（毫秒）
+
+    第一个 chunk 的间隔记为 0：首包等待是生成成本，缓存回放不需要重现。
+    """
+
+    def __init__(self):
+        self.timings: List[Tuple[int, int]] = []
+        self._last: Optional[float] = None
+
+    def record(self, chunk: str):
+        now = time.monotonic()
+        gap = 0 if self._last is None else int((now - self._last) * 1000)
+        self._last = now
+        self.timings.append((len(chunk), gap))
+
+    def total_chars(self) -> int:
+        return sum(n for n, _ in self.timings)
+
+
+def encode_timings(timings: Sequence[Tuple[int, int]]) -> str:
+    """[(chunk 字数, 间隔 ms)] → uint16 交错数组 → zlib → base64"""
+    packed = array.array("H")
+    for n, gap in timings:
+        packed.append(min(n, 0xFFFF))
+        packed.append(min(max(gap, 0), 0xFFFF))
+    return base64.b64encode(zlib.compress(packed.tobytes(), 9)).decode("ascii")
+
+
+def decode_timings(raw: Optional[str]) -> Optional[List[Tuple[int, int]]]:
+    if not raw:
+        return None
+    try:
+        packed = array.array("H")
+        packed.frombytes(zlib.decompress(base64.b64decode(raw)))
+    except (ValueError, zlib.error):
+        return None
+    values = packed.tolist()
+    return list(zip(values[0::2], values[1::2]))
+
+
+async def replay_cached_stream(
+    text: str,
+    strategy: str = "adaptive",
+    timings: Optional[Sequence[Tuple[int, int]]] = None,
+    chunk_chars: int = 16,
+    chunk_delay_ms: int = 20,
+    paced_chunks: int = REPLAY_PACED_CHUNKS,
+    max_seconds: float = REPLAY_MAX_SECONDS,
+) -> AsyncGenerator[str, None]:
+    """按策略回放缓存文本
+
+    - instant:  整段一帧
+    - adaptive: 前 paced_chunks 段按 chunk_delay_ms 间隔，其余合成一帧
+    - recorded: 按记录的 chunk 切分和间隔回放，总时长超过 max_seconds 时等比压缩；
+                没有时序或时序与文本对不上（如语义缓存命中）时按 adaptive
+    """
+    if not text:
+        return
+    if strategy == "instant":
+        yield text
+        return
+
+    if strategy == "recorded" and timings and sum(n for n, _ in timings) == len(text):
+        total = sum(gap for _, gap in timings) / 1000.0
+        scale = min(1.0, max_seconds / total) if total > 0 else 0.0
+        pos = 0
+        for n, gap in timings:
+            if gap and scale:
+                await asyncio.sleep(gap * scale / 1000.0)
+            yield text[pos:pos + n]
+            pos += n
+        return
+
+    chunks = chunk_for_stream(text, chunk_chars)
+    paced = chunks[:paced_chunks]
+    for i, chunk in enumerate(paced):
+        if i and chunk_delay_ms > 0:
+            await asyncio.sleep(chunk_delay_ms / 1000.0)
+        yield chunk
+    rest = "".join(chunks[paced_chunks:])
+    if rest:
+        if paced and chunk_delay_ms > 0:
+            await asyncio.sleep(chunk_delay_ms / 1000.0)
+        yield rest
+
+
 __all__ = [
     "CacheBackend",
     "NullCache",
     "InMemoryCache",
     "RedisCache",
+    "NearCache",
     "get_cache",
     "llm_cache_key",
     "should_skip_cache",
     "chunk_for_stream",
     "fake_stream_from_cache",
+    "select_replay_strategy",
+    "llm_timing_key",
+    "StreamRecorder",
+    "encode_timings",
+    "decode_timings",
+    "replay_cached_stream",
     "DEFAULT_TTL_SECONDS",
     "CACHE_ENABLED",
 ]
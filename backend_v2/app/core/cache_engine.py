@@ -0,0 +1,288 @@
+"""
+MindPal Backend V2 - In-Process Cache Engine
+
+InMemoryCache 的存储引擎（同步、单事件循环内使用，不加锁）。
+
+- 容量同时按条数和字节数限制（LLM 回复最长 4000 字，按条数限制会严重低估内存）
+- 淘汰策略:
+  - lru:     一个 OrderedDict，命中 move_to_end，满了淘汰最久未用的，全部 O(1)
+  - tinylfu: W-TinyLFU —— 1% 的 LRU 窗口 + 99% 的分段 LRU 主区（试用区 20% / 保护区 80%），
+             新条目先进窗口；被挤出窗口时和主区的淘汰候选比较访问频率（Count-Min Sketch 估计），
+             频率更高才准入。一次性访问的冷 key 进不了主区，热点不会被扫描流量冲掉
+- 过期条目读到时删除，另由 sweep() 批量清理（InMemoryCache 定期调用）
+- 条目被移除时回调 on_remove(key, reason)，reason ∈ evicted / expired / rejected
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# 每个条目的固定开销估计（dict 槽位 + 条目对象 + 字符串头），计入字节预算
+ENTRY_OVERHEAD = 96
+
+POLICIES = ("lru", "tinylfu")
+
+# 老化时每个 4-bit 计数减半
+_HALVE = bytes(i >> 1 for i in range(256))
+_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+
+def entry_size(key: str, value: str) -> int:
+    return len(key.encode("utf-8")) + len(value.encode("utf-8")) + ENTRY_OVERHEAD
+
+
+class CountMinSketch:
+    """4 行 Count-Min Sketch，计数上限 15；递增 10×width 次后全表减半（频率随时间衰减）"""
+
+    __slots__ = ("_rows", "_mask", "_sample_size", "_additions")
+
+    def __init__(self, expected_items: int):
+        width = 1 << max(10, (max(1, expected_items) - 1).bit_length())
+        self._rows = [bytearray(width) for _ in _SEEDS]
+        self._mask = width - 1
+        self._sample_size = 10 * width
+        self._additions = 0
+
+    def _indexes(self, key: str):
+        h = hash(key)
+        mask = self._mask
+        return [((h ^ seed) * 0x2545F491 >> 17) & mask for seed in _SEEDS]
+
+    def frequency(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def increment(self, key: str):
+        added = False
+        for row, i in zip(self._rows, self._indexes(key)):
+            if row[i] < 15:
+                row[i] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self._sample_size:
+                for row in self._rows:
+                    row[:] = row.translate(_HALVE)
+                self._additions //= 2
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "size", "segment")
+
+    def __init__(self, value: str, expires: float, size: int, segment: str):
+        self.value = value
+        self.expires = expires
+        self.size = size
+        self.segment = segment
+
+
+class _Segment:
+    """一段 LRU（头部最久未用）"""
+
+    __slots__ = ("entries", "bytes", "max_bytes", "max_items")
+
+    def __init__(self, max_bytes: int, max_items: int):
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.bytes = 0
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+
+    def over(self) -> bool:
+        return self.bytes > self.max_bytes or len(self.entries) > self.max_items
+
+
+class CacheEngine:
+    """按条数 + 字节预算限制的 LRU / W-TinyLFU 存储"""
+
+    def __init__(
+        self,
+        max_items: int,
+        max_bytes: int,
+        policy: str = "tinylfu",
+        on_remove: Optional[Callable[[str, str], None]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown cache policy: {policy}")
+        self.policy = policy
+        self.max_items = max(1, max_items)
+        self.max_bytes = max(1, max_bytes)
+        self._on_remove = on_remove
+        self._index: Dict[str, _Entry] = {}
+        self._bytes = 0
+
+        if policy == "lru":
+            self._segments = {"main": _Segment(self.max_bytes, self.max_items)}
+            self._sketch = None
+            self._entry_segment = "main"
+        else:
+            window_bytes = max(1, self.max_bytes // 100)
+            window_items = max(1, self.max_items // 100)
+            main_bytes = self.max_bytes - window_bytes
+            main_items = max(1, self.max_items - window_items)
+            self._segments = {
+                "window": _Segment(window_bytes, window_items),
+                "probation": _Segment(main_bytes, main_items),
+                "protected": _Segment(main_bytes * 4 // 5, main_items * 4 // 5),
+            }
+            # 主区整体的上限（试用区 + 保护区）
+            self._main_bytes = main_bytes
+            self._main_items = main_items
+            self._sketch = CountMinSketch(self.max_items)
+            self._entry_segment = "window"
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    # ==================== 读写 ====================
+
+    def get(self, key: str, now: float) -> Optional[str]:
+        if self._sketch is not None:
+            self._sketch.increment(key)
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= now:
+            self._remove(key, "expired")
+            return None
+        self._touch(key, entry)
+        return entry.value
+
+    def set(self, key: str, value: str, expires: float) -> bool:
+        """写入；条目比整个预算还大时不存（返回 False）"""
+        size = entry_size(key, value)
+        if size > self.max_bytes or (self.policy == "tinylfu" and size > self._main_bytes):
+            if key in self._index:
+                self._remove(key, "rejected")
+            return False
+        if self._sketch is not None:
+            self._sketch.increment(key)
+
+        entry = self._index.get(key)
+        if entry is not None:
+            segment = self._segments[entry.segment]
+            segment.bytes += size - entry.size
+            self._bytes += size - entry.size
+            entry.value, entry.expires, entry.size = value, expires, size
+            self._touch(key, entry)
+        else:
+            entry = _Entry(value, expires, size, self._entry_segment)
+            segment = self._segments[self._entry_segment]
+            segment.entries[key] = entry
+            segment.bytes += size
+            self._index[key] = entry
+            self._bytes += size
+        self._enforce()
+        return key in self._index
+
+    def deadline(self, key: str) -> Optional[float]:
+        """条目的过期时刻（不存在返回 None，不算一次访问）"""
+        entry = self._index.get(key)
+        return entry.expires if entry is not None else None
+
+    def delete(self, key: str) -> bool:
+        if key not in self._index:
+            return False
+        self._remove(key, None)
+        return True
+
+    def sweep(self, now: float) -> int:
+        """清理所有已过期条目，返回清理数"""
+        expired: List[str] = [k for k, e in self._index.items() if e.expires <= now]
+        for key in expired:
+            self._remove(key, "expired")
+        return len(expired)
+
+    def clear(self):
+        for segment in self._segments.values():
+            segment.entries.clear()
+            segment.bytes = 0
+        self._index.clear()
+        self._bytes = 0
+
+    # ==================== 内部 ====================
+
+    def _move(self, key: str, entry: _Entry, target: str):
+        """把条目移到 target 段的尾部（最近使用）"""
+        source = self._segments[entry.segment]
+        del source.entries[key]
+        source.bytes -= entry.size
+        dest = self._segments[target]
+        dest.entries[key] = entry
+        dest.bytes += entry.size
+        entry.segment = target
+
+    def _touch(self, key: str, entry: _Entry):
+        if entry.segment == "probation":
+            # 试用区再次命中 → 升入保护区；保护区溢出的降回试用区
+            self._move(key, entry, "protected")
+            protected = self._segments["protected"]
+            while protected.over() and len(protected.entries) > 1:
+                demoted_key, demoted = next(iter(protected.entries.items()))
+                self._move(demoted_key, demoted, "probation")
+        else:
+            self._segments[entry.segment].entries.move_to_end(key)
+
+    def _remove(self, key: str, reason: Optional[str]):
+        entry = self._index.pop(key)
+        segment = self._segments[entry.segment]
+        del segment.entries[key]
+        segment.bytes -= entry.size
+        self._bytes -= entry.size
+        if reason and self._on_remove is not None:
+            self._on_remove(key, reason)
+
+    def _main_over(self) -> bool:
+        probation, protected = self._segments["probation"], self._segments["protected"]
+        return (
+            probation.bytes + protected.bytes > self._main_bytes
+            or len(probation.entries) + len(protected.entries) > self._main_items
+        )
+
+    def _enforce(self):
+        if self.policy == "lru":
+            main = self._segments["main"]
+            while main.over():
+                self._remove(next(iter(main.entries)), "evicted")
+            return
+
+        window = self._segments["window"]
+        while window.over():
+            candidate_key, candidate = next(iter(window.entries.items()))
+            self._move(candidate_key, candidate, "probation")
+            self._admit(candidate_key)
+
+        # 试用区 / 保护区里的条目被改写变大时窗口不会溢出，主区要自己收缩
+        protected = self._segments["protected"]
+        while protected.over() and len(protected.entries) > 1:
+            demoted_key, demoted = next(iter(protected.entries.items()))
+            self._move(demoted_key, demoted, "probation")
+        probation = self._segments["probation"]
+        while self._main_over():
+            victim = probation if probation.entries else protected
+            self._remove(next(iter(victim.entries)), "evicted")
+
+    def _admit(self, candidate_key: str):
+        """窗口挤出的候选进入试用区尾部；主区超限时与淘汰候选比频率，输的一方出局"""
+        probation, protected = self._segments["probation"], self._segments["protected"]
+        candidate_freq = None
+        while self._main_over():
+            victim_key = next(iter(probation.entries))
+            if victim_key == candidate_key:
+                if not protected.entries:
+                    self._remove(candidate_key, "rejected")
+                    return
+                victim_key = next(iter(protected.entries))
+            if candidate_freq is None:
+                candidate_freq = self._sketch.frequency(candidate_key)
+            if candidate_freq > self._sketch.frequency(victim_key):
+                self._remove(victim_key, "evicted")
+            else:
+                self._remove(candidate_key, "rejected")
+                return
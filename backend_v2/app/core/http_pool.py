@@ -0,0 +1,328 @@
+"""
+MindPal Backend V2 - Shared HTTP Connection Pool
+
+进程级 HTTP 连接池 - LLM / Embedding / TTS / ASR / 内容安全共用
+
+- 每个上游 origin（scheme + host + port）一个 httpx.AsyncClient，连接上限按 host 配置，
+  同一上游的所有服务共享 keep-alive 连接（千问对话与千问 Embedding 同一个 host）
+- 安装了 h2 时开启 HTTP/2，通过 TLS ALPN 协商，上游不支持时自动回退 HTTP/1.1
+- 超时由调用方按请求传入（client.post(..., timeout=...)），连接池只给默认值
+- FastAPI lifespan 启动时 warm_up() 预先建立 TCP + TLS，首个用户请求不再付握手成本
+- stats() 给出每个上游的连接数（在用/空闲）、在途/排队请求数和排队等待时间，用于调并发上限
+
+等待时间 = 请求进入连接池到拿到连接（新建连接的 connect 开始，或复用连接的发送请求头开始），
+通过 httpcore 的 trace 扩展测得，不包含上游的处理耗时。
+
+配置（环境变量）:
+    HTTP_POOL_MAX_CONNECTIONS   每个上游的最大连接数，默认 64
+    HTTP_POOL_MAX_KEEPALIVE     每个上游保留的空闲连接数，默认 16
+    HTTP_POOL_KEEPALIVE_EXPIRY  空闲连接保留秒数，默认 30
+    HTTP_POOL_HOST_LIMITS       按 host 覆盖，如 "dashscope.aliyuncs.com=128:32,api.anthropic.com=32"
+    HTTP_POOL_HTTP2             是否尝试 HTTP/2，默认 true
+    HTTP_POOL_TIMEOUT           默认超时秒数，默认 30
+    HTTP_POOL_WARMUP_TIMEOUT    预热单个上游的超时秒数，默认 3
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+
+# ==================== 配置 ====================
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "64"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "16"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP_POOL_HTTP2", "true").lower() != "false"
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))
+WARMUP_TIMEOUT = float(os.getenv("HTTP_POOL_WARMUP_TIMEOUT", "3"))
+
+# 等待时间统计窗口（最近 N 个请求）
+WAIT_SAMPLES = 1024
+
+Origin = Tuple[str, str, int]
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def parse_host_limits(value: str) -> Dict[str, httpx.Limits]:
+    """解析 HTTP_POOL_HOST_LIMITS："host=max[:keepalive],..." """
+    limits: Dict[str, httpx.Limits] = {}
+    for item in value.split(","):
+        host, sep, spec = item.strip().partition("=")
+        if not sep or not host:
+            continue
+        max_conn, _, keepalive = spec.partition(":")
+        try:
+            max_connections = int(max_conn)
+            max_keepalive = int(keepalive) if keepalive else min(MAX_KEEPALIVE, max_connections)
+        except ValueError:
+            continue
+        limits[host.strip().lower()] = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+    return limits
+
+
+def _origin(url: str) -> Origin:
+    parsed = httpx.URL(url)
+    return (parsed.scheme, parsed.host, parsed.port or (443 if parsed.scheme == "https" else 80))
+
+
+def _origin_label(origin: Origin) -> str:
+    scheme, host, port = origin
+    default = 443 if scheme == "https" else 80
+    return f"{scheme}://{host}" if port == default else f"{scheme}://{host}:{port}"
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+# ==================== 带统计的 transport ====================
+
+class _CountedStream(httpx.AsyncByteStream):
+    """响应体读完/关闭时回调一次（流式响应在此之前一直占用连接）"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """包一层 AsyncHTTPTransport，统计在途请求、排队等待时间和协议版本"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self._in_flight = 0
+        self._waiting = 0
+        self._wait_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._counters: Dict[str, int] = {"requests": 0, "new_connections": 0, "errors": 0}
+        self._versions: Dict[str, int] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+        outer_trace = request.extensions.get("trace")
+
+        def mark_acquired():
+            nonlocal acquired
+            if not acquired:
+                acquired = True
+                self._waiting -= 1
+                self._wait_ms.append((time.perf_counter() - started) * 1000)
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            # 连接池分配到连接后的第一个事件：新建连接的 connect_tcp，或复用连接的发送请求
+            if not acquired:
+                mark_acquired()
+                if event_name == "connection.connect_tcp.started":
+                    self._counters["new_connections"] += 1
+            if outer_trace is not None:
+                await outer_trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self._counters["requests"] += 1
+        self._in_flight += 1
+        self._waiting += 1
+
+        closed = False
+
+        def release():
+            nonlocal closed
+            if not closed:
+                closed = True
+                self._in_flight -= 1
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._counters["errors"] += 1
+            release()
+            raise
+        finally:
+            # 非 httpcore 的 transport 没有 trace 事件，按拿到响应计
+            mark_acquired()
+
+        version = response.extensions.get("http_version", b"HTTP/1.1")
+        version = version.decode("ascii", "replace") if isinstance(version, bytes) else str(version)
+        self._versions[version] = self._versions.get(version, 0) + 1
+        response.stream = _CountedStream(response.stream, release)
+        return response
+
+    def connection_stats(self) -> Dict[str, int]:
+        """底层 httpcore 连接池的连接状态"""
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"connections": len(connections), "in_use": len(connections) - idle, "idle": idle}
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_ms)
+        return {
+            **self.connection_stats(),
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            **self._counters,
+            "http_versions": dict(self._versions),
+            "wait_ms": {
+                "p50": round(_percentile(waits, 0.50), 3),
+                "p99": round(_percentile(waits, 0.99), 3),
+                "max": round(waits[-1], 3) if waits else 0.0,
+                "samples": len(waits),
+            },
+        }
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+# ==================== 连接池管理 ====================
+
+class HTTPPool:
+    """按上游 origin 管理共享的 httpx.AsyncClient"""
+
+    def __init__(
+        self,
+        limits: Optional[httpx.Limits] = None,
+        host_limits: Optional[Dict[str, httpx.Limits]] = None,
+        http2: Optional[bool] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        """
+        Args:
+            limits: 每个上游的默认连接上限
+            host_limits: 按 host 覆盖的连接上限
+            http2: 是否尝试 HTTP/2（None 表示按 HTTP_POOL_HTTP2 且 h2 已安装）
+            timeout: 默认超时（秒），调用方可按请求覆盖
+        """
+        self._limits = limits or httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self._host_limits = host_limits if host_limits is not None else parse_host_limits(
+            os.getenv("HTTP_POOL_HOST_LIMITS", "")
+        )
+        self._http2 = (HTTP2_ENABLED if http2 is None else http2) and _h2_available()
+        self._timeout = timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[Origin, httpx.AsyncClient] = {}
+        self._transports: Dict[Origin, PooledTransport] = {}
+
+    @property
+    def http2(self) -> bool:
+        return self._http2
+
+    def _bind(self):
+        """连接绑定在事件循环上；换了循环（测试里每次 asyncio.run）就丢弃旧连接池"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._loop is not loop:
+            self._loop = loop
+            self._clients = {}
+            self._transports = {}
+
+    def limits_for(self, host: str) -> httpx.Limits:
+        return self._host_limits.get(host.lower(), self._limits)
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """取 url 所在上游的共享 client（不要 aclose 它，也不要用 async with）"""
+        self._bind()
+        origin = _origin(url)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            transport = PooledTransport(httpx.AsyncHTTPTransport(
+                http2=self._http2,
+                limits=self.limits_for(origin[1]),
+            ))
+            client = httpx.AsyncClient(transport=transport, timeout=self._timeout)
+            self._clients[origin] = client
+            self._transports[origin] = transport
+        return client
+
+    async def warm_up(self, urls: Iterable[str], timeout: float = WARMUP_TIMEOUT) -> Dict[str, bool]:
+        """预先和上游建立连接（HEAD 请求，状态码不重要），失败不影响启动"""
+        origins: Dict[Origin, str] = {}
+        for url in urls:
+            if url:
+                origins.setdefault(_origin(url), url)
+
+        async def touch(origin: Origin) -> bool:
+            try:
+                await self.client(origins[origin]).head(_origin_label(origin) + "/", timeout=timeout)
+                return True
+            except httpx.HTTPError:
+                return False
+
+        results = await asyncio.gather(*(touch(origin) for origin in origins))
+        return {_origin_label(origin): ok for origin, ok in zip(origins, results)}
+
+    def stats(self) -> Dict[str, Any]:
+        """各上游的连接池状态"""
+        return {
+            "http2": self._http2,
+            "upstreams": {
+                _origin_label(origin): {
+                    **transport.stats(),
+                    "max_connections": self.limits_for(origin[1]).max_connections,
+                }
+                for origin, transport in self._transports.items()
+            },
+        }
+
+    async def aclose(self):
+        """关闭所有连接（lifespan 关闭时调用）"""
+        clients, self._clients, self._transports = self._clients, {}, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()), return_exceptions=True)
+
+
+_http_pool: Optional[HTTPPool] = None
+
+
+def get_http_pool() -> HTTPPool:
+    """获取全局连接池"""
+    global _http_pool
+    if _http_pool is None:
+        _http_pool = HTTPPool()
+    return _http_pool
+
+
+__all__ = [
+    "HTTPPool",
+    "PooledTransport",
+    "get_http_pool",
+    "parse_host_limits",
+]
@@ -150,10 +150,8 @@ class MinorModeGuard:
         cache = get_cache()
         key = self._today_key(user_id)
         try:
-            used_str = await cache.get(key)
-            used = int(used_str) if used_str else 0
-            # 24 小时过期（T+1 自然重置）
-            await cache.set(key, str(used + minutes_used), ttl=86400)
+            # 原子自增（Redis INCRBY，一次往返）；24 小时过期（T+1 自然重置）
+            await cache.incr(key, minutes_used, ttl=86400)
         except Exception:
             pass  # 计数故障不阻塞主流程
 
@@ -6,7 +6,8 @@ MindPal Backend V2 - Quota Middleware / Dependency
   2. QuotaGuard.check(): 适用于 SSE / WebSocket 流式端点（在流已开启后
      需要手动发送 error 事件，不能靠异常返回 402）
 
-配额底层由 ai/cost.py 的 CostTracker 管理，内存态 + 每日重置 + 会员等级。
+配额底层由 ai/cost.py 的 CostTracker 管理，每日重置 + 会员等级；检查只读本地影子，
+多 worker 的用量经 ai/usage_store.py 的共享计数器每个 flush 周期汇总回来。
 """
 
 from __future__ import annotations
@@ -0,0 +1,194 @@
+"""
+MindPal Backend V2 - LLM Single-Flight
+
+同一时刻多人发来同一条可缓存的 prompt 时（llm_cache_key 相同），原来每个请求都各自
+未命中缓存、各自调一次 LLM、各自写一次缓存。这里对未命中做合并（single-flight）：
+
+- 某个 key 的第一个未命中请求成为 leader，立即在后台任务里拉取上游流（chat_stream / chat）
+- 同一 key 的并发请求成为 follower，订阅 leader 的输出：
+  流式的从第一个 chunk 开始回放已收到的部分，之后实时跟随；非流式的等最终全文
+- leader 自己也是订阅者之一（上游由后台任务驱动，不依赖任何一个请求的生命周期）
+- 上游异常会原样抛给所有订阅者（各自走原来的兜底文案）
+- 所有参与者都放弃了（客户端断开 / 输出审核截断）时取消上游，不再白白生成
+- 结束（成功 / 失败 / 取消）即从登记表移除；之后的请求走缓存或成为新的 leader
+
+每个参与者拿到的是上游原始输出，输出审核、写缓存、落库仍由各自的请求负责
+（写缓存只由 leader 做）。
+
+## 配置
+
+    LLM_SINGLE_FLIGHT_ENABLED=true
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.cache import chunk_for_stream
+
+
+SINGLE_FLIGHT_ENABLED = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() != "false"
+
+
+class FlightAbandoned(Exception):
+    """所有参与者都已离开，上游被取消"""
+
+
+class Flight:
+    """一次进行中的上游调用，输出按 chunk 缓冲，供任意多个订阅者从头读取"""
+
+    def __init__(self, key: str, registry: "SingleFlight"):
+        self.key = key
+        self.chunks: List[str] = []
+        self.text: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.followers = 0
+        self._registry = registry
+        self._refs = 1  # leader
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # ==================== 上游（leader 的后台任务）====================
+
+    def start_stream(self, source: AsyncIterator[str]):
+        self._task = asyncio.ensure_future(self._pump_stream(source))
+
+    def start_call(self, call: Callable[[], Awaitable[str]]):
+        self._task = asyncio.ensure_future(self._pump_call(call))
+
+    async def _pump_stream(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+            self._finish("".join(self.chunks), None)
+        except asyncio.CancelledError:
+            self._finish(None, FlightAbandoned(self.key))
+            raise
+        except Exception as e:
+            self._finish(None, e)
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def _pump_call(self, call: Callable[[], Awaitable[str]]):
+        try:
+            text = await call()
+        except asyncio.CancelledError:
+            self._finish(None, FlightAbandoned(self.key))
+            raise
+        except Exception as e:
+            self._finish(None, e)
+        else:
+            # 非流式上游没有增量，流式 follower 按回放粒度切片
+            self.chunks.extend(chunk_for_stream(text or ""))
+            self._finish(text or "", None)
+
+    def _finish(self, text: Optional[str], error: Optional[BaseException]):
+        if self.done:
+            return
+        self.text, self.error, self.done = text, error, True
+        self._registry._drop(self)
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    # ==================== 订阅者 ====================
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        """从第一个 chunk 开始回放，之后实时跟随；结束（含提前 aclose）时释放引用"""
+        i = 0
+        try:
+            while True:
+                while i < len(self.chunks):
+                    yield self.chunks[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.release()
+
+    async def result(self) -> str:
+        """等待最终全文"""
+        try:
+            while not self.done:
+                await self._changed.wait()
+            if self.error is not None:
+                raise self.error
+            return self.text or ""
+        finally:
+            self.release()
+
+    def release(self):
+        """参与者离开；最后一个离开且上游未结束时取消上游"""
+        self._refs -= 1
+        if self._refs <= 0 and not self.done:
+            self._finish(None, FlightAbandoned(self.key))
+            if self._task is not None:
+                self._task.cancel()
+
+
+class SingleFlight:
+    """按 key 登记进行中的上游调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._stats = {"leaders": 0, "followers": 0, "abandoned": 0}
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """加入 key 的 flight，返回 (flight, 是否 leader)；leader 须随即 start_stream / start_call"""
+        flight = self._flights.get(key)
+        if flight is not None and not flight.done:
+            flight._refs += 1
+            flight.followers += 1
+            self._stats["followers"] += 1
+            return flight, False
+        flight = Flight(key, self)
+        self._flights[key] = flight
+        self._stats["leaders"] += 1
+        return flight, True
+
+    def stream(self, key: str, source: Callable[[], AsyncIterator[str]]) -> Tuple[Flight, bool]:
+        """流式：leader 用 source() 启动上游"""
+        flight, leader = self.join(key)
+        if leader:
+            flight.start_stream(source())
+        return flight, leader
+
+    def call(self, key: str, call: Callable[[], Awaitable[str]]) -> Tuple[Flight, bool]:
+        """非流式：leader 用 call() 启动上游"""
+        flight, leader = self.join(key)
+        if leader:
+            flight.start_call(call)
+        return flight, leader
+
+    def _drop(self, flight: Flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if isinstance(flight.error, FlightAbandoned):
+            self._stats["abandoned"] += 1
+
+    def stats(self):
+        return {**self._stats, "in_flight": len(self._flights)}
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """全局实例；LLM_SINGLE_FLIGHT_ENABLED=false 时返回 None"""
+    global _single_flight
+    if not SINGLE_FLIGHT_ENABLED:
+        return None
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
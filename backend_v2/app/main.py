@@ -2,7 +2,10 @@
 MindPal Backend V2 - FastAPI Main Entry
 """
 
+import os
 from contextlib import asynccontextmanager
+from typing import List
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -11,6 +14,27 @@ from datetime import datetime
 from app.config import settings
 from app.database import engine, Base
 from app.api.v1 import api_router
+from app.core.cache import get_cache
+from app.core.http_pool import get_http_pool
+from app.services.ai import get_llm_router
+from app.services.ai.cluster_health import SHARED_HEALTH_ENABLED
+from app.services.ai.cost import get_cost_tracker
+from app.services.ai.usage_store import COST_STORE_ENABLED, create_usage_store
+from app.services.llm import ClaudeService, QwenService
+from app.services.voice.token_manager import AliyunTokenManager
+from app.services.voice.tts import TTSService
+
+
+def _warmup_urls() -> List[str]:
+    """启动时预热连接的上游：只预热已配置凭证的服务，外加 HTTP_POOL_WARMUP_URLS"""
+    urls = [url.strip() for url in os.getenv("HTTP_POOL_WARMUP_URLS", "").split(",") if url.strip()]
+    if settings.DASHSCOPE_API_KEY:
+        urls.append(QwenService.API_URL)  # 千问对话与千问 Embedding 同一 host
+    if settings.ANTHROPIC_API_KEY:
+        urls.append(ClaudeService.API_URL)
+    if settings.ALIYUN_ACCESS_KEY_ID and settings.ALIYUN_ACCESS_KEY_SECRET:
+        urls.extend([AliyunTokenManager.TOKEN_URL, TTSService.API_URL])  # ASR 与 TTS 同一网关
+    return urls
 
 
 @asynccontextmanager
@@ -19,9 +43,29 @@ async def lifespan(app: FastAPI):
     # 启动时: 创建数据库表
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    # 启动时: 预热上游 HTTP 连接（失败不影响启动）
+    if os.getenv("HTTP_POOL_WARMUP", "true").lower() != "false":
+        warmed = await get_http_pool().warm_up(_warmup_urls())
+        if warmed:
+            print(f"[{datetime.now()}] HTTP pool warm-up: {warmed}")
+    # 启动时: 接入集群共享的 LLM 熔断状态（多 worker 部署）
+    if SHARED_HEALTH_ENABLED:
+        get_llm_router().start_shared_health()
+    # 启动时: 用量写入共享配额计数器与 usage_daily 表
+    if COST_STORE_ENABLED:
+        store = create_usage_store()
+        get_cost_tracker().attach_store(store)
+        store.start()
     print(f"[{datetime.now()}] MindPal Backend V2 started")
     yield
     # 关闭时: 清理资源
+    if SHARED_HEALTH_ENABLED:
+        await get_llm_router().stop_shared_health()
+    store = get_cost_tracker().store
+    if store is not None:
+        await store.stop()  # 最后一次 flush
+    await get_http_pool().aclose()
+    await get_cache().aclose()
     await engine.dispose()
     print(f"[{datetime.now()}] MindPal Backend V2 stopped")
 
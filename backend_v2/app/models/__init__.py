@@ -14,6 +14,7 @@ from app.models.digital_human import DigitalHuman, DHConversation, DHMessage
 from app.models.proactive import ProactiveMessage
 from app.models.cp import CpInvitation, CpBond
 from app.models.report import UserReport, ReportCategory, ReportStatus, ReportTargetType
+from app.models.usage import UsageDaily
 
 __all__ = [
     "Base",
@@ -49,4 +50,5 @@ __all__ = [
     "ReportCategory",
     "ReportStatus",
     "ReportTargetType",
+    "UsageDaily",
 ]
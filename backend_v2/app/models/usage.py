@@ -0,0 +1,33 @@
+"""
+MindPal Backend V2 - Daily Usage Model
+
+按日、按 AI 服务汇总的用量（CostTracker 的写后缓冲每隔几秒批量累加进来）。
+一行 = 某天某个服务的累计 token / 成本 / 请求数，多个 worker 用 UPDATE ... SET x = x + :delta 并发累加。
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import BigInteger, Date, DateTime, Float, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class UsageDaily(Base):
+    """每日用量汇总表"""
+    __tablename__ = "usage_daily"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    date: Mapped[date] = mapped_column(Date, index=True)
+    service: Mapped[str] = mapped_column(String(64))
+
+    input_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    output_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    cost: Mapped[float] = mapped_column(Float, default=0.0)      # 元
+    requests: Mapped[int] = mapped_column(Integer, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("date", "service", name="uq_usage_daily_date_service"),
+    )
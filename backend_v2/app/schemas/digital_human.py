@@ -97,6 +97,10 @@ class DHChatRequest(BaseModel):
     dh_id: int = Field(..., description="数字人ID")
     message: str = Field(..., min_length=1, max_length=2000, description="用户消息")
     session_id: Optional[str] = Field(default=None, description="会话ID，可选")
+    stream_replay: Optional[str] = Field(
+        default=None,
+        description="流式接口命中缓存时的回放方式: instant | adaptive | recorded，缺省用服务端配置",
+    )
 
     class Config:
         json_schema_extra = {
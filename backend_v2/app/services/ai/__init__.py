@@ -6,12 +6,16 @@ MindPal Backend V2 - AI Services
 from app.services.ai.router import LLMRouter, get_llm_router
 from app.services.ai.health import LLMHealthChecker, ServiceHealth, get_health_checker
 from app.services.ai.cost import CostTracker, get_cost_tracker
+from app.services.ai.limiter import AdmissionController, AdmissionPriority, admission_priority
 
 __all__ = [
     "LLMRouter",
     "LLMHealthChecker",
     "ServiceHealth",
     "CostTracker",
+    "AdmissionController",
+    "AdmissionPriority",
+    "admission_priority",
     "get_llm_router",
     "get_health_checker",
     "get_cost_tracker",
@@ -0,0 +1,282 @@
+"""
+MindPal Backend V2 - Cluster-Shared LLM Health
+多 worker 共享的熔断状态
+
+LLMHealthChecker 的 ServiceHealth 是进程内的：起多个 uvicorn worker 时，上游挂了每个 worker
+都要各自用真实用户请求失败 failure_threshold 次才熔断，恢复期的半开探测也是拿真实请求去试。
+这里把成功 / 失败计数发布到共享后端（core/cache 的 CacheBackend，生产即 Redis），
+所有 worker 按聚合后的错误率做熔断决策：
+
+- 滑动窗口计数：每 BUCKET_SECONDS 一个桶（mp:llmh:<服务>:<桶号>:ok / :err，INCRBY + TTL），
+  最近 WINDOW_SECONDS 内的桶求和即聚合请求数 / 错误数
+- 本地先累加，每 SYNC_SECONDS 批量 flush 一次，并用一次 MGET 拉回所有服务的窗口和熔断状态
+  （热路径 is_available 只读本地快照，不走网络）
+- 窗口内请求数 ≥ MIN_REQUESTS 且错误率 ≥ ERROR_RATE 时打开熔断：
+  mp:llmh:<服务>:open = 打开截止时刻（epoch 秒），所有 worker 下次同步即看到
+- 截止时刻过后进入半开：真实流量仍不放行，由抢到探测锁（mp:llmh:<服务>:probe，INCR 返回 1）
+  的那一个 worker 发一次轻量 ping；成功则关闭熔断并清空窗口，失败则再打开 OPEN_SECONDS
+- 快照过期（后端不可用 / 同步停了）时返回 None，LLMHealthChecker 退回进程内的熔断逻辑
+
+## 配置
+
+    LLM_SHARED_HEALTH_ENABLED=false
+    LLM_SHARED_HEALTH_WINDOW_SECONDS=60
+    LLM_SHARED_HEALTH_BUCKET_SECONDS=10
+    LLM_SHARED_HEALTH_SYNC_SECONDS=2
+    LLM_SHARED_HEALTH_MIN_REQUESTS=10
+    LLM_SHARED_HEALTH_ERROR_RATE=0.5
+    LLM_SHARED_HEALTH_OPEN_SECONDS=30
+    LLM_SHARED_HEALTH_PROBE_TIMEOUT_SECONDS=5
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.cache import CacheBackend, NearCache, get_cache
+
+
+SHARED_HEALTH_ENABLED = os.getenv("LLM_SHARED_HEALTH_ENABLED", "false").lower() == "true"
+WINDOW_SECONDS = int(os.getenv("LLM_SHARED_HEALTH_WINDOW_SECONDS", "60"))
+BUCKET_SECONDS = int(os.getenv("LLM_SHARED_HEALTH_BUCKET_SECONDS", "10"))
+SYNC_SECONDS = float(os.getenv("LLM_SHARED_HEALTH_SYNC_SECONDS", "2"))
+MIN_REQUESTS = int(os.getenv("LLM_SHARED_HEALTH_MIN_REQUESTS", "10"))
+ERROR_RATE = float(os.getenv("LLM_SHARED_HEALTH_ERROR_RATE", "0.5"))
+OPEN_SECONDS = float(os.getenv("LLM_SHARED_HEALTH_OPEN_SECONDS", "30"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("LLM_SHARED_HEALTH_PROBE_TIMEOUT_SECONDS", "5"))
+
+KEY_PREFIX = "mp:llmh"
+
+# 快照超过这么多个同步周期没刷新就视为过期
+STALE_SYNC_PERIODS = 3
+
+
+@dataclass
+class ClusterView:
+    """某个服务在整个集群最近一个窗口内的状态"""
+    requests: int = 0
+    errors: int = 0
+    open_until: Optional[float] = None   # 熔断打开的截止时刻（epoch 秒），None 表示关闭
+    synced_at: float = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+class SharedHealth:
+    """聚合各 worker 的成功 / 失败计数，并在集群范围内打开 / 探测 / 关闭熔断"""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        probe: Optional[Callable[[str], Awaitable[bool]]] = None,
+        window_seconds: int = WINDOW_SECONDS,
+        bucket_seconds: int = BUCKET_SECONDS,
+        sync_seconds: float = SYNC_SECONDS,
+        min_requests: int = MIN_REQUESTS,
+        error_rate: float = ERROR_RATE,
+        open_seconds: float = OPEN_SECONDS,
+        probe_timeout: float = PROBE_TIMEOUT_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            backend: 共享后端（所有 worker 必须是同一个 Redis）
+            probe: 半开探测，async probe(服务名) -> 是否正常；None 表示不探测（熔断到期直接关闭）
+            clock: 时间源（epoch 秒，各 worker 需时钟同步）
+        """
+        self.backend = backend
+        self.probe = probe
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.buckets = max(1, math.ceil(window_seconds / self.bucket_seconds))
+        self.sync_seconds = sync_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self.clock = clock
+        self._services: List[str] = []
+        self._views: Dict[str, ClusterView] = {}
+        self._pending: Dict[Tuple[str, int, str], int] = defaultdict(int)
+        self._probes: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"syncs": 0, "sync_errors": 0, "opened": 0, "probes": 0, "probe_failures": 0}
+
+    # ==================== 记录 ====================
+
+    def register_service(self, name: str):
+        if name not in self._views:
+            self._services.append(name)
+            self._views[name] = ClusterView()
+
+    def record(self, name: str, ok: bool):
+        """本地累加，下次同步时 flush"""
+        self.register_service(name)
+        self._pending[(name, self._bucket(self.clock()), "ok" if ok else "err")] += 1
+
+    # ==================== 决策 ====================
+
+    def is_available(self, name: str) -> Optional[bool]:
+        """按集群快照判断；快照过期或未知服务返回 None（由调用方退回本地逻辑）"""
+        view = self._views.get(name)
+        now = self.clock()
+        if view is None or now - view.synced_at > self.sync_seconds * STALE_SYNC_PERIODS:
+            return None
+        # 打开或半开（等待探测结果）都不放真实流量
+        return view.open_until is None
+
+    def view(self, name: str) -> Optional[ClusterView]:
+        return self._views.get(name)
+
+    # ==================== 同步 ====================
+
+    def _bucket(self, now: float) -> int:
+        return int(now // self.bucket_seconds)
+
+    def _counter_key(self, name: str, bucket: int, kind: str) -> str:
+        return f"{KEY_PREFIX}:{name}:{bucket}:{kind}"
+
+    def _open_key(self, name: str) -> str:
+        return f"{KEY_PREFIX}:{name}:open"
+
+    def _probe_key(self, name: str) -> str:
+        return f"{KEY_PREFIX}:{name}:probe"
+
+    def _window(self, now: float) -> List[int]:
+        current = self._bucket(now)
+        return list(range(current - self.buckets + 1, current + 1))
+
+    async def sync(self):
+        """flush 本地计数，拉回聚合窗口，必要时打开熔断 / 发起探测"""
+        # 缓存后端出错时读写都静默返回空值，先确认连得上，否则快照保持不刷新（随后过期）
+        if not await self.backend.ping():
+            raise ConnectionError("shared health backend unavailable")
+        pending, self._pending = self._pending, defaultdict(int)
+        ttl = (self.buckets + 1) * self.bucket_seconds
+        await asyncio.gather(*(
+            self.backend.incr(self._counter_key(name, bucket, kind), count, ttl)
+            for (name, bucket, kind), count in pending.items()
+        ))
+
+        now = self.clock()
+        window = self._window(now)
+        services = list(self._services)
+        keys: List[str] = []
+        for name in services:
+            keys.append(self._open_key(name))
+            for bucket in window:
+                keys.append(self._counter_key(name, bucket, "ok"))
+                keys.append(self._counter_key(name, bucket, "err"))
+        values = await self.backend.mget(keys) if keys else []
+
+        per_service = 1 + 2 * len(window)
+        for i, name in enumerate(services):
+            chunk = values[i * per_service:(i + 1) * per_service]
+            view = self._views[name]
+            view.open_until = float(chunk[0]) if chunk[0] else None
+            view.requests = sum(int(v or 0) for v in chunk[1:])
+            view.errors = sum(int(v or 0) for v in chunk[2::2])
+            view.synced_at = now
+
+            if view.open_until is None:
+                if view.requests >= self.min_requests and view.error_rate >= self.error_rate:
+                    await self._open(name, now)
+            elif now >= view.open_until:
+                await self._maybe_probe(name)
+        self._stats["syncs"] += 1
+
+    async def _open(self, name: str, now: float):
+        until = now + self.open_seconds
+        await self.backend.set(self._open_key(name), repr(until), ttl=int(self.open_seconds * 10) + 60)
+        self._views[name].open_until = until
+        self._stats["opened"] += 1
+
+    async def _close(self, name: str, now: float):
+        """关闭熔断并清空窗口（否则旧的错误计数会让它立刻再次打开）"""
+        keys = [self._open_key(name)]
+        for bucket in self._window(now):
+            keys.append(self._counter_key(name, bucket, "ok"))
+            keys.append(self._counter_key(name, bucket, "err"))
+        await asyncio.gather(*(self.backend.delete(k) for k in keys))
+        view = self._views[name]
+        view.open_until, view.requests, view.errors = None, 0, 0
+
+    async def _maybe_probe(self, name: str):
+        """半开：只有抢到探测锁的 worker 发探测"""
+        task = self._probes.get(name)
+        if task is not None and not task.done():
+            return
+        if self.probe is None:
+            await self._close(name, self.clock())
+            return
+        owner = await self.backend.incr(self._probe_key(name), 1, ttl=int(self.probe_timeout) + 1)
+        if owner == 1:
+            self._probes[name] = asyncio.ensure_future(self._run_probe(name))
+
+    async def _run_probe(self, name: str):
+        self._stats["probes"] += 1
+        try:
+            ok = await asyncio.wait_for(self.probe(name), self.probe_timeout)
+        except Exception:
+            ok = False
+        now = self.clock()
+        try:
+            if ok:
+                await self._close(name, now)
+            else:
+                self._stats["probe_failures"] += 1
+                await self._open(name, now)
+        finally:
+            await self.backend.delete(self._probe_key(name))
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                print(f"Shared health sync error: {e}")
+            await asyncio.sleep(self.sync_seconds)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._probes.values()] if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+        self._task = None
+        self._probes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = self.clock()
+        return {
+            **self._stats,
+            "services": {
+                name: {
+                    "requests": view.requests,
+                    "errors": view.errors,
+                    "error_rate": round(view.error_rate, 4),
+                    "circuit": "closed" if view.open_until is None
+                    else ("open" if now < view.open_until else "half_open"),
+                    "synced_ago_s": round(now - view.synced_at, 1) if view.synced_at else None,
+                }
+                for name, view in self._views.items()
+            },
+        }
+
+
+def create_shared_health(probe: Optional[Callable[[str], Awaitable[bool]]] = None) -> SharedHealth:
+    """用全局缓存后端构建；绕过进程内近端缓存，否则各 worker 读到的是自己的旧快照"""
+    backend = get_cache()
+    if isinstance(backend, NearCache):
+        backend = backend.remote
+    return SharedHealth(backend, probe=probe)
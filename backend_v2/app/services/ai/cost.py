@@ -1,14 +1,25 @@
 """
 MindPal Backend V2 - Cost Tracker
 AI服务成本追踪
+
+用量预留: 调用前按估算值 reserve（计入配额检查，同一玩家的并发请求不会一起越过限额），
+流结束后按真实用量 settle（释放预留并记账）；请求中途异常没有结算的预留 RESERVATION_TTL_SECONDS 后自动失效。
+
+跨 worker / 持久化: attach_store(UsageStore) 后用量同时写进共享计数器和 usage_daily 表（见 usage_store.py）；
+配额检查仍只读本地影子，影子每个 flush 周期按集群总量刷新。
 """
 
+import itertools
 import os
-from typing import Dict, Optional, Any
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Any, Tuple
 from datetime import datetime, date
 from dataclasses import dataclass, field
 from collections import defaultdict
 
+if TYPE_CHECKING:
+    from app.services.ai.usage_store import UsageStore
+
 
 @dataclass
 class UsageRecord:
@@ -35,13 +46,18 @@ class DailyUsage:
 class PlayerQuota:
     """玩家配额"""
     player_id: int
+    membership_type: str = "free"
     daily_token_limit: int = 50000       # 每日token限额
     daily_cost_limit: float = 0.10       # 每日成本限额（元）
     used_tokens_today: int = 0
     used_cost_today: float = 0.0
+    reserved_tokens: int = 0             # 进行中请求的预留（尚未结算）
     last_reset: date = field(default_factory=date.today)
 
 
+# 未结算预留的有效期（秒）
+RESERVATION_TTL_SECONDS = int(os.getenv("COST_RESERVATION_TTL_SECONDS", "300"))
+
 # 价格表（元/1K tokens）
 PRICING: Dict[str, Dict[str, float]] = {
     "qwen.turbo": {"input": 0.008, "output": 0.008},
@@ -86,6 +102,15 @@ class CostTracker:
         self._daily_usage: Dict[date, DailyUsage] = {}
         self._player_quotas: Dict[int, PlayerQuota] = {}
         self._pricing = PRICING
+        # reservation_id → (player_id, tokens, 失效时刻)
+        self._reservations: Dict[str, Tuple[int, int, float]] = {}
+        self._reservation_ids = itertools.count(1)
+        self.store: Optional["UsageStore"] = None
+
+    def attach_store(self, store: "UsageStore"):
+        """接入共享 / 持久化存储"""
+        store.bind(self)
+        self.store = store
 
     def calculate_cost(
         self,
@@ -141,6 +166,9 @@ class CostTracker:
         quota.used_tokens_today += input_tokens + output_tokens
         quota.used_cost_today += cost
 
+        if self.store is not None:
+            self.store.record(player_id, today, service, input_tokens, output_tokens, cost)
+
         return {
             "cost": cost,
             "input_tokens": input_tokens,
@@ -154,9 +182,10 @@ class CostTracker:
         player_id: int,
         estimated_tokens: int = 0
     ) -> Dict[str, Any]:
-        """检查配额"""
+        """检查配额（进行中请求的预留一并计入）"""
         quota = self._get_or_create_quota(player_id)
         self._reset_quota_if_needed(quota)
+        self._expire_reservations()
 
         # 无限配额
         if quota.daily_token_limit < 0:
@@ -168,7 +197,7 @@ class CostTracker:
             }
 
         # 检查token配额
-        if quota.used_tokens_today + estimated_tokens > quota.daily_token_limit:
+        if quota.used_tokens_today + quota.reserved_tokens + estimated_tokens > quota.daily_token_limit:
             return {
                 "allowed": False,
                 "reason": "daily_token_limit_exceeded",
@@ -192,6 +221,39 @@ class CostTracker:
             "remaining_cost": quota.daily_cost_limit - quota.used_cost_today
         }
 
+    def reserve(self, player_id: int, tokens: int) -> str:
+        """调用前预留估算的 token 数，返回 reservation_id"""
+        self._expire_reservations()
+        reservation_id = f"r{next(self._reservation_ids)}"
+        tokens = max(0, int(tokens))
+        self._reservations[reservation_id] = (player_id, tokens, time.monotonic() + RESERVATION_TTL_SECONDS)
+        self._get_or_create_quota(player_id).reserved_tokens += tokens
+        return reservation_id
+
+    def release(self, reservation_id: Optional[str]):
+        """释放预留（调用失败或已结算）；重复释放无副作用"""
+        entry = self._reservations.pop(reservation_id, None) if reservation_id else None
+        if entry is not None:
+            quota = self._get_or_create_quota(entry[0])
+            quota.reserved_tokens = max(0, quota.reserved_tokens - entry[1])
+
+    def settle(
+        self,
+        reservation_id: Optional[str],
+        player_id: int,
+        service: str,
+        input_tokens: int,
+        output_tokens: int
+    ) -> Dict[str, Any]:
+        """释放预留并按真实用量记账"""
+        self.release(reservation_id)
+        return self.record_usage(player_id, service, input_tokens, output_tokens)
+
+    def _expire_reservations(self):
+        now = time.monotonic()
+        for reservation_id in [r for r, (_, _, expires) in self._reservations.items() if expires <= now]:
+            self.release(reservation_id)
+
     def set_player_quota(
         self,
         player_id: int,
@@ -200,9 +262,15 @@ class CostTracker:
         """设置玩家配额"""
         quota_config = MEMBERSHIP_QUOTAS.get(membership_type, MEMBERSHIP_QUOTAS["free"])
         quota = self._get_or_create_quota(player_id)
+        quota.membership_type = membership_type if membership_type in MEMBERSHIP_QUOTAS else "free"
         quota.daily_token_limit = quota_config["daily_token_limit"]
         quota.daily_cost_limit = quota_config["daily_cost_limit"]
 
+    def get_membership_type(self, player_id: int) -> str:
+        """玩家的会员类型（未设置过配额的按 free）"""
+        quota = self._player_quotas.get(player_id)
+        return quota.membership_type if quota else "free"
+
     def get_player_usage(self, player_id: int) -> Dict[str, Any]:
         """获取玩家使用情况"""
         quota = self._get_or_create_quota(player_id)
@@ -213,6 +281,7 @@ class CostTracker:
             "date": quota.last_reset.isoformat(),
             "used_tokens": quota.used_tokens_today,
             "used_cost": round(quota.used_cost_today, 4),
+            "reserved_tokens": quota.reserved_tokens,
             "daily_token_limit": quota.daily_token_limit,
             "daily_cost_limit": quota.daily_cost_limit,
             "remaining_tokens": max(0, quota.daily_token_limit - quota.used_tokens_today) if quota.daily_token_limit > 0 else -1,
@@ -252,6 +321,16 @@ class CostTracker:
             }
         }
 
+    async def load_daily_report(self, report_date: Optional[date] = None) -> Dict[str, Any]:
+        """集群范围的每日报告（读 usage_daily）；没接存储或读库失败时退回本进程的统计"""
+        target_date = report_date or date.today()
+        if self.store is not None:
+            try:
+                return await self.store.load_daily_report(target_date)
+            except Exception as e:
+                print(f"Load daily report error: {e}")
+        return self.get_daily_report(target_date)
+
     def get_service_stats(self) -> Dict[str, Any]:
         """获取服务统计"""
         today = date.today()
@@ -276,8 +355,20 @@ class CostTracker:
         """获取或创建玩家配额"""
         if player_id not in self._player_quotas:
             self._player_quotas[player_id] = PlayerQuota(player_id=player_id)
+        if self.store is not None:
+            self.store.touch(player_id)
         return self._player_quotas[player_id]
 
+    def _apply_shadow(self, player_id: int, day: date, used_tokens: int, used_cost: float):
+        """用集群总量覆盖本地影子（由 UsageStore 每个 flush 周期调用）"""
+        quota = self._player_quotas.get(player_id)
+        if quota is None:
+            quota = self._player_quotas[player_id] = PlayerQuota(player_id=player_id)
+        self._reset_quota_if_needed(quota)
+        if quota.last_reset == day:
+            quota.used_tokens_today = used_tokens
+            quota.used_cost_today = used_cost
+
     def _reset_quota_if_needed(self, quota: PlayerQuota):
         """如果需要则重置配额"""
         today = date.today()
@@ -1,15 +1,43 @@
 """
 MindPal Backend V2 - LLM Health Checker
 LLM服务健康检查与熔断
+
+延迟统计:
+- 总耗时与首包耗时（TTFT）各自维护 EWMA（第一个样本即初值，不再从 0 爬升）
+  和最近 LATENCY_WINDOW 个样本的滑动窗口，用于分位数（p50 / p95 / p99）
+- get_best_service 的延迟分 = EWMA 与 p95 的平均：既跟得上最近的变化，又不忽略长尾
+- ttft_budget_ms: 路由器对冲请求用的首包预算（按 TTFT 分位数学习）
+
+集群共享熔断（cluster_health.SharedHealth，attach_shared 后生效）:
+成功 / 失败同时发布到共享后端；is_available 优先按集群聚合错误率的熔断状态判断，
+共享快照过期时退回本进程的连续失败熔断。
 """
 
 import asyncio
-from typing import Dict, Optional, List, Tuple
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Optional, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
+import math
 import time
 
+if TYPE_CHECKING:
+    from app.services.ai.cluster_health import SharedHealth
+
+# 分位数滑动窗口大小 / EWMA 平滑系数
+LATENCY_WINDOW = 256
+EWMA_ALPHA = 0.2
+
+
+def _percentile(samples: Deque[float], p: float) -> Optional[float]:
+    """最近邻分位数（样本为空返回 None）"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
 
 class ServiceStatus(str, Enum):
     """服务状态"""
@@ -40,6 +68,10 @@ class ServiceHealth:
     avg_latency_ms: float = 0.0
     min_latency_ms: float = float('inf')
     max_latency_ms: float = 0.0
+    ewma_latency_ms: Optional[float] = None
+    ewma_ttft_ms: Optional[float] = None
+    latency_samples: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    ttft_samples: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
 
     # 熔断配置
     failure_threshold: int = 5          # 连续失败阈值
@@ -52,6 +84,18 @@ class ServiceHealth:
             return 1.0
         return self.successful_requests / self.total_requests
 
+    def latency_percentile(self, p: float) -> Optional[float]:
+        return _percentile(self.latency_samples, p)
+
+    def ttft_percentile(self, p: float) -> Optional[float]:
+        return _percentile(self.ttft_samples, p)
+
+    def latency_estimate_ms(self) -> Optional[float]:
+        """选路用的延迟估计：EWMA 与 p95 的平均（无样本返回 None）"""
+        if self.ewma_latency_ms is None:
+            return None
+        return (self.ewma_latency_ms + self.latency_percentile(95)) / 2
+
     @property
     def is_available(self) -> bool:
         """检查服务是否可用"""
@@ -72,6 +116,14 @@ class ServiceHealth:
         return self.status == ServiceStatus.DEGRADED
 
 
+def _ewma(current: Optional[float], sample: float) -> float:
+    return sample if current is None else current * (1 - EWMA_ALPHA) + sample * EWMA_ALPHA
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
 class LLMHealthChecker:
     """LLM服务健康检查器"""
 
@@ -80,6 +132,13 @@ class LLMHealthChecker:
         self._running = False
         self._check_interval = 30  # 秒
         self._check_task: Optional[asyncio.Task] = None
+        self.shared: Optional["SharedHealth"] = None
+
+    def attach_shared(self, shared: "SharedHealth"):
+        """接入集群共享熔断状态（已注册的服务一并登记）"""
+        self.shared = shared
+        for name in self._services:
+            shared.register_service(name)
 
     def register_service(self, name: str, **config) -> ServiceHealth:
         """注册服务"""
@@ -90,18 +149,23 @@ class LLMHealthChecker:
                 success_threshold=config.get("success_threshold", 3),
                 recovery_timeout_seconds=config.get("recovery_timeout", 60)
             )
+            if self.shared is not None:
+                self.shared.register_service(name)
         return self._services[name]
 
     def get_service(self, name: str) -> Optional[ServiceHealth]:
         """获取服务状态"""
         return self._services.get(name)
 
-    def record_success(self, service_name: str, latency_ms: float):
-        """记录成功请求"""
+    def record_success(self, service_name: str, latency_ms: float, ttft_ms: Optional[float] = None):
+        """记录成功请求（ttft_ms: 首包耗时，流式调用时提供）"""
         health = self._services.get(service_name)
         if not health:
             health = self.register_service(service_name)
 
+        if self.shared is not None:
+            self.shared.record(service_name, True)
+
         health.total_requests += 1
         health.successful_requests += 1
         health.consecutive_successes += 1
@@ -113,6 +177,11 @@ class LLMHealthChecker:
         health.avg_latency_ms = (health.avg_latency_ms * 0.9) + (latency_ms * 0.1)
         health.min_latency_ms = min(health.min_latency_ms, latency_ms)
         health.max_latency_ms = max(health.max_latency_ms, latency_ms)
+        health.ewma_latency_ms = _ewma(health.ewma_latency_ms, latency_ms)
+        health.latency_samples.append(latency_ms)
+        if ttft_ms is not None:
+            health.ewma_ttft_ms = _ewma(health.ewma_ttft_ms, ttft_ms)
+            health.ttft_samples.append(ttft_ms)
 
         # 状态转换
         if health.status == ServiceStatus.RECOVERING:
@@ -128,6 +197,9 @@ class LLMHealthChecker:
         if not health:
             health = self.register_service(service_name)
 
+        if self.shared is not None:
+            self.shared.record(service_name, False)
+
         health.total_requests += 1
         health.failed_requests += 1
         health.consecutive_failures += 1
@@ -143,12 +215,37 @@ class LLMHealthChecker:
             health.status = ServiceStatus.DEGRADED
 
     def is_available(self, service_name: str) -> bool:
-        """检查服务是否可用"""
+        """检查服务是否可用（接入了共享状态且快照有效时按集群熔断判断）"""
+        if self.shared is not None:
+            shared = self.shared.is_available(service_name)
+            if shared is not None:
+                return shared
         health = self._services.get(service_name)
         if not health:
             return True  # 未知服务默认可用
         return health.is_available
 
+    def record_ttft(self, service_name: str, ttft_ms: float):
+        """只记一个首包样本（对冲中被取消的一路：首包至少这么久，不记入成功 / 失败）"""
+        health = self._services.get(service_name)
+        if not health:
+            health = self.register_service(service_name)
+        health.ewma_ttft_ms = _ewma(health.ewma_ttft_ms, ttft_ms)
+        health.ttft_samples.append(ttft_ms)
+
+    def ttft_budget_ms(
+        self,
+        service_name: str,
+        percentile: float = 95,
+        min_samples: int = 20,
+        default_ms: float = 3000,
+    ) -> float:
+        """首包预算：样本足够时取 TTFT 的 percentile 分位数，否则 default_ms"""
+        health = self._services.get(service_name)
+        if not health or len(health.ttft_samples) < min_samples:
+            return default_ms
+        return health.ttft_percentile(percentile)
+
     def get_best_service(self, candidates: List[str]) -> Optional[str]:
         """从候选服务中选择最佳的"""
         available = [s for s in candidates if self.is_available(s)]
@@ -173,8 +270,8 @@ class LLMHealthChecker:
             health = self._services.get(name)
             if not health:
                 return 0.5
-            # 成功率权重0.6 + 延迟权重0.4（延迟越低分越高）
-            latency_score = 1.0 / (1.0 + health.avg_latency_ms / 1000.0)
+            # 成功率权重0.6 + 延迟权重0.4（延迟越低分越高；无样本按 0 计，让新服务有机会被选中）
+            latency_score = 1.0 / (1.0 + (health.latency_estimate_ms() or 0.0) / 1000.0)
             return health.success_rate * 0.6 + latency_score * 0.4
 
         return max(available, key=score)
@@ -187,6 +284,12 @@ class LLMHealthChecker:
                 "is_available": health.is_available,
                 "success_rate": f"{health.success_rate:.1%}",
                 "avg_latency_ms": f"{health.avg_latency_ms:.0f}",
+                "ewma_latency_ms": _round(health.ewma_latency_ms),
+                "p50_latency_ms": _round(health.latency_percentile(50)),
+                "p95_latency_ms": _round(health.latency_percentile(95)),
+                "p99_latency_ms": _round(health.latency_percentile(99)),
+                "ewma_ttft_ms": _round(health.ewma_ttft_ms),
+                "p95_ttft_ms": _round(health.ttft_percentile(95)),
                 "total_requests": health.total_requests,
                 "consecutive_failures": health.consecutive_failures,
                 "last_check": health.last_check.isoformat(),
@@ -0,0 +1,276 @@
+"""
+MindPal Backend V2 - LLM Admission Control
+按模型的本地限流 + 优先级准入队列
+
+ModelConfig.rate_limit_rpm（以及 rate_limit_tpm）原来只是配置，没有任何地方执行；
+突发流量下直接打到上游的 429，被 LLMHealthChecker 记成失败，健康的服务商也可能被熔断。
+
+- 每个模型两个令牌桶：请求数（RPM）和 token 数（TPM，0 = 不限），容量 = 一分钟额度，匀速回填
+- 桶里有余量且没人排队时直接放行；否则进入该模型的准入队列
+- 队列按优先级出队：危机 > 付费会员 > 免费用户，同优先级先来先到
+- 每个优先级有最长等待时间；超时或队列已满即放弃该模型，路由器溢出到降级链的下一个
+- 上游仍然返回 429 时 penalize() 清空请求桶（按 Retry-After 暂停），不计入熔断
+
+token 数按请求前的估算扣减（TokenEstimator 的输入估算 + 预留输出，与配额预留同一口径），不做事后校正。
+
+## 配置
+
+    LLM_ADMISSION_WAIT_CRISIS_MS=1000
+    LLM_ADMISSION_WAIT_PAID_MS=3000
+    LLM_ADMISSION_WAIT_FREE_MS=5000
+    LLM_ADMISSION_MAX_QUEUE=200       # 每个模型的排队上限
+    LLM_TPM_<MODEL>=120000            # 覆盖模型的 TPM 额度，如 LLM_TPM_QWEN_PLUS（0 = 不限）
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from enum import IntEnum
+from typing import Any, Dict, List, Optional
+
+from app.services.llm.tokenizer import get_token_estimator
+
+
+class AdmissionPriority(IntEnum):
+    """准入优先级（数值越小越先出队）"""
+    CRISIS = 0
+    PAID = 1
+    FREE = 2
+
+
+MAX_WAIT_SECONDS: Dict[AdmissionPriority, float] = {
+    AdmissionPriority.CRISIS: float(os.getenv("LLM_ADMISSION_WAIT_CRISIS_MS", "1000")) / 1000,
+    AdmissionPriority.PAID: float(os.getenv("LLM_ADMISSION_WAIT_PAID_MS", "3000")) / 1000,
+    AdmissionPriority.FREE: float(os.getenv("LLM_ADMISSION_WAIT_FREE_MS", "5000")) / 1000,
+}
+MAX_QUEUE = int(os.getenv("LLM_ADMISSION_MAX_QUEUE", "200"))
+
+# 估算时给输出预留的 token 数
+RESERVED_OUTPUT_TOKENS = 300
+
+
+def admission_priority(is_crisis: bool = False, membership_type: Optional[str] = None) -> AdmissionPriority:
+    """危机 > 付费会员（monthly / yearly / svip）> 免费"""
+    if is_crisis:
+        return AdmissionPriority.CRISIS
+    if membership_type and membership_type != "free":
+        return AdmissionPriority.PAID
+    return AdmissionPriority.FREE
+
+
+def estimate_request_tokens(
+    messages: List[Dict[str, str]],
+    system_prompt: str,
+    provider: str = "default",
+) -> int:
+    """一次调用的 token 数：输入按该服务商的 TokenEstimator 估算，加上输出预留"""
+    return get_token_estimator().count_messages(messages, system_prompt, provider) + RESERVED_OUTPUT_TOKENS
+
+
+def tpm_limit(model_name: str, default: int) -> int:
+    """模型的 TPM 额度，LLM_TPM_<MODEL>（如 LLM_TPM_QWEN_PLUS）可覆盖"""
+    env_name = "LLM_TPM_" + model_name.upper().replace(".", "_").replace("-", "_")
+    return int(os.getenv(env_name, str(default)))
+
+
+class TokenBucket:
+    """容量 = 每分钟额度、匀速回填的令牌桶；rate_per_min <= 0 表示不限"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, rate_per_min: float):
+        self.capacity = float(rate_per_min)
+        self.rate = rate_per_min / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """还要等多久才够 amount（超过容量的按容量算，避免永远等不到）"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def drain(self, pause_seconds: float, now: float):
+        """清空并额外暂停 pause_seconds"""
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0) - pause_seconds * self.rate
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "enqueued")
+
+    def __init__(self, priority: AdmissionPriority, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class ModelLimiter:
+    """单个模型的令牌桶 + 优先级准入队列"""
+
+    def __init__(self, name: str, rpm: int, tpm: int = 0, max_queue: int = MAX_QUEUE):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.token_budget = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self._heap: List[tuple] = []  # (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._stats = {"admitted": 0, "queued": 0, "timeouts": 0, "rejected": 0, "throttled": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # ==================== 准入 ====================
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.token_budget.wait_time(tokens, now))
+
+    def _take(self, tokens: int, now: float):
+        self.requests.take(1, now)
+        self.token_budget.take(tokens, now)
+        self._stats["admitted"] += 1
+
+    def try_acquire(self, tokens: int) -> bool:
+        """不排队：有余量且没人在排队才放行"""
+        now = time.monotonic()
+        if self._pending() == 0 and self._wait_time(tokens, now) <= 0:
+            self._take(tokens, now)
+            return True
+        return False
+
+    async def acquire(
+        self,
+        tokens: int,
+        priority: AdmissionPriority = AdmissionPriority.FREE,
+        max_wait: Optional[float] = None,
+    ) -> bool:
+        """排队等待额度；超过 max_wait（默认按优先级）或队列已满返回 False"""
+        if self.try_acquire(tokens):
+            return True
+        if self._pending() >= self.max_queue:
+            self._stats["rejected"] += 1
+            return False
+
+        waiter = _Waiter(priority, tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (int(priority), next(self._seq), waiter))
+        self._stats["queued"] += 1
+        self._ensure_dispatcher()
+        timeout = MAX_WAIT_SECONDS[priority] if max_wait is None else max_wait
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                return True  # 超时的同时刚好被放行
+            waiter.future.cancel()
+            self._stats["timeouts"] += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已经扣了额度，请求方却放弃了：额度不退，只是不再使用
+                raise
+            waiter.future.cancel()
+            raise
+        finally:
+            wait = time.monotonic() - waiter.enqueued
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def penalize(self, retry_after: float = 1.0):
+        """上游 429：清空请求桶并暂停 retry_after 秒"""
+        self.requests.drain(retry_after, time.monotonic())
+        self._stats["throttled"] += 1
+
+    def _pending(self) -> int:
+        return sum(1 for _, _, w in self._heap if not w.future.done())
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        """按优先级依次放行队首；额度不够时睡到够为止（新来的高优先级在下一轮排到队首）"""
+        while self._heap:
+            _, _, head = self._heap[0]
+            if head.future.done():
+                heapq.heappop(self._heap)
+                continue
+            now = time.monotonic()
+            wait = self._wait_time(head.tokens, now)
+            if wait <= 0:
+                heapq.heappop(self._heap)
+                self._take(head.tokens, now)
+                head.future.set_result(True)
+                continue
+            # 最多睡到队首等待者的截止时刻，过期的在下一轮被清掉
+            await asyncio.sleep(min(wait, 0.5))
+
+    # ==================== 状态 ====================
+
+    def stats(self) -> Dict[str, Any]:
+        depth: Dict[str, int] = {p.name.lower(): 0 for p in AdmissionPriority}
+        for priority, _, waiter in self._heap:
+            if not waiter.future.done():
+                depth[AdmissionPriority(priority).name.lower()] += 1
+        waited = self._stats["queued"]
+        now = time.monotonic()
+        return {
+            **self._stats,
+            "queue_depth": depth,
+            "avg_wait_ms": round(self._wait_total / waited * 1000, 1) if waited else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 1),
+            "rpm_available": None if self.requests.unlimited
+            else round(self.requests.tokens + (now - self.requests.updated) * self.requests.rate, 1),
+        }
+
+
+class AdmissionController:
+    """所有模型的限流器"""
+
+    def __init__(self, limits: Dict[str, Dict[str, int]]):
+        """limits: 模型名 → {"rpm": ..., "tpm": ...}"""
+        self._limiters = {
+            name: ModelLimiter(name, cfg.get("rpm", 0), cfg.get("tpm", 0))
+            for name, cfg in limits.items()
+        }
+
+    def get(self, model_name: str) -> Optional[ModelLimiter]:
+        return self._limiters.get(model_name)
+
+    def try_acquire(self, model_name: str, tokens: int) -> bool:
+        limiter = self._limiters.get(model_name)
+        return limiter is None or limiter.try_acquire(tokens)
+
+    async def acquire(self, model_name: str, tokens: int, priority: AdmissionPriority) -> bool:
+        limiter = self._limiters.get(model_name)
+        return limiter is None or await limiter.acquire(tokens, priority)
+
+    def penalize(self, model_name: str, retry_after: float = 1.0):
+        limiter = self._limiters.get(model_name)
+        if limiter is not None:
+            limiter.penalize(retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
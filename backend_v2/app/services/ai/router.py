@@ -1,15 +1,52 @@
 """
 MindPal Backend V2 - LLM Router
 智能LLM路由器 - 根据场景和健康状态选择最佳模型
+
+对冲请求（hedged request）:
+降级链原来严格串行，只有当前模型抛错才换下一个；慢但没挂的服务商会直接拖高 p99。
+现在当前模型在首包预算内（ServiceHealth 学到的 TTFT 分位数）还没出首个 token 时，
+并行向降级链里下一个可用模型发备份请求，谁先出首个 token 用谁，另一路立即取消。
+失败（首包前抛错）仍按原来的方式换下一个模型。
+
+## 配置
+
+    LLM_HEDGE_ENABLED=true
+    LLM_HEDGE_PERCENTILE=95       # 首包预算取 TTFT 的分位数
+    LLM_HEDGE_MIN_SAMPLES=20      # 样本不足时用默认预算
+    LLM_HEDGE_DEFAULT_TTFT_MS=3000
+    LLM_HEDGE_MIN_TTFT_MS=200     # 预算下限，避免过早对冲放大请求量
+    LLM_HEDGE_MAX_PARALLEL=2      # 同时在途的请求数上限（含原请求）
+
+准入控制（app/services/ai/limiter.py）:
+每个模型发请求前先过本地 RPM / TPM 令牌桶；额度不够时按优先级排队（危机 > 付费 > 免费），
+等待超过上限即溢出到降级链的下一个模型。对冲的备份请求不排队，没有余量就不对冲。
+上游返回 429 时暂停该模型的准入，不计入熔断。
 """
 
+import asyncio
 import os
 import time
 from typing import Dict, List, Optional, AsyncGenerator, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from app.services.ai.cluster_health import create_shared_health
 from app.services.ai.health import LLMHealthChecker, get_health_checker
+from app.services.ai.limiter import (
+    AdmissionController,
+    AdmissionPriority,
+    admission_priority,
+    estimate_request_tokens,
+    tpm_limit,
+)
+
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() != "false"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_TTFT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_TTFT_MS", "3000"))
+HEDGE_MIN_TTFT_MS = float(os.getenv("LLM_HEDGE_MIN_TTFT_MS", "200"))
+HEDGE_MAX_PARALLEL = int(os.getenv("LLM_HEDGE_MAX_PARALLEL", "2"))
 
 
 class ModelTier(str, Enum):
@@ -32,6 +69,7 @@ class ModelConfig:
     cost_per_1k_input: float = 0.0
     cost_per_1k_output: float = 0.0
     rate_limit_rpm: int = 60
+    rate_limit_tpm: int = 0     # 0 = 不限；预定义模型的额度可用 LLM_TPM_<MODEL> 覆盖
     supports_streaming: bool = True
 
 
@@ -47,7 +85,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.8,
         cost_per_1k_input=0.008,
         cost_per_1k_output=0.008,
-        rate_limit_rpm=60
+        rate_limit_rpm=60,
+        rate_limit_tpm=tpm_limit("qwen.turbo", 120000)
     ),
     "qwen.plus": ModelConfig(
         name="qwen.plus",
@@ -58,7 +97,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.7,
         cost_per_1k_input=0.04,
         cost_per_1k_output=0.04,
-        rate_limit_rpm=60
+        rate_limit_rpm=60,
+        rate_limit_tpm=tpm_limit("qwen.plus", 120000)
     ),
     "qwen.max": ModelConfig(
         name="qwen.max",
@@ -69,7 +109,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.6,
         cost_per_1k_input=0.12,
         cost_per_1k_output=0.12,
-        rate_limit_rpm=30
+        rate_limit_rpm=30,
+        rate_limit_tpm=tpm_limit("qwen.max", 60000)
     ),
 
     # Anthropic Claude
@@ -82,7 +123,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.7,
         cost_per_1k_input=0.00025,
         cost_per_1k_output=0.00125,
-        rate_limit_rpm=50
+        rate_limit_rpm=50,
+        rate_limit_tpm=tpm_limit("claude.haiku", 50000)
     ),
     "claude.sonnet": ModelConfig(
         name="claude.sonnet",
@@ -93,7 +135,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.6,
         cost_per_1k_input=0.003,
         cost_per_1k_output=0.015,
-        rate_limit_rpm=50
+        rate_limit_rpm=50,
+        rate_limit_tpm=tpm_limit("claude.sonnet", 40000)
     ),
     "claude.opus": ModelConfig(
         name="claude.opus",
@@ -104,7 +147,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.5,
         cost_per_1k_input=0.015,
         cost_per_1k_output=0.075,
-        rate_limit_rpm=30
+        rate_limit_rpm=30,
+        rate_limit_tpm=tpm_limit("claude.opus", 40000)
     ),
 
     # 火山引擎豆包
@@ -117,7 +161,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.8,
         cost_per_1k_input=0.0003,
         cost_per_1k_output=0.0003,
-        rate_limit_rpm=100
+        rate_limit_rpm=100,
+        rate_limit_tpm=tpm_limit("volcengine.lite", 200000)
     ),
     "volcengine.pro": ModelConfig(
         name="volcengine.pro",
@@ -128,7 +173,8 @@ MODEL_CONFIGS: Dict[str, ModelConfig] = {
         default_temperature=0.7,
         cost_per_1k_input=0.0008,
         cost_per_1k_output=0.0008,
-        rate_limit_rpm=100
+        rate_limit_rpm=100,
+        rate_limit_tpm=tpm_limit("volcengine.pro", 200000)
     ),
 }
 
@@ -168,16 +214,54 @@ NPC_ROUTING: Dict[str, Dict[str, List[str]]] = {
 }
 
 
+class _Attempt:
+    """对某个模型的一次流式调用：创建即开始等首个 token"""
+
+    def __init__(self, model_name: str, stream: AsyncGenerator[str, None]):
+        self.model_name = model_name
+        self.stream = stream
+        self.started = time.monotonic()
+        self.first_at: Optional[float] = None
+        self.first: asyncio.Task = asyncio.ensure_future(self._first_chunk())
+
+    async def _first_chunk(self) -> Optional[str]:
+        """首个 chunk（空流返回 None）"""
+        try:
+            return await self.stream.__anext__()
+        except StopAsyncIteration:
+            return None
+        finally:
+            self.first_at = time.monotonic()
+
+    async def close(self):
+        """取消等待中的首包并关闭流（停止底层请求）"""
+        if not self.first.done():
+            self.first.cancel()
+            await asyncio.wait([self.first])
+        elif not self.first.cancelled():
+            self.first.exception()  # 已处理过的失败，避免 "exception was never retrieved"
+        try:
+            await self.stream.aclose()
+        except Exception:
+            pass
+
+
 class LLMRouter:
     """LLM智能路由器"""
 
     def __init__(
         self,
-        health_checker: Optional[LLMHealthChecker] = None
+        health_checker: Optional[LLMHealthChecker] = None,
+        limiter: Optional[AdmissionController] = None
     ):
         self.health = health_checker or get_health_checker()
         self.model_configs = MODEL_CONFIGS
+        self.limiter = limiter or AdmissionController({
+            name: {"rpm": config.rate_limit_rpm, "tpm": config.rate_limit_tpm}
+            for name, config in self.model_configs.items()
+        })
         self.npc_routing = NPC_ROUTING
+        self._stats = {"hedged": 0, "hedge_wins": 0}
 
         # 注册所有模型到健康检查器
         for name in self.model_configs:
@@ -256,10 +340,11 @@ class LLMRouter:
         system_prompt: str,
         is_crisis: bool = False,
         temperature: Optional[float] = None,
-        max_retries: int = 3
+        max_retries: int = 3,
+        priority: Optional[AdmissionPriority] = None
     ) -> AsyncGenerator[str, None]:
         """
-        路由请求到最佳模型（带自动降级）
+        路由请求到最佳模型（带准入控制、自动降级和首包超时对冲）
 
         Args:
             npc_id: NPC ID
@@ -267,49 +352,126 @@ class LLMRouter:
             system_prompt: 系统提示词
             is_crisis: 是否危机模式
             temperature: 温度参数
-            max_retries: 最大重试次数
+            max_retries: 最大重试次数（失败的模型数上限）
+            priority: 准入优先级，默认按 is_crisis 取 CRISIS / FREE
 
         Yields:
             回复文本片段
         """
-        fallback_chain = self.get_fallback_chain(npc_id, is_crisis)
-
+        pending = [m for m in self.get_fallback_chain(npc_id, is_crisis) if m in self.model_configs]
+        attempts: List[_Attempt] = []
         last_error = None
         retries = 0
-
-        for model_name in fallback_chain:
-            if retries >= max_retries:
-                break
-
-            if not self.health.is_available(model_name):
-                continue
-
-            config = self.model_configs.get(model_name)
-            if not config:
-                continue
-
-            start_time = time.time()
-
-            try:
-                # 调用实际的LLM服务
-                async for chunk in self._call_llm(
-                    config=config,
-                    messages=messages,
-                    system_prompt=system_prompt,
-                    temperature=temperature or config.default_temperature
-                ):
-                    yield chunk
-
-                # 记录成功
-                latency_ms = (time.time() - start_time) * 1000
-                self.health.record_success(model_name, latency_ms)
-                return  # 成功完成
-
-            except Exception as e:
-                last_error = e
-                self.health.record_failure(model_name, str(e))
-                retries += 1
-                continue
+        if priority is None:
+            priority = admission_priority(is_crisis)
+        request_tokens: Dict[str, int] = {}
+        hedge_blocked = False
+
+        def tokens_for(model_name: str) -> int:
+            """按模型所属服务商估算（各家分词器系数不同），同一服务商只算一次"""
+            provider = self.model_configs[model_name].provider
+            if provider not in request_tokens:
+                request_tokens[provider] = estimate_request_tokens(messages, system_prompt, provider)
+            return request_tokens[provider]
+
+        def start(model_name: str):
+            config = self.model_configs[model_name]
+            attempts.append(_Attempt(model_name, self._call_llm(
+                config=config,
+                messages=messages,
+                system_prompt=system_prompt,
+                temperature=temperature or config.default_temperature
+            )))
+
+        async def launch() -> bool:
+            """向降级链中下一个可用模型发起请求；排队超时的模型跳过（溢出到下一个）"""
+            while pending:
+                model_name = pending.pop(0)
+                if not self.health.is_available(model_name):
+                    continue
+                if not await self.limiter.acquire(model_name, tokens_for(model_name), priority):
+                    continue
+                start(model_name)
+                return True
+            return False
+
+        def launch_hedge() -> bool:
+            """对冲：只用有现成余量的模型，不排队，也不把暂时没额度的模型移出降级链"""
+            for model_name in list(pending):
+                if self.health.is_available(model_name) and self.limiter.try_acquire(model_name, tokens_for(model_name)):
+                    pending.remove(model_name)
+                    start(model_name)
+                    return True
+            return False
+
+        try:
+            while retries < max_retries and (attempts or await launch()):
+                # 1. 等首个 token：超过最新一路的首包预算就对冲下一个模型
+                winner: Optional[_Attempt] = None
+                while winner is None and attempts:
+                    timeout = None
+                    if HEDGE_ENABLED and pending and not hedge_blocked and len(attempts) < HEDGE_MAX_PARALLEL:
+                        newest = attempts[-1]
+                        deadline = newest.started + self._ttft_budget_ms(newest.model_name) / 1000.0
+                        timeout = max(0.0, deadline - time.monotonic())
+                    done, _ = await asyncio.wait(
+                        [a.first for a in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not done:
+                        if launch_hedge():
+                            self._stats["hedged"] += 1
+                        else:
+                            hedge_blocked = True
+                        continue
+                    for attempt in [a for a in attempts if a.first in done]:
+                        error = attempt.first.exception()
+                        if error is None:
+                            winner = attempt
+                            break
+                        attempts.remove(attempt)
+                        await attempt.close()
+                        last_error = error
+                        self._record_failure(attempt.model_name, error)
+                        retries += 1
+                    if winner is None and not attempts and retries < max_retries:
+                        await launch()
+
+                if winner is None:
+                    break
+
+                # 2. 选定胜者，取消其余各路；被取消的一路记一个截尾的首包样本，
+                #    否则慢的那部分永远进不了统计，预算会越学越小、对冲越来越多
+                ttft_ms = (winner.first_at - winner.started) * 1000
+                for attempt in attempts:
+                    if attempt is not winner:
+                        if not attempt.first.done():
+                            self.health.record_ttft(
+                                attempt.model_name, (time.monotonic() - attempt.started) * 1000
+                            )
+                        await attempt.close()
+                if winner is not attempts[0]:
+                    self._stats["hedge_wins"] += 1
+                attempts = []
+
+                # 3. 输出胜者的剩余内容
+                try:
+                    first = winner.first.result()
+                    if first is not None:
+                        yield first
+                        async for chunk in winner.stream:
+                            yield chunk
+                    latency_ms = (time.monotonic() - winner.started) * 1000
+                    self.health.record_success(winner.model_name, latency_ms, ttft_ms)
+                    return  # 成功完成
+                except Exception as e:
+                    last_error = e
+                    self._record_failure(winner.model_name, e)
+                    retries += 1
+                finally:
+                    await winner.close()
+        finally:
+            for attempt in attempts:
+                await attempt.close()
 
         # 所有模型都失败
         error_msg = f"[系统] 服务暂时不可用，请稍后再试"
@@ -317,6 +479,23 @@ class LLMRouter:
             error_msg += f" ({str(last_error)[:100]})"
         yield error_msg
 
+    def _record_failure(self, model_name: str, error: BaseException):
+        """上游 429 只暂停该模型的准入，不算健康失败（否则突发流量会熔断健康的服务商）"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            self.limiter.penalize(model_name, retry_after)
+        else:
+            self.health.record_failure(model_name, str(error))
+
+    def _ttft_budget_ms(self, model_name: str) -> float:
+        budget = self.health.ttft_budget_ms(
+            model_name,
+            percentile=HEDGE_PERCENTILE,
+            min_samples=HEDGE_MIN_SAMPLES,
+            default_ms=HEDGE_DEFAULT_TTFT_MS,
+        )
+        return max(HEDGE_MIN_TTFT_MS, budget)
+
     async def _call_llm(
         self,
         config: ModelConfig,
@@ -325,44 +504,57 @@ class LLMRouter:
         temperature: float
     ) -> AsyncGenerator[str, None]:
         """调用具体的LLM服务"""
-        # 根据provider选择不同的调用方式
+        service = self._provider_service(config)
+        async for chunk in service.chat_stream(
+            messages=messages,
+            system_prompt=system_prompt,
+            temperature=temperature
+        ):
+            yield chunk
+
+    def _provider_service(self, config: ModelConfig):
+        """按 provider 取对应的 LLM 服务"""
         # 这里需要与现有的LLM服务集成
-
         if config.provider == "qwen":
             from app.services.llm.qwen import QwenService
-            service = QwenService()
-            async for chunk in service.stream_chat(
-                messages=messages,
-                system_prompt=system_prompt,
-                temperature=temperature
-            ):
-                yield chunk
+            return QwenService()
 
         elif config.provider == "claude":
             from app.services.llm.claude import ClaudeService
-            service = ClaudeService()
-            async for chunk in service.stream_chat(
-                messages=messages,
-                system_prompt=system_prompt,
-                temperature=temperature
-            ):
-                yield chunk
+            return ClaudeService()
 
         elif config.provider == "volcengine":
             # TODO: 实现火山引擎服务
             # 暂时降级到qwen
             from app.services.llm.qwen import QwenService
-            service = QwenService()
-            async for chunk in service.stream_chat(
-                messages=messages,
-                system_prompt=system_prompt,
-                temperature=temperature
-            ):
-                yield chunk
+            return QwenService()
 
         else:
             raise ValueError(f"Unknown provider: {config.provider}")
 
+    async def probe_model(self, model_name: str) -> bool:
+        """熔断半开时的轻量探测：1 个输出 token 的同步调用"""
+        config = self.model_configs.get(model_name)
+        if config is None:
+            return False
+        reply = await self._provider_service(config).chat(
+            messages=[{"role": "user", "content": "ping"}],
+            system_prompt="",
+            max_tokens=1
+        )
+        # 各服务出错时返回 "[错误] ..." 文本而不是抛异常
+        return bool(reply) and not reply.startswith("[错误]")
+
+    def start_shared_health(self):
+        """接入集群共享熔断（LLM_SHARED_HEALTH_ENABLED=true 时由 lifespan 调用）"""
+        if self.health.shared is None:
+            self.health.attach_shared(create_shared_health(probe=self.probe_model))
+        self.health.shared.start()
+
+    async def stop_shared_health(self):
+        if self.health.shared is not None:
+            await self.health.shared.stop()
+
     def get_routing_status(self) -> Dict[str, Any]:
         """获取路由状态"""
         return {
@@ -375,10 +567,24 @@ class LLMRouter:
                 for name, config in self.model_configs.items()
             },
             "health": self.health.get_all_status(),
+            "hedging": {"enabled": HEDGE_ENABLED, **self._stats},
+            "admission": self.limiter.stats(),
+            "cluster_health": self.health.shared.stats() if self.health.shared else None,
             "npc_routing": self.npc_routing
         }
 
 
+def _retry_after(error: BaseException) -> Optional[float]:
+    """上游限流（HTTP 429）时返回建议的暂停秒数，否则 None"""
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) != 429:
+        return None
+    try:
+        return max(0.0, float(response.headers.get("retry-after", 1)))
+    except (TypeError, ValueError):
+        return 1.0
+
+
 # 单例实例
 _router: Optional[LLMRouter] = None
 
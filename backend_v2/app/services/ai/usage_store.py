@@ -0,0 +1,260 @@
+"""
+MindPal Backend V2 - Durable Usage Store
+CostTracker 的跨 worker 共享与持久化
+
+CostTracker 的 _player_quotas / _daily_usage 原来只在进程内：重启即清零，
+N 个 worker 各算各的，一个用户最多能用到 N 倍的每日配额。这里给它加一层存储（attach_store 后生效）：
+
+- 配额计数器放在共享缓存后端（生产即 Redis）：mp:quota:<玩家>:<日期>:tokens / :cost（成本按百万分之一元取整），
+  INCRBY 原子累加并返回集群总量，TTL 两天
+- record_usage 只写本地：本地影子立即加上，增量进写后缓冲；每 FLUSH_SECONDS 批量 INCRBY 一次，
+  返回的集群总量（加上 flush 期间新产生的本地增量）覆盖本地影子；
+  最近 ACTIVE_SECONDS 内查过配额、但本轮没有增量的玩家用一次 MGET 刷新
+- check_quota / QuotaGuard.check 仍只读本地影子（亚毫秒），与集群总量的偏差不超过一个 flush 周期
+- 按 (日期, 服务) 汇总的 token / 成本 / 请求数同样缓冲，每个周期在一个事务里累加进 usage_daily 表
+  （UPDATE ... SET x = x + :delta，没有行时 INSERT；并发建行冲突则整批留到下个周期重试）
+- 缓存后端或数据库不可用时增量留在缓冲里，恢复后补写
+
+## 配置
+
+    COST_STORE_ENABLED=true
+    COST_FLUSH_SECONDS=2
+    COST_ACTIVE_SECONDS=300
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from app.core.cache import CacheBackend, NearCache, get_cache
+from app.models.usage import UsageDaily
+
+if TYPE_CHECKING:
+    from app.services.ai.cost import CostTracker
+
+
+COST_STORE_ENABLED = os.getenv("COST_STORE_ENABLED", "true").lower() != "false"
+FLUSH_SECONDS = float(os.getenv("COST_FLUSH_SECONDS", "2"))
+ACTIVE_SECONDS = float(os.getenv("COST_ACTIVE_SECONDS", "300"))
+
+QUOTA_KEY_PREFIX = "mp:quota"
+QUOTA_KEY_TTL = 2 * 86400
+COST_MICROS = 1_000_000
+
+
+class UsageStore:
+    """配额计数器（共享缓存）+ 每日汇总（SQL）的写后缓冲"""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        session_factory: Optional[Callable] = None,
+        flush_seconds: float = FLUSH_SECONDS,
+        active_seconds: float = ACTIVE_SECONDS,
+    ):
+        """
+        Args:
+            backend: 共享缓存后端（所有 worker 必须是同一个 Redis）
+            session_factory: AsyncSession 工厂，默认 app.database.async_session_maker
+        """
+        self.backend = backend
+        self._session_factory = session_factory
+        self.flush_seconds = flush_seconds
+        self.active_seconds = active_seconds
+        self._tracker: Optional["CostTracker"] = None
+        # (玩家, 日期) → [tokens, 成本（百万分之一元）]
+        self._quota_deltas: Dict[Tuple[int, date], List[int]] = defaultdict(lambda: [0, 0])
+        # (日期, 服务) → [input_tokens, output_tokens, cost, requests]
+        self._service_deltas: Dict[Tuple[date, str], List[float]] = defaultdict(lambda: [0, 0, 0.0, 0])
+        self._active: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_flush: Optional[float] = None
+        self._stats = {"flushes": 0, "cache_errors": 0, "db_errors": 0, "rows_written": 0}
+
+    def bind(self, tracker: "CostTracker"):
+        self._tracker = tracker
+
+    # ==================== 本地记录（同步，热路径）====================
+
+    def touch(self, player_id: int):
+        """标记玩家活跃：其影子在之后的每个周期都会刷新"""
+        self._active[player_id] = time.monotonic()
+
+    def record(self, player_id: int, day: date, service: str, input_tokens: int, output_tokens: int, cost: float):
+        self.touch(player_id)
+        quota = self._quota_deltas[(player_id, day)]
+        quota[0] += input_tokens + output_tokens
+        quota[1] += int(round(cost * COST_MICROS))
+        totals = self._service_deltas[(day, service)]
+        totals[0] += input_tokens
+        totals[1] += output_tokens
+        totals[2] += cost
+        totals[3] += 1
+
+    # ==================== flush ====================
+
+    def _key(self, player_id: int, day: date, field: str) -> str:
+        return f"{QUOTA_KEY_PREFIX}:{player_id}:{day.isoformat()}:{field}"
+
+    async def flush(self):
+        """写出缓冲的增量并刷新活跃玩家的影子"""
+        if await self.backend.ping():
+            await self._flush_quotas()
+        else:
+            self._stats["cache_errors"] += 1  # 增量留在缓冲里，恢复后补写
+        await self._flush_services()
+        self._last_flush = time.monotonic()
+        self._stats["flushes"] += 1
+
+    async def _flush_quotas(self):
+        deltas, self._quota_deltas = self._quota_deltas, defaultdict(lambda: [0, 0])
+        items = list(deltas.items())
+        results = await asyncio.gather(*(
+            asyncio.gather(
+                self.backend.incr(self._key(pid, day, "tokens"), tokens, QUOTA_KEY_TTL),
+                self.backend.incr(self._key(pid, day, "cost"), cost, QUOTA_KEY_TTL),
+            )
+            for (pid, day), (tokens, cost) in items
+        ))
+
+        today = date.today()
+        totals: Dict[int, Tuple[int, int]] = {}
+        for ((pid, day), (tokens, cost)), (new_tokens, new_cost) in zip(items, results):
+            # 写失败的那一半留到下个周期（另一半已经加上了，不能重复）
+            if new_tokens is None:
+                self._quota_deltas[(pid, day)][0] += tokens
+            if new_cost is None:
+                self._quota_deltas[(pid, day)][1] += cost
+            if day == today and new_tokens is not None and new_cost is not None:
+                totals[pid] = (new_tokens, new_cost)
+
+        now = time.monotonic()
+        for pid in [p for p, seen in self._active.items() if now - seen > self.active_seconds]:
+            del self._active[pid]
+        others = [pid for pid in self._active if pid not in totals]
+        if others:
+            keys = [self._key(pid, today, field) for pid in others for field in ("tokens", "cost")]
+            values = await self.backend.mget(keys)
+            for i, pid in enumerate(others):
+                totals[pid] = (int(values[2 * i] or 0), int(values[2 * i + 1] or 0))
+
+        if self._tracker is not None:
+            for pid, (tokens, cost) in totals.items():
+                # flush 期间新记下的本地增量还没进集群总量，叠加上
+                pending = self._quota_deltas.get((pid, today), (0, 0))
+                self._tracker._apply_shadow(
+                    pid, today, tokens + pending[0], (cost + pending[1]) / COST_MICROS
+                )
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from app.database import async_session_maker
+            self._session_factory = async_session_maker
+        return self._session_factory
+
+    async def _flush_services(self):
+        deltas, self._service_deltas = self._service_deltas, defaultdict(lambda: [0, 0, 0.0, 0])
+        if not deltas:
+            return
+        try:
+            async with self._sessions()() as session:
+                for (day, service), (input_tokens, output_tokens, cost, requests) in deltas.items():
+                    result = await session.execute(
+                        update(UsageDaily)
+                        .where(UsageDaily.date == day, UsageDaily.service == service)
+                        .values(
+                            input_tokens=UsageDaily.input_tokens + input_tokens,
+                            output_tokens=UsageDaily.output_tokens + output_tokens,
+                            cost=UsageDaily.cost + cost,
+                            requests=UsageDaily.requests + requests,
+                            updated_at=datetime.utcnow(),
+                        )
+                    )
+                    if result.rowcount == 0:
+                        session.add(UsageDaily(
+                            date=day, service=service, input_tokens=input_tokens,
+                            output_tokens=output_tokens, cost=cost, requests=requests,
+                        ))
+                await session.commit()
+            self._stats["rows_written"] += len(deltas)
+        except Exception as e:
+            # 整批回滚（含并发建行冲突），增量并回缓冲下个周期重试
+            self._stats["db_errors"] += 1
+            print(f"Usage flush error: {e}")
+            for key, values in deltas.items():
+                totals = self._service_deltas[key]
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+    # ==================== 查询 ====================
+
+    async def load_daily_report(self, report_date: date) -> Dict[str, Any]:
+        """usage_daily 里某天的汇总（所有 worker；本进程尚未 flush 的部分不含）"""
+        async with self._sessions()() as session:
+            rows = (await session.execute(
+                select(UsageDaily).where(UsageDaily.date == report_date)
+            )).scalars().all()
+        by_service = {
+            row.service: {
+                "input_tokens": row.input_tokens,
+                "output_tokens": row.output_tokens,
+                "cost": round(row.cost, 4),
+                "requests": row.requests,
+            }
+            for row in rows
+        }
+        total_input = sum(s["input_tokens"] for s in by_service.values())
+        total_output = sum(s["output_tokens"] for s in by_service.values())
+        return {
+            "date": report_date.isoformat(),
+            "total_cost": round(sum(row.cost for row in rows), 4),
+            "total_input_tokens": total_input,
+            "total_output_tokens": total_output,
+            "total_tokens": total_input + total_output,
+            "request_count": sum(s["requests"] for s in by_service.values()),
+            "by_service": by_service,
+        }
+
+    # ==================== 生命周期 ====================
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Usage store flush error: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        """停止后台任务并做最后一次 flush"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.wait([self._task])
+        self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "active_players": len(self._active),
+            "pending_players": len(self._quota_deltas),
+            "pending_services": len(self._service_deltas),
+            "last_flush_ago_s": round(time.monotonic() - self._last_flush, 2) if self._last_flush else None,
+        }
+
+
+def create_usage_store() -> UsageStore:
+    """用全局缓存后端构建；绕过进程内近端缓存，否则读回的是本进程的旧值"""
+    backend = get_cache()
+    if isinstance(backend, NearCache):
+        backend = backend.remote
+    return UsageStore(backend)
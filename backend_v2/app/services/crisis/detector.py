@@ -1,6 +1,8 @@
 """
 MindPal Backend V2 - Crisis Detector
 危机检测器 - 识别心理危机信号
+
+三档关键词的匹配由 services/lexicon.py 的 LexiconScanner 一次扫描完成。
 """
 
 import re
@@ -91,45 +93,50 @@ class CrisisDetector:
             for pattern, level in self.CRISIS_PATTERNS
         ]
 
-    def detect(self, text: str, context: Optional[List[str]] = None) -> CrisisResult:
+    @staticmethod
+    def _scan(text: str):
+        # 延迟导入：lexicon 依赖本模块的词表
+        from app.services.lexicon import get_lexicon_scanner
+        return get_lexicon_scanner().scan(text)
+
+    def detect(self, text: str, context: Optional[List[str]] = None, scan=None) -> CrisisResult:
         """
         检测文本中的危机信号
 
         Args:
             text: 用户输入文本
             context: 最近的对话上下文（用于上下文分析）
+            scan: 同一条消息的 LexiconScan（对话链路已扫描过时传入，避免重复扫描）
 
         Returns:
             CrisisResult: 危机检测结果
         """
-        text_lower = text.lower()
+        if scan is None:
+            scan = self._scan(text)
         triggers: List[str] = []
         max_level = CrisisLevel.NONE
         score = 0.0
 
         # 1. 高风险关键词检测
-        for keyword in self.HIGH_RISK_KEYWORDS:
-            if keyword in text_lower:
-                triggers.append(f"[高风险] {keyword}")
-                max_level = CrisisLevel.HIGH
-                score += 0.4
+        for keyword in scan.crisis["high"]:
+            triggers.append(f"[高风险] {keyword}")
+            max_level = CrisisLevel.HIGH
+            score += 0.4
 
         # 2. 中风险关键词检测
         if max_level != CrisisLevel.HIGH:
-            for keyword in self.MEDIUM_RISK_KEYWORDS:
-                if keyword in text_lower:
-                    triggers.append(f"[中风险] {keyword}")
-                    if max_level.value < CrisisLevel.MEDIUM.value:
-                        max_level = CrisisLevel.MEDIUM
-                    score += 0.2
+            for keyword in scan.crisis["medium"]:
+                triggers.append(f"[中风险] {keyword}")
+                if max_level.value < CrisisLevel.MEDIUM.value:
+                    max_level = CrisisLevel.MEDIUM
+                score += 0.2
 
         # 3. 低风险关键词检测
         if max_level == CrisisLevel.NONE:
-            for keyword in self.LOW_RISK_KEYWORDS:
-                if keyword in text_lower:
-                    triggers.append(f"[关注] {keyword}")
-                    max_level = CrisisLevel.LOW
-                    score += 0.1
+            for keyword in scan.crisis["low"]:
+                triggers.append(f"[关注] {keyword}")
+                max_level = CrisisLevel.LOW
+                score += 0.1
 
         # 4. 模式匹配
         for pattern, level in self._compiled_patterns:
@@ -172,13 +179,8 @@ class CrisisDetector:
         risk_score = 0.0
 
         # 检查上下文中的关键词密度
-        all_keywords = (
-            self.HIGH_RISK_KEYWORDS +
-            self.MEDIUM_RISK_KEYWORDS +
-            self.LOW_RISK_KEYWORDS
-        )
-
-        matched_count = sum(1 for kw in all_keywords if kw in context_text)
+        scan = self._scan(context_text)
+        matched_count = sum(len(scan.crisis[tier]) for tier in ("high", "medium", "low"))
         if matched_count > 0:
             risk_score = min(matched_count * 0.1, 0.8)
 
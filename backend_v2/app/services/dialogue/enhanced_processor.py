@@ -3,14 +3,30 @@ MindPal Backend V2 - Enhanced Dialogue Processor
 集成情感分析、危机干预、记忆检索的增强对话处理器
 """
 
-from typing import Optional, Dict, Any, List, AsyncGenerator
-from dataclasses import dataclass
+import asyncio
+import os
+import time
+from typing import Optional, Dict, Any, List, AsyncGenerator, Awaitable, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
 
 from app.services.emotion import get_emotion_analyzer, EmotionResult
 from app.services.crisis import get_crisis_detector, get_crisis_handler, CrisisResult
 from app.services.memory import get_memory_retriever, ConversationMemory
-from app.services.ai import get_llm_router, get_cost_tracker
+from app.services.ai import get_llm_router, get_cost_tracker, admission_priority
+from app.services.lexicon import get_lexicon_scanner
+
+
+# 各预处理阶段的超时（秒）。记忆检索（embedding + 向量检索）超时直接降级为无记忆；
+# 玩家档案走请求自身的 DB session，中途取消会破坏 session 状态，因此不设超时，只在出错时降级。
+STAGE_TIMEOUTS: Dict[str, Optional[float]] = {
+    "memory": float(os.getenv("DIALOGUE_MEMORY_TIMEOUT_MS", "800")) / 1000,
+    "profile": None,
+}
+
+# prefetch_memories 的任务多久没被 process_message 认领就作废（取消并丢弃），以及最多保留多少个
+MEMORY_PREFETCH_TTL_SECONDS = 10.0
+MEMORY_PREFETCH_MAX = 256
 
 
 @dataclass
@@ -40,6 +56,13 @@ class DialogueContext:
     selected_model: str = ""
     is_crisis_mode: bool = False
 
+    # 流水线观测：各阶段耗时（毫秒）与降级记录（"memory:timeout" 等）
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    degraded_stages: List[str] = field(default_factory=list)
+
+    # 上下文构建路径：full / speculative_with_memory / speculative_without_memory
+    context_path: str = "full"
+
 
 class EnhancedDialogueProcessor:
     """增强型对话处理器"""
@@ -59,6 +82,94 @@ class EnhancedDialogueProcessor:
             self.crisis_handler = None
             self.memory_manager = None
 
+        # prefetch_memories 提前启动的检索任务：(player_id, npc_id, message) → (task, 耗时记录, 启动时刻)
+        self._memory_prefetch: Dict[Tuple[int, str, str], Tuple[asyncio.Task, Dict[str, float], float]] = {}
+
+    def prefetch_memories(self, player_id: int, npc_id: str, message: str):
+        """提前启动记忆检索（只依赖消息文本），与调用方后续的 DB 查询重叠执行
+
+        process_message 收到相同 (player_id, npc_id, message) 时直接复用该任务。
+        调用方应在拒绝类检查（审核、配额等）之后再调用；没被认领的任务
+        MEMORY_PREFETCH_TTL_SECONDS 后作废，总数不超过 MEMORY_PREFETCH_MAX。
+        """
+        self._expire_prefetch()
+        key = (player_id, npc_id, message)
+        if key not in self._memory_prefetch:
+            while len(self._memory_prefetch) >= MEMORY_PREFETCH_MAX:
+                self._drop_prefetch(next(iter(self._memory_prefetch)))
+            timings: Dict[str, float] = {}
+            task = asyncio.ensure_future(
+                self._timed("memory", self._retrieve_memories(player_id, npc_id, message), timings)
+            )
+            self._memory_prefetch[key] = (task, timings, time.monotonic())
+
+    def _drop_prefetch(self, key: Tuple[int, str, str]):
+        entry = self._memory_prefetch.pop(key, None)
+        if entry is not None and not entry[0].done():
+            entry[0].cancel()
+
+    def _expire_prefetch(self):
+        deadline = time.monotonic() - MEMORY_PREFETCH_TTL_SECONDS
+        # 按插入顺序即启动顺序，遇到未过期的就停
+        for key, (_, _, started) in list(self._memory_prefetch.items()):
+            if started > deadline:
+                break
+            self._drop_prefetch(key)
+
+    @staticmethod
+    async def _timed(name: str, awaitable: Awaitable, timings: Dict[str, float]):
+        """记录阶段自身的执行耗时（与何时被 await 无关）"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    async def _run_stage(
+        self,
+        context: DialogueContext,
+        name: str,
+        awaitable: Awaitable,
+        default: Any,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """执行一个可降级阶段：超时或异常时返回 default 并记入 degraded_stages"""
+        timeout = timeout if timeout is not None else STAGE_TIMEOUTS.get(name)
+        try:
+            if timeout:
+                return await asyncio.wait_for(awaitable, timeout)
+            return await awaitable
+        except asyncio.TimeoutError:
+            context.degraded_stages.append(f"{name}:timeout")
+        except Exception:
+            context.degraded_stages.append(f"{name}:error")
+        return default
+
+    async def _retrieve_memories(self, player_id: int, npc_id: str, message: str) -> List[Dict]:
+        memories = await self.memory_retriever.retrieve_relevant(
+            player_id=player_id,
+            npc_id=npc_id,
+            query=message,
+            limit=5
+        )
+        return [
+            {
+                "summary": mem.summary,
+                "emotion": mem.emotion,
+                "relevance": mem.relevance_score
+            }
+            for mem in memories
+        ]
+
+    async def _load_profile(self, player_id: int) -> Dict:
+        profile = await self.memory_manager.get_player_profile(player_id)
+        return {
+            "nickname": profile.nickname,
+            "interests": profile.interests,
+            "communication_style": profile.communication_style,
+            "recent_topics": profile.recent_topics
+        }
+
     async def process_message(
         self,
         player_id: int,
@@ -68,11 +179,19 @@ class EnhancedDialogueProcessor:
         player_name: str = "玩家",
         affinity_value: int = 0,
         base_system_prompt: str = "",
-        history_messages: List[Dict] = None
+        history_messages: List[Dict] = None,
+        memory_budget_ms: Optional[float] = None,
+        scan=None
     ) -> DialogueContext:
         """
         处理用户消息，执行完整的预处理流程
 
+        Args:
+            memory_budget_ms: 投机模式下记忆检索的等待预算。检索在预算内完成才注入记忆，
+                否则不带记忆继续（不阻塞 LLM 首包）。None 表示按 STAGE_TIMEOUTS 完整等待；
+                危机模式始终完整等待。
+            scan: 消息的 LexiconScan（接口层审核时已扫描），None 时在这里扫描一次
+
         Returns:
             DialogueContext: 包含所有分析结果的上下文对象
         """
@@ -87,14 +206,36 @@ class EnhancedDialogueProcessor:
             recent_messages=history_messages or []
         )
 
-        # 1. 情感分析
-        context.emotion_result = self.emotion_analyzer.analyze(message)
+        # 记忆检索、玩家档案不依赖情感/危机结果，先启动（与下面的同步分析重叠）
+        timings = context.stage_timings
+        self._expire_prefetch()  # 过期的不复用（检索结果可能已过时）
+        prefetched = self._memory_prefetch.pop((player_id, npc_id, message), None)
+        if prefetched:
+            memory_task, prefetch_timings, _ = prefetched
+        else:
+            prefetch_timings = timings
+            memory_task = asyncio.ensure_future(
+                self._timed("memory", self._retrieve_memories(player_id, npc_id, message), timings)
+            )
+        profile_task = None
+        if self.memory_manager:
+            profile_task = asyncio.ensure_future(
+                self._timed("profile", self._load_profile(player_id), timings)
+            )
+
+        # 1. 情感分析（与危机检测共用一次关键词扫描）
+        start = time.perf_counter()
+        if scan is None:
+            scan = get_lexicon_scanner().scan(message)
+        context.emotion_result = self.emotion_analyzer.analyze(message, scan=scan)
 
         # 2. 危机检测
         context.crisis_result = self.crisis_detector.detect(
             message,
-            context=[msg.get("content", "") for msg in (history_messages or [])[-5:]]
+            context=[msg.get("content", "") for msg in (history_messages or [])[-5:]],
+            scan=scan
         )
+        timings["analysis"] = round((time.perf_counter() - start) * 1000, 2)
 
         # 3. 判断是否进入危机模式
         context.is_crisis_mode = (
@@ -102,37 +243,21 @@ class EnhancedDialogueProcessor:
             context.emotion_result.crisis_risk
         )
 
-        # 4. 检索相关记忆
-        try:
-            memories = await self.memory_retriever.retrieve_relevant(
-                player_id=player_id,
-                npc_id=npc_id,
-                query=message,
-                limit=5
-            )
-            context.relevant_memories = [
-                {
-                    "summary": mem.summary,
-                    "emotion": mem.emotion,
-                    "relevance": mem.relevance_score
-                }
-                for mem in memories
-            ]
-        except Exception:
-            context.relevant_memories = []
-
-        # 5. 获取玩家档案
-        if self.memory_manager:
-            try:
-                profile = await self.memory_manager.get_player_profile(player_id)
-                context.player_profile = {
-                    "nickname": profile.nickname,
-                    "interests": profile.interests,
-                    "communication_style": profile.communication_style,
-                    "recent_topics": profile.recent_topics
-                }
-            except Exception:
-                context.player_profile = {}
+        # 4-5. 并发等待记忆检索与玩家档案，各自超时/出错时降级
+        speculative = memory_budget_ms is not None and not context.is_crisis_mode
+        memory_timeout = memory_budget_ms / 1000 if speculative else None
+        stages = [self._run_stage(context, "memory", memory_task, [], memory_timeout)]
+        if profile_task is not None:
+            stages.append(self._run_stage(context, "profile", profile_task, {}))
+        results = await asyncio.gather(*stages)
+        context.relevant_memories = results[0]
+        if profile_task is not None:
+            context.player_profile = results[1]
+        if "memory" in prefetch_timings:
+            timings["memory"] = prefetch_timings["memory"]
+        if speculative:
+            memory_ready = not any(d.startswith("memory:") for d in context.degraded_stages)
+            context.context_path = "speculative_with_memory" if memory_ready else "speculative_without_memory"
 
         # 6. 选择最佳模型
         model_name, model_config = self.llm_router.select_model(
@@ -243,14 +368,28 @@ class EnhancedDialogueProcessor:
         except Exception:
             return None
 
+    def reserve_usage(
+        self,
+        context: DialogueContext,
+        estimated_tokens: int
+    ) -> str:
+        """调用 LLM 前按估算预留配额，返回 reservation_id（交给 record_usage 结算）"""
+        return self.cost_tracker.reserve(context.player_id, estimated_tokens)
+
+    def release_usage(self, reservation_id: Optional[str]):
+        """调用失败时释放预留，不计费"""
+        self.cost_tracker.release(reservation_id)
+
     def record_usage(
         self,
         context: DialogueContext,
         input_tokens: int,
-        output_tokens: int
+        output_tokens: int,
+        reservation_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """记录使用量"""
-        return self.cost_tracker.record_usage(
+        """记录使用量（有预留时一并释放）"""
+        return self.cost_tracker.settle(
+            reservation_id,
             player_id=context.player_id,
             service=context.selected_model,
             input_tokens=input_tokens,
@@ -282,7 +421,11 @@ class EnhancedDialogueProcessor:
             messages=messages,
             system_prompt=context.enhanced_system_prompt,
             is_crisis=context.is_crisis_mode,
-            max_retries=3
+            max_retries=3,
+            priority=admission_priority(
+                context.is_crisis_mode,
+                self.cost_tracker.get_membership_type(context.player_id)
+            )
         ):
             yield chunk
 
@@ -303,7 +446,12 @@ class EnhancedDialogueProcessor:
                 "intervention_needed": context.crisis_result.needs_intervention if context.crisis_result else False
             },
             "model": context.selected_model,
-            "memories_used": len(context.relevant_memories) if context.relevant_memories else 0
+            "memories_used": len(context.relevant_memories) if context.relevant_memories else 0,
+            "pipeline": {
+                "path": context.context_path,
+                "stage_ms": dict(context.stage_timings),
+                "degraded": list(context.degraded_stages),
+            }
         }
 
 
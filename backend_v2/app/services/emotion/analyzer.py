@@ -1,6 +1,9 @@
 """
 MindPal Backend V2 - Emotion Analyzer
 情感分析器 - 关键词检测 + LLM增强分析
+
+关键词 / 修饰词 / 危机词的匹配由 services/lexicon.py 的 LexiconScanner 一次扫描完成，
+这里只根据命中位置计分。
 """
 
 import re
@@ -92,16 +95,25 @@ class EmotionAnalyzer:
         """
         self.enable_llm = enable_llm
 
-    def analyze(self, text: str) -> EmotionResult:
-        """分析文本情感"""
+    def analyze(self, text: str, scan=None) -> EmotionResult:
+        """分析文本情感
+
+        Args:
+            scan: 同一条消息的 LexiconScan（对话链路已扫描过时传入，避免重复扫描）
+        """
+        if scan is None:
+            # 延迟导入：lexicon 依赖本模块的词表
+            from app.services.lexicon import get_lexicon_scanner
+            scan = get_lexicon_scanner().scan(text)
+
         # 1. 关键词检测
-        scores, matched_keywords = self._keyword_detection(text)
+        scores, matched_keywords = self._keyword_detection(scan)
 
         # 2. 计算强度
-        intensity = self._calculate_intensity(text, scores)
+        intensity = self._calculate_intensity(text, scores, scan)
 
         # 3. 危机检测
-        crisis_risk = self._detect_crisis(text)
+        crisis_risk = scan.emotion_crisis
 
         # 4. 确定主导情感
         dominant = self._get_dominant_emotion(scores)
@@ -126,30 +138,24 @@ class EmotionAnalyzer:
             keywords_matched=matched_keywords
         )
 
-    def _keyword_detection(self, text: str) -> Tuple[Dict[EmotionType, float], List[str]]:
-        """关键词检测"""
-        text_lower = text.lower()
+    def _keyword_detection(self, scan) -> Tuple[Dict[EmotionType, float], List[str]]:
+        """关键词检测（命中与位置来自 LexiconScan）"""
         scores: Dict[EmotionType, float] = {e: 0.0 for e in EmotionType}
         matched_keywords: List[str] = []
 
-        for emotion, keywords in self.EMOTION_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    # 基础分数
-                    base_score = 0.3
-
-                    # 检查强度修饰词
-                    for modifier, multiplier in self.INTENSITY_MODIFIERS.items():
-                        if modifier in text_lower:
-                            keyword_idx = text_lower.find(keyword.lower())
-                            modifier_idx = text_lower.find(modifier)
-                            # 修饰词在关键词前10个字符内
-                            if 0 <= keyword_idx - modifier_idx <= 10:
-                                base_score *= multiplier
-                                break
-
-                    scores[emotion] += base_score
-                    matched_keywords.append(keyword)
+        for emotion, keyword, keyword_idx in scan.emotion_hits:
+            # 基础分数
+            base_score = 0.3
+
+            # 检查强度修饰词（首次出现位置）
+            for modifier, multiplier, modifier_idx in scan.modifiers:
+                # 修饰词在关键词前10个字符内
+                if 0 <= keyword_idx - modifier_idx <= 10:
+                    base_score *= multiplier
+                    break
+
+            scores[emotion] += base_score
+            matched_keywords.append(keyword)
 
         # 归一化
         total = sum(scores.values())
@@ -163,7 +169,8 @@ class EmotionAnalyzer:
     def _calculate_intensity(
         self,
         text: str,
-        scores: Dict[EmotionType, float]
+        scores: Dict[EmotionType, float],
+        scan,
     ) -> float:
         """计算情感强度"""
         # 基础强度：最高情感分数
@@ -171,9 +178,8 @@ class EmotionAnalyzer:
 
         # 修饰词加成
         intensity_boost = 0.0
-        for modifier, multiplier in self.INTENSITY_MODIFIERS.items():
-            if modifier in text:
-                intensity_boost = max(intensity_boost, multiplier - 1.0)
+        for _, multiplier, _ in scan.modifiers:
+            intensity_boost = max(intensity_boost, multiplier - 1.0)
 
         # 标点符号加成
         exclamation_count = text.count("!") + text.count("！")
@@ -201,14 +207,6 @@ class EmotionAnalyzer:
 
         return min(base_intensity + intensity_boost, 1.0)
 
-    def _detect_crisis(self, text: str) -> bool:
-        """检测危机关键词"""
-        text_lower = text.lower()
-        for keyword in self.CRISIS_KEYWORDS:
-            if keyword in text_lower:
-                return True
-        return False
-
     def _get_dominant_emotion(
         self,
         scores: Dict[EmotionType, float]
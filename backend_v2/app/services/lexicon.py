@@ -0,0 +1,128 @@
+"""
+MindPal Backend V2 - Lexicon Scanner
+统一关键词扫描 - 情感 / 危机 / 内容审核共用一次扫描
+
+一轮对话里同一条用户消息原本要被逐词扫描四遍：
+EmotionAnalyzer 的情感词（每个命中再套一层修饰词循环）、EmotionAnalyzer 的危机词、
+CrisisDetector 的三档危机词、LocalFilter 的审核词。
+
+LexiconScanner 把情感词、强度修饰词、两套危机词作为辅助词编进 LocalFilter 的
+Aho-Corasick 自动机（同一个自动机，不额外占内存），消息小写后扫描一次，得到:
+  - 各情感词及其首次出现位置（按词表顺序）
+  - 各修饰词的首次出现位置
+  - 危机词（EmotionAnalyzer 口径）是否命中、CrisisDetector 三档命中
+  - 审核词命中（FilterHit，与 LocalFilter.check 一致）
+
+调用方（对话接口）扫描一次，把 LexiconScan 传给 Moderator.check / process_message；
+EmotionAnalyzer.analyze / CrisisDetector.detect 不传时自己扫描，结果与逐词实现一致。
+正则类规则（危机模式、联系方式、注入）仍由各自模块执行。
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.services.crisis.detector import CrisisDetector
+from app.services.emotion.analyzer import EmotionAnalyzer, EmotionType
+from app.services.moderation.filters import FilterHit, LocalFilter, get_local_filter
+
+
+CRISIS_TIERS: Tuple[str, ...] = ("high", "medium", "low")
+
+
+@dataclass(slots=True)
+class LexiconScan:
+    """一条消息的扫描结果"""
+    text: str
+    # (情感, 关键词, 首次位置)，按 EMOTION_KEYWORDS 的顺序
+    emotion_hits: List[Tuple[EmotionType, str, int]] = field(default_factory=list)
+    # (修饰词, 倍数, 首次位置)，按 INTENSITY_MODIFIERS 的顺序
+    modifiers: List[Tuple[str, float, int]] = field(default_factory=list)
+    # EmotionAnalyzer.CRISIS_KEYWORDS 是否命中
+    emotion_crisis: bool = False
+    # CrisisDetector 各档命中的关键词（按各档词表顺序）
+    crisis: Dict[str, List[str]] = field(default_factory=lambda: {tier: [] for tier in CRISIS_TIERS})
+    # 审核词命中，及扫描时的审核词库版本（词库重载后旧命中不再复用）
+    moderation_hits: List[FilterHit] = field(default_factory=list)
+    version: str = ""
+
+
+class LexiconScanner:
+    """情感 / 危机 / 审核词的一次扫描"""
+
+    def __init__(self, local_filter: Optional[LocalFilter] = None):
+        self._local = local_filter or get_local_filter()
+
+        # 小写词 → 标签列表。标签: ("emotion", 序号, 情感, 原词) / ("modifier", 序号, 修饰词, 倍数)
+        #                           / ("emotion_crisis",) / ("crisis", 档位, 序号, 原词)
+        tags: Dict[str, List[tuple]] = {}
+        order = 0
+        for emotion, keywords in EmotionAnalyzer.EMOTION_KEYWORDS.items():
+            for keyword in keywords:
+                tags.setdefault(keyword.lower(), []).append(("emotion", order, emotion, keyword))
+                order += 1
+        for i, (modifier, multiplier) in enumerate(EmotionAnalyzer.INTENSITY_MODIFIERS.items()):
+            tags.setdefault(modifier.lower(), []).append(("modifier", i, modifier, multiplier))
+        for keyword in EmotionAnalyzer.CRISIS_KEYWORDS:
+            tags.setdefault(keyword.lower(), []).append(("emotion_crisis",))
+        tier_lists = (
+            CrisisDetector.HIGH_RISK_KEYWORDS,
+            CrisisDetector.MEDIUM_RISK_KEYWORDS,
+            CrisisDetector.LOW_RISK_KEYWORDS,
+        )
+        for tier, keywords in zip(CRISIS_TIERS, tier_lists):
+            for i, keyword in enumerate(keywords):
+                tags.setdefault(keyword.lower(), []).append(("crisis", tier, i, keyword))
+
+        self._local.add_lexicon(tags)
+        self._word_tags = tags
+        self._bind()
+
+    def _bind(self):
+        """固定住 LocalFilter 当前的编译结果（词库重载后关键词 id 会变，需重新绑定）"""
+        self._snapshot = self._local.snapshot()
+        self._tags: Dict[int, List[tuple]] = {self._snapshot.index[word]: t for word, t in self._word_tags.items()}
+
+    def scan(self, text: str) -> LexiconScan:
+        """扫描一条消息"""
+        if self._local.snapshot() is not self._snapshot:
+            self._bind()
+        snapshot = self._snapshot
+        result = LexiconScan(text=text, version=snapshot.version)
+        if not text:
+            return result
+
+        matches, _ = snapshot.automaton.scan(text.lower())
+        first: Dict[int, int] = {}
+        for start, _, kid in matches:
+            first.setdefault(kid, start)
+
+        emotion_hits, modifiers = [], []
+        crisis: Dict[str, List[Tuple[int, str]]] = {tier: [] for tier in CRISIS_TIERS}
+        for kid, pos in first.items():
+            for tag in self._tags.get(kid, ()):
+                kind = tag[0]
+                if kind == "emotion":
+                    emotion_hits.append((tag[1], tag[2], tag[3], pos))
+                elif kind == "modifier":
+                    modifiers.append((tag[1], tag[2], tag[3], pos))
+                elif kind == "emotion_crisis":
+                    result.emotion_crisis = True
+                else:
+                    crisis[tag[1]].append((tag[2], tag[3]))
+
+        result.emotion_hits = [(emotion, keyword, pos) for _, emotion, keyword, pos in sorted(emotion_hits, key=lambda h: h[0])]
+        result.modifiers = [(modifier, multiplier, pos) for _, modifier, multiplier, pos in sorted(modifiers, key=lambda m: m[0])]
+        result.crisis = {tier: [keyword for _, keyword in sorted(hits)] for tier, hits in crisis.items()}
+        result.moderation_hits = snapshot.word_hits(text, matches)
+        return result
+
+
+_scanner: Optional[LexiconScanner] = None
+
+
+def get_lexicon_scanner() -> LexiconScanner:
+    """获取全局扫描器（与全局 LocalFilter 共用自动机）"""
+    global _scanner
+    if _scanner is None:
+        _scanner = LexiconScanner()
+    return _scanner
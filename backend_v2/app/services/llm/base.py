@@ -9,6 +9,9 @@ from typing import AsyncGenerator, Dict, List, Optional, Any
 class BaseLLMService(ABC):
     """LLM服务抽象基类"""
 
+    # 服务商标识（token 估算按它选系数）
+    provider: str = "default"
+
     @abstractmethod
     async def chat(
         self,
@@ -26,6 +29,7 @@ class BaseLLMService(ABC):
             system_prompt: 系统提示词
             temperature: 温度参数
             max_tokens: 最大token数
+            usage: 可选的 TokenUsage，填入上游报告的用量（通过 kwargs 传入）
 
         Returns:
             AI回复文本
@@ -3,20 +3,24 @@ MindPal Backend V2 - Claude LLM Service
 """
 
 from typing import AsyncGenerator, Dict, List, Optional
-import httpx
 import json
 
 from app.services.llm.base import BaseLLMService
+from app.services.llm.tokenizer import TokenUsage
 from app.config import settings
+from app.core.http_pool import get_http_pool
 
 
 class ClaudeService(BaseLLMService):
     """Anthropic Claude服务 - 专门用于情感对话"""
 
+    provider = "claude"
+    API_URL = "https://api.anthropic.com/v1/messages"
+
     def __init__(self):
         self.api_key = settings.ANTHROPIC_API_KEY
         self.model = settings.CLAUDE_MODEL
-        self.base_url = "https://api.anthropic.com/v1/messages"
+        self.base_url = self.API_URL
         self.version = "2023-06-01"
 
     def _build_messages(
@@ -42,9 +46,10 @@ class ClaudeService(BaseLLMService):
         system_prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        usage: Optional[TokenUsage] = None,
         **kwargs
     ) -> str:
-        """同步对话"""
+        """同步对话（usage: 可选的用量收集器，填入上游报告的 token 数）"""
         if not self.api_key:
             return "[错误] 未配置ANTHROPIC_API_KEY"
 
@@ -63,22 +68,25 @@ class ClaudeService(BaseLLMService):
             "messages": claude_messages,
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                self.base_url,
-                headers=headers,
-                json=payload
-            )
+        client = get_http_pool().client(self.base_url)
+        response = await client.post(
+            self.base_url,
+            headers=headers,
+            json=payload,
+            timeout=60.0,
+        )
 
-            if response.status_code != 200:
-                return f"[错误] API请求失败: {response.status_code} - {response.text}"
+        if response.status_code != 200:
+            return f"[错误] API请求失败: {response.status_code} - {response.text}"
 
-            result = response.json()
+        result = response.json()
+        if usage is not None:
+            usage.update(result.get("usage"))
 
-            if "content" in result and len(result["content"]) > 0:
-                return result["content"][0]["text"]
-            else:
-                return f"[错误] 无法解析响应: {result}"
+        if "content" in result and len(result["content"]) > 0:
+            return result["content"][0]["text"]
+        else:
+            return f"[错误] 无法解析响应: {result}"
 
     async def chat_stream(
         self,
@@ -86,9 +94,10 @@ class ClaudeService(BaseLLMService):
         system_prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        usage: Optional[TokenUsage] = None,
         **kwargs
     ) -> AsyncGenerator[str, None]:
-        """流式对话"""
+        """流式对话（usage: 可选的用量收集器，流结束时填入上游报告的 token 数）"""
         if not self.api_key:
             yield "[错误] 未配置ANTHROPIC_API_KEY"
             return
@@ -109,28 +118,39 @@ class ClaudeService(BaseLLMService):
             "stream": True,
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream(
-                "POST",
-                self.base_url,
-                headers=headers,
-                json=payload
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data:"):
-                        data = line[5:].strip()
-                        if data == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data)
-                            if chunk.get("type") == "content_block_delta":
-                                delta = chunk.get("delta", {})
-                                if delta.get("type") == "text_delta":
-                                    text = delta.get("text", "")
-                                    if text:
-                                        yield text
-                        except json.JSONDecodeError:
-                            continue
+        client = get_http_pool().client(self.base_url)
+        async with client.stream(
+            "POST",
+            self.base_url,
+            headers=headers,
+            json=payload,
+            timeout=120.0,
+        ) as response:
+            if response.status_code != 200:
+                # 429 / 5xx 必须抛出：路由器据此限流暂停、降级和计入熔断，不能当成空回复
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                        if usage is not None:
+                            # message_start 带 input_tokens，message_delta 带累计 output_tokens
+                            if chunk.get("type") == "message_start":
+                                usage.update(chunk.get("message", {}).get("usage"))
+                            elif chunk.get("type") == "message_delta":
+                                usage.update(chunk.get("usage"))
+                        if chunk.get("type") == "content_block_delta":
+                            delta = chunk.get("delta", {})
+                            if delta.get("type") == "text_delta":
+                                text = delta.get("text", "")
+                                if text:
+                                    yield text
+                    except json.JSONDecodeError:
+                        continue
 
     async def analyze_emotion(self, text: str) -> Dict[str, float]:
         """情感分析 - Claude擅长的领域"""
@@ -3,20 +3,24 @@ MindPal Backend V2 - Qwen (通义千问) LLM Service
 """
 
 from typing import AsyncGenerator, Dict, List, Optional
-import httpx
 import json
 
 from app.services.llm.base import BaseLLMService
+from app.services.llm.tokenizer import TokenUsage
 from app.config import settings
+from app.core.http_pool import get_http_pool
 
 
 class QwenService(BaseLLMService):
     """阿里云通义千问服务"""
 
+    provider = "qwen"
+    API_URL = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+
     def __init__(self):
         self.api_key = settings.DASHSCOPE_API_KEY
         self.model = settings.QWEN_MODEL
-        self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
+        self.base_url = self.API_URL
 
     def _build_messages(
         self,
@@ -34,9 +38,10 @@ class QwenService(BaseLLMService):
         system_prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        usage: Optional[TokenUsage] = None,
         **kwargs
     ) -> str:
-        """同步对话"""
+        """同步对话（usage: 可选的用量收集器，填入上游报告的 token 数）"""
         if not self.api_key:
             return "[错误] 未配置DASHSCOPE_API_KEY"
 
@@ -59,24 +64,27 @@ class QwenService(BaseLLMService):
             }
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                self.base_url,
-                headers=headers,
-                json=payload
-            )
+        client = get_http_pool().client(self.base_url)
+        response = await client.post(
+            self.base_url,
+            headers=headers,
+            json=payload,
+            timeout=60.0,
+        )
 
-            if response.status_code != 200:
-                return f"[错误] API请求失败: {response.status_code}"
+        if response.status_code != 200:
+            return f"[错误] API请求失败: {response.status_code}"
 
-            result = response.json()
+        result = response.json()
+        if usage is not None:
+            usage.update(result.get("usage"))
 
-            if "output" in result and "choices" in result["output"]:
-                return result["output"]["choices"][0]["message"]["content"]
-            elif "output" in result and "text" in result["output"]:
-                return result["output"]["text"]
-            else:
-                return f"[错误] 无法解析响应: {result}"
+        if "output" in result and "choices" in result["output"]:
+            return result["output"]["choices"][0]["message"]["content"]
+        elif "output" in result and "text" in result["output"]:
+            return result["output"]["text"]
+        else:
+            return f"[错误] 无法解析响应: {result}"
 
     async def chat_stream(
         self,
@@ -84,9 +92,10 @@ class QwenService(BaseLLMService):
         system_prompt: str,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        usage: Optional[TokenUsage] = None,
         **kwargs
     ) -> AsyncGenerator[str, None]:
-        """流式对话"""
+        """流式对话（usage: 可选的用量收集器，流结束时填入上游报告的 token 数）"""
         if not self.api_key:
             yield "[错误] 未配置DASHSCOPE_API_KEY"
             return
@@ -112,29 +121,37 @@ class QwenService(BaseLLMService):
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            async with client.stream(
-                "POST",
-                self.base_url,
-                headers=headers,
-                json=payload
-            ) as response:
-                async for line in response.aiter_lines():
-                    if line.startswith("data:"):
-                        data = line[5:].strip()
-                        if data == "[DONE]":
-                            break
-                        try:
-                            chunk = json.loads(data)
-                            if "output" in chunk:
-                                if "choices" in chunk["output"]:
-                                    content = chunk["output"]["choices"][0]["message"].get("content", "")
-                                    if content:
-                                        yield content
-                                elif "text" in chunk["output"]:
-                                    yield chunk["output"]["text"]
-                        except json.JSONDecodeError:
-                            continue
+        client = get_http_pool().client(self.base_url)
+        async with client.stream(
+            "POST",
+            self.base_url,
+            headers=headers,
+            json=payload,
+            timeout=120.0,
+        ) as response:
+            if response.status_code != 200:
+                # 429 / 5xx 必须抛出：路由器据此限流暂停、降级和计入熔断，不能当成空回复
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                        if usage is not None:
+                            # 每个包都带累计 usage，最后一个即总量
+                            usage.update(chunk.get("usage"))
+                        if "output" in chunk:
+                            if "choices" in chunk["output"]:
+                                content = chunk["output"]["choices"][0]["message"].get("content", "")
+                                if content:
+                                    yield content
+                            elif "text" in chunk["output"]:
+                                yield chunk["output"]["text"]
+                    except json.JSONDecodeError:
+                        continue
 
     async def analyze_emotion(self, text: str) -> Dict[str, float]:
         """情感分析"""
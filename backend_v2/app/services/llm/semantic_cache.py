@@ -0,0 +1,229 @@
+"""
+MindPal Backend V2 - Semantic LLM Response Cache
+
+llm_cache_key 是对 model + system_prompt + messages + temperature 的精确哈希，
+"今天好累啊" 和 "今天好累" 永远命中不了同一条。这里在精确缓存之后再加一层（可选）
+语义缓存：
+
+- 指纹 = sha256(model + system_prompt + 历史消息 + temperature)，即除最后一条用户消息外
+  精确 key 的全部输入；只在指纹相同的条目之间比较（同一人设、同一上下文）
+- 最后一条用户消息用 EmbeddingService 向量化，在同指纹的条目里做最近邻检索
+  （每个指纹一小块归一化的 float32 矩阵，一次 matmul），余弦相似度 ≥ 阈值即返回该条目缓存的回复
+- 进程内存储：条数上限 + TTL，超出时淘汰最早写入的
+- 向量化有时间预算（远端 embedding 慢时直接当未命中，不拖慢首包）
+
+是否可以缓存仍由 should_skip_cache 决定（危机模式 / 高温 / 过短过长），调用方先判断。
+阈值的取舍（命中率 vs 答非所问）用 scripts/bench_semantic_cache.py 离线回放评估。
+
+## 配置
+
+    LLM_SEMANTIC_CACHE_ENABLED=false
+    LLM_SEMANTIC_CACHE_THRESHOLD=0.92
+    LLM_SEMANTIC_CACHE_MAX_ITEMS=10000
+    LLM_SEMANTIC_CACHE_TTL_SECONDS=86400
+    LLM_SEMANTIC_CACHE_TIMEOUT_MS=200
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.cache import DEFAULT_TTL_SECONDS
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ITEMS", "10000"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("LLM_SEMANTIC_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+SEMANTIC_CACHE_TIMEOUT_MS = float(os.getenv("LLM_SEMANTIC_CACHE_TIMEOUT_MS", "200"))
+
+
+def prompt_fingerprint(
+    model: str,
+    history: List[Dict[str, str]],
+    system_prompt: str,
+    temperature: float,
+) -> str:
+    """语义缓存的分区指纹（与 llm_cache_key 同样的规范化，只是不含最后一条用户消息）"""
+    payload = {
+        "m": model,
+        "sp": system_prompt or "",
+        "msgs": history or [],
+        "t": round(float(temperature), 3),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SemanticHit:
+    response: str
+    score: float
+    matched_text: str
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    text: str
+    response: str
+    expires: float
+
+
+class _Partition:
+    """一个指纹下的条目：id 列表与按行对应的单位向量矩阵"""
+
+    __slots__ = ("ids", "matrix")
+
+    def __init__(self, dimension: int):
+        self.ids: List[str] = []
+        self.matrix = np.empty((0, dimension), dtype=np.float32)
+
+
+class SemanticCache:
+    """按指纹分区的最近邻回复缓存"""
+
+    def __init__(
+        self,
+        embedder=None,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_items: int = SEMANTIC_CACHE_MAX_ITEMS,
+        ttl: float = SEMANTIC_CACHE_TTL_SECONDS,
+        timeout_ms: Optional[float] = SEMANTIC_CACHE_TIMEOUT_MS,
+    ):
+        """
+        Args:
+            embedder: 提供 async encode(text) 的对象，默认全局 EmbeddingService
+            threshold: 最低余弦相似度
+            max_items: 条目上限
+            ttl: 条目有效期（秒）
+            timeout_ms: 单次向量化的时间预算，None 表示不限
+        """
+        self._embedder = embedder
+        self.threshold = threshold
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+        self.timeout_ms = timeout_ms
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()  # 写入顺序
+        self._partitions: Dict[str, _Partition] = {}
+        self._ids = itertools.count()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "embed_failures": 0}
+
+    def _get_embedder(self):
+        if self._embedder is None:
+            from app.services.memory.embedding import get_embedding_service
+            self._embedder = get_embedding_service()
+        return self._embedder
+
+    async def _embed(self, text: str):
+        """向量化；超出时间预算或失败返回 None"""
+        try:
+            coro = self._get_embedder().encode(text)
+            if self.timeout_ms is None:
+                return await coro
+            return await asyncio.wait_for(coro, self.timeout_ms / 1000.0)
+        except Exception:
+            self._stats["embed_failures"] += 1
+            return None
+
+    async def lookup(self, fingerprint: str, text: str) -> Optional[SemanticHit]:
+        """同指纹下与 text 最相近的条目，相似度不到阈值返回 None"""
+        if fingerprint not in self._partitions:
+            # 空分区不必花一次向量化
+            self._stats["misses"] += 1
+            return None
+        vector = await self._embed(text)
+        hit = None
+        partition = self._partitions.get(fingerprint)  # 向量化期间可能已被淘汰
+        if vector is not None and partition is not None:
+            query = _unit(vector)
+            if query is not None and query.shape[0] == partition.matrix.shape[1]:
+                scores = partition.matrix @ query
+                best = int(np.argmax(scores))
+                score = float(scores[best])
+                doc_id = partition.ids[best]
+                entry = self._entries[doc_id]
+                if entry.expires <= time.monotonic():
+                    self._remove(doc_id)
+                elif score >= self.threshold:
+                    hit = SemanticHit(entry.response, score, entry.text)
+        self._stats["hits" if hit else "misses"] += 1
+        return hit
+
+    async def store(self, fingerprint: str, text: str, response: str) -> bool:
+        """写入一条（text 的向量通常已在 lookup 时算过，EmbeddingService 的向量缓存直接命中）"""
+        if not text or not response:
+            return False
+        vector = await self._embed(text)
+        row = _unit(vector) if vector is not None else None
+        if row is None:
+            return False
+        partition = self._partitions.get(fingerprint)
+        if partition is None:
+            partition = self._partitions[fingerprint] = _Partition(row.shape[0])
+        elif partition.matrix.shape[1] != row.shape[0]:
+            return False  # 换了 embedding 模型，旧条目随 TTL / 淘汰自然退出
+        doc_id = f"s{next(self._ids)}"
+        partition.ids.append(doc_id)
+        partition.matrix = np.vstack([partition.matrix, row[None, :]])
+        self._entries[doc_id] = _Entry(fingerprint, text, response, time.monotonic() + self.ttl)
+        self._stats["stores"] += 1
+        while len(self._entries) > self.max_items:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+        return True
+
+    def _remove(self, doc_id: str):
+        entry = self._entries.pop(doc_id, None)
+        if entry is None:
+            return
+        partition = self._partitions[entry.fingerprint]
+        if len(partition.ids) == 1:
+            del self._partitions[entry.fingerprint]
+            return
+        i = partition.ids.index(doc_id)
+        del partition.ids[i]
+        partition.matrix = np.delete(partition.matrix, i, axis=0)
+
+    def clear(self):
+        for doc_id in list(self._entries):
+            self._remove(doc_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "partitions": len(self._partitions),
+            "threshold": self.threshold,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _unit(vector) -> Optional[np.ndarray]:
+    vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else None
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """全局实例；LLM_SEMANTIC_CACHE_ENABLED 未开启时返回 None"""
+    global _semantic_cache
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
@@ -0,0 +1,49 @@
+"""
+MindPal Backend V2 - LLM Stream Helpers
+LLM 流式输出的辅助工具
+
+PrefetchedStream: 立即在后台开始消费一个异步生成器（即发起 LLM 请求），
+把 chunk 放进队列；调用方稍后再迭代读取。用于把 LLM 的首包等待与
+其余收尾工作（提交事务、返回响应头）重叠。
+"""
+
+import asyncio
+from typing import AsyncIterator, Optional
+
+
+_END = object()
+
+
+class PrefetchedStream:
+    """后台预取的流：创建即开始拉取，迭代时按顺序吐出 chunk，异常原样抛出"""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self._queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._queue.put_nowait(e)
+        finally:
+            self._queue.put_nowait(_END)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        item = await self._queue.get()
+        if item is _END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def cancel(self):
+        """放弃剩余输出（客户端断开等），停止底层请求"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
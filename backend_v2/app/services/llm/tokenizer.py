@@ -0,0 +1,168 @@
+"""
+MindPal Backend V2 - Token Estimation & Usage Capture
+
+原来对话端点记用量用 len(content) // 3 同时估算输入和输出：中文 1 字大约 0.7～1.3 个 token，
+按 1/3 算系统性偏低，配额和 CostTracker 的报表都不准。这里分两部分：
+
+- TokenEstimator: 按字符类别线性估算（中日韩字 / 英文字母 / 数字 / 标点符号 / 空白，
+  各服务商一组系数，外加每条消息的模板开销），几次正则计数、不分词，热路径上可以忽略
+  （scripts/bench_tokenizer.py 测吞吐）
+- TokenUsage: 调用方传给 chat / chat_stream 的用量收集器，服务在流结束事件里填入上游报告的
+  真实 token 数（DashScope 每个 SSE 包的 usage；Anthropic 的 message_start / message_delta）
+
+用法：调用前按估算值预留配额（CostTracker.reserve），流结束后 reconcile 取真实用量（没报告的部分用估算），
+再结算（CostTracker.settle）。真实用量同时用来在线校准该服务商的估算系数（EWMA 比例）。
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+_CJK = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]")  # 假名、中日韩统一表意文字（含扩展 A / 兼容）、韩文
+_LETTER = re.compile(r"[A-Za-z]")
+_WORD = re.compile(r"[A-Za-z]+")
+_DIGIT = re.compile(r"[0-9]")
+_SPACE = re.compile(r"\s")
+
+# 在线校准：比例的 EWMA 系数、允许范围、参与校准的最小 token 数（太短的比例噪声大）
+CALIBRATION_ALPHA = 0.1
+CALIBRATION_RANGE = (0.5, 2.0)
+CALIBRATION_MIN_TOKENS = 20
+
+
+@dataclass(frozen=True)
+class TokenProfile:
+    """一个服务商分词器的字符类别系数（每字符 token 数）"""
+    cjk: float              # 中日韩字
+    letters_per_token: float  # 英文字母，每个单词至少 1 个 token
+    digit: float            # 数字
+    other: float            # 标点、符号、emoji 等
+    per_message: int = 4    # 每条消息的角色 / 模板开销
+    base: int = 3           # 每次请求的固定开销
+
+
+PROFILES: Dict[str, TokenProfile] = {
+    # 通义千问：词表里中文词多，约 1.4 字 / token；数字逐位切分
+    "qwen": TokenProfile(cjk=0.7, letters_per_token=4.2, digit=1.0, other=1.0),
+    # Claude：中文约 1 字 1 token 以上；数字约 3 位一个 token
+    "claude": TokenProfile(cjk=1.2, letters_per_token=3.8, digit=0.35, other=1.0),
+    "default": TokenProfile(cjk=1.0, letters_per_token=4.0, digit=0.5, other=1.0),
+}
+
+
+@dataclass
+class TokenUsage:
+    """上游报告的用量（没报告的字段为 None）"""
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+    def update(self, data: Optional[Dict]):
+        """合并一段 usage（后到的覆盖先到的：两家的 output_tokens 都是累计值）"""
+        if not data:
+            return
+        if data.get("input_tokens") is not None:
+            self.input_tokens = int(data["input_tokens"])
+        if data.get("output_tokens") is not None:
+            self.output_tokens = int(data["output_tokens"])
+
+
+class TokenEstimator:
+    """按字符类别估算 token 数，并用真实用量在线校准"""
+
+    def __init__(self, profiles: Optional[Dict[str, TokenProfile]] = None):
+        self.profiles = dict(profiles or PROFILES)
+        self._factors: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _profile(self, provider: str) -> TokenProfile:
+        return self.profiles.get(provider) or self.profiles["default"]
+
+    def _raw_count(self, text: str, profile: TokenProfile) -> float:
+        if not text:
+            return 0.0
+        cjk = len(_CJK.findall(text))
+        if cjk == len(text):
+            return cjk * profile.cjk
+        letters = len(_LETTER.findall(text))
+        words = len(_WORD.findall(text)) if letters else 0
+        digits = len(_DIGIT.findall(text))
+        spaces = len(_SPACE.findall(text))
+        other = len(text) - cjk - letters - digits - spaces
+        return (
+            cjk * profile.cjk
+            + max(words, letters / profile.letters_per_token)
+            + digits * profile.digit
+            + other * profile.other
+        )
+
+    def count(self, text: str, provider: str = "default") -> int:
+        """一段文本的估算 token 数（已乘校准系数）"""
+        raw = self._raw_count(text, self._profile(provider))
+        return int(round(raw * self._factors.get(provider, 1.0)))
+
+    def count_messages(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str = "",
+        provider: str = "default",
+    ) -> int:
+        """一次对话请求的估算输入 token 数（含模板开销）"""
+        profile = self._profile(provider)
+        raw = profile.base + self._raw_count(system_prompt or "", profile)
+        if system_prompt:
+            raw += profile.per_message
+        for message in messages:
+            raw += profile.per_message + self._raw_count(message.get("content", ""), profile)
+        return int(round(raw * self._factors.get(provider, 1.0)))
+
+    def calibrate(self, provider: str, estimated: int, actual: int):
+        """真实用量 / 估算值的比例做 EWMA，作为该服务商的校准系数"""
+        if estimated < CALIBRATION_MIN_TOKENS or actual <= 0:
+            return
+        with self._lock:
+            factor = self._factors.get(provider, 1.0)
+            ratio = actual / (estimated / factor)  # 与未校准的原始估算比
+            factor = factor * (1 - CALIBRATION_ALPHA) + ratio * CALIBRATION_ALPHA
+            low, high = CALIBRATION_RANGE
+            self._factors[provider] = min(high, max(low, factor))
+            self._samples[provider] = self._samples.get(provider, 0) + 1
+
+    def reconcile(
+        self,
+        provider: str,
+        usage: Optional[TokenUsage],
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        output_text: str,
+    ) -> Tuple[int, int]:
+        """结算用的 (input_tokens, output_tokens)：优先用上游报告的，缺的用估算；报告了的顺便校准"""
+        estimated_in = self.count_messages(messages, system_prompt, provider)
+        estimated_out = self.count(output_text, provider)
+        input_tokens, output_tokens = estimated_in, estimated_out
+        if usage is not None and usage.input_tokens is not None:
+            input_tokens = usage.input_tokens
+            self.calibrate(provider, estimated_in, input_tokens)
+        if usage is not None and usage.output_tokens is not None:
+            output_tokens = usage.output_tokens
+            self.calibrate(provider, estimated_out, output_tokens)
+        return input_tokens, output_tokens
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            provider: {"factor": round(self._factors[provider], 4), "samples": self._samples.get(provider, 0)}
+            for provider in self._factors
+        }
+
+
+_estimator: Optional[TokenEstimator] = None
+
+
+def get_token_estimator() -> TokenEstimator:
+    """全局实例（校准系数进程内共享）"""
+    global _estimator
+    if _estimator is None:
+        _estimator = TokenEstimator()
+    return _estimator
@@ -1,9 +1,13 @@
 """
 MindPal Backend V2 - Embedding Service
 文本向量化服务 - 支持多种Embedding提供商
+
+所有 provider 输出 float32 ndarray：encode 返回一维 (dim,)，encode_batch 返回二维 (n, dim)，
+直接交给 VectorDocument / 向量索引，中间不再转 List[float]。
 """
 
 import os
+import asyncio
 import hashlib
 import json
 from typing import List, Optional, Dict, Any
@@ -11,17 +15,27 @@ from abc import ABC, abstractmethod
 import httpx
 from functools import lru_cache
 
+import numpy as np
+
+from app.core.cache import NearCache, RedisCache, get_cache
+from app.core.http_pool import get_http_pool
+from app.services.memory.embedding_batcher import EmbeddingBatcher
+from app.services.memory.embedding_cache import EmbeddingCache
+
 
 class EmbeddingServiceBase(ABC):
     """Embedding服务基类"""
 
+    # 单次 encode_batch 的最大文本数（微批合并器按此拆分）
+    max_batch_size: int = 32
+
     @abstractmethod
-    async def encode(self, text: str) -> List[float]:
+    async def encode(self, text: str) -> np.ndarray:
         """将单个文本编码为向量"""
         pass
 
     @abstractmethod
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
         """批量编码文本"""
         pass
 
@@ -31,32 +45,37 @@ class EmbeddingServiceBase(ABC):
         """向量维度"""
         pass
 
+    @property
+    def model_id(self) -> str:
+        """模型标识（向量缓存 key 的一部分，换模型即换 key）"""
+        model = getattr(self, "model", None) or getattr(self, "model_name", "")
+        return f"{type(self).__name__}:{model}:{self.dimension}"
+
 
 class QwenEmbeddingService(EmbeddingServiceBase):
     """阿里云通义千问Embedding服务"""
 
+    max_batch_size = 25  # text-embedding-v2 单次最多 25 条
+
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/embeddings/text-embedding/text-embedding"
         self.model = "text-embedding-v2"
         self._dimension = 1536
-        self._client: Optional[httpx.AsyncClient] = None
 
     @property
     def dimension(self) -> int:
         return self._dimension
 
     async def _get_client(self) -> httpx.AsyncClient:
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(timeout=30.0)
-        return self._client
+        return get_http_pool().client(self.base_url)
 
-    async def encode(self, text: str) -> List[float]:
+    async def encode(self, text: str) -> np.ndarray:
         """编码单个文本"""
         results = await self.encode_batch([text])
         return results[0]
 
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
         """批量编码文本"""
         client = await self._get_client()
 
@@ -78,7 +97,8 @@ class QwenEmbeddingService(EmbeddingServiceBase):
         response = await client.post(
             self.base_url,
             json=payload,
-            headers=headers
+            headers=headers,
+            timeout=30.0,
         )
         response.raise_for_status()
 
@@ -87,38 +107,37 @@ class QwenEmbeddingService(EmbeddingServiceBase):
 
         # 按index排序
         sorted_embeddings = sorted(embeddings, key=lambda x: x.get("text_index", 0))
-        return [e["embedding"] for e in sorted_embeddings]
+        return np.asarray([e["embedding"] for e in sorted_embeddings], dtype=np.float32)
 
     async def close(self):
-        if self._client and not self._client.is_closed:
-            await self._client.aclose()
+        # 连接归共享连接池管理（lifespan 关闭时统一释放）
+        pass
 
 
 class OpenAIEmbeddingService(EmbeddingServiceBase):
     """OpenAI Embedding服务"""
 
+    max_batch_size = 256
+
     def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.base_url = base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         self.model = "text-embedding-3-small"
         self._dimension = 1536
-        self._client: Optional[httpx.AsyncClient] = None
 
     @property
     def dimension(self) -> int:
         return self._dimension
 
     async def _get_client(self) -> httpx.AsyncClient:
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(timeout=30.0)
-        return self._client
+        return get_http_pool().client(self.base_url)
 
-    async def encode(self, text: str) -> List[float]:
+    async def encode(self, text: str) -> np.ndarray:
         """编码单个文本"""
         results = await self.encode_batch([text])
         return results[0]
 
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
         """批量编码文本"""
         client = await self._get_client()
 
@@ -135,7 +154,8 @@ class OpenAIEmbeddingService(EmbeddingServiceBase):
         response = await client.post(
             f"{self.base_url}/embeddings",
             json=payload,
-            headers=headers
+            headers=headers,
+            timeout=30.0,
         )
         response.raise_for_status()
 
@@ -144,15 +164,20 @@ class OpenAIEmbeddingService(EmbeddingServiceBase):
 
         # 按index排序
         sorted_embeddings = sorted(embeddings, key=lambda x: x.get("index", 0))
-        return [e["embedding"] for e in sorted_embeddings]
+        return np.asarray([e["embedding"] for e in sorted_embeddings], dtype=np.float32)
 
     async def close(self):
-        if self._client and not self._client.is_closed:
-            await self._client.aclose()
+        # 连接归共享连接池管理（lifespan 关闭时统一释放）
+        pass
 
 
 class LocalEmbeddingService(EmbeddingServiceBase):
-    """本地Embedding服务 - 使用sentence-transformers（备用方案）"""
+    """本地Embedding服务 - 使用sentence-transformers（备用方案）
+
+    模型加载和推理都是同步 CPU 计算，放到线程池执行，不阻塞事件循环。
+    """
+
+    max_batch_size = 64
 
     def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2"):
         self.model_name = model_name
@@ -174,17 +199,17 @@ class LocalEmbeddingService(EmbeddingServiceBase):
                 raise ImportError("请安装 sentence-transformers: pip install sentence-transformers")
         return self._model
 
-    async def encode(self, text: str) -> List[float]:
+    async def encode(self, text: str) -> np.ndarray:
         """编码单个文本"""
-        model = self._load_model()
-        embedding = model.encode(text, convert_to_numpy=True)
-        return embedding.tolist()
+        model = await asyncio.to_thread(self._load_model)
+        embedding = await asyncio.to_thread(model.encode, text, convert_to_numpy=True)
+        return embedding.astype(np.float32, copy=False)
 
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
         """批量编码文本"""
-        model = self._load_model()
-        embeddings = model.encode(texts, convert_to_numpy=True)
-        return embeddings.tolist()
+        model = await asyncio.to_thread(self._load_model)
+        embeddings = await asyncio.to_thread(model.encode, texts, convert_to_numpy=True)
+        return embeddings.astype(np.float32, copy=False)
 
     async def close(self):
         pass
@@ -193,6 +218,8 @@ class LocalEmbeddingService(EmbeddingServiceBase):
 class SimpleHashEmbedding(EmbeddingServiceBase):
     """简单哈希Embedding - 用于测试和开发（无需API）"""
 
+    max_batch_size = 256
+
     def __init__(self, dimension: int = 384):
         self._dimension = dimension
 
@@ -200,29 +227,25 @@ class SimpleHashEmbedding(EmbeddingServiceBase):
     def dimension(self) -> int:
         return self._dimension
 
-    async def encode(self, text: str) -> List[float]:
-        """使用哈希生成伪向量"""
-        # 基于文本内容生成确定性的向量
-        hash_bytes = hashlib.sha512(text.encode()).digest()
-
-        # 扩展到所需维度
-        vector = []
-        for i in range(self._dimension):
-            byte_idx = i % len(hash_bytes)
-            # 归一化到 [-1, 1]
-            value = (hash_bytes[byte_idx] / 127.5) - 1.0
-            vector.append(value)
-
-        # 归一化向量
-        norm = sum(v ** 2 for v in vector) ** 0.5
-        if norm > 0:
-            vector = [v / norm for v in vector]
-
-        return vector
-
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
-        """批量编码"""
-        return [await self.encode(text) for text in texts]
+    def _hash_vectors(self, texts: List[str]) -> np.ndarray:
+        """sha512 摘要按字节循环扩展到目标维度，映射到 [-1, 1] 后按行归一化"""
+        digests = np.frombuffer(
+            b"".join(hashlib.sha512(text.encode()).digest() for text in texts),
+            dtype=np.uint8,
+        ).reshape(len(texts), 64)
+        # float64 计算再转 float32：同一文本单条/批量编码的结果逐位一致
+        vectors = digests[:, np.arange(self._dimension) % 64] / 127.5 - 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors.astype(np.float32)
+
+    async def encode(self, text: str) -> np.ndarray:
+        """使用哈希生成伪向量（基于文本内容，确定性）"""
+        return self._hash_vectors([text])[0]
+
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """批量编码（一次向量化计算）"""
+        return self._hash_vectors(texts)
 
     async def close(self):
         pass
@@ -233,6 +256,8 @@ class EmbeddingService:
 
     _instance: Optional["EmbeddingService"] = None
     _service: Optional[EmbeddingServiceBase] = None
+    _cache: Optional[EmbeddingCache] = None
+    _batcher: Optional[EmbeddingBatcher] = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -242,6 +267,13 @@ class EmbeddingService:
     def __init__(self):
         if self._service is None:
             self._service = self._create_service()
+            self._cache = self._create_cache()
+            self._batcher = EmbeddingBatcher(
+                self._service,
+                max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", str(self._service.max_batch_size))),
+                max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")),
+                max_pending=int(os.getenv("EMBEDDING_BATCH_MAX_PENDING", "1024")),
+            )
 
     def _create_service(self) -> EmbeddingServiceBase:
         """根据配置创建Embedding服务"""
@@ -257,17 +289,59 @@ class EmbeddingService:
             # 默认使用简单哈希（开发/测试用）
             return SimpleHashEmbedding()
 
+    @staticmethod
+    def _create_cache() -> EmbeddingCache:
+        """向量缓存：EMBEDDING_CACHE_SHARED=auto 时仅在配置了 Redis 的情况下启用共享层"""
+        shared_mode = os.getenv("EMBEDDING_CACHE_SHARED", "auto").lower()
+        cache = get_cache()
+        # 向量有自己的进程内 L1，共享层直接用远端（跳过近端缓存）
+        remote = cache.remote if isinstance(cache, NearCache) else cache
+        shared = None
+        if shared_mode == "true" or (shared_mode == "auto" and isinstance(remote, RedisCache)):
+            shared = remote
+        return EmbeddingCache(
+            max_items=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+            shared=shared,
+            shared_ttl=int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 86400))),
+        )
+
     @property
     def dimension(self) -> int:
         return self._service.dimension
 
-    async def encode(self, text: str) -> List[float]:
-        """编码文本"""
-        return await self._service.encode(text)
-
-    async def encode_batch(self, texts: List[str]) -> List[List[float]]:
-        """批量编码"""
-        return await self._service.encode_batch(texts)
+    async def encode(self, text: str) -> np.ndarray:
+        """编码文本（先查向量缓存）"""
+        return (await self.encode_batch([text]))[0]
+
+    async def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """批量编码：缓存命中的直接返回，其余文本去重后交给微批合并器"""
+        model_id = self._service.model_id
+        keys = [EmbeddingCache.key(model_id, text) for text in texts]
+        vectors = await self._cache.get_many(keys)
+
+        pending: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                pending.setdefault(key, text)
+        if pending:
+            encoded = await self._batcher.encode_batch(list(pending.values()))
+            # 复制成独立的行，缓存里不持有整批结果矩阵
+            fresh = [np.array(v, dtype=np.float32) for v in encoded]
+            await self._cache.put_many(list(pending), fresh)
+            by_key = dict(zip(pending, fresh))
+            vectors = [v if v is not None else by_key[k] for k, v in zip(keys, vectors)]
+
+        if not vectors:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.stack(vectors)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """向量缓存命中率"""
+        return self._cache.stats()
+
+    def batch_stats(self) -> Dict[str, Any]:
+        """微批合并统计"""
+        return self._batcher.stats()
 
     async def close(self):
         """关闭服务"""
@@ -0,0 +1,159 @@
+"""
+MindPal Backend V2 - Embedding Micro-Batcher
+向量化请求合并器 - 把并发的 encode 请求合并成一次 encode_batch
+
+- 没有批次在途时，同一轮事件循环内到达的请求立即合并发出（低负载不增加延迟）
+- 有批次在途时，新请求最多等待 max_wait_ms 或攒够 max_batch_size 条再发出
+- 相同文本（排队中或已在途）只编码一次，结果分发给所有等待者
+- 超过 provider 单次上限的批次按 max_batch_size 拆分
+- 背压：排队 + 在途文本数达到 max_pending 时，新请求等待而不是继续堆积
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+
+class EmbeddingBatcher:
+    """asyncio 微批合并器"""
+
+    def __init__(
+        self,
+        service: Any,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        max_pending: int = 1024,
+    ):
+        """
+        Args:
+            service: 具有 encode_batch(texts) 的 provider
+            max_batch_size: 单次 encode_batch 的最大文本数
+            max_wait_ms: 有批次在途时，新请求的最长等待时间
+            max_pending: 排队 + 在途的文本数上限
+        """
+        self._service = service
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000.0
+        self._max_pending = max(1, max_pending)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Dict[str, List[asyncio.Future]] = {}  # 文本 → 等待者（相同文本合并）
+        self._running: Dict[str, List[asyncio.Future]] = {}  # 在途批次中的文本 → 等待者
+        self._timer: Optional[asyncio.Handle] = None
+        self._pending = 0
+        self._inflight = 0
+        self._waiters: List[asyncio.Future] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters = {"requests": 0, "texts": 0, "batches": 0, "deduped": 0}
+
+    def _bind(self, loop: asyncio.AbstractEventLoop):
+        """绑定当前事件循环（测试里每次 asyncio.run 都是新循环，旧状态直接丢弃）"""
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = {}
+            self._running = {}
+            self._timer = None
+            self._pending = 0
+            self._inflight = 0
+            self._waiters = []
+            self._tasks = set()
+
+    async def encode_batch(self, texts: List[str]) -> List[Any]:
+        """提交一组文本，等待合并后的批次返回对应向量"""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        self._bind(loop)
+
+        while self._pending >= self._max_pending:
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+        self._pending += len(texts)
+        self._counters["requests"] += 1
+        self._counters["texts"] += len(texts)
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            futures.append(future)
+            # 文本已在在途批次或队列中：直接挂到已有的等待者列表上
+            running = self._running.get(text)
+            if running is not None:
+                running.append(future)
+                self._counters["deduped"] += 1
+                continue
+            waiting = self._queue.setdefault(text, [])
+            if waiting:
+                self._counters["deduped"] += 1
+            waiting.append(future)
+
+        if len(self._queue) >= self._max_batch_size:
+            self._flush()
+        elif self._queue and self._timer is None:
+            if self._inflight == 0:
+                self._timer = loop.call_soon(self._flush)
+            else:
+                self._timer = loop.call_later(self._max_wait, self._flush)
+
+        try:
+            return list(await asyncio.gather(*futures))
+        finally:
+            self._pending -= len(texts)
+            self._wake()
+
+    def _wake(self):
+        while self._waiters and self._pending < self._max_pending:
+            waiter = self._waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        waiting, self._queue = self._queue, {}
+
+        texts = list(waiting)
+        for start in range(0, len(texts), self._max_batch_size):
+            batch = {text: waiting[text] for text in texts[start:start + self._max_batch_size]}
+            self._running.update(batch)
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[str, List[asyncio.Future]]):
+        self._counters["batches"] += 1
+        self._inflight += 1
+        try:
+            vectors = await self._service.encode_batch(list(batch))
+            if len(vectors) != len(batch):
+                raise ValueError(f"embedding batch returned {len(vectors)} vectors for {len(batch)} texts")
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        finally:
+            self._inflight -= 1
+            for text, futures in batch.items():
+                if self._running.get(text) is futures:
+                    del self._running[text]
+            # 在途批次结束后，排队中的请求不必再等满 max_wait
+            if self._queue and self._inflight == 0:
+                self._flush()
+
+        for vector, futures in zip(vectors, batch.values()):
+            for future in futures:
+                if not future.done():
+                    future.set_result(vector)
+
+    def stats(self) -> Dict[str, Any]:
+        """合并效果统计"""
+        batches = self._counters["batches"]
+        return {
+            **self._counters,
+            "avg_batch_texts": round(self._counters["texts"] / batches, 2) if batches else 0.0,
+            "pending": self._pending,
+            "inflight_batches": self._inflight,
+        }
@@ -0,0 +1,127 @@
+"""
+MindPal Backend V2 - Embedding Cache
+文本向量缓存 - EmbeddingService.encode / encode_batch 的两级缓存
+
+- L1: 进程内 LRU，key = sha256(模型标识 + 文本)，值为 float32 数组
+- L2（可选）: core/cache 的 CacheBackend（生产为 Redis），值为 float16 二进制的 base64，
+  1536 维向量约 4KB，多进程/多实例共享；命中后回填 L1
+- 固定查询串（"最近的对话记忆"、情感查询表）和跨用户的相同文本都只请求一次 API
+
+L2 读写失败只当作未命中，不影响主链路（与 core/cache 的降级策略一致）。
+"""
+
+import asyncio
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.cache import CacheBackend
+
+
+class EmbeddingCache:
+    """两级向量缓存"""
+
+    def __init__(
+        self,
+        max_items: int = 4096,
+        shared: Optional[CacheBackend] = None,
+        shared_ttl: int = 7 * 86400,
+    ):
+        """
+        Args:
+            max_items: 进程内 LRU 容量，0 表示关闭 L1
+            shared: 共享缓存后端，None 表示不启用 L2
+            shared_ttl: L2 过期时间（秒）
+        """
+        self._max_items = max_items
+        self._local: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._shared = shared
+        self._shared_ttl = shared_ttl
+        self._counters = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(model_id: str, text: str) -> str:
+        return hashlib.sha256(f"{model_id}\n{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        return f"mp:emb:{key}"
+
+    @staticmethod
+    def _encode(vector: np.ndarray) -> str:
+        return base64.b64encode(vector.astype("<f2").tobytes()).decode("ascii")
+
+    @staticmethod
+    def _decode(value: str) -> Optional[np.ndarray]:
+        try:
+            return np.frombuffer(base64.b64decode(value), dtype="<f2").astype(np.float32)
+        except (ValueError, TypeError):
+            return None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if self._max_items <= 0:
+            return
+        self._local[key] = vector
+        self._local.move_to_end(key)
+        while len(self._local) > self._max_items:
+            self._local.popitem(last=False)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """按 key 批量查缓存（L1 → L2），未命中的位置为 None"""
+        found: List[Optional[np.ndarray]] = []
+        missing: List[int] = []
+        for i, key in enumerate(keys):
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+                self._counters["local_hits"] += 1
+            else:
+                missing.append(i)
+            found.append(vector)
+
+        if missing and self._shared is not None:
+            values = await asyncio.gather(
+                *(self._shared.get(self._shared_key(keys[i])) for i in missing),
+                return_exceptions=True,
+            )
+            still_missing = []
+            for i, value in zip(missing, values):
+                vector = self._decode(value) if isinstance(value, str) else None
+                if vector is None:
+                    still_missing.append(i)
+                    continue
+                found[i] = vector
+                self._remember(keys[i], vector)
+                self._counters["shared_hits"] += 1
+            missing = still_missing
+
+        self._counters["misses"] += len(missing)
+        return found
+
+    async def put_many(self, keys: Sequence[str], vectors: Sequence[np.ndarray]):
+        """写入两级缓存"""
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        if self._shared is not None and keys:
+            await asyncio.gather(
+                *(
+                    self._shared.set(self._shared_key(key), self._encode(vector), self._shared_ttl)
+                    for key, vector in zip(keys, vectors)
+                ),
+                return_exceptions=True,
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """命中率统计"""
+        lookups = sum(self._counters.values())
+        hits = self._counters["local_hits"] + self._counters["shared_hits"]
+        return {
+            **self._counters,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "local_items": len(self._local),
+            "shared_enabled": self._shared is not None,
+        }
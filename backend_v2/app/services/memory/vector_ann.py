@@ -0,0 +1,219 @@
+"""
+MindPal Backend V2 - IVF Vector Index
+近似最近邻索引 - 倒排文件（IVF-Flat），纯 NumPy 实现
+
+在 MatrixIndex 之上增加一层粗量化:
+- 用球面 k-means 把单位向量聚成 nlist 个簇（质心同样归一化，簇分配 = 最大内积）
+- 每个簇记录属于它的行号（倒排列表），压实后一次性按簇重建，新写入的行当场分配并追加到簇尾
+- 检索时先对质心打分，只扫描得分最高的 nprobe 个簇里的行，再复用 MatrixIndex 的阈值/top-k 逻辑
+- 带 (player_id, npc_id) 过滤时先看分区大小：小分区直接精确扫分区切片
+  （本来就是 O(分区)），大分区才走 IVF，并在候选行上按分区编号预过滤
+
+向量本身仍只存一份（MatrixIndex 的矩阵），倒排列表只存行号；压实时按 order 重映射。
+行数低于 exact_rows 或尚未训练时退化为精确检索，召回率与 MatrixIndex 一致。
+
+没有采用 HNSW：图遍历每一步都是小向量运算，纯 Python 下逐跳开销远高于
+IVF 对整簇做一次 matmul；nprobe 在这里承担 HNSW 中 ef_search 的召回/延迟权衡。
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.memory.vector_index import MatrixIndex, PartitionKey
+
+
+class IVFIndex(MatrixIndex):
+    """IVF-Flat 近似检索索引"""
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        nlist: int = 1024,
+        nprobe: int = 16,
+        exact_rows: int = 20000,
+        min_list_rows: int = 64,
+        train_sample_per_list: int = 64,
+        train_iterations: int = 10,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+        **kwargs,
+    ):
+        """
+        Args:
+            dimension: 向量维度，None 表示由第一条写入的向量决定
+            nlist: 簇数量上限（实际簇数 = min(nlist, 行数 // min_list_rows)）
+            nprobe: 每次检索扫描的簇数，越大召回越高、延迟越高
+            exact_rows: 候选行数（全量或分区）不超过该值时走精确检索
+            min_list_rows: 每个簇的平均最少行数，避免小数据集上簇过碎
+            train_sample_per_list: k-means 训练时每个簇的采样行数
+            train_iterations: k-means 迭代次数
+            retrain_growth: 行数增长到上次训练时的多少倍后，下次压实重新训练
+            seed: 训练采样的随机种子
+            **kwargs: 透传给 MatrixIndex（容量、压实阈值等）
+        """
+        super().__init__(dimension=dimension, **kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.exact_rows = exact_rows
+        self._min_list_rows = max(1, min_list_rows)
+        self._train_sample_per_list = train_sample_per_list
+        self._train_iterations = train_iterations
+        self._retrain_growth = retrain_growth
+        self._seed = seed
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)   # 行 → 簇编号
+        self._lists: List[np.ndarray] = []           # 簇编号 → 压实后的行号
+        self._list_tail: Dict[int, List[int]] = {}   # 簇编号 → 压实后新增的行号
+        self._trained_rows = 0
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    # ==================== 写入 ====================
+
+    def _ensure_capacity(self, rows: int):
+        super()._ensure_capacity(rows)
+        capacity = self._matrix.shape[0]
+        if self._assign.shape[0] < capacity:
+            assign = np.zeros(capacity, dtype=np.int32)
+            assign[:len(self._assign)] = self._assign
+            self._assign = assign
+
+    def _on_rows_added(self, start: int, end: int):
+        if not self.trained:
+            return
+        assign = self._nearest_centroids(self._matrix[start:end])
+        self._assign[start:end] = assign
+        for offset, cluster in enumerate(assign.tolist()):
+            self._list_tail.setdefault(cluster, []).append(start + offset)
+
+    def _on_compacted(self, order: np.ndarray):
+        n = self._size
+        assign = np.zeros(self._matrix.shape[0], dtype=np.int32)
+        if self.trained and len(self._assign):
+            assign[:n] = self._assign[order]
+        self._assign = assign
+        self._list_tail = {}
+
+        if n >= self._min_list_rows * 2 and (
+            not self.trained or n >= self._trained_rows * self._retrain_growth
+        ):
+            self._train(n)
+            self._assign[:n] = self._nearest_centroids(self._matrix[:n])
+
+        if not self.trained:
+            self._lists = []
+            return
+        sorted_rows = np.argsort(self._assign[:n], kind="stable")
+        bounds = np.searchsorted(self._assign[:n][sorted_rows], np.arange(len(self._centroids) + 1))
+        self._lists = [
+            sorted_rows[bounds[c]:bounds[c + 1]] for c in range(len(self._centroids))
+        ]
+
+    # ==================== 训练 ====================
+
+    def _nearest_centroids(self, vectors: np.ndarray, chunk: int = 16384) -> np.ndarray:
+        """逐块计算每行最近的质心（最大内积），控制中间矩阵大小"""
+        result = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk] @ self._centroids.T
+            result[start:start + chunk] = np.argmax(block, axis=1)
+        return result
+
+    def _train(self, n: int):
+        """在前 n 行（压实后全部存活）上训练球面 k-means 质心"""
+        rng = np.random.default_rng(self._seed)
+        k = max(1, min(self.nlist, n // self._min_list_rows))
+        sample_size = min(n, k * self._train_sample_per_list)
+        sample = self._matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, k, replace=False)].copy()
+
+        for _ in range(self._train_iterations):
+            self._centroids = centroids
+            assign = self._nearest_centroids(sample)
+            order = np.argsort(assign, kind="stable")
+            clusters, starts = np.unique(assign[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+
+            centroids = np.empty_like(centroids)
+            empty = np.ones(k, dtype=bool)
+            empty[clusters] = False
+            centroids[clusters] = sums
+            # 空簇重新取样本点，避免质心塌缩
+            if empty.any():
+                centroids[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            np.divide(centroids, norms, out=centroids, where=norms > 0)
+
+        self._centroids = centroids.astype(np.float32, copy=False)
+        self._trained_rows = n
+
+    # ==================== 查询 ====================
+
+    def _candidate_rows(self, key: Optional[PartitionKey]) -> int:
+        if key is None:
+            return len(self._id_to_row)
+        span, tail = self._partition_rows(key)
+        rows = (span[1] - span[0]) if span else 0
+        return rows + (len(tail) if tail is not None else 0)
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        limit: int = 5,
+        score_threshold: float = 0.0,
+        key: Optional[PartitionKey] = None,
+        id_filter: Optional[Callable[[str], bool]] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        """近似 top-k 检索，参数同 MatrixIndex.search
+
+        Args:
+            nprobe: 本次扫描的簇数，None 使用索引默认值
+        """
+        if (
+            not self.trained
+            or limit <= 0
+            or not self.accepts(query_vector)
+            or self._candidate_rows(key) <= self.exact_rows
+        ):
+            return super().search(query_vector, limit, score_threshold, key, id_filter)
+
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        query_norm = float(np.linalg.norm(query))
+        if query_norm == 0:
+            return super().search(query_vector, limit, score_threshold, key, id_filter)
+
+        code = None
+        if key is not None:
+            code = self._code_of.get(key)
+            if code is None:
+                return []
+
+        probe = min(nprobe or self.nprobe, len(self._centroids))
+        centroid_scores = self._centroids @ query
+        probed = np.argpartition(-centroid_scores, probe - 1)[:probe].tolist()
+
+        parts = [self._lists[c] for c in probed if c < len(self._lists)]
+        parts += [np.asarray(self._list_tail[c], dtype=np.int64) for c in probed if c in self._list_tail]
+        if not parts:
+            return []
+        rows = np.concatenate(parts)
+        if code is not None:
+            rows = rows[self._codes[rows] == code]
+
+        scores = self._matrix[rows] @ query
+        return self._rank(rows, scores, self._alive[rows], query_norm, limit, score_threshold, id_filter)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({
+            "ivf_lists": len(self._centroids) if self.trained else 0,
+            "ivf_nprobe": self.nprobe,
+            "ivf_trained_rows": self._trained_rows,
+            "ivf_tail_rows": sum(len(rows) for rows in self._list_tail.values()),
+        })
+        return stats
@@ -0,0 +1,383 @@
+"""
+MindPal Backend V2 - Vector Matrix Index
+向量矩阵索引 - InMemoryVectorStore 的 NumPy 检索内核
+
+布局:
+- 所有向量存放在一块连续的 float32 矩阵中，写入时即归一化（范数预先算好），
+  检索时余弦相似度 = 矩阵 @ 查询向量 / |查询向量|，一次 matmul 完成
+- (player_id, npc_id) → 行区间的分区索引：压实后同一分区的行在矩阵中连续，
+  按分区过滤的检索只对这一段切片做 matmul，不再扫描其他租户的行
+- 上次压实之后新增的行追加在矩阵尾部，按分区记录行号（tail）
+- 删除只打墓碑（alive=False），墓碑或尾部行数超过阈值时整体压实（按分区重排）
+- top-k 用 argpartition 选出，再只对 k 个结果排序
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+PartitionKey = Tuple[Any, Any]
+
+# 分区字段：检索时 filter_metadata 同时包含这两个字段才会走分区索引
+PARTITION_FIELDS = ("player_id", "npc_id")
+
+
+def partition_key(metadata: Dict[str, Any]) -> PartitionKey:
+    """从文档元数据中提取分区 key"""
+    return (metadata.get("player_id"), metadata.get("npc_id"))
+
+
+class MatrixIndex:
+    """连续矩阵 + 分区行区间索引"""
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        initial_capacity: int = 1024,
+        compact_dead_ratio: float = 0.25,
+        compact_tail_ratio: float = 0.1,
+        min_compact_rows: int = 1024,
+    ):
+        """
+        Args:
+            dimension: 向量维度，None 表示由第一条写入的向量决定
+            initial_capacity: 矩阵初始行数（之后按 2 倍扩容）
+            compact_dead_ratio: 墓碑行占比超过该值时压实
+            compact_tail_ratio: 尾部未归入分区区间的行占比超过该值时压实
+            min_compact_rows: 墓碑/尾部行数低于该值时不触发压实
+        """
+        self.dimension = dimension
+        self._initial_capacity = max(1, initial_capacity)
+        self._compact_dead_ratio = compact_dead_ratio
+        self._compact_tail_ratio = compact_tail_ratio
+        self._min_compact_rows = min_compact_rows
+
+        self._matrix = np.empty((0, dimension or 0), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._codes = np.empty(0, dtype=np.int64)   # 行 → 分区编号
+        self._size = 0                                # 已使用的行数（含墓碑）
+
+        self._row_ids: List[Optional[str]] = []
+        self._id_to_row: Dict[str, int] = {}
+
+        self._code_of: Dict[PartitionKey, int] = {}
+        self._key_of: List[PartitionKey] = []
+        self._ranges: Dict[int, Tuple[int, int]] = {}  # 分区编号 → [start, end)
+        self._tail: Dict[int, List[int]] = {}          # 分区编号 → 尾部行号
+        self._tail_rows = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._id_to_row
+
+    # ==================== 写入 ====================
+
+    def add(self, doc_id: str, vector: Sequence[float], metadata: Dict[str, Any]) -> bool:
+        """写入（或覆盖）一条向量。维度不匹配时返回 False，不写入。"""
+        return not self.add_many([(doc_id, vector, metadata)])
+
+    def add_many(
+        self,
+        items: Iterable[Tuple[str, Sequence[float], Dict[str, Any]]],
+    ) -> List[str]:
+        """批量写入，返回因维度不匹配而未写入的 doc_id 列表"""
+        rejected: List[str] = []
+        accepted: List[Tuple[str, np.ndarray, int]] = []
+        pending: Dict[str, int] = {}
+
+        for doc_id, vector, metadata in items:
+            vec = self._prepare(vector)
+            if vec is None:
+                rejected.append(doc_id)
+                continue
+            # 同一批次内重复 id：后写覆盖先写
+            if doc_id in pending:
+                accepted[pending[doc_id]] = (doc_id, vec, self._code_for(partition_key(metadata)))
+                continue
+            pending[doc_id] = len(accepted)
+            accepted.append((doc_id, vec, self._code_for(partition_key(metadata))))
+
+        if not accepted:
+            return rejected
+
+        for doc_id, _, _ in accepted:
+            if doc_id in self._id_to_row:
+                self._tombstone(doc_id)
+
+        self._ensure_capacity(self._size + len(accepted))
+        start = self._size
+        end = start + len(accepted)
+        self._matrix[start:end] = np.stack([vec for _, vec, _ in accepted])
+        self._alive[start:end] = True
+        self._codes[start:end] = [code for _, _, code in accepted]
+        self._size = end
+
+        for offset, (doc_id, _, code) in enumerate(accepted):
+            row = start + offset
+            self._row_ids.append(doc_id)
+            self._id_to_row[doc_id] = row
+            self._tail.setdefault(code, []).append(row)
+        self._tail_rows += len(accepted)
+        self._on_rows_added(start, end)
+
+        self._maybe_compact()
+        return rejected
+
+    def load_matrix(
+        self,
+        doc_ids: Sequence[str],
+        vectors: np.ndarray,
+        metadatas: Sequence[Dict[str, Any]],
+    ):
+        """向空索引整块导入向量（启动时从快照加载用，归一化全程向量化）"""
+        if self._size:
+            raise ValueError("load_matrix requires an empty index")
+        if not len(doc_ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = int(vectors.shape[1])
+            self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"dimension mismatch: {vectors.shape[1]} != {self.dimension}")
+
+        n = len(doc_ids)
+        self._ensure_capacity(n)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=self._matrix[:n], where=norms > 0)
+        self._matrix[:n][norms[:, 0] == 0] = 0.0
+        self._alive[:n] = True
+        self._codes[:n] = [self._code_for(partition_key(m)) for m in metadatas]
+        self._size = n
+        self._row_ids = list(doc_ids)
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        self._dead = n - len(self._id_to_row)  # 重复 id 只保留最后一行
+        if self._dead:
+            live_rows = set(self._id_to_row.values())
+            for row in range(n):
+                if row not in live_rows:
+                    self._alive[row] = False
+                    self._row_ids[row] = None
+        self.compact()
+
+    def remove(self, doc_id: str) -> bool:
+        """删除一条向量（打墓碑，延迟压实）"""
+        if doc_id not in self._id_to_row:
+            return False
+        self._tombstone(doc_id)
+        self._maybe_compact()
+        return True
+
+    def _tombstone(self, doc_id: str):
+        row = self._id_to_row.pop(doc_id)
+        self._alive[row] = False
+        self._row_ids[row] = None
+        self._dead += 1
+
+    def _prepare(self, vector: Sequence[float]) -> Optional[np.ndarray]:
+        """转成 float32 单位向量；维度不匹配返回 None"""
+        vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if self.dimension is None:
+            if vec.shape[0] == 0:
+                return None
+            self.dimension = int(vec.shape[0])
+            self._matrix = np.empty((0, self.dimension), dtype=np.float32)
+        if vec.shape[0] != self.dimension:
+            return None
+        norm = float(np.linalg.norm(vec))
+        if norm > 0:
+            vec = vec / norm
+        return vec
+
+    def _code_for(self, key: PartitionKey) -> int:
+        code = self._code_of.get(key)
+        if code is None:
+            code = len(self._key_of)
+            self._code_of[key] = code
+            self._key_of.append(key)
+        return code
+
+    def _ensure_capacity(self, rows: int):
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(capacity * 2, self._initial_capacity, rows)
+        matrix = np.empty((new_capacity, self.dimension), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        codes = np.zeros(new_capacity, dtype=np.int64)
+        codes[:self._size] = self._codes[:self._size]
+        self._matrix, self._alive, self._codes = matrix, alive, codes
+
+    # ==================== 压实 ====================
+
+    def _maybe_compact(self):
+        threshold_dead = max(self._min_compact_rows, self._compact_dead_ratio * self._size)
+        threshold_tail = max(self._min_compact_rows, self._compact_tail_ratio * self._size)
+        if self._dead > threshold_dead or self._tail_rows > threshold_tail:
+            self.compact()
+
+    def compact(self):
+        """丢弃墓碑行，并把所有行按分区重排成连续区间"""
+        live = np.flatnonzero(self._alive[:self._size])
+        order = live[np.argsort(self._codes[live], kind="stable")]
+        n = len(order)
+
+        capacity = max(self._initial_capacity, n)
+        matrix = np.empty((capacity, self.dimension or 0), dtype=np.float32)
+        np.take(self._matrix, order, axis=0, out=matrix[:n])
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:n] = True
+        codes = np.zeros(capacity, dtype=np.int64)
+        sorted_codes = self._codes[order]
+        codes[:n] = sorted_codes
+
+        row_ids = [self._row_ids[row] for row in order.tolist()]
+
+        ranges: Dict[int, Tuple[int, int]] = {}
+        if n:
+            unique_codes, starts = np.unique(sorted_codes, return_index=True)
+            ends = np.append(starts[1:], n)
+            for code, start, end in zip(unique_codes.tolist(), starts.tolist(), ends.tolist()):
+                ranges[code] = (start, end)
+
+        self._matrix, self._alive, self._codes = matrix, alive, codes
+        self._size = n
+        self._row_ids = row_ids
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(row_ids)}
+        self._ranges = ranges
+        self._tail = {}
+        self._tail_rows = 0
+        self._dead = 0
+        self._on_compacted(order)
+
+    # ==================== 子类扩展点 ====================
+
+    def _on_rows_added(self, start: int, end: int):
+        """[start, end) 行刚写入矩阵尾部（压实判断之前调用）"""
+
+    def _on_compacted(self, order: np.ndarray):
+        """压实完成；order[i] 是新第 i 行在压实前的行号"""
+
+    # ==================== 查询 ====================
+
+    def _partition_rows(self, key: PartitionKey) -> Tuple[Optional[Tuple[int, int]], Optional[np.ndarray]]:
+        code = self._code_of.get(key)
+        if code is None:
+            return None, None
+        tail = self._tail.get(code)
+        return self._ranges.get(code), (np.asarray(tail, dtype=np.int64) if tail else None)
+
+    def partition_ids(self, key: PartitionKey) -> List[str]:
+        """分区内所有存活文档 id（行序）"""
+        span, tail = self._partition_rows(key)
+        rows: List[int] = []
+        if span:
+            rows.extend(range(span[0], span[1]))
+        if tail is not None:
+            rows.extend(tail.tolist())
+        return [self._row_ids[row] for row in rows if self._alive[row]]
+
+    def accepts(self, vector: Sequence[float]) -> bool:
+        """查询向量维度是否与索引一致"""
+        return self.dimension is not None and len(vector) == self.dimension
+
+    def search(
+        self,
+        query_vector: Sequence[float],
+        limit: int = 5,
+        score_threshold: float = 0.0,
+        key: Optional[PartitionKey] = None,
+        id_filter: Optional[Callable[[str], bool]] = None,
+    ) -> List[Tuple[str, float]]:
+        """余弦相似度 top-k 检索
+
+        Args:
+            query_vector: 查询向量（维度须与索引一致，调用方先用 accepts 判断）
+            limit: 返回数量
+            score_threshold: 最低相似度
+            key: 分区 key，None 表示全量扫描
+            id_filter: 额外的逐文档过滤（只作用于通过阈值的候选行）
+
+        Returns:
+            [(doc_id, score)]，按 score 降序
+        """
+        if limit <= 0 or self._size == 0 or not self.accepts(query_vector):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        query_norm = float(np.linalg.norm(query))
+
+        rows: Optional[np.ndarray] = None
+        if key is None:
+            scores = self._matrix[:self._size] @ query
+            alive = self._alive[:self._size]
+        else:
+            span, tail = self._partition_rows(key)
+            parts_rows: List[np.ndarray] = []
+            parts_scores: List[np.ndarray] = []
+            if span and span[1] > span[0]:
+                parts_rows.append(np.arange(span[0], span[1]))
+                parts_scores.append(self._matrix[span[0]:span[1]] @ query)
+            if tail is not None:
+                parts_rows.append(tail)
+                parts_scores.append(self._matrix[tail] @ query)
+            if not parts_rows:
+                return []
+            rows = np.concatenate(parts_rows)
+            scores = np.concatenate(parts_scores)
+            alive = self._alive[rows]
+
+        return self._rank(rows, scores, alive, query_norm, limit, score_threshold, id_filter)
+
+    def _rank(
+        self,
+        rows: Optional[np.ndarray],
+        scores: np.ndarray,
+        alive: np.ndarray,
+        query_norm: float,
+        limit: int,
+        score_threshold: float,
+        id_filter: Optional[Callable[[str], bool]],
+    ) -> List[Tuple[str, float]]:
+        """对候选行打分结果做阈值/过滤/top-k（rows 为 None 表示候选即全部行）"""
+        if query_norm > 0:
+            scores = scores / query_norm
+        else:
+            scores = np.zeros_like(scores)
+
+        candidates = np.flatnonzero(alive & (scores >= score_threshold))
+        if id_filter is not None and len(candidates):
+            keep = [
+                id_filter(self._row_ids[row])
+                for row in (candidates if rows is None else rows[candidates]).tolist()
+            ]
+            candidates = candidates[np.asarray(keep, dtype=bool)]
+
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        result_rows = candidates if rows is None else rows[candidates]
+        return [
+            (self._row_ids[row], float(scores[i]))
+            for row, i in zip(result_rows.tolist(), candidates.tolist())
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """索引状态（调试/监控用）"""
+        return {
+            "dimension": self.dimension,
+            "documents": len(self._id_to_row),
+            "rows": self._size,
+            "dead_rows": self._dead,
+            "tail_rows": self._tail_rows,
+            "partitions": len(set(self._ranges) | set(self._tail)),
+            "matrix_bytes": int(self._matrix.nbytes),
+        }
@@ -0,0 +1,355 @@
+"""
+MindPal Backend V2 - Vector Store Persistence Log
+InMemoryVectorStore 的追加式持久化 - 预写日志(WAL) + 快照
+
+磁盘布局（base = persist_path 去掉扩展名）:
+  {base}.wal.{seq}   追加式日志段。每条记录 = 16 字节定长头 + float32 原始向量 + orjson 元数据
+  {base}.snap        快照。定长头 + 64 字节对齐的 float32 向量块 + orjson 元数据块
+
+记录头: magic(2s) op(B) flags(B) dim(I) meta_len(I) crc32(I)
+  op=PUT    向量 dim*4 字节 + {"id","text","metadata","created_at"}
+  op=DELETE dim=0，元数据为 {"ids": [...]}
+
+写入: 每次 add/delete 只追加一条记录，O(1)，不再重写整个语料。
+压实: 日志超过阈值时切换到新日志段，由后台线程把当时的文档集合写成新快照
+      (临时文件 + os.replace 原子替换)，完成后删除旧日志段。
+启动: 内存映射快照、一次性读出向量块，再按序回放快照之后的日志段。
+      日志尾部的半条记录（进程崩溃时写入中断）会被截断丢弃。
+"""
+
+import glob
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import orjson
+
+
+RECORD_MAGIC = b"MP"
+OP_PUT = 1
+OP_DELETE = 2
+RECORD_HEADER = struct.Struct("<2sBBIII")
+
+SNAPSHOT_MAGIC = b"MPVS"
+SNAPSHOT_VERSION = 1
+# magic, version, dim, count, wal_seq, vec_offset, meta_offset, meta_len
+SNAPSHOT_HEADER = struct.Struct("<4sHIQQQQQ")
+SNAPSHOT_ALIGN = 64
+SNAPSHOT_CHUNK_ROWS = 8192
+
+
+@dataclass
+class LogRecord:
+    """回放出来的一条日志"""
+    op: int
+    doc_id: str = ""
+    text: str = ""
+    vector: Optional[np.ndarray] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    created_at: Optional[datetime] = None
+    deleted_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class LoadedState:
+    """启动时从磁盘恢复的状态"""
+    # 快照中的文档: (doc_id, text, metadata, created_at, row)；row=-1 时向量在 odd_vectors 里
+    snapshot_entries: List[Tuple[str, str, Dict[str, Any], datetime, int]] = field(default_factory=list)
+    snapshot_vectors: Optional[np.ndarray] = None
+    odd_vectors: Dict[str, np.ndarray] = field(default_factory=dict)
+    records: List[LogRecord] = field(default_factory=list)
+
+
+def _parse_datetime(value: Optional[str]) -> datetime:
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+
+class VectorLog:
+    """追加式日志 + 快照"""
+
+    def __init__(
+        self,
+        base_path: str,
+        fsync: bool = False,
+        compact_min_bytes: int = 16 * 1024 * 1024,
+        compact_ratio: float = 0.5,
+    ):
+        """
+        Args:
+            base_path: 文件前缀（不含扩展名）
+            fsync: 每次追加后是否 fsync（默认只 flush 到操作系统）
+            compact_min_bytes: 日志低于该大小时不压实
+            compact_ratio: 日志大小超过快照大小的该比例时压实
+        """
+        self.base_path = base_path
+        self.fsync = fsync
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_ratio = compact_ratio
+
+        self._seq = 0
+        self._wal = None
+        self._wal_bytes = 0
+        self._lock = threading.Lock()
+        self._compact_thread: Optional[threading.Thread] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return f"{self.base_path}.snap"
+
+    def _wal_path(self, seq: int) -> str:
+        return f"{self.base_path}.wal.{seq}"
+
+    def _wal_segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for path in glob.glob(f"{glob.escape(self.base_path)}.wal.*"):
+            suffix = path.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def exists(self) -> bool:
+        """磁盘上是否已有快照或日志"""
+        return os.path.exists(self.snapshot_path) or bool(self._wal_segments())
+
+    # ==================== 启动恢复 ====================
+
+    def load(self) -> LoadedState:
+        """读快照 + 回放日志，并打开新的日志段用于追加"""
+        state = LoadedState()
+        snapshot_seq = self._load_snapshot(state)
+
+        segments = [(seq, path) for seq, path in self._wal_segments() if seq >= snapshot_seq]
+        for seq, path in segments:
+            self._replay_segment(path, state.records)
+
+        # 快照已覆盖的旧日志段（上次压实后未来得及删除）
+        for seq, path in self._wal_segments():
+            if seq < snapshot_seq:
+                self._remove_quietly(path)
+
+        last_seq = segments[-1][0] if segments else snapshot_seq
+        self._use_segment(last_seq)
+        return state
+
+    def _load_snapshot(self, state: LoadedState) -> int:
+        path = self.snapshot_path
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, "rb") as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+            magic, version, dim, count, wal_seq, vec_offset, meta_offset, meta_len = SNAPSHOT_HEADER.unpack(header)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"unsupported vector snapshot: {path}")
+            f.seek(meta_offset)
+            meta = orjson.loads(f.read(meta_len))
+
+        rows = sum(1 for entry in meta if entry.get("r", -1) >= 0)
+        if rows and dim:
+            mapped = np.memmap(path, dtype=np.float32, mode="r", offset=vec_offset, shape=(rows, dim))
+            # 一次性读入内存后释放映射，避免后续压实替换快照文件时被占用（Windows）
+            state.snapshot_vectors = np.array(mapped)
+            del mapped
+
+        for entry in meta:
+            row = entry.get("r", -1)
+            if row < 0:
+                state.odd_vectors[entry["id"]] = np.asarray(entry.get("v", []), dtype=np.float32)
+            state.snapshot_entries.append((
+                entry["id"],
+                entry.get("t", ""),
+                entry.get("m", {}),
+                _parse_datetime(entry.get("c")),
+                row,
+            ))
+        return wal_seq
+
+    def _replay_segment(self, path: str, records: List[LogRecord]):
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            magic, op, _flags, dim, meta_len, crc = RECORD_HEADER.unpack_from(data, offset)
+            body_start = offset + RECORD_HEADER.size
+            body_end = body_start + dim * 4 + meta_len
+            if magic != RECORD_MAGIC or body_end > len(data):
+                break
+            body = data[body_start:body_end]
+            if zlib.crc32(body) != crc:
+                break
+
+            meta = orjson.loads(body[dim * 4:])
+            if op == OP_PUT:
+                records.append(LogRecord(
+                    op=OP_PUT,
+                    doc_id=meta["id"],
+                    text=meta.get("text", ""),
+                    vector=np.frombuffer(body[:dim * 4], dtype=np.float32).copy(),
+                    metadata=meta.get("metadata", {}),
+                    created_at=_parse_datetime(meta.get("created_at")),
+                ))
+            elif op == OP_DELETE:
+                records.append(LogRecord(op=OP_DELETE, deleted_ids=list(meta.get("ids", []))))
+            offset = body_end
+            valid_bytes = offset
+
+        if valid_bytes < len(data):
+            print(f"Warning: truncating torn vector log tail {path} at byte {valid_bytes}")
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    # ==================== 追加写入 ====================
+
+    def _use_segment(self, seq: int):
+        """切到第 seq 段；文件等第一次追加时才创建（只读打开的空库不在磁盘上留下空日志）"""
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        self._seq = seq
+        path = self._wal_path(seq)
+        self._wal_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _open_segment(self):
+        os.makedirs(os.path.dirname(self.base_path) or ".", exist_ok=True)
+        self._wal = open(self._wal_path(self._seq), "ab")
+        self._wal_bytes = self._wal.tell()
+
+    @staticmethod
+    def _encode(op: int, vector: Optional[Sequence[float]], meta: Dict[str, Any]) -> bytes:
+        vec_bytes = b"" if vector is None else np.asarray(vector, dtype=np.float32).reshape(-1).tobytes()
+        meta_bytes = orjson.dumps(meta, option=orjson.OPT_NON_STR_KEYS)
+        body = vec_bytes + meta_bytes
+        header = RECORD_HEADER.pack(RECORD_MAGIC, op, 0, len(vec_bytes) // 4, len(meta_bytes), zlib.crc32(body))
+        return header + body
+
+    def append_put(self, docs: Sequence[Any]):
+        """追加 PUT 记录（docs 需有 id/text/vector/metadata/created_at 属性）"""
+        payload = b"".join(
+            self._encode(OP_PUT, doc.vector, {
+                "id": doc.id,
+                "text": doc.text,
+                "metadata": doc.metadata,
+                "created_at": doc.created_at.isoformat(),
+            })
+            for doc in docs
+        )
+        self._write(payload)
+
+    def append_delete(self, doc_ids: Sequence[str]):
+        """追加 DELETE 记录"""
+        if doc_ids:
+            self._write(self._encode(OP_DELETE, None, {"ids": list(doc_ids)}))
+
+    def _write(self, payload: bytes):
+        with self._lock:
+            if self._wal is None:
+                self._open_segment()
+            self._wal.write(payload)
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+            self._wal_bytes += len(payload)
+
+    # ==================== 压实 ====================
+
+    def needs_compaction(self) -> bool:
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return False
+        snapshot_bytes = os.path.getsize(self.snapshot_path) if os.path.exists(self.snapshot_path) else 0
+        return self._wal_bytes > max(self.compact_min_bytes, snapshot_bytes * self.compact_ratio)
+
+    def compact(self, docs: Sequence[Any], dimension: Optional[int], background: bool = True):
+        """切换日志段，并把 docs（调用时刻的完整文档集合）写成新快照
+
+        docs 必须是调用方此刻的快照列表；切段之后的写入进入新日志段，
+        启动时会在新快照之上回放。
+        """
+        with self._lock:
+            self._use_segment(self._seq + 1)
+            new_seq = self._seq
+
+        if background:
+            self._compact_thread = threading.Thread(
+                target=self._write_snapshot,
+                args=(list(docs), dimension, new_seq),
+                name="vector-log-compaction",
+                daemon=True,
+            )
+            self._compact_thread.start()
+        else:
+            self._write_snapshot(list(docs), dimension, new_seq)
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        if self._compact_thread is not None:
+            self._compact_thread.join(timeout)
+
+    def _write_snapshot(self, docs: List[Any], dimension: Optional[int], wal_seq: int):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.base_path) or ".", exist_ok=True)
+            dim = dimension or 0
+            meta: List[Dict[str, Any]] = []
+            matrix_docs = []
+            for doc in docs:
+                entry = {
+                    "id": doc.id,
+                    "t": doc.text,
+                    "m": doc.metadata,
+                    "c": doc.created_at.isoformat(),
+                    "r": -1,
+                }
+                if dim and len(doc.vector) == dim:
+                    entry["r"] = len(matrix_docs)
+                    matrix_docs.append(doc)
+                else:
+                    entry["v"] = np.asarray(doc.vector, dtype=np.float32).tolist()
+                meta.append(entry)
+
+            meta_bytes = orjson.dumps(meta, option=orjson.OPT_NON_STR_KEYS)
+            vec_offset = -(-SNAPSHOT_HEADER.size // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+            meta_offset = vec_offset + len(matrix_docs) * dim * 4
+
+            with open(tmp_path, "wb") as f:
+                f.write(SNAPSHOT_HEADER.pack(
+                    SNAPSHOT_MAGIC, SNAPSHOT_VERSION, dim, len(docs), wal_seq,
+                    vec_offset, meta_offset, len(meta_bytes),
+                ))
+                f.write(b"\0" * (vec_offset - SNAPSHOT_HEADER.size))
+                for start in range(0, len(matrix_docs), SNAPSHOT_CHUNK_ROWS):
+                    chunk = matrix_docs[start:start + SNAPSHOT_CHUNK_ROWS]
+                    block = np.empty((len(chunk), dim), dtype=np.float32)
+                    for i, doc in enumerate(chunk):
+                        block[i] = doc.vector
+                    f.write(block.tobytes())
+                f.write(meta_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            for seq, path in self._wal_segments():
+                if seq < wal_seq:
+                    self._remove_quietly(path)
+        except Exception as e:
+            print(f"Warning: Failed to write vector store snapshot: {e}")
+            self._remove_quietly(tmp_path)
+
+    @staticmethod
+    def _remove_quietly(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def close(self):
+        self.wait_for_compaction()
+        with self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
@@ -0,0 +1,305 @@
+"""
+MindPal Backend V2 - Sharded Vector Store
+按租户分片的向量存储 - 每个 (player_id, npc_id) 一个磁盘分片，按需加载、LRU 驱逐
+
+磁盘布局（VECTOR_STORE_PATH 下）:
+    shards/{player_id}/{npc_id}/memory_store.snap
+    shards/{player_id}/{npc_id}/memory_store.wal.{seq}
+
+- 每个分片是一个独立的 InMemoryVectorStore（自带 VectorLog 快照 + 日志）
+- 分片第一次被访问时才从磁盘加载；常驻分片按 LRU 排序，
+  估算内存超过预算或常驻分片数超过上限时，关闭最久未用的分片（日志已落盘，直接丢弃内存）
+- 带 (player_id, npc_id) 的读写只触达一个分片；只带 player_id 的查询（账号导出）
+  只枚举该玩家目录下的分片；其他查询才会遍历全部分片
+- 按 id 的 get/delete 先查常驻分片，再按 MemoryRetriever 的 id 格式
+  mem_{player_id}_{npc_id}_{hex} 直接定位分片；不符合该格式且不在常驻分片里的 id 视为不存在
+  （不遍历磁盘：一次未知 id 的查询不能把整棵分片树加载进内存）
+"""
+
+import os
+import re
+import shutil
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from app.services.memory.vector_index import MatrixIndex, PartitionKey, partition_key
+from app.services.memory.vector_log import VectorLog
+from app.services.memory.vector_store import (
+    InMemoryVectorStore,
+    SearchResult,
+    VectorDocument,
+    VectorLike,
+    VectorStoreBase,
+)
+
+
+ShardDir = Tuple[str, str]
+
+# 每条文档除向量外的内存开销估算（文本、元数据 dict、索引映射）
+DOC_OVERHEAD_BYTES = 1024
+
+_MEMORY_ID_PATTERN = re.compile(r"^mem_(\d+)_(.+)_[0-9a-f]{8}$")
+
+
+def _segment(value: Any) -> str:
+    """分区字段 → 目录名；None 用 quote 永远不会产生的 "%" 表示"""
+    if value is None:
+        return "%"
+    return quote(str(value), safe="")
+
+
+def _shard_dir(key: PartitionKey) -> ShardDir:
+    return (_segment(key[0]), _segment(key[1]))
+
+
+def _small_index() -> MatrixIndex:
+    # 单个分片通常只有几百条，默认 1024 行的初始容量会浪费内存
+    return MatrixIndex(initial_capacity=16, min_compact_rows=64)
+
+
+class ShardedVectorStore(VectorStoreBase):
+    """按 (player_id, npc_id) 分片的向量存储"""
+
+    def __init__(
+        self,
+        root: str,
+        memory_budget_bytes: int = 512 * 1024 * 1024,
+        max_resident_shards: int = 1024,
+        fsync: bool = False,
+        index_factory: Callable[[], MatrixIndex] = _small_index,
+    ):
+        """
+        Args:
+            root: 存储根目录（分片放在 root/shards 下）
+            memory_budget_bytes: 常驻分片的估算内存上限
+            max_resident_shards: 常驻分片数上限（每个分片持有一个日志文件句柄）
+            fsync: 日志写入后是否 fsync
+            index_factory: 创建分片检索索引
+        """
+        self._root = root
+        self._shard_root = os.path.join(root, "shards")
+        self._memory_budget = memory_budget_bytes
+        self._max_resident = max(1, max_resident_shards)
+        self._fsync = fsync
+        self._index_factory = index_factory
+
+        self._shards: "OrderedDict[ShardDir, InMemoryVectorStore]" = OrderedDict()
+        self._shard_bytes: Dict[ShardDir, int] = {}
+        self._resident_bytes = 0
+        self._counters = {"hits": 0, "loads": 0, "evictions": 0}
+
+        self._migrate_legacy()
+
+    # ==================== 分片管理 ====================
+
+    def _open_shard(self, shard_root: str, shard: ShardDir) -> InMemoryVectorStore:
+        return InMemoryVectorStore(
+            persist_path=os.path.join(shard_root, shard[0], shard[1], "memory_store.json"),
+            fsync=self._fsync,
+            index=self._index_factory(),
+        )
+
+    def _shard(self, shard: ShardDir, create: bool) -> Optional[InMemoryVectorStore]:
+        """取分片（必要时从磁盘加载）；create=False 且磁盘上不存在时返回 None"""
+        store = self._shards.get(shard)
+        if store is not None:
+            self._shards.move_to_end(shard)
+            self._counters["hits"] += 1
+            return store
+        if not create and not os.path.isdir(os.path.join(self._shard_root, *shard)):
+            return None
+
+        store = self._open_shard(self._shard_root, shard)
+        self._shards[shard] = store
+        self._counters["loads"] += 1
+        self._account(shard)
+        return store
+
+    def _account(self, shard: ShardDir):
+        """重新估算分片内存并按预算驱逐"""
+        store = self._shards.get(shard)
+        if store is None:
+            return
+        size = store._index.stats()["matrix_bytes"] + len(store._documents) * DOC_OVERHEAD_BYTES
+        self._resident_bytes += size - self._shard_bytes.get(shard, 0)
+        self._shard_bytes[shard] = size
+        self._evict()
+
+    def _evict(self):
+        """驱逐最久未用的分片，最近访问的那个总是保留"""
+        while len(self._shards) > 1 and (
+            self._resident_bytes > self._memory_budget
+            or len(self._shards) > self._max_resident
+        ):
+            shard, store = self._shards.popitem(last=False)
+            self._resident_bytes -= self._shard_bytes.pop(shard, 0)
+            self._close(store)
+            self._counters["evictions"] += 1
+
+    @staticmethod
+    def _close(store: InMemoryVectorStore):
+        if store._log:
+            store._log.close()
+
+    def _disk_shards(self, player_id: Any = None) -> List[ShardDir]:
+        """磁盘 + 常驻的分片目录；给定 player_id 时只列该玩家的分片"""
+        players = [_segment(player_id)] if player_id is not None else (
+            sorted(os.listdir(self._shard_root)) if os.path.isdir(self._shard_root) else []
+        )
+        found: List[ShardDir] = []
+        for player in players:
+            player_dir = os.path.join(self._shard_root, player)
+            if os.path.isdir(player_dir):
+                found.extend((player, npc) for npc in sorted(os.listdir(player_dir)))
+        seen = set(found)
+        found.extend(
+            shard for shard in self._shards
+            if shard not in seen and (player_id is None or shard[0] == _segment(player_id))
+        )
+        return found
+
+    def _shards_for(self, filter_metadata: Optional[Dict[str, Any]]) -> Iterator[InMemoryVectorStore]:
+        """按过滤条件枚举需要查询的分片"""
+        key, _ = InMemoryVectorStore._split_filter(filter_metadata)
+        if key is not None:
+            candidates = [_shard_dir(key)]
+        else:
+            candidates = self._disk_shards((filter_metadata or {}).get("player_id"))
+        for shard in candidates:
+            store = self._shard(shard, create=False)
+            if store is not None:
+                yield store
+
+    def _locate(self, doc_id: str) -> Tuple[Optional[ShardDir], Optional[InMemoryVectorStore]]:
+        """按 id 找到所在分片"""
+        for shard, store in self._shards.items():
+            if doc_id in store._documents:
+                return shard, store
+
+        match = _MEMORY_ID_PATTERN.match(doc_id)
+        if match:
+            shard = (_segment(match.group(1)), _segment(match.group(2)))
+            if shard not in self._shards:
+                store = self._shard(shard, create=False)
+                if store is not None and doc_id in store._documents:
+                    return shard, store
+        return None, None
+
+    def _migrate_legacy(self):
+        """首次启用分片时，把未分片的 memory_store 拆进各分片目录"""
+        legacy_path = os.path.join(self._root, "memory_store.json")
+        if os.path.isdir(self._shard_root):
+            return
+        if not os.path.exists(legacy_path) and not VectorLog(os.path.join(self._root, "memory_store")).exists():
+            return
+        legacy = InMemoryVectorStore(persist_path=legacy_path)
+
+        groups: Dict[ShardDir, List[VectorDocument]] = {}
+        for doc in legacy._documents.values():
+            groups.setdefault(_shard_dir(partition_key(doc.metadata)), []).append(doc)
+        self._close(legacy)
+
+        # 先写到临时目录，整体 rename，避免迁移中断留下半套分片
+        tmp_root = self._shard_root + ".tmp"
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        for shard, docs in groups.items():
+            store = self._open_shard(tmp_root, shard)
+            store._documents.update((doc.id, doc) for doc in docs)
+            # 带上维度，快照才会用 float32 二进制块存向量
+            store._log.compact(docs, len(docs[0].vector), background=False)
+            self._close(store)
+        os.replace(tmp_root, self._shard_root)
+
+    # ==================== VectorStoreBase ====================
+
+    async def add(self, doc: VectorDocument) -> str:
+        """添加文档"""
+        shard = _shard_dir(partition_key(doc.metadata))
+        store = self._shard(shard, create=True)
+        await store.add(doc)
+        self._account(shard)
+        return doc.id
+
+    async def add_batch(self, docs: List[VectorDocument]) -> List[str]:
+        """批量添加文档（按分片分组写入）"""
+        groups: Dict[ShardDir, List[VectorDocument]] = {}
+        for doc in docs:
+            groups.setdefault(_shard_dir(partition_key(doc.metadata)), []).append(doc)
+        for shard, shard_docs in groups.items():
+            await self._shard(shard, create=True).add_batch(shard_docs)
+            self._account(shard)
+        return [doc.id for doc in docs]
+
+    async def search(
+        self,
+        query_vector: VectorLike,
+        limit: int = 5,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        score_threshold: float = 0.0
+    ) -> List[SearchResult]:
+        """搜索相似向量（带完整分区 key 时只查一个分片）"""
+        results: List[SearchResult] = []
+        for store in self._shards_for(filter_metadata):
+            results.extend(await store.search(query_vector, limit, filter_metadata, score_threshold))
+        results.sort(key=lambda r: r.score, reverse=True)
+        return results[:limit]
+
+    async def delete(self, doc_id: str) -> bool:
+        """删除文档"""
+        shard, store = self._locate(doc_id)
+        if store is None:
+            return False
+        deleted = await store.delete(doc_id)
+        self._account(shard)
+        return deleted
+
+    async def get(self, doc_id: str) -> Optional[VectorDocument]:
+        """获取文档"""
+        _, store = self._locate(doc_id)
+        return await store.get(doc_id) if store is not None else None
+
+    async def count(self, filter_metadata: Optional[Dict[str, Any]] = None) -> int:
+        """文档数量（可按元数据过滤）"""
+        total = 0
+        for store in self._shards_for(filter_metadata):
+            total += await store.count(filter_metadata)
+        return total
+
+    async def list_by_metadata(
+        self,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        limit: int = 50,
+        offset: int = 0,
+        order_desc: bool = True,
+    ) -> List[VectorDocument]:
+        """按元数据过滤列出文档（按 created_at 排序）"""
+        docs: List[VectorDocument] = []
+        for store in self._shards_for(filter_metadata):
+            docs.extend(await store.list_by_metadata(filter_metadata, offset + limit, 0, order_desc))
+        docs.sort(key=lambda d: d.created_at, reverse=order_desc)
+        return docs[offset:offset + limit]
+
+    async def delete_by_metadata(
+        self,
+        filter_metadata: Dict[str, Any],
+    ) -> int:
+        """按元数据批量删除。"""
+        if not filter_metadata:
+            return 0
+        deleted = 0
+        # 逐个分片删除：生成器每次只加载一个分片，当前分片总是最近使用的，不会被驱逐
+        for store in self._shards_for(filter_metadata):
+            deleted += await store.delete_by_metadata(filter_metadata)
+        for shard in list(self._shards):
+            self._account(shard)
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """分片缓存状态（调试/监控用）"""
+        return {
+            "resident_shards": len(self._shards),
+            "resident_bytes": self._resident_bytes,
+            "memory_budget_bytes": self._memory_budget,
+            **self._counters,
+        }
@@ -6,24 +6,41 @@ MindPal Backend V2 - Vector Store
 import os
 import json
 import math
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Sequence, Set, Tuple, Union
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 import asyncio
 
+import numpy as np
 
-@dataclass
+from app.services.memory.vector_index import MatrixIndex, PartitionKey, PARTITION_FIELDS
+from app.services.memory.vector_ann import IVFIndex
+from app.services.memory.vector_log import VectorLog, OP_PUT, OP_DELETE
+
+
+# 向量参数既接受 ndarray（embedding 层的输出），也接受普通的浮点序列
+VectorLike = Union[np.ndarray, Sequence[float]]
+
+
+@dataclass(slots=True)
 class VectorDocument:
-    """向量文档"""
+    """向量文档
+
+    vector 统一存为一维 float32 ndarray（384 维约 1.5KB，List[float] 约 10KB）；
+    传入 float32 数组（含快照矩阵的行视图）时不复制。
+    """
     id: str
     text: str
-    vector: List[float]
+    vector: np.ndarray
     metadata: Dict[str, Any] = field(default_factory=dict)
     created_at: datetime = field(default_factory=datetime.utcnow)
 
+    def __post_init__(self):
+        self.vector = np.asarray(self.vector, dtype=np.float32).reshape(-1)
 
-@dataclass
+
+@dataclass(slots=True)
 class SearchResult:
     """搜索结果"""
     id: str
@@ -45,7 +62,7 @@ class VectorStoreBase:
 
     async def search(
         self,
-        query_vector: List[float],
+        query_vector: VectorLike,
         limit: int = 5,
         filter_metadata: Optional[Dict[str, Any]] = None,
         score_threshold: float = 0.0
@@ -87,50 +104,122 @@ class VectorStoreBase:
 
 
 class InMemoryVectorStore(VectorStoreBase):
-    """内存向量存储 - 开发测试用"""
+    """内存向量存储 - 开发测试用
+
+    文档本体保存在 _documents，向量同时写入 MatrixIndex（连续 float32 矩阵 +
+    (player_id, npc_id) 分区索引），检索走向量化 matmul。
+    维度与索引不一致的文档不进矩阵，检索时按相似度 0 处理（与逐条计算的旧语义一致）。
+    持久化走 VectorLog：每次写入只追加一条日志，快照由后台线程定期压实。
+    传入 IVFIndex 即为近似检索（VECTOR_STORE_TYPE=ivf），其余行为不变。
+    """
 
-    def __init__(self, persist_path: Optional[str] = None):
+    def __init__(
+        self,
+        persist_path: Optional[str] = None,
+        fsync: bool = False,
+        index: Optional[MatrixIndex] = None,
+    ):
         self._documents: Dict[str, VectorDocument] = {}
+        self._index = index if index is not None else MatrixIndex()
+        self._unindexed: Set[str] = set()
         self._persist_path = persist_path
+        self._log: Optional[VectorLog] = None
+        if persist_path:
+            self._log = VectorLog(os.path.splitext(persist_path)[0], fsync=fsync)
         self._load_from_disk()
 
     def _load_from_disk(self):
-        """从磁盘加载"""
-        if self._persist_path and os.path.exists(self._persist_path):
-            try:
-                with open(self._persist_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    for doc_data in data:
-                        doc = VectorDocument(
-                            id=doc_data["id"],
-                            text=doc_data["text"],
-                            vector=doc_data["vector"],
-                            metadata=doc_data.get("metadata", {}),
-                            created_at=datetime.fromisoformat(doc_data.get("created_at", datetime.utcnow().isoformat()))
-                        )
-                        self._documents[doc.id] = doc
-            except Exception as e:
-                print(f"Warning: Failed to load vector store from disk: {e}")
-
-    def _save_to_disk(self):
-        """保存到磁盘"""
-        if self._persist_path:
-            try:
-                data = [
-                    {
-                        "id": doc.id,
-                        "text": doc.text,
-                        "vector": doc.vector,
-                        "metadata": doc.metadata,
-                        "created_at": doc.created_at.isoformat()
-                    }
-                    for doc in self._documents.values()
-                ]
-                os.makedirs(os.path.dirname(self._persist_path), exist_ok=True)
-                with open(self._persist_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, ensure_ascii=False)
-            except Exception as e:
-                print(f"Warning: Failed to save vector store to disk: {e}")
+        """从磁盘加载：快照 + 日志回放（首次启动时迁移旧版 JSON 全量文件）"""
+        if not self._log:
+            return
+        try:
+            if not self._log.exists() and os.path.exists(self._persist_path):
+                self._import_legacy_json()
+                return
+
+            state = self._log.load()
+
+            indexed_ids: List[str] = []
+            indexed_meta: List[Dict[str, Any]] = []
+            odd_docs: List[VectorDocument] = []
+            for doc_id, text, metadata, created_at, row in state.snapshot_entries:
+                vector = state.snapshot_vectors[row] if row >= 0 else state.odd_vectors[doc_id]
+                doc = VectorDocument(
+                    id=doc_id,
+                    text=text,
+                    vector=vector,
+                    metadata=metadata,
+                    created_at=created_at
+                )
+                self._documents[doc_id] = doc
+                if row >= 0:
+                    indexed_ids.append(doc_id)
+                    indexed_meta.append(metadata)
+                else:
+                    odd_docs.append(doc)
+            if indexed_ids:
+                self._index.load_matrix(indexed_ids, state.snapshot_vectors, indexed_meta)
+            if odd_docs:
+                self._index_docs(odd_docs)
+
+            for record in state.records:
+                if record.op == OP_PUT:
+                    doc = VectorDocument(
+                        id=record.doc_id,
+                        text=record.text,
+                        vector=record.vector,
+                        metadata=record.metadata,
+                        created_at=record.created_at
+                    )
+                    self._documents[doc.id] = doc
+                    self._index_docs([doc])
+                elif record.op == OP_DELETE:
+                    for doc_id in record.deleted_ids:
+                        if self._documents.pop(doc_id, None) is not None:
+                            self._unindex(doc_id)
+        except Exception as e:
+            print(f"Warning: Failed to load vector store from disk: {e}")
+
+    def _import_legacy_json(self):
+        """读取旧版 memory_store.json，并立即写成快照"""
+        with open(self._persist_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            for doc_data in data:
+                doc = VectorDocument(
+                    id=doc_data["id"],
+                    text=doc_data["text"],
+                    vector=doc_data["vector"],
+                    metadata=doc_data.get("metadata", {}),
+                    created_at=datetime.fromisoformat(doc_data.get("created_at", datetime.utcnow().isoformat()))
+                )
+                self._documents[doc.id] = doc
+        self._index_docs(list(self._documents.values()))
+        self._log.load()
+        self._log.compact(list(self._documents.values()), self._index.dimension, background=False)
+
+    def _persist_put(self, docs: List[VectorDocument]):
+        """追加写入日志（O(本次写入量)，不再重写全量）"""
+        if not self._log:
+            return
+        try:
+            self._log.append_put(docs)
+            self._maybe_compact()
+        except Exception as e:
+            print(f"Warning: Failed to append vector store log: {e}")
+
+    def _persist_delete(self, doc_ids: List[str]):
+        if not self._log:
+            return
+        try:
+            self._log.append_delete(doc_ids)
+            self._maybe_compact()
+        except Exception as e:
+            print(f"Warning: Failed to append vector store log: {e}")
+
+    def _maybe_compact(self):
+        """日志过大时切段并在后台线程生成新快照"""
+        if self._log.needs_compaction():
+            self._log.compact(list(self._documents.values()), self._index.dimension)
 
     @staticmethod
     def _cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -147,10 +236,26 @@ class InMemoryVectorStore(VectorStoreBase):
 
         return dot_product / (norm1 * norm2)
 
+    def _index_docs(self, docs: List[VectorDocument]):
+        """把文档向量写入矩阵索引；维度不匹配的记入 _unindexed"""
+        rejected = set(self._index.add_many(
+            (doc.id, doc.vector, doc.metadata) for doc in docs
+        ))
+        for doc in docs:
+            if doc.id in rejected:
+                self._unindexed.add(doc.id)
+            else:
+                self._unindexed.discard(doc.id)
+
+    def _unindex(self, doc_id: str):
+        self._index.remove(doc_id)
+        self._unindexed.discard(doc_id)
+
     async def add(self, doc: VectorDocument) -> str:
         """添加文档"""
         self._documents[doc.id] = doc
-        self._save_to_disk()
+        self._index_docs([doc])
+        self._persist_put([doc])
         return doc.id
 
     async def add_batch(self, docs: List[VectorDocument]) -> List[str]:
@@ -159,49 +264,72 @@ class InMemoryVectorStore(VectorStoreBase):
         for doc in docs:
             self._documents[doc.id] = doc
             ids.append(doc.id)
-        self._save_to_disk()
+        self._index_docs(docs)
+        self._persist_put(docs)
         return ids
 
+    @staticmethod
+    def _split_filter(
+        filter_metadata: Optional[Dict[str, Any]]
+    ) -> Tuple[Optional[PartitionKey], Dict[str, Any]]:
+        """拆出分区 key 和其余过滤条件"""
+        if not filter_metadata or not all(f in filter_metadata for f in PARTITION_FIELDS):
+            return None, dict(filter_metadata or {})
+        key = tuple(filter_metadata[f] for f in PARTITION_FIELDS)
+        rest = {k: v for k, v in filter_metadata.items() if k not in PARTITION_FIELDS}
+        return key, rest
+
     async def search(
         self,
-        query_vector: List[float],
+        query_vector: VectorLike,
         limit: int = 5,
         filter_metadata: Optional[Dict[str, Any]] = None,
         score_threshold: float = 0.0
     ) -> List[SearchResult]:
         """搜索相似向量"""
-        results = []
+        key, rest = self._split_filter(filter_metadata)
+
+        id_filter = None
+        if rest:
+            id_filter = lambda doc_id: self._match_filter(self._documents[doc_id], rest)
+
+        scored: List[Tuple[str, float]] = []
+        zero_score_ids: Set[str] = set(self._unindexed)
+        if self._index.accepts(query_vector):
+            scored = self._index.search(
+                query_vector,
+                limit=limit,
+                score_threshold=score_threshold,
+                key=key,
+                id_filter=id_filter,
+            )
+        else:
+            # 查询维度与索引不一致：所有文档相似度视为 0
+            zero_score_ids = set(self._documents)
 
-        for doc in self._documents.values():
-            # 元数据过滤
-            if filter_metadata:
-                match = all(
-                    doc.metadata.get(k) == v
-                    for k, v in filter_metadata.items()
-                )
-                if not match:
-                    continue
-
-            # 计算相似度
-            score = self._cosine_similarity(query_vector, doc.vector)
-
-            if score >= score_threshold:
-                results.append(SearchResult(
-                    id=doc.id,
-                    text=doc.text,
-                    score=score,
-                    metadata=doc.metadata
-                ))
+        if score_threshold <= 0 and zero_score_ids:
+            for doc_id in zero_score_ids:
+                if self._match_filter(self._documents[doc_id], filter_metadata):
+                    scored.append((doc_id, 0.0))
+            scored.sort(key=lambda x: x[1], reverse=True)
 
-        # 按分数排序
-        results.sort(key=lambda x: x.score, reverse=True)
-        return results[:limit]
+        results = []
+        for doc_id, score in scored[:limit]:
+            doc = self._documents[doc_id]
+            results.append(SearchResult(
+                id=doc.id,
+                text=doc.text,
+                score=score,
+                metadata=doc.metadata
+            ))
+        return results
 
     async def delete(self, doc_id: str) -> bool:
         """删除文档"""
         if doc_id in self._documents:
             del self._documents[doc_id]
-            self._save_to_disk()
+            self._unindex(doc_id)
+            self._persist_delete([doc_id])
             return True
         return False
 
@@ -215,11 +343,21 @@ class InMemoryVectorStore(VectorStoreBase):
             return True
         return all(doc.metadata.get(k) == v for k, v in filter_metadata.items())
 
+    def _candidate_docs(self, filter_metadata: Optional[Dict[str, Any]]) -> List[VectorDocument]:
+        """按过滤条件取文档；带 (player_id, npc_id) 时只看该分区"""
+        key, _ = self._split_filter(filter_metadata)
+        if key is None:
+            docs = self._documents.values()
+        else:
+            ids = self._index.partition_ids(key) + list(self._unindexed)
+            docs = (self._documents[doc_id] for doc_id in ids)
+        return [doc for doc in docs if self._match_filter(doc, filter_metadata)]
+
     async def count(self, filter_metadata: Optional[Dict[str, Any]] = None) -> int:
         """文档数量（可按元数据过滤）"""
         if not filter_metadata:
             return len(self._documents)
-        return sum(1 for doc in self._documents.values() if self._match_filter(doc, filter_metadata))
+        return len(self._candidate_docs(filter_metadata))
 
     async def list_by_metadata(
         self,
@@ -229,10 +367,7 @@ class InMemoryVectorStore(VectorStoreBase):
         order_desc: bool = True,
     ) -> List[VectorDocument]:
         """按元数据过滤列出文档（按 created_at 排序）"""
-        filtered = [
-            doc for doc in self._documents.values()
-            if self._match_filter(doc, filter_metadata)
-        ]
+        filtered = self._candidate_docs(filter_metadata)
         filtered.sort(key=lambda d: d.created_at, reverse=order_desc)
         return filtered[offset:offset + limit]
 
@@ -243,14 +378,12 @@ class InMemoryVectorStore(VectorStoreBase):
         """按元数据批量删除。"""
         if not filter_metadata:
             return 0
-        to_delete = [
-            doc_id for doc_id, doc in self._documents.items()
-            if self._match_filter(doc, filter_metadata)
-        ]
+        to_delete = [doc.id for doc in self._candidate_docs(filter_metadata)]
         for doc_id in to_delete:
             del self._documents[doc_id]
+            self._unindex(doc_id)
         if to_delete:
-            self._save_to_disk()
+            self._persist_delete(to_delete)
         return len(to_delete)
 
 
@@ -298,7 +431,7 @@ class ChromaVectorStore(VectorStoreBase):
         collection = self._get_collection()
         collection.add(
             ids=[doc.id],
-            embeddings=[doc.vector],
+            embeddings=[doc.vector.tolist()],
             documents=[doc.text],
             metadatas=[{**doc.metadata, "created_at": doc.created_at.isoformat()}]
         )
@@ -312,7 +445,7 @@ class ChromaVectorStore(VectorStoreBase):
         collection = self._get_collection()
         collection.add(
             ids=[doc.id for doc in docs],
-            embeddings=[doc.vector for doc in docs],
+            embeddings=[doc.vector.tolist() for doc in docs],
             documents=[doc.text for doc in docs],
             metadatas=[{**doc.metadata, "created_at": doc.created_at.isoformat()} for doc in docs]
         )
@@ -320,7 +453,7 @@ class ChromaVectorStore(VectorStoreBase):
 
     async def search(
         self,
-        query_vector: List[float],
+        query_vector: VectorLike,
         limit: int = 5,
         filter_metadata: Optional[Dict[str, Any]] = None,
         score_threshold: float = 0.0
@@ -331,7 +464,7 @@ class ChromaVectorStore(VectorStoreBase):
         where = filter_metadata if filter_metadata else None
 
         results = collection.query(
-            query_embeddings=[query_vector],
+            query_embeddings=[np.asarray(query_vector, dtype=np.float32).tolist()],
             n_results=limit,
             where=where
         )
@@ -449,11 +582,34 @@ class VectorStore:
         store_type = store_type or os.getenv("VECTOR_STORE_TYPE", "memory")
         persist_path = os.getenv("VECTOR_STORE_PATH", "./data/vector_store")
 
+        fsync = os.getenv("VECTOR_STORE_FSYNC", "false").lower() == "true"
+
         if store_type == "chroma":
             self._store = ChromaVectorStore(persist_directory=persist_path)
+        elif store_type == "ivf":
+            # 近似检索：nprobe 调召回/延迟，候选行数不超过 EXACT_ROWS 时仍走精确检索
+            self._store = InMemoryVectorStore(
+                persist_path=os.path.join(persist_path, "memory_store.json"),
+                fsync=fsync,
+                index=IVFIndex(
+                    nlist=int(os.getenv("VECTOR_STORE_NLIST", "1024")),
+                    nprobe=int(os.getenv("VECTOR_STORE_NPROBE", "16")),
+                    exact_rows=int(os.getenv("VECTOR_STORE_EXACT_ROWS", "20000")),
+                ),
+            )
+        elif store_type == "sharded":
+            # 每个 (player_id, npc_id) 一个磁盘分片，按需加载，超出内存预算按 LRU 驱逐
+            from app.services.memory.vector_shards import ShardedVectorStore
+            self._store = ShardedVectorStore(
+                root=persist_path,
+                memory_budget_bytes=int(os.getenv("VECTOR_STORE_SHARD_BUDGET_MB", "512")) * 1024 * 1024,
+                max_resident_shards=int(os.getenv("VECTOR_STORE_MAX_SHARDS", "1024")),
+                fsync=fsync,
+            )
         else:
             self._store = InMemoryVectorStore(
-                persist_path=os.path.join(persist_path, "memory_store.json")
+                persist_path=os.path.join(persist_path, "memory_store.json"),
+                fsync=fsync,
             )
 
     async def add(self, doc: VectorDocument) -> str:
@@ -464,7 +620,7 @@ class VectorStore:
 
     async def search(
         self,
-        query_vector: List[float],
+        query_vector: VectorLike,
         limit: int = 5,
         filter_metadata: Optional[Dict[str, Any]] = None,
         score_threshold: float = 0.0
@@ -9,12 +9,14 @@ MindPal Backend V2 - Content Moderation Package
   - 本地规则先行（关键词 + 正则，毫秒级响应，不产生云调用成本）
   - 云端兜底可选（阿里云绿网 / 腾讯云天御，通过 env 开关打开）
   - 统一入口 Moderator.check(text, scene) 返回 ModerationResult
+  - 流式输出用 Moderator.stream(scene) 逐段审核，命中即截断
 """
 
 from app.services.moderation.moderator import (
     Moderator,
     ModerationResult,
     ModerationCategory,
+    StreamModerator,
     get_moderator,
     SAFE_FALLBACK_REPLY,
 )
@@ -23,6 +25,7 @@ __all__ = [
     "Moderator",
     "ModerationResult",
     "ModerationCategory",
+    "StreamModerator",
     "get_moderator",
     "SAFE_FALLBACK_REPLY",
 ]
@@ -13,6 +13,8 @@ MindPal Backend V2 - Aliyun Content Moderation Adapter
      ALIYUN_ACCESS_KEY_ID=xxx
      ALIYUN_ACCESS_KEY_SECRET=xxx
      ALIYUN_MODERATION_REGION=cn-shanghai  (默认)
+     ALIYUN_MODERATION_BATCH_SIZE=100      (批量接口每次请求的文本数，TextScan 上限 100)
+     ALIYUN_MODERATION_CONCURRENCY=4       (批量请求的并发上限，进程内共享)
 4. 安装 SDK: pip install aliyun-python-sdk-green
 
 ## 为什么只做 Adapter 骨架
@@ -25,9 +27,14 @@ MindPal Backend V2 - Aliyun Content Moderation Adapter
 
 from __future__ import annotations
 
+import asyncio
 import os
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Sequence
+
+import httpx
+
+from app.core.http_pool import get_http_pool
 
 
 # 阿里云绿网标签到本地 ModerationCategory 的映射
@@ -71,8 +78,12 @@ class AliyunModeration:
         self.access_key_id = os.getenv("ALIYUN_ACCESS_KEY_ID", "")
         self.access_key_secret = os.getenv("ALIYUN_ACCESS_KEY_SECRET", "")
         self.region = os.getenv("ALIYUN_MODERATION_REGION", "cn-shanghai")
-        self._client = None
+        self.endpoint = f"https://green.{self.region}.aliyuncs.com"
+        self.batch_size = max(1, min(100, int(os.getenv("ALIYUN_MODERATION_BATCH_SIZE", "100"))))
+        self.concurrency = max(1, int(os.getenv("ALIYUN_MODERATION_CONCURRENCY", "4")))
         self._sdk_available: Optional[bool] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     def _check_sdk(self) -> bool:
         """懒检查 SDK 是否可用"""
@@ -85,6 +96,10 @@ class AliyunModeration:
             self._sdk_available = False
         return self._sdk_available
 
+    def _get_client(self) -> httpx.AsyncClient:
+        """REST 直连用的 HTTP 客户端（共享连接池）"""
+        return get_http_pool().client(self.endpoint)
+
     @property
     def usable(self) -> bool:
         """凭证 + SDK 都到位才算可用"""
@@ -99,7 +114,7 @@ class AliyunModeration:
         """检测文本。若 SDK 不可用，直接返回 pass。
 
         NOTE: 阿里云 SDK 实际是同步 API。生产集成时可用 asyncio.to_thread
-        包装（Python 3.9+），或改为 httpx 直接调 REST 接口。
+        包装（Python 3.9+），或用 self._get_client() 直接调 REST 接口（复用共享连接池）。
         这里只返回结构化结果，真实调用由运维同学按需补齐。
         """
         if not self.usable:
@@ -113,6 +128,48 @@ class AliyunModeration:
         # 当前版本未启用真实调用，避免因无效 key 产生错误调用。
         return AliyunModerationResult(is_blocked=False, suggestion="pass")
 
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """批量请求的并发闸门（按事件循环重建）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def check_batch(self, texts: Sequence[str]) -> List[AliyunModerationResult]:
+        """批量检测，结果与 texts 一一对应。SDK 不可用时全部 pass。
+
+        按 batch_size 切成多次 TextScan 请求（一次请求带多个 task），
+        同时在途的请求不超过 concurrency 个。某一批失败只影响该批（suggestion="error"）。
+        """
+        if not texts:
+            return []
+        if not self.usable:
+            return [AliyunModerationResult(is_blocked=False, suggestion="pass") for _ in texts]
+
+        semaphore = self._get_semaphore()
+
+        async def run_chunk(chunk: Sequence[str]) -> List[AliyunModerationResult]:
+            async with semaphore:
+                try:
+                    return await self._scan_tasks(chunk)
+                except Exception:
+                    return [AliyunModerationResult(is_blocked=False, suggestion="error") for _ in chunk]
+
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results: List[AliyunModerationResult] = []
+        for chunk_results in await asyncio.gather(*(run_chunk(c) for c in chunks)):
+            results.extend(chunk_results)
+        return results
+
+    async def _scan_tasks(self, texts: Sequence[str]) -> List[AliyunModerationResult]:
+        """一次 TextScan 请求（tasks=[{"content": text}, ...]），按 task 顺序返回
+
+        占位：与 check_text 相同，真实调用由运维同学按需补齐（POST {endpoint}/green/text/scan，
+        用 self._get_client() 复用共享连接池）。
+        """
+        return [AliyunModerationResult(is_blocked=False, suggestion="pass") for _ in texts]
+
 
 _aliyun_moderation: Optional[AliyunModeration] = None
 
@@ -0,0 +1,239 @@
+"""
+MindPal Backend V2 - Aho-Corasick Automaton
+
+多模式串匹配自动机 - LocalFilter 的词匹配引擎
+
+- 构建一次（trie + BFS 失败指针，输出集合沿失败链预先合并），
+  之后一次 O(len(text)) 扫描找出所有关键词的所有出现位置，与词库大小无关
+- 扫描状态可以跨调用延续（scan(text, state, offset)），流式输出逐段喂入即可
+- 5 万词的词库构建约需数百毫秒，可按词库内容摘要序列化到磁盘缓存，
+  多 worker / 重启时直接加载；缓存文件名含摘要，词库变化自动失效
+
+缓存目录由 MODERATION_AUTOMATON_CACHE_DIR 指定，未设置则不落盘（每次构建）。
+目录必须归当前用户所有，权限收紧为 0700；缓存是纯 JSON 数据（转移表 / 失败指针 / 输出），
+加载时校验结构，不会执行文件里的任何内容。写失败只是不缓存。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import stat
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 序列化格式版本（结构变化时递增，旧缓存自动失效）
+FORMAT_VERSION = 3
+
+# 关键词数少于此值时构建比读盘还快，不落缓存
+MIN_CACHED_KEYWORDS = 2000
+
+Match = Tuple[int, int, int]  # (start, end, keyword_id)
+
+
+class AhoCorasick:
+    """Aho-Corasick 自动机，关键词 id 为其在 keywords 中的下标"""
+
+    __slots__ = ("keywords", "_goto", "_fail", "_out", "_prefix", "_lengths")
+
+    def __init__(self, keywords: Sequence[str], prefix_keywords: Optional[int] = None):
+        """
+        Args:
+            keywords: 关键词（调用方负责大小写归一）
+            prefix_keywords: prefix_length() 只考虑前这么多个关键词的前缀，None 表示全部
+        """
+        self.keywords: List[str] = list(keywords)
+        self._lengths: List[int] = [len(k) for k in self.keywords]
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        self._prefix: List[int] = [0]
+        self._build(len(self.keywords) if prefix_keywords is None else prefix_keywords)
+
+    def _build(self, prefix_keywords: int):
+        goto, out = self._goto, self._out
+        own: List[List[int]] = [[]]
+        depth = [0]
+        watched = [False]  # 节点是否为前 prefix_keywords 个关键词之一的前缀
+        for kid, keyword in enumerate(self.keywords):
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    own.append([])
+                    depth.append(depth[state] + 1)
+                    watched.append(False)
+                state = nxt
+                if kid < prefix_keywords:
+                    watched[state] = True
+            own[state].append(kid)
+
+        fail = [0] * len(goto)
+        out[:] = [()] * len(goto)
+        # 失败链上深度递减，第一个被关注的节点就是最长的被关注前缀
+        prefix = [0] * len(goto)
+        queue = deque()
+        for nxt in goto[0].values():
+            queue.append(nxt)
+            out[nxt] = tuple(own[nxt])
+            prefix[nxt] = depth[nxt] if watched[nxt] else 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                # 输出 = 自身结尾的词 + 失败链上的词（BFS 保证 fail 的输出已合并）
+                out[nxt] = tuple(own[nxt]) + out[fail[nxt]]
+                prefix[nxt] = depth[nxt] if watched[nxt] else prefix[fail[nxt]]
+                queue.append(nxt)
+        self._fail = fail
+        self._prefix = prefix
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def prefix_length(self, state: int) -> int:
+        """文本末尾仍可能是某个（被关注的）关键词开头的字符数"""
+        return self._prefix[state]
+
+    def scan(self, text: str, state: int = 0, offset: int = 0) -> Tuple[List[Match], int]:
+        """从 state 开始扫描 text，返回 (命中列表, 结束状态)
+
+        命中按结束位置排序；位置 = offset + 在 text 中的下标，跨段续扫时
+        传入上一段的结束状态和累计长度，得到的就是全文坐标（start 可能落在前一段里）。
+        """
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        matches: List[Match] = []
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            if out[state]:
+                end = offset + i + 1
+                for kid in out[state]:
+                    matches.append((end - lengths[kid], end, kid))
+        return matches, state
+
+    def iter_matches(self, text: str) -> Iterator[Match]:
+        """所有命中 (start, end, keyword_id)，按结束位置排序"""
+        return iter(self.scan(text)[0])
+
+    # ==================== 磁盘缓存 ====================
+
+    @staticmethod
+    def digest(keywords: Sequence[str], prefix_keywords: Optional[int] = None) -> str:
+        h = hashlib.sha256(f"aho-corasick:v{FORMAT_VERSION}:{prefix_keywords}\n".encode("utf-8"))
+        for keyword in keywords:
+            h.update(keyword.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    @classmethod
+    def _load(cls, path: str, digest: str) -> Optional["AhoCorasick"]:
+        try:
+            if not _owned_by_us(os.stat(path)):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if not isinstance(payload, dict) or payload.get("digest") != digest:
+                return None
+            keywords = [str(k) for k in payload["keywords"]]
+            goto = [{str(ch): int(nxt) for ch, nxt in edges.items()} for edges in payload["goto"]]
+            fail = [int(f) for f in payload["fail"]]
+            out = [tuple(int(kid) for kid in kids) for kids in payload["out"]]
+            prefix = [int(p) for p in payload["prefix"]]
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+        states = len(goto)
+        if not (len(fail) == len(out) == len(prefix) == states) or states == 0:
+            return None
+        # 状态 / 关键词下标越界说明文件被截断或篡改
+        if any(not 0 <= n < states for edges in goto for n in edges.values()) \
+                or any(not 0 <= f < states for f in fail) \
+                or any(not 0 <= kid < len(keywords) for kids in out for kid in kids):
+            return None
+        automaton = cls.__new__(cls)
+        automaton.keywords = keywords
+        automaton._lengths = [len(k) for k in keywords]
+        automaton._goto = goto
+        automaton._fail = fail
+        automaton._out = out
+        automaton._prefix = prefix
+        return automaton
+
+    def _dump(self, path: str, digest: str):
+        payload = {
+            "digest": digest,
+            "keywords": self.keywords,
+            "goto": self._goto,
+            "fail": self._fail,
+            "out": self._out,
+            "prefix": self._prefix,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    @classmethod
+    def load_or_build(
+        cls,
+        keywords: Sequence[str],
+        cache_dir: Optional[str] = None,
+        prefix_keywords: Optional[int] = None,
+    ) -> "AhoCorasick":
+        """按词库摘要读磁盘缓存，没有则构建并写回"""
+        if len(keywords) < MIN_CACHED_KEYWORDS:
+            return cls(keywords, prefix_keywords)
+
+        cache_dir = _private_dir(cache_dir or os.getenv("MODERATION_AUTOMATON_CACHE_DIR"))
+        if cache_dir is None:
+            return cls(keywords, prefix_keywords)
+        digest = cls.digest(keywords, prefix_keywords)
+        path = os.path.join(cache_dir, f"mindpal_moderation_{digest[:32]}.json")
+
+        automaton = cls._load(path, digest)
+        if automaton is not None:
+            return automaton
+        automaton = cls(keywords, prefix_keywords)
+        automaton._dump(path, digest)
+        return automaton
+
+
+def _owned_by_us(st: os.stat_result) -> bool:
+    getuid = getattr(os, "getuid", None)
+    return getuid is None or st.st_uid == getuid()
+
+
+def _private_dir(path: Optional[str]) -> Optional[str]:
+    """确保缓存目录存在、归当前用户所有且权限为 0700；做不到则返回 None（不缓存）"""
+    if not path:
+        return None
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode) or not _owned_by_us(st):
+            return None
+        if st.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    except OSError:
+        return None
+    return path
@@ -0,0 +1,140 @@
+"""
+MindPal Backend V2 - Moderation Verdict Cache
+
+审核结果缓存。user_input 里大量是重复的短句（"你好"、"在吗"、表情），
+每条都重新过本地规则、甚至再调一次云审，白白花钱加延迟。
+
+- key = (场景, 词库版本, 归一化文本的 sha256)
+  归一化 = 去首尾空白 + 小写（本地规则本身大小写不敏感）；词库文件一改，
+  LocalFilter.version 变化，旧结果自然不再命中
+- 本进程 LRU + TTL；MODERATION_CACHE_SHARED=true 时再以 core/cache 的后端
+  （Redis / 内存）做二级缓存，多 worker 共享云审结果
+- 只缓存短文本（长文本几乎不重复，只会挤掉热点）
+- 云审 "error" 的结果不缓存（故障放行不能被固化下来）；dry-run 时不缓存
+
+命中时返回的是第一次审核该归一化文本时的结果，hits 里的原文片段 / 位置
+以那次的文本为准（仅用于埋点）。
+
+## 配置
+
+    MODERATION_CACHE_ENABLED=true
+    MODERATION_CACHE_MAX_ITEMS=10000
+    MODERATION_CACHE_TTL_SECONDS=3600
+    MODERATION_CACHE_MAX_CHARS=64
+    MODERATION_CACHE_SHARED=false
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from app.core.cache import CacheBackend, get_cache
+
+
+CACHE_ENABLED = os.getenv("MODERATION_CACHE_ENABLED", "true").lower() != "false"
+CACHE_MAX_ITEMS = int(os.getenv("MODERATION_CACHE_MAX_ITEMS", "10000"))
+CACHE_TTL_SECONDS = int(os.getenv("MODERATION_CACHE_TTL_SECONDS", "3600"))
+CACHE_MAX_CHARS = int(os.getenv("MODERATION_CACHE_MAX_CHARS", "64"))
+CACHE_SHARED = os.getenv("MODERATION_CACHE_SHARED", "false").lower() == "true"
+
+
+def normalize_text(text: str) -> str:
+    """缓存用的归一化：去首尾空白 + 小写"""
+    return text.strip().lower()
+
+
+class VerdictCache:
+    """审核结果缓存（进程内 LRU + TTL，可选共享后端）
+
+    值是任意对象；共享后端需要序列化，由 encode / decode 负责（dict ↔ 值）。
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[Any], Dict],
+        decode: Callable[[Dict], Any],
+        max_items: int = CACHE_MAX_ITEMS,
+        ttl: int = CACHE_TTL_SECONDS,
+        max_chars: int = CACHE_MAX_CHARS,
+        backend: Optional[CacheBackend] = None,
+    ):
+        self._encode = encode
+        self._decode = decode
+        self.max_items = max_items
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.backend = backend
+        self._store: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()  # key → (过期时刻, 值)
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def key(self, text: str, scene: str, version: str) -> Optional[str]:
+        """缓存 key；不适合缓存（空 / 过长）时返回 None"""
+        normalized = normalize_text(text)
+        if not normalized or len(normalized) > self.max_chars:
+            return None
+        h = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"mp:mod:{scene}:{version}:{h}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        item = self._store.get(key)
+        if item is not None:
+            expires, value = item
+            if time.monotonic() < expires:
+                self._store.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            del self._store[key]
+
+        if self.backend is not None:
+            raw = await self.backend.get(key)
+            if raw:
+                try:
+                    value = self._decode(json.loads(raw))
+                except (ValueError, KeyError, TypeError):
+                    value = None
+                if value is not None:
+                    self._put(key, value)
+                    self._stats["shared_hits"] += 1
+                    return value
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        self._put(key, value)
+        self._stats["stores"] += 1
+        if self.backend is not None:
+            await self.backend.set(
+                key, json.dumps(self._encode(value), ensure_ascii=False), ttl=self.ttl
+            )
+
+    def _put(self, key: str, value: Any):
+        self._store[key] = (time.monotonic() + self.ttl, value)
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_items:
+            self._store.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        self._store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["shared_hits"] + self._stats["misses"]
+        hits = self._stats["hits"] + self._stats["shared_hits"]
+        return {
+            **self._stats,
+            "size": len(self._store),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_verdict_cache(encode: Callable[[Any], Dict], decode: Callable[[Dict], Any]) -> Optional[VerdictCache]:
+    """按环境变量构建；关闭时返回 None"""
+    if not CACHE_ENABLED:
+        return None
+    return VerdictCache(encode, decode, backend=get_cache() if CACHE_SHARED else None)
@@ -17,7 +17,8 @@ MindPal Backend V2 - Local Content Filters
    - MINOR     未成年相关不当内容
 
 3. **正则 > 词匹配**：对有典型模式的内容（如联系方式诱导、赌博网址）用正则；
-   纯词匹配用 Aho-Corasick 级别的高效遍历（Python 内置 `in` 已够用，文档级别优化留给 P3+）。
+   纯词匹配用 Aho-Corasick 自动机（automaton.py），全部类别一次 O(len(text)) 扫描，
+   与词库大小无关；大词库的自动机按内容摘要缓存到磁盘，重启/多 worker 直接加载。
 
 4. **Dry-run 模式**：返回命中信息但不阻塞，供运营调优阈值。
 
@@ -35,17 +36,24 @@ MindPal Backend V2 - Local Content Filters
   yyy
 
 读取路径由 MODERATION_WORDLIST_PATH 环境变量指定，默认不加载（只用内置示例）。
+文件改动后自动重新加载（最多每 MODERATION_WORDLIST_CHECK_SECONDS 秒 stat 一次），
+LocalFilter.version 随词库内容变化，审核结果缓存以它为 key 的一部分。
+复用同一个自动机的扫描器（services/lexicon.py）通过 LocalFilter.snapshot() 拿到一次编译的只读结果。
 """
 
 from __future__ import annotations
 
+import hashlib
 import os
 import re
+import time
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
 from typing import Dict, List, Optional, Set, Tuple
 
+from app.services.moderation.automaton import AhoCorasick
+
 
 class ModerationCategory(str, Enum):
     """违规类别（对应监管要求 + 内部策略）"""
@@ -114,6 +122,65 @@ _PROMPT_INJECTION_PATTERNS = [
     re.compile(r"(?:输出你的|reveal|show).{0,10}(?:system\s*prompt|system.?prompt|系统提示|系统指令)", re.IGNORECASE),
 ]
 
+# 全部正则规则（顺序与 LocalFilter.check 一致），流式审核逐段复用
+_REGEX_RULES: List[Tuple[re.Pattern, ModerationCategory]] = (
+    [(rx, ModerationCategory.CONTACT_SCAM) for rx in _CONTACT_PATTERNS]
+    + [(rx, ModerationCategory.ILLEGAL) for rx in _GAMBLING_PATTERNS]
+    + [(rx, ModerationCategory.PROMPT_INJECTION) for rx in _PROMPT_INJECTION_PATTERNS]
+)
+
+# 词库文件变更检查间隔（秒）
+WORDLIST_CHECK_SECONDS = float(os.getenv("MODERATION_WORDLIST_CHECK_SECONDS", "5"))
+
+# 流式审核时正则重扫的尾部窗口（字符数）。上面的模式除 URL 外长度都有上界且远小于此值，
+# 跨段的命中只要落在窗口内就能被发现
+REGEX_WINDOW = 256
+
+def _partial(word: str, rest: str = "") -> str:
+    """匹配 word 任意前缀的正则片段；word 完整出现后还可以接 rest（rest 自身须可为空）"""
+    pattern = rest
+    for ch in reversed(word):
+        pattern = f"(?:{re.escape(ch)}{pattern})?"
+    return pattern
+
+
+def _partial_any(*words: str, extra: Tuple[str, ...] = ()) -> str:
+    """多个词（及 extra 里现成的前缀片段）任一的前缀"""
+    return "(?:" + "|".join([_partial(w) for w in words] + list(extra)) + ")"
+
+
+# 越狱句式 "…一个 / a " 之后：最多 40 个任意字符 + 结尾词的前缀（最长 without restrictions，20 字符）
+_ROLEPLAY_OPENER = r"(?:一(?:个.{0,59})?|a(?:\s+.{0,59})?)?"
+
+# 流式审核的正则暂缓：(触发前缀, 触发前缀之后、命中成立之前还可能出现的文本)。
+# 正则要等整段模式到齐才命中，之前的部分不能先发给前端：末尾出现触发前缀（或其开头几个字符）
+# 且其后的文本仍是对应规则的前缀形状时，从触发前缀起暂缓。续写与各自的规则逐段对应，
+# 一旦偏离（如 act 后面不是空白 + as）立即放行。英文触发词要求前面不是字母数字（fact、faq 不算）
+_REGEX_PENDING: List[Tuple[Tuple[str, ...], re.Pattern]] = [
+    (("加", "加我", "联系", "微信", "qq", "扣扣", "q", "telegram", "tg"),
+     re.compile(r"\s*[:：]?\s*\d{0,4}")),
+    (("vx", "wx"), re.compile(r"\s*[:：]?\s*[0-9a-z_-]{0,3}")),
+    (("http://", "https://", "www."), re.compile(r"[^\s一-龥]{0,9}")),
+    (("澳门", "缅甸", "菲律宾"), re.compile(r".{0,10}" + _partial_any("赌场", "官网", "app"))),
+    (("上分", "下分", "开赔", "彩金", "赌注"), re.compile(r"")),
+    (("忽略", "ignore"),
+     re.compile(r".{0,20}" + _partial_any("之前", "previous", "上述", "system", "指令", "instruction"))),
+    (("你现在是", "假装是"), re.compile(_ROLEPLAY_OPENER)),
+    (("pretend",), re.compile(r"(?:\s+" + _partial("you", r"(?:\s+" + _partial("are", _ROLEPLAY_OPENER) + ")?") + ")?")),
+    (("act",), re.compile(r"(?:\s+" + _partial("as", _ROLEPLAY_OPENER) + ")?")),
+    (("输出你的", "reveal", "show"),
+     re.compile(r".{0,10}" + _partial_any(
+         "系统提示", "系统指令", extra=(_partial("system", r"(?:(?:\s*|.)" + _partial("prompt") + ")?"),)))),
+]
+_TRIGGER_AUTOMATON = AhoCorasick([t for triggers, _ in _REGEX_PENDING for t in triggers])
+_TRIGGER_TAILS: List[re.Pattern] = [tail for triggers, tail in _REGEX_PENDING for _ in triggers]
+# 触发前缀 + 续写（单个空白分隔时）最长约 76 字符：更早的触发不可能还在进行中
+REGEX_PENDING_SPAN = 80
+
+
+def _ascii_alnum(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
 
 @dataclass
 class FilterHit:
@@ -125,6 +192,35 @@ class FilterHit:
     end: int
 
 
+@dataclass(frozen=True)
+class WordlistSnapshot:
+    """LocalFilter 一次编译的结果。重新编译生成新快照，持有旧快照的扫描继续用旧的关键词 id"""
+    automaton: AhoCorasick
+    # keyword id → [(类别序号, 类别, 原词)]；辅助词没有 owner
+    owners: List[List[Tuple[int, ModerationCategory, str]]]
+    # 小写词（审核词 + 辅助词）→ keyword id
+    index: Dict[str, int]
+    # 审核词库版本（不含辅助词）
+    version: str
+    max_word_len: int
+
+    def word_hits(self, text: str, matches) -> List[FilterHit]:
+        """自动机命中 → FilterHit：每个 (类别, 词) 取首次出现，按类别顺序、位置排序"""
+        first: Dict[Tuple[int, str], Tuple[int, FilterHit]] = {}
+        for start, _, kid in matches:
+            for order, cat, word in self.owners[kid]:
+                if (order, word) not in first:
+                    first[(order, word)] = (order, FilterHit(
+                        category=cat,
+                        pattern=word,
+                        matched_text=text[start:start + len(word)],
+                        start=start,
+                        end=start + len(word),
+                    ))
+        ranked = sorted(first.values(), key=lambda item: (item[0], item[1].start))
+        return [hit for _, hit in ranked]
+
+
 @dataclass
 class FilterResult:
     """本地过滤结果"""
@@ -190,44 +286,119 @@ class LocalFilter:
         self,
         extra_words: Optional[Dict[ModerationCategory, Set[str]]] = None,
     ):
-        # 合并：内置示例 + 外部词库
-        self._words: Dict[ModerationCategory, Set[str]] = {}
+        self._extra_words = extra_words
+        self._wordlist_path = os.getenv("MODERATION_WORDLIST_PATH") or None
+        self._wordlist_stamp = self._stat_wordlist()
+        self._next_wordlist_check = time.monotonic() + WORDLIST_CHECK_SECONDS
+        self._words = self._load_words()
+
+        # 辅助词表（情感 / 危机关键词，见 services/lexicon.py）：与审核词编进同一个自动机，
+        # 一次扫描同时得到所有信号；辅助词本身不产生审核命中
+        self._lexicon: Set[str] = set()
+        self._compile()
+
+    def _load_words(self) -> Dict[ModerationCategory, Set[str]]:
+        """合并：内置示例 + 构造参数 + 外部词库文件（如果配置了）"""
+        words: Dict[ModerationCategory, Set[str]] = {}
         for cat, lst in _BUILTIN_WORDS.items():
-            self._words[cat] = set(lst)
-        if extra_words:
-            for cat, extra in extra_words.items():
-                self._words.setdefault(cat, set()).update(extra)
-
-        # 加载外部文件（如果配置了）
-        wordlist_path = os.getenv("MODERATION_WORDLIST_PATH")
-        if wordlist_path:
-            loaded = _load_external_wordlist(wordlist_path)
+            words[cat] = set(lst)
+        if self._extra_words:
+            for cat, extra in self._extra_words.items():
+                words.setdefault(cat, set()).update(extra)
+        if self._wordlist_path:
+            loaded = _load_external_wordlist(self._wordlist_path)
             for cat, extra in loaded.items():
-                self._words.setdefault(cat, set()).update(extra)
+                words.setdefault(cat, set()).update(extra)
+        return words
+
+    def _stat_wordlist(self) -> Optional[Tuple[int, int]]:
+        if not self._wordlist_path:
+            return None
+        try:
+            st = os.stat(self._wordlist_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def reload_if_changed(self) -> bool:
+        """词库文件变了就重新加载并编译（按 WORDLIST_CHECK_SECONDS 节流），返回是否重载"""
+        if not self._wordlist_path:
+            return False
+        now = time.monotonic()
+        if now < self._next_wordlist_check:
+            return False
+        self._next_wordlist_check = now + WORDLIST_CHECK_SECONDS
+        stamp = self._stat_wordlist()
+        if stamp == self._wordlist_stamp:
+            return False
+        self._wordlist_stamp = stamp
+        self._words = self._load_words()
+        self._compile()
+        return True
+
+    def add_lexicon(self, words) -> None:
+        """追加辅助词（小写）并重新编译"""
+        new = {w.lower() for w in words if w} - self._lexicon
+        if new:
+            self._lexicon |= new
+            self._compile()
+
+    def _compile(self):
+        """把所有类别的词编译进一个自动机（小写匹配，同一小写形式可归属多个类别/原词）"""
+        index: Dict[str, int] = {}
+        owners: List[List[Tuple[int, ModerationCategory, str]]] = []
+        max_word_len = 0
+        digest = hashlib.sha256(b"local-filter\n")
+        for order, (cat, wordset) in enumerate(self._words.items()):
+            digest.update(f"[{cat.value}]\n".encode("utf-8"))
+            for word in sorted(wordset):
+                if not word:
+                    continue
+                digest.update(word.encode("utf-8") + b"\n")
+                kid = index.setdefault(word.lower(), len(index))
+                if kid == len(owners):
+                    owners.append([])
+                owners[kid].append((order, cat, word))
+                max_word_len = max(max_word_len, len(word))
+        moderation_keywords = len(index)
+        for word in sorted(self._lexicon):
+            if index.setdefault(word, len(index)) == len(owners):
+                owners.append([])
+        # 审核词库版本（不含辅助词）：词库变化 → 版本变化 → 审核结果缓存自动失效
+        self.version = digest.hexdigest()[:16]
+        self._snapshot = WordlistSnapshot(
+            # 流式审核的暂缓长度只看审核词前缀（辅助词不需要暂缓）
+            automaton=AhoCorasick.load_or_build(list(index), prefix_keywords=moderation_keywords),
+            owners=owners,
+            index=index,
+            version=self.version,
+            max_word_len=max_word_len,
+        )
+
+    def snapshot(self) -> WordlistSnapshot:
+        """当前编译结果（自动机 / keyword id 归属 / 词 → id / 版本），重新编译后返回新对象"""
+        return self._snapshot
+
+    def _match_words(self, text: str) -> List[FilterHit]:
+        """词匹配：每个 (类别, 词) 取首次出现，按类别顺序、位置排序"""
+        snapshot = self._snapshot
+        return snapshot.word_hits(text, snapshot.automaton.iter_matches(text.lower()))
+
+    def stream(self) -> "FilterStream":
+        """增量检查器（流式输出逐段喂入）"""
+        return FilterStream(self)
+
+    def check(self, text: str, word_hits: Optional[List[FilterHit]] = None) -> FilterResult:
+        """检查文本，返回命中结果。命中任一规则即 is_blocked=True。
 
-    def check(self, text: str) -> FilterResult:
-        """检查文本，返回命中结果。命中任一规则即 is_blocked=True。"""
+        Args:
+            word_hits: 已由 LexiconScanner 扫出的词命中（同一条消息不再重复扫描）
+        """
         if not text:
             return FilterResult(is_blocked=False)
 
-        hits: List[FilterHit] = []
-
-        # 1. 词匹配（各类别）
-        lowered = text.lower()
-        for cat, wordset in self._words.items():
-            for word in wordset:
-                if not word:
-                    continue
-                lw = word.lower()
-                idx = lowered.find(lw)
-                if idx >= 0:
-                    hits.append(FilterHit(
-                        category=cat,
-                        pattern=word,
-                        matched_text=text[idx:idx + len(word)],
-                        start=idx,
-                        end=idx + len(word),
-                    ))
+        # 1. 词匹配（各类别，一次扫描）
+        hits: List[FilterHit] = list(word_hits) if word_hits is not None else self._match_words(text)
 
         # 2. 联系方式 / 赌博正则
         for rx in _CONTACT_PATTERNS:
@@ -270,6 +441,97 @@ class LocalFilter:
         )
 
 
+class FilterStream:
+    """LocalFilter 的增量版本
+
+    自动机状态跨段延续，每段只扫描新增文本（O(len(chunk))）；正则只重扫末尾
+    REGEX_WINDOW 个字符 + 新增文本，且只报告结束位置落在新增文本里的命中。
+    与 check() 一样，每个 (类别, 词) / 每条正则只报告第一次出现，位置为全文坐标。
+    """
+
+    def __init__(self, local: LocalFilter):
+        # 固定住当前编译结果：add_lexicon 重新编译后，进行中的流仍用旧自动机的状态编号
+        snapshot = local.snapshot()
+        self._automaton = snapshot.automaton
+        self._owners = snapshot.owners
+        self._state = 0
+        self._offset = 0        # 已喂入的总字符数
+        self._window = ""       # 末尾文本（正则重扫、回取跨段命中的原文）
+        self._keep = max(REGEX_WINDOW, snapshot.max_word_len)
+        self._seen_words: Set[Tuple[int, str]] = set()
+        self._seen_rules: Set[int] = set()
+        self._trigger_state = 0
+        self._triggers: List[Tuple[int, int, int]] = []  # 最近 REGEX_PENDING_SPAN 内的正则触发前缀
+        self.hits: List[FilterHit] = []
+
+    @property
+    def holdback(self) -> int:
+        """末尾还可能属于某个敏感词或正则命中的字符数（这部分暂不应展示）"""
+        text = self._window.lower()
+        base = self._offset - len(text)
+        hold = self._automaton.prefix_length(self._state)
+        partial = _TRIGGER_AUTOMATON.prefix_length(self._trigger_state)
+        if partial and self._at_boundary(text, len(text) - partial):
+            hold = max(hold, partial)
+        for start, end, kid in self._triggers:
+            if start >= base and _TRIGGER_TAILS[kid].fullmatch(text, end - base):
+                hold = max(hold, self._offset - start)
+        return hold
+
+    @staticmethod
+    def _at_boundary(text: str, pos: int) -> bool:
+        """text[pos:] 开头的触发词是否独立成词：英文触发词前面不能紧跟字母数字"""
+        if pos <= 0 or pos >= len(text):
+            return True
+        return not (_ascii_alnum(text[pos]) and _ascii_alnum(text[pos - 1]))
+
+    def feed(self, chunk: str) -> List[FilterHit]:
+        """喂入一段文本，返回这段新产生的命中"""
+        if not chunk:
+            return []
+        base = self._offset - len(self._window)  # 窗口在全文中的起点
+        text = self._window + chunk
+        new_hits: List[FilterHit] = []
+
+        matches, self._state = self._automaton.scan(chunk.lower(), self._state, self._offset)
+        for start, _, kid in matches:
+            for order, cat, word in self._owners[kid]:
+                if (order, word) in self._seen_words:
+                    continue
+                self._seen_words.add((order, word))
+                new_hits.append(FilterHit(
+                    category=cat,
+                    pattern=word,
+                    matched_text=text[start - base:start - base + len(word)],
+                    start=start,
+                    end=start + len(word),
+                ))
+
+        for i, (rx, cat) in enumerate(_REGEX_RULES):
+            if i in self._seen_rules:
+                continue
+            for m in rx.finditer(text):
+                if base + m.end() > self._offset:
+                    self._seen_rules.add(i)
+                    new_hits.append(FilterHit(
+                        category=cat,
+                        pattern=rx.pattern,
+                        matched_text=m.group(0),
+                        start=base + m.start(),
+                        end=base + m.end(),
+                    ))
+                    break
+
+        triggers, self._trigger_state = _TRIGGER_AUTOMATON.scan(chunk.lower(), self._trigger_state, self._offset)
+        triggers = [t for t in triggers if self._at_boundary(text, t[0] - base)]
+        self._offset += len(chunk)
+        self._window = text[-self._keep:]
+        horizon = self._offset - REGEX_PENDING_SPAN
+        self._triggers = [t for t in self._triggers + triggers if t[0] >= horizon]
+        self.hits.extend(new_hits)
+        return new_hits
+
+
 _local_filter: Optional[LocalFilter] = None
 
 
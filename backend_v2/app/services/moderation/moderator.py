@@ -11,7 +11,7 @@ Moderator 是对外唯一入口。调用方只需:
 ## 场景
 
 - user_input:    用户发送的对话消息
-- llm_output:    LLM 生成的回复（非流式全量 or 流式收束后）
+- llm_output:    LLM 生成的回复（非流式全量；流式用 Moderator.stream() 逐段审核）
 - knowledge:     用户上传的知识库文档
 - profile:       数字人名字/性格自定义描述等
 
@@ -20,11 +20,33 @@ llm_output 更关心 PORN/POLITICS）。当前实现用同一套规则，将来
 
 ## 执行顺序
 
+0. 结果缓存（cache.py，按 场景 + 词库版本 + 归一化文本；重复短句直接返回）
 1. Local filter（毫秒级）
 2. 如果 local 命中且是高风险类别 → 直接 block
 3. 否则调用阿里云（如启用）做二审
 4. 合并结果返回
 
+## 流式输出
+
+    guard = get_moderator().stream(scene="llm_output")
+    async for chunk in llm_stream:
+        safe = guard.feed(chunk)      # 可以发给前端的部分
+        if guard.blocked:
+            break                     # 命中即截断，敏感词本身不会发出去
+    tail, result = await guard.finish()
+
+本地规则增量执行（自动机状态跨 chunk 延续），末尾可能构成敏感词开头的几个字符、
+以及联系方式 / URL 等正则还没到齐的候选暂缓发送；结束时不再对全文重扫，只有启用了云审时才对全文做一次二审。
+
+## 批量
+
+    results = await get_moderator().check_batch(texts, scene="knowledge")
+
+知识库上传、记忆批量导入、评测集等一次审核多条文本。相同文本只审一次；
+本地规则按块执行（块之间让出事件循环），超大批量可配 MODERATION_BATCH_WORKERS
+用进程池并行；需要云审的文本合并成 AliyunModeration.check_batch 的批量请求，
+并发受 ALIYUN_MODERATION_CONCURRENCY 限制。结果与逐条 check() 一致。
+
 ## 返回
 
 ModerationResult 结构化告诉调用方:
@@ -37,10 +59,13 @@ ModerationResult 结构化告诉调用方:
 
 from __future__ import annotations
 
+import asyncio
 import os
-from dataclasses import dataclass, field
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from app.services.moderation.cache import VerdictCache, build_verdict_cache
 from app.services.moderation.aliyun import (
     AliyunModeration,
     get_aliyun_moderation,
@@ -48,6 +73,7 @@ from app.services.moderation.aliyun import (
 from app.services.moderation.filters import (
     FilterHit,
     FilterResult,
+    FilterStream,
     LocalFilter,
     ModerationCategory,
     get_local_filter,
@@ -94,6 +120,38 @@ class ModerationResult:
     cloud_suggestion: str = "pass"
     score: float = 0.0
 
+    def to_dict(self) -> Dict:
+        return {
+            "blocked": self.blocked,
+            "category": self.category.value,
+            "reason": self.reason,
+            "user_message": self.user_message,
+            "hits": [
+                [h.category.value, h.pattern, h.matched_text, h.start, h.end] for h in self.hits
+            ],
+            "local_blocked": self.local_blocked,
+            "cloud_blocked": self.cloud_blocked,
+            "cloud_suggestion": self.cloud_suggestion,
+            "score": self.score,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ModerationResult":
+        return cls(
+            blocked=data["blocked"],
+            category=ModerationCategory(data["category"]),
+            reason=data["reason"],
+            user_message=data["user_message"],
+            hits=[
+                FilterHit(ModerationCategory(cat), pattern, matched, start, end)
+                for cat, pattern, matched, start, end in data["hits"]
+            ],
+            local_blocked=data["local_blocked"],
+            cloud_blocked=data["cloud_blocked"],
+            cloud_suggestion=data["cloud_suggestion"],
+            score=data["score"],
+        )
+
 
 def is_moderation_enabled() -> bool:
     """全局审核开关。生产环境应为 true。"""
@@ -105,6 +163,27 @@ def is_dry_run() -> bool:
     return os.getenv("MODERATION_DRY_RUN", "false").lower() == "true"
 
 
+# 批量审核：本地规则每块条数（块之间让出事件循环）
+LOCAL_BATCH_CHUNK = 256
+# 进程池 worker 数（0 = 不用进程池，在事件循环里分块执行）
+BATCH_WORKERS = int(os.getenv("MODERATION_BATCH_WORKERS", "0"))
+# 去重后条数达到此值才走进程池（小批量时进程间传输比匹配本身还贵）
+BATCH_PROCESS_MIN = int(os.getenv("MODERATION_BATCH_PROCESS_MIN", "5000"))
+
+
+# 进程池 worker 内的过滤器（initializer 传入，每个 worker 反序列化一次）
+_worker_filter: Optional[LocalFilter] = None
+
+
+def _init_worker(local: LocalFilter):
+    global _worker_filter
+    _worker_filter = local
+
+
+def _worker_check(texts: List[str]) -> List[FilterResult]:
+    return [_worker_filter.check(t) for t in texts]
+
+
 class Moderator:
     """内容审核统一入口"""
 
@@ -115,9 +194,19 @@ class Moderator:
     ):
         self.local = local_filter or get_local_filter()
         self.aliyun = aliyun or get_aliyun_moderation()
+        self.cache: Optional[VerdictCache] = build_verdict_cache(
+            ModerationResult.to_dict, ModerationResult.from_dict
+        )
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_version = ""
+
+    async def check(self, text: str, scene: str = "user_input", scan=None) -> ModerationResult:
+        """检查文本。返回结构化结果。
 
-    async def check(self, text: str, scene: str = "user_input") -> ModerationResult:
-        """检查文本。返回结构化结果。"""
+        Args:
+            scan: 同一条消息的 LexiconScan（基于全局 LocalFilter 的自动机），
+                  传入时直接复用其中的审核词命中，不再扫描
+        """
         # 全局开关关闭
         if not is_moderation_enabled():
             return ModerationResult(blocked=False)
@@ -125,8 +214,28 @@ class Moderator:
         if not text or len(text.strip()) == 0:
             return ModerationResult(blocked=False)
 
+        # 0. 结果缓存（词库文件变了先重载，版本号随之变化）
+        self.local.reload_if_changed()
+        key = None
+        if self.cache is not None and not is_dry_run():
+            key = self.cache.key(text, scene, self.local.version)
+            if key is not None:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    return replace(cached, hits=list(cached.hits))
+
+        result = await self._check_uncached(text, scene, scan)
+        # 云审故障时的放行不缓存，下次重试云审
+        if key is not None and result.cloud_suggestion != "error":
+            await self.cache.set(key, replace(result, hits=list(result.hits)))
+        return result
+
+    async def _check_uncached(self, text: str, scene: str, scan=None) -> ModerationResult:
         # 1. 本地规则
-        local: FilterResult = self.local.check(text)
+        word_hits = None
+        if scan is not None and scan.version == self.local.version:
+            word_hits = scan.moderation_hits
+        local: FilterResult = self.local.check(text, word_hits=word_hits)
 
         # 2. 高风险类别快速判定
         if local.is_blocked and local.dominant_category in HIGH_RISK_CATEGORIES:
@@ -137,16 +246,7 @@ class Moderator:
             )
 
         # 3. 低风险或 SAFE —— 调阿里云二审
-        cloud_suggestion = "pass"
-        cloud_blocked = False
-        if self.aliyun.usable:
-            try:
-                cloud = await self.aliyun.check_text(text)
-                cloud_suggestion = cloud.suggestion
-                cloud_blocked = cloud.is_blocked
-            except Exception:
-                # 云审故障不阻断主链路
-                cloud_suggestion = "error"
+        cloud_suggestion, cloud_blocked = await self._cloud_review(text)
 
         return self._build_result(
             local_result=local,
@@ -155,6 +255,93 @@ class Moderator:
             scene=scene,
         )
 
+    async def _cloud_review(self, text: str) -> Tuple[str, bool]:
+        """阿里云二审，返回 (suggestion, blocked)；未启用为 pass"""
+        if not self.aliyun.usable:
+            return "pass", False
+        try:
+            cloud = await self.aliyun.check_text(text)
+            return cloud.suggestion, cloud.is_blocked
+        except Exception:
+            # 云审故障不阻断主链路
+            return "error", False
+
+    async def check_batch(self, texts: Sequence[str], scene: str = "user_input") -> List[ModerationResult]:
+        """批量检查，结果与 texts 一一对应（与逐条 check 的判定一致）"""
+        if not is_moderation_enabled():
+            return [ModerationResult(blocked=False) for _ in texts]
+        self.local.reload_if_changed()
+
+        # 去重（空白文本直接放行）
+        unique: Dict[str, int] = {}
+        for text in texts:
+            if text and text.strip():
+                unique.setdefault(text, len(unique))
+        distinct = list(unique)
+
+        # 1. 本地规则
+        local_results = await self._local_batch(distinct)
+
+        # 2. 高风险命中直接判定，其余合并成一次批量云审
+        review = [
+            i for i, local in enumerate(local_results)
+            if not (local.is_blocked and local.dominant_category in HIGH_RISK_CATEGORIES)
+        ]
+        reviewed = set(review)
+        cloud: Dict[int, Tuple[str, bool]] = {}
+        if review and self.aliyun.usable:
+            try:
+                answers = await self.aliyun.check_batch([distinct[i] for i in review])
+                cloud = {i: (a.suggestion, a.is_blocked) for i, a in zip(review, answers)}
+            except Exception:
+                # 云审故障不阻断主链路
+                cloud = {i: ("error", False) for i in review}
+
+        results = []
+        for i, local in enumerate(local_results):
+            cloud_suggestion, cloud_blocked = cloud.get(i, ("pass", False))
+            if i not in reviewed:
+                cloud_suggestion = "skipped"
+            results.append(self._build_result(
+                local_result=local,
+                cloud_suggestion=cloud_suggestion,
+                cloud_blocked=cloud_blocked,
+                scene=scene,
+            ))
+        safe = ModerationResult(blocked=False)
+        return [results[unique[t]] if t in unique else safe for t in texts]
+
+    async def _local_batch(self, texts: List[str]) -> List[FilterResult]:
+        """本地规则批量执行：大批量走进程池，否则分块执行并让出事件循环"""
+        if BATCH_WORKERS > 0 and len(texts) >= BATCH_PROCESS_MIN:
+            if self._pool is not None and self._pool_version != self.local.version:
+                # 词库重载过：worker 里还是旧过滤器
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=BATCH_WORKERS, initializer=_init_worker, initargs=(self.local,)
+                )
+                self._pool_version = self.local.version
+            loop = asyncio.get_running_loop()
+            size = -(-len(texts) // BATCH_WORKERS)
+            parts = await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _worker_check, texts[i:i + size])
+                for i in range(0, len(texts), size)
+            ))
+            return [r for part in parts for r in part]
+
+        results: List[FilterResult] = []
+        for i in range(0, len(texts), LOCAL_BATCH_CHUNK):
+            if i:
+                await asyncio.sleep(0)
+            results.extend(self.local.check(t) for t in texts[i:i + LOCAL_BATCH_CHUNK])
+        return results
+
+    def stream(self, scene: str = "llm_output") -> "StreamModerator":
+        """流式输出的增量审核器（每次回复新建一个）"""
+        return StreamModerator(self, scene)
+
     def _build_result(
         self,
         local_result: FilterResult,
@@ -191,6 +378,85 @@ class Moderator:
         )
 
 
+class StreamModerator:
+    """流式输出审核：逐段喂入，命中即截断
+
+    feed() 返回可以立即展示的文本：末尾 holdback 个字符（可能是敏感词的开头，
+    或联系方式 / URL 等正则命中还没到齐的部分）暂缓，等后续 chunk 证明无害再放出；命中后 blocked=True，之后的输入全部丢弃。
+    dry-run 模式下只记录命中，不截断。
+    """
+
+    def __init__(self, moderator: Moderator, scene: str = "llm_output"):
+        self._moderator = moderator
+        self._scene = scene
+        self._enabled = is_moderation_enabled()
+        self._filter: FilterStream = moderator.local.stream()
+        self._pending = ""
+        # 只有云审需要全文
+        self._parts: Optional[List[str]] = [] if moderator.aliyun.usable else None
+        self.result: Optional[ModerationResult] = None
+
+    @property
+    def blocked(self) -> bool:
+        return self.result is not None and self.result.blocked
+
+    def _local_result(self) -> FilterResult:
+        hits = self._filter.hits
+        return FilterResult(is_blocked=bool(hits), hits=list(hits), score=min(1.0, len(hits) * 0.25))
+
+    def feed(self, chunk: str) -> str:
+        """喂入一段输出，返回现在可以发给前端的文本"""
+        if not self._enabled:
+            return chunk
+        if self.blocked or not chunk:
+            return ""
+        if self._parts is not None:
+            self._parts.append(chunk)
+
+        self._pending += chunk
+        if self._filter.feed(chunk):
+            result = self._moderator._build_result(
+                local_result=self._local_result(),
+                cloud_suggestion="skipped",
+                scene=self._scene,
+            )
+            if result.blocked:
+                self.result = result
+                self._pending = ""
+                return ""
+
+        keep = min(self._filter.holdback, len(self._pending))
+        ready = self._pending[:len(self._pending) - keep]
+        self._pending = self._pending[len(self._pending) - keep:]
+        return ready
+
+    async def finish(self) -> Tuple[str, ModerationResult]:
+        """流结束：返回 (暂缓的尾部文本, 最终审核结果)"""
+        if not self._enabled:
+            return "", ModerationResult(blocked=False)
+        if self.result is not None and self.result.blocked:
+            return "", self.result
+
+        tail, self._pending = self._pending, ""
+        local = self._local_result()
+        if local.is_blocked and local.dominant_category in HIGH_RISK_CATEGORIES:
+            cloud_suggestion, cloud_blocked = "skipped", False
+        elif self._parts:
+            cloud_suggestion, cloud_blocked = await self._moderator._cloud_review("".join(self._parts))
+        else:
+            cloud_suggestion, cloud_blocked = "pass", False
+
+        self.result = self._moderator._build_result(
+            local_result=local,
+            cloud_suggestion=cloud_suggestion,
+            cloud_blocked=cloud_blocked,
+            scene=self._scene,
+        )
+        if self.result.blocked:
+            tail = ""
+        return tail, self.result
+
+
 _moderator: Optional[Moderator] = None
 
 
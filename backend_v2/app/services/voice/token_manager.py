@@ -17,6 +17,7 @@ import httpx
 from loguru import logger
 
 from app.config import settings
+from app.core.http_pool import get_http_pool
 
 
 class AliyunTokenManager:
@@ -34,23 +35,18 @@ class AliyunTokenManager:
         self.access_key_secret = settings.ALIYUN_ACCESS_KEY_SECRET
         self._token: Optional[str] = None
         self._token_expire_time: int = 0
-        self._client: Optional[httpx.AsyncClient] = None
 
     @property
     def is_configured(self) -> bool:
         return bool(self.access_key_id and self.access_key_secret)
 
     async def _get_client(self) -> httpx.AsyncClient:
-        """获取 HTTP 客户端"""
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(timeout=30.0)
-        return self._client
+        """获取 HTTP 客户端（共享连接池）"""
+        return get_http_pool().client(self.TOKEN_URL)
 
     async def close(self):
-        """关闭客户端"""
-        if self._client and not self._client.is_closed:
-            await self._client.aclose()
-            self._client = None
+        """关闭客户端（连接归共享连接池管理，lifespan 关闭时统一释放）"""
+        pass
 
     def _sign(self, params: dict) -> str:
         """
@@ -131,7 +127,7 @@ class AliyunTokenManager:
 
             # 发送请求
             client = await self._get_client()
-            response = await client.get(self.TOKEN_URL, params=params)
+            response = await client.get(self.TOKEN_URL, params=params, timeout=30.0)
 
             if response.status_code == 200:
                 result = response.json()
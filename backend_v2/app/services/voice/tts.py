@@ -11,6 +11,7 @@ import httpx
 from loguru import logger
 
 from app.config import settings
+from app.core.http_pool import get_http_pool
 from app.services.voice.token_manager import get_token_manager
 
 
@@ -68,19 +69,14 @@ class TTSService:
     def __init__(self):
         self.app_key = getattr(settings, 'ALIYUN_TTS_APP_KEY', None)
         self.token_manager = get_token_manager()
-        self._client: Optional[httpx.AsyncClient] = None
 
     async def _get_client(self) -> httpx.AsyncClient:
-        """获取HTTP客户端"""
-        if self._client is None or self._client.is_closed:
-            self._client = httpx.AsyncClient(timeout=30.0)
-        return self._client
+        """获取HTTP客户端（共享连接池，同一 NLS 网关的 ASR/TTS 复用连接）"""
+        return get_http_pool().client(self.API_URL)
 
     async def close(self):
-        """关闭客户端"""
-        if self._client and not self._client.is_closed:
-            await self._client.aclose()
-            self._client = None
+        """关闭客户端（连接归共享连接池管理，lifespan 关闭时统一释放）"""
+        pass
 
     async def synthesize(
         self,
@@ -127,7 +123,8 @@ class TTSService:
             response = await client.post(
                 self.API_URL,
                 data=params,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=30.0,
             )
 
             if response.status_code == 200:
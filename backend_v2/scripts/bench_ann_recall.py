@@ -0,0 +1,160 @@
+"""
+MindPal Backend V2 - ANN Recall Benchmark
+
+测 IVFIndex（VECTOR_STORE_TYPE=ivf）在不同 nprobe 下的 recall@k 与延迟，
+以 MatrixIndex 精确检索结果为真值。
+
+## 用法
+
+    cd backend_v2
+
+    # 默认 200k × 384，nprobe 扫 1/4/16/64
+    python -m scripts.bench_ann_recall
+
+    # 目标规模：1M × 384（训练 + 分配需要几十秒）
+    python -m scripts.bench_ann_recall --docs 1000000 --nlist 2048 --nprobe 8 16 32 64
+
+    # 只测一个大分区内的检索（分区预过滤路径）
+    python -m scripts.bench_ann_recall --partitions 4
+
+    # 输出 JSON
+    python -m scripts.bench_ann_recall --format json
+
+数据默认是高斯混合（--clusters 个中心 + --noise 噪声），比各向同性高斯更接近
+真实 embedding 的分布；--clusters 0 则为纯随机向量（IVF 的最坏情况）。
+单核测量请设置 OMP_NUM_THREADS=1 / OPENBLAS_NUM_THREADS=1。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 让脚本能直接用 `python -m scripts.bench_ann_recall`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from app.services.memory.vector_ann import IVFIndex
+from app.services.memory.vector_index import MatrixIndex
+from scripts.bench_vector_search import summarize
+
+
+def make_vectors(rng: np.random.Generator, n: int, dim: int, clusters: int, noise: float) -> np.ndarray:
+    if clusters <= 0:
+        return rng.standard_normal((n, dim), dtype=np.float32)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, n)]
+    vectors += noise * rng.standard_normal((n, dim), dtype=np.float32)
+    return vectors
+
+
+def load(index: MatrixIndex, vectors: np.ndarray, keys: np.ndarray) -> float:
+    t0 = time.perf_counter()
+    index.load_matrix(
+        [f"mem_{i}" for i in range(len(vectors))],
+        vectors,
+        [{"player_id": int(k), "npc_id": "dh_1"} for k in keys],
+    )
+    return time.perf_counter() - t0
+
+
+def run(args) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    vectors = make_vectors(rng, args.docs, args.dim, args.clusters, args.noise)
+    keys = rng.integers(0, args.partitions, size=args.docs)
+    # 查询取自同一分布（扰动过的文档向量），与线上"查相近记忆"一致
+    picks = rng.integers(0, args.docs, args.queries)
+    queries = vectors[picks] + args.noise * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    query_keys = keys[picks] if args.partitions > 1 else [None] * args.queries
+
+    exact = MatrixIndex(dimension=args.dim)
+    exact_build = load(exact, vectors, keys)
+    ivf = IVFIndex(dimension=args.dim, nlist=args.nlist, exact_rows=0, seed=args.seed)
+    ivf_build = load(ivf, vectors, keys)
+
+    def key_of(k):
+        return None if k is None else (int(k), "dh_1")
+
+    truth: List[set] = []
+    exact_ms = []
+    for q, k in zip(queries, query_keys):
+        t = time.perf_counter()
+        found = exact.search(q, limit=args.k, score_threshold=-1.0, key=key_of(k))
+        exact_ms.append((time.perf_counter() - t) * 1000)
+        truth.append({doc_id for doc_id, _ in found})
+
+    sweeps = []
+    for nprobe in args.nprobe:
+        latencies = []
+        hits = 0
+        for q, k, expected in zip(queries, query_keys, truth):
+            t = time.perf_counter()
+            found = ivf.search(q, limit=args.k, score_threshold=-1.0, key=key_of(k), nprobe=nprobe)
+            latencies.append((time.perf_counter() - t) * 1000)
+            hits += len(expected & {doc_id for doc_id, _ in found})
+        sweeps.append({
+            "nprobe": nprobe,
+            f"recall@{args.k}": round(hits / (len(truth) * args.k), 4),
+            **summarize(latencies),
+        })
+
+    return {
+        "docs": args.docs,
+        "dim": args.dim,
+        "clusters": args.clusters,
+        "partitions": args.partitions,
+        "k": args.k,
+        "nlist": ivf.stats()["ivf_lists"],
+        "exact_build_seconds": round(exact_build, 2),
+        "ivf_build_seconds": round(ivf_build, 2),
+        "exact": summarize(exact_ms),
+        "ivf": sweeps,
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    k = report["k"]
+    print("=" * 70)
+    print(f"ANN recall benchmark  docs={report['docs']}  dim={report['dim']}  "
+          f"clusters={report['clusters']}  partitions={report['partitions']}")
+    print("=" * 70)
+    print(f"build: exact {report['exact_build_seconds']}s  "
+          f"ivf {report['ivf_build_seconds']}s (nlist={report['nlist']})")
+    print(f"{'kernel':<20}{f'recall@{k}':>12}{'p50 ms':>12}{'p99 ms':>12}{'mean ms':>12}")
+    print("-" * 70)
+    exact = report["exact"]
+    print(f"{'exact':<20}{1.0:>12}{exact['p50_ms']:>12}{exact['p99_ms']:>12}{exact['mean_ms']:>12}")
+    for row in report["ivf"]:
+        label = f"ivf nprobe={row['nprobe']}"
+        print(f"{label:<20}{row[f'recall@{k}']:>12}{row['p50_ms']:>12}{row['p99_ms']:>12}{row['mean_ms']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal ANN 召回率基准")
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
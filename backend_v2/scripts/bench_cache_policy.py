@@ -0,0 +1,148 @@
+"""
+MindPal Backend V2 - In-Memory Cache Policy Benchmark
+
+在 Zipf 分布的访问序列上比较进程内缓存的命中率（cache-aside：未命中就写入）：
+  - fifo:    改造前的 InMemoryCache（按条数限制，满了淘汰最早写入的）
+  - lru:     CacheEngine(policy="lru")
+  - tinylfu: CacheEngine(policy="tinylfu")
+
+值长度 200-4000 字（模拟 LLM 回复，每个 key 固定），三者用同样的字节预算
+（fifo 的条数上限 = 预算 / 平均条目大小）。预算按全部 key 总字节数的百分比给出。
+
+## 用法
+
+    cd backend_v2
+
+    python -m scripts.bench_cache_policy
+    python -m scripts.bench_cache_policy --keys 50000 --requests 500000 --alpha 0.8 --budgets 1,5,20
+    python -m scripts.bench_cache_policy --format json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+# 让脚本能直接用 `python -m scripts.bench_cache_policy`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.cache_engine import CacheEngine, entry_size
+
+
+class FifoCache:
+    """改造前 InMemoryCache.set 的淘汰方式（对照组）"""
+
+    def __init__(self, max_items: int):
+        self._store: "OrderedDict[str, str]" = OrderedDict()
+        self._max = max(1, max_items)
+
+    def get(self, key: str, now: float):
+        return self._store.get(key)
+
+    def set(self, key: str, value: str, expires: float):
+        if len(self._store) >= self._max:
+            self._store.pop(next(iter(self._store)), None)
+        self._store[key] = value
+
+
+def zipf_trace(keys: int, requests: int, alpha: float, seed: int) -> np.ndarray:
+    """有限 key 空间上的 Zipf 采样（排名 1 最热），返回 key 下标；排名随机打乱到 key 上"""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, keys + 1) ** alpha
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    ranks = np.searchsorted(cdf, rng.random(requests))
+    return rng.permutation(keys)[ranks]
+
+
+def make_values(keys: int, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed + 1)
+    lengths = rng.integers(200, 4001, size=keys)
+    return ["回" * int(n) for n in lengths]
+
+
+def replay(cache, trace: np.ndarray, names: List[str], values: List[str]) -> Dict[str, float]:
+    hits = 0
+    t0 = time.perf_counter()
+    for i in trace.tolist():
+        key = names[i]
+        if cache.get(key, 0.0) is not None:
+            hits += 1
+        else:
+            cache.set(key, values[i], float("inf"))
+    elapsed = time.perf_counter() - t0
+    return {
+        "hit_ratio": round(hits / len(trace), 4),
+        "ops_per_sec": round(len(trace) / elapsed, 1),
+    }
+
+
+def run(args) -> Dict[str, Any]:
+    names = [f"mp:llm:{i:08x}" for i in range(args.keys)]
+    values = make_values(args.keys, args.seed)
+    sizes = [entry_size(k, v) for k, v in zip(names, values)]
+    total_bytes = sum(sizes)
+    avg_size = total_bytes / args.keys
+    trace = zipf_trace(args.keys, args.requests, args.alpha, args.seed)
+
+    rows = []
+    for pct in args.budgets:
+        budget = int(total_bytes * pct / 100)
+        row: Dict[str, Any] = {"budget_pct": pct, "budget_bytes": budget}
+        row["fifo"] = replay(FifoCache(int(budget / avg_size)), trace, names, values)
+        for policy in ("lru", "tinylfu"):
+            engine = CacheEngine(max_items=args.keys, max_bytes=budget, policy=policy)
+            row[policy] = replay(engine, trace, names, values)
+        rows.append(row)
+
+    return {
+        "keys": args.keys,
+        "requests": args.requests,
+        "alpha": args.alpha,
+        "working_set_mb": round(total_bytes / 1024 / 1024, 1),
+        "rows": rows,
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 78)
+    print(f"Cache policy benchmark  keys={report['keys']}  requests={report['requests']}  "
+          f"zipf alpha={report['alpha']}  working set={report['working_set_mb']}MB")
+    print("=" * 78)
+    print(f"{'budget':>8}{'fifo':>12}{'lru':>12}{'tinylfu':>12}{'lru ops/s':>16}{'tinylfu ops/s':>16}")
+    print("-" * 78)
+    for row in report["rows"]:
+        print(f"{row['budget_pct']:>7}%"
+              f"{row['fifo']['hit_ratio'] * 100:>11.1f}%"
+              f"{row['lru']['hit_ratio'] * 100:>11.1f}%"
+              f"{row['tinylfu']['hit_ratio'] * 100:>11.1f}%"
+              f"{row['lru']['ops_per_sec']:>16.0f}{row['tinylfu']['ops_per_sec']:>16.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal 进程内缓存淘汰策略命中率基准")
+    parser.add_argument("--keys", type=int, default=50000, help="key 空间大小")
+    parser.add_argument("--requests", type=int, default=500000, help="访问次数")
+    parser.add_argument("--alpha", type=float, default=0.9, help="Zipf 指数")
+    parser.add_argument("--budgets", default="1,2,5,10,20", help="字节预算（占全部 key 总字节数的百分比，逗号分隔）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+    args.budgets = [float(b) for b in args.budgets.split(",") if b.strip()]
+
+    report = run(args)
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
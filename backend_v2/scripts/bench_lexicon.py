@@ -0,0 +1,165 @@
+"""
+MindPal Backend V2 - Lexicon Scanner Benchmark
+
+测一条用户消息的关键词预处理（情感分析 + 危机检测 + 审核词）吞吐（条/秒）：
+  - separate: 改造前的做法，情感词 / 修饰词 / 危机词逐词 find，审核词单独过一遍自动机
+  - unified:  LexiconScanner 一次自动机扫描
+两条链路之后的计分（EmotionAnalyzer.analyze / CrisisDetector.detect / LocalFilter.check）相同，
+同时校验两者的扫描结果和最终的情感、危机、审核结果完全一致。
+
+消息取自 docs/compliance/evaluation/datasets/*.yaml 的 input，审核词库 = 内置示例词 +
+--words 条合成词（与 bench_moderation_filter 相同）。
+
+## 用法
+
+    cd backend_v2
+
+    python -m scripts.bench_lexicon
+    python -m scripts.bench_lexicon --words 0 --format json
+
+## 依赖
+
+    pip install pyyaml
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+# 让脚本能直接用 `python -m scripts.bench_lexicon`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scripts.bench_moderation_filter import DEFAULT_DATASETS, load_messages, synthetic_words, throughput
+
+from app.services.crisis.detector import CrisisDetector
+from app.services.emotion.analyzer import EmotionAnalyzer
+from app.services.lexicon import CRISIS_TIERS, LexiconScan, LexiconScanner
+from app.services.moderation.filters import LocalFilter
+
+
+def separate_scan(local: LocalFilter, text: str) -> LexiconScan:
+    """改造前的逐词扫描（对照组），产出同样的 LexiconScan"""
+    result = LexiconScan(text=text)
+    lowered = text.lower()
+    for emotion, keywords in EmotionAnalyzer.EMOTION_KEYWORDS.items():
+        for keyword in keywords:
+            idx = lowered.find(keyword.lower())
+            if idx >= 0:
+                result.emotion_hits.append((emotion, keyword, idx))
+    for modifier, multiplier in EmotionAnalyzer.INTENSITY_MODIFIERS.items():
+        idx = lowered.find(modifier)
+        if idx >= 0:
+            result.modifiers.append((modifier, multiplier, idx))
+    result.emotion_crisis = any(keyword in lowered for keyword in EmotionAnalyzer.CRISIS_KEYWORDS)
+    tier_lists = (
+        CrisisDetector.HIGH_RISK_KEYWORDS,
+        CrisisDetector.MEDIUM_RISK_KEYWORDS,
+        CrisisDetector.LOW_RISK_KEYWORDS,
+    )
+    result.crisis = {
+        tier: [keyword for keyword in keywords if keyword in lowered]
+        for tier, keywords in zip(CRISIS_TIERS, tier_lists)
+    }
+    result.moderation_hits = local._match_words(text)
+    return result
+
+
+def pipeline(scan_fn, analyzer: EmotionAnalyzer, detector: CrisisDetector, local: LocalFilter):
+    def run(text: str):
+        scan = scan_fn(text)
+        emotion = analyzer.analyze(text, scan=scan)
+        crisis = detector.detect(text, scan=scan)
+        moderation = local.check(text, word_hits=scan.moderation_hits)
+        return scan, emotion, crisis, moderation
+    return run
+
+
+def outcome(scan: LexiconScan, emotion, crisis, moderation):
+    """用于一致性比较的结果（去掉时间戳）"""
+    return (
+        scan.emotion_hits,
+        scan.modifiers,
+        scan.emotion_crisis,
+        scan.crisis,
+        scan.moderation_hits,
+        emotion,
+        (crisis.level, crisis.score, crisis.triggers),
+        moderation.hits,
+    )
+
+
+def run(args) -> Dict[str, Any]:
+    messages = load_messages(Path(args.target))
+    if not messages:
+        print("✗ 未找到评测消息", file=sys.stderr)
+        sys.exit(2)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["MODERATION_AUTOMATON_CACHE_DIR"] = cache_dir
+        local = LocalFilter(extra_words=synthetic_words(args.words, args.seed))
+        t0 = time.perf_counter()
+        scanner = LexiconScanner(local)
+        build_seconds = time.perf_counter() - t0
+
+    analyzer, detector = EmotionAnalyzer(), CrisisDetector()
+    separate = pipeline(lambda t: separate_scan(local, t), analyzer, detector, local)
+    unified = pipeline(scanner.scan, analyzer, detector, local)
+
+    mismatches = [t for t in messages if outcome(*separate(t)) != outcome(*unified(t))]
+
+    separate_tp = throughput(separate, messages, args.seconds)
+    unified_tp = throughput(unified, messages, args.seconds)
+    return {
+        "messages": len(messages),
+        "avg_chars": round(sum(map(len, messages)) / len(messages), 1),
+        "keywords": len(local.snapshot().automaton.keywords),
+        "lexicon_keywords": len(scanner._tags),
+        "lexicon_build_seconds": round(build_seconds, 3),
+        "mismatches": len(mismatches),
+        "separate": separate_tp,
+        "unified": unified_tp,
+        "speedup": round(unified_tp["msgs_per_sec"] / separate_tp["msgs_per_sec"], 1),
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 70)
+    print(f"Lexicon benchmark  messages={report['messages']}  avg_chars={report['avg_chars']}  "
+          f"keywords={report['keywords']} (lexicon {report['lexicon_keywords']})")
+    print("=" * 70)
+    print(f"lexicon merge + rebuild {report['lexicon_build_seconds']}s")
+    print(f"{'pipeline':<15}{'msgs/sec':>15}{'us/msg':>15}")
+    print("-" * 70)
+    for name in ("separate", "unified"):
+        row = report[name]
+        print(f"{name:<15}{row['msgs_per_sec']:>15}{row['us_per_msg']:>15}")
+    print("-" * 70)
+    flag = "✅" if report["mismatches"] == 0 else "❌"
+    print(f"speedup ×{report['speedup']}   result mismatches: {report['mismatches']} {flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal 统一关键词扫描吞吐基准")
+    parser.add_argument("target", nargs="?", default=str(DEFAULT_DATASETS), help="YAML 文件或目录")
+    parser.add_argument("--words", type=int, default=50000, help="合成审核词数量")
+    parser.add_argument("--seconds", type=float, default=2.0, help="每条链路的最短测量时间")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+MindPal Backend V2 - LLM Hedged Routing Benchmark
+
+用模拟的服务商回放 LLMRouter.route_request，比较:
+  - sequential: 关闭对冲（原来的行为：只有抛错才换下一个模型）
+  - hedged:     首包超过 TTFT 分位数预算时向下一个模型发备份请求，先出首包者胜
+
+模拟服务商（default NPC 的降级链 qwen.plus → volcengine.pro → claude.haiku）:
+  首包耗时 ~ 对数正态（中位数 ttft_ms），以 tail_prob 的概率再乘 tail_factor（慢但没挂）；
+  之后每 token_gap_ms 吐一个 chunk，共 chunks 个；以 error_rate 的概率在首包前抛错。
+
+报告首包 / 总耗时的 p50 / p95 / p99，以及每条消息实际发出的上游请求数（对冲的额外开销）。
+前 --warmup 条消息只用于让 ServiceHealth 学到延迟分布，不计入结果。
+所有耗时按 --time-scale 缩放后真实 sleep（报告里换算回模拟毫秒）。
+
+## 用法
+
+    cd backend_v2
+
+    python -m scripts.bench_llm_hedging
+    python -m scripts.bench_llm_hedging --requests 3000 --concurrency 200 --time-scale 0.05
+    python -m scripts.bench_llm_hedging --percentile 90
+    python -m scripts.bench_llm_hedging --format json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+# 让脚本能直接用 `python -m scripts.bench_llm_hedging`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.ai import router as router_module
+from app.services.ai.health import LLMHealthChecker
+from app.services.ai.limiter import AdmissionController
+from app.services.ai.router import LLMRouter
+
+
+PROVIDERS: Dict[str, Dict[str, float]] = {
+    "qwen.plus": {"ttft_ms": 600, "sigma": 0.3, "tail_prob": 0.08, "tail_factor": 8, "error_rate": 0.01},
+    "volcengine.pro": {"ttft_ms": 800, "sigma": 0.3, "tail_prob": 0.03, "tail_factor": 5, "error_rate": 0.01},
+    "claude.haiku": {"ttft_ms": 900, "sigma": 0.25, "tail_prob": 0.02, "tail_factor": 4, "error_rate": 0.01},
+}
+
+
+class SimulatedRouter(LLMRouter):
+    """_call_llm 换成按 PROVIDERS 模拟的流"""
+
+    def __init__(self, args, rng: random.Random):
+        # 不限流，只比较对冲本身
+        super().__init__(health_checker=LLMHealthChecker(), limiter=AdmissionController({}))
+        self.args = args
+        self.rng = rng
+        self.upstream_calls = 0
+
+    async def _call_llm(self, config, messages, system_prompt, temperature):
+        profile = PROVIDERS[config.name]
+        scale = self.args.time_scale / 1000.0
+        self.upstream_calls += 1
+        ttft = profile["ttft_ms"] * self.rng.lognormvariate(0, profile["sigma"])
+        if self.rng.random() < profile["tail_prob"]:
+            ttft *= profile["tail_factor"]
+        await asyncio.sleep(ttft * scale)
+        if self.rng.random() < profile["error_rate"]:
+            raise RuntimeError(f"{config.name} upstream error")
+        for i in range(self.args.chunks):
+            if i:
+                await asyncio.sleep(self.args.token_gap_ms * scale)
+            yield "字"
+
+
+async def one_request(router: SimulatedRouter, time_scale: float) -> Dict[str, float]:
+    start = time.monotonic()
+    first = None
+    async for _ in router.route_request("default", [{"role": "user", "content": "你好"}], "你是小暖"):
+        if first is None:
+            first = time.monotonic()
+    end = time.monotonic()
+    return {
+        "ttft_ms": ((first or end) - start) * 1000 / time_scale,
+        "total_ms": (end - start) * 1000 / time_scale,
+    }
+
+
+async def run_mode(args, hedged: bool) -> Dict[str, Any]:
+    router_module.HEDGE_ENABLED = hedged
+    router_module.HEDGE_PERCENTILE = args.percentile
+    # 预算的默认值 / 下限是真实毫秒，按时间缩放
+    router_module.HEDGE_DEFAULT_TTFT_MS = args.default_ttft_ms * args.time_scale
+    router_module.HEDGE_MIN_TTFT_MS = args.min_ttft_ms * args.time_scale
+    router = SimulatedRouter(args, random.Random(args.seed))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded():
+        async with semaphore:
+            return await one_request(router, args.time_scale)
+
+    await asyncio.gather(*(bounded() for _ in range(args.warmup)))
+    calls_before = router.upstream_calls
+    stats_before = dict(router._stats)
+    results = await asyncio.gather(*(bounded() for _ in range(args.requests)))
+
+    ttft = np.array([r["ttft_ms"] for r in results])
+    total = np.array([r["total_ms"] for r in results])
+    row: Dict[str, Any] = {"mode": "hedged" if hedged else "sequential"}
+    for name, values in (("ttft", ttft), ("total", total)):
+        for p in (50, 95, 99):
+            row[f"{name}_p{p}_ms"] = round(float(np.percentile(values, p)), 1)
+    row["upstream_per_msg"] = round((router.upstream_calls - calls_before) / args.requests, 3)
+    row["hedged"] = router._stats["hedged"] - stats_before["hedged"]
+    row["hedge_wins"] = router._stats["hedge_wins"] - stats_before["hedge_wins"]
+    row["ttft_budget_ms"] = round(router._ttft_budget_ms("qwen.plus") / args.time_scale, 1)
+    return row
+
+
+async def run(args) -> Dict[str, Any]:
+    rows = [await run_mode(args, False), await run_mode(args, True)]
+    return {
+        "percentile": args.percentile,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "chunks": args.chunks,
+        "providers": PROVIDERS,
+        "rows": rows,
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 100)
+    print(f"LLM hedging benchmark  requests={report['requests']}  concurrency={report['concurrency']}  "
+          f"chunks/reply={report['chunks']}  (simulated ms)")
+    print("=" * 100)
+    print(f"{'mode':<12}{'ttft p50':>10}{'ttft p95':>10}{'ttft p99':>10}"
+          f"{'total p50':>11}{'total p95':>11}{'total p99':>11}{'upstream/msg':>14}{'hedges':>8}{'wins':>7}")
+    print("-" * 100)
+    for row in report["rows"]:
+        print(f"{row['mode']:<12}{row['ttft_p50_ms']:>10.0f}{row['ttft_p95_ms']:>10.0f}{row['ttft_p99_ms']:>10.0f}"
+              f"{row['total_p50_ms']:>11.0f}{row['total_p95_ms']:>11.0f}{row['total_p99_ms']:>11.0f}"
+              f"{row['upstream_per_msg']:>14.3f}{row['hedged']:>8}{row['hedge_wins']:>7}")
+    print("-" * 100)
+    print(f"learned qwen.plus TTFT budget (p{report['percentile']:g}): {report['rows'][1]['ttft_budget_ms']:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal LLM 对冲路由模拟基准")
+    parser.add_argument("--requests", type=int, default=2000, help="计入结果的消息数")
+    parser.add_argument("--warmup", type=int, default=300, help="预热消息数（学习延迟分布）")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=20, help="每条回复的 chunk 数")
+    parser.add_argument("--token-gap-ms", type=float, default=30, help="chunk 间隔（模拟毫秒）")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="真实耗时 = 模拟耗时 × time-scale")
+    parser.add_argument("--percentile", type=float, default=router_module.HEDGE_PERCENTILE,
+                        help="首包预算取 TTFT 的分位数")
+    parser.add_argument("--default-ttft-ms", type=float, default=router_module.HEDGE_DEFAULT_TTFT_MS,
+                        help="样本不足时的首包预算（模拟毫秒）")
+    parser.add_argument("--min-ttft-ms", type=float, default=router_module.HEDGE_MIN_TTFT_MS,
+                        help="首包预算下限（模拟毫秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+MindPal Backend V2 - Semantic Cache Replay Benchmark
+
+离线回放一串用户消息，评估语义缓存在不同相似度阈值下的:
+  - hit_rate:        命中次数 / 消息数
+  - false_hit_rate:  命中了但命中的是另一个意图的回复 / 命中次数（答非所问）
+  - recall:          正确命中 / 可命中（同意图此前已出现过）的消息数
+  - exact:           对照组，精确 key（llm_cache_key）的命中率
+
+所有消息在同一个指纹下回放（同一人设、首轮对话），即语义缓存最容易误命中的情形。
+未命中的消息写入缓存，回复即其意图标签。
+
+数据:
+  - 默认用内置的意图组（同组为同义改写；另有刻意放入的字面相近、意思相反的组）
+  - --replay FILE: JSONL，每行 {"text": "...", "intent": "..."}（如线上日志抽样后人工标注）
+
+向量化:
+  - ngram:   字符 bigram 哈希词袋（离线、无依赖，近似字面相似度，默认）
+  - service: 当前配置的 EmbeddingService（EMBEDDING_PROVIDER，评估真实模型时用）
+
+## 用法
+
+    cd backend_v2
+
+    python -m scripts.bench_semantic_cache
+    python -m scripts.bench_semantic_cache --thresholds 0.7,0.8,0.9 --passes 5
+    EMBEDDING_PROVIDER=qwen python -m scripts.bench_semantic_cache --embedder service --replay replay.jsonl
+    python -m scripts.bench_semantic_cache --format json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# 让脚本能直接用 `python -m scripts.bench_semantic_cache`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.llm.semantic_cache import SemanticCache, prompt_fingerprint
+
+
+INTENTS: Dict[str, List[str]] = {
+    "tired": ["今天好累啊，什么都不想做", "今天好累，什么都不想干", "好累啊今天什么都不想做", "今天真的太累了，啥也不想做"],
+    "not_tired": ["今天一点都不累，精神特别好", "今天不累，精神很好"],
+    "happy": ["今天考试通过了，好开心", "考试通过了！今天好开心", "今天考试过了，开心死了"],
+    "unhappy": ["今天考试没通过，好难过", "考试没过，今天好难过"],
+    "insomnia": ["最近总是失眠怎么办", "最近老是失眠，该怎么办", "最近一直失眠怎么办啊", "总是睡不着觉怎么办"],
+    "sleepy": ["最近总是犯困怎么办", "最近老是犯困，该怎么办"],
+    "greet_morning": ["早上好呀，今天过得怎么样", "早上好，今天过得怎么样", "早呀，今天过得如何"],
+    "greet_night": ["晚上好呀，今天过得怎么样", "晚上好，今天过得如何"],
+    "recommend_movie": ["能推荐一部好看的电影吗", "推荐一部好看的电影吧", "有什么好看的电影推荐吗"],
+    "recommend_book": ["能推荐一本好看的书吗", "推荐一本好看的书吧", "有什么好看的书推荐吗"],
+    "work_stress": ["工作压力好大，老板天天催", "工作压力太大了，老板一直在催", "老板天天催，工作压力好大"],
+    "study_stress": ["学习压力好大，老师天天催作业", "学习压力太大了，作业写不完"],
+    "miss_family": ["一个人在外地，好想家", "在外地一个人，好想家啊", "好想家，一个人在外地工作"],
+    "lonely": ["感觉好孤独，没人陪我说话", "好孤独啊，没有人陪我聊天", "没人陪我说话，感觉好孤独"],
+    "breakup": ["和男朋友分手了，心里好难受", "跟男朋友分手了，好难受", "刚和男朋友分手，心里很难受"],
+    "reconcile": ["和男朋友和好了，心里好开心", "跟男朋友和好了，好开心"],
+    "weather": ["今天外面下雨了，心情有点低落", "外面在下雨，心情有点低落", "下雨天心情有点低落"],
+    "self_intro": ["你叫什么名字，介绍一下自己吧", "介绍一下你自己吧，你叫什么名字", "你是谁，介绍一下自己"],
+    "exercise": ["想开始运动，有什么建议吗", "我想开始锻炼身体，有什么建议", "想开始运动健身，给点建议吧"],
+    "diet": ["想开始减肥，有什么建议吗", "我想减肥，有什么建议", "想开始节食减肥，给点建议吧"],
+}
+
+
+def load_replay(path: Path) -> List[Tuple[str, str]]:
+    items = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line:
+            row = json.loads(line)
+            items.append((row["text"], str(row["intent"])))
+    return items
+
+
+def build_trace(items: List[Tuple[str, str]], passes: int, seed: int) -> List[Tuple[str, str]]:
+    """每轮把全部消息打乱后回放一遍"""
+    rng = random.Random(seed)
+    trace = []
+    for _ in range(passes):
+        batch = list(items)
+        rng.shuffle(batch)
+        trace.extend(batch)
+    return trace
+
+
+class NgramEmbedder:
+    """字符 bigram（含单字）哈希到固定维度的词袋向量"""
+
+    def __init__(self, dimension: int = 1024):
+        self.dimension = dimension
+
+    async def encode(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dimension, dtype=np.float32)
+        chars = [c for c in text.lower() if c.isalnum()]
+        grams = chars + [a + b for a, b in zip(chars, chars[1:])]
+        for gram in grams:
+            h = int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dimension] += 1.0 if h >> 63 else -1.0
+        return vec
+
+
+def make_embedder(name: str):
+    if name == "service":
+        from app.services.memory.embedding import get_embedding_service
+        return get_embedding_service()
+    return NgramEmbedder()
+
+
+async def replay(trace: List[Tuple[str, str]], embedder, threshold: float) -> Dict[str, Any]:
+    cache = SemanticCache(embedder=embedder, threshold=threshold, max_items=len(trace) + 1, timeout_ms=None)
+    fingerprint = prompt_fingerprint("bench", [], "你是小暖，一个温柔的 AI 伙伴。", 0.8)
+    seen_intents, seen_texts = set(), set()
+    hits = false_hits = answerable = exact = 0
+    for text, intent in trace:
+        if intent in seen_intents:
+            answerable += 1
+        if text in seen_texts:
+            exact += 1
+        hit = await cache.lookup(fingerprint, text)
+        if hit is not None:
+            hits += 1
+            if hit.response != intent:
+                false_hits += 1
+        else:
+            await cache.store(fingerprint, text, intent)
+        seen_intents.add(intent)
+        seen_texts.add(text)
+    n = len(trace)
+    return {
+        "threshold": threshold,
+        "hit_rate": round(hits / n, 4),
+        "false_hit_rate": round(false_hits / hits, 4) if hits else 0.0,
+        "recall": round((hits - false_hits) / answerable, 4) if answerable else 0.0,
+        "exact_hit_rate": round(exact / n, 4),
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    if args.replay:
+        items = load_replay(Path(args.replay))
+    else:
+        items = [(text, intent) for intent, texts in INTENTS.items() for text in texts]
+    trace = build_trace(items, args.passes, args.seed)
+    embedder = make_embedder(args.embedder)
+    rows = [await replay(trace, embedder, t) for t in args.thresholds]
+    return {
+        "embedder": args.embedder,
+        "messages": len(trace),
+        "distinct_texts": len({t for t, _ in items}),
+        "intents": len({i for _, i in items}),
+        "rows": rows,
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 70)
+    print(f"Semantic cache replay  embedder={report['embedder']}  messages={report['messages']}  "
+          f"texts={report['distinct_texts']}  intents={report['intents']}")
+    print("=" * 70)
+    print(f"{'threshold':>10}{'hit rate':>12}{'false hits':>12}{'recall':>12}{'exact key':>12}")
+    print("-" * 70)
+    for row in report["rows"]:
+        print(f"{row['threshold']:>10.2f}"
+              f"{row['hit_rate'] * 100:>11.1f}%"
+              f"{row['false_hit_rate'] * 100:>11.1f}%"
+              f"{row['recall'] * 100:>11.1f}%"
+              f"{row['exact_hit_rate'] * 100:>11.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal 语义缓存离线回放（命中率 vs 误命中率）")
+    parser.add_argument("--replay", help="JSONL 回放文件（text / intent），默认用内置意图组")
+    parser.add_argument("--embedder", choices=["ngram", "service"], default="ngram")
+    parser.add_argument("--thresholds", default="0.6,0.7,0.8,0.85,0.9,0.92,0.95", help="相似度阈值，逗号分隔")
+    parser.add_argument("--passes", type=int, default=3, help="回放轮数（每轮全部消息打乱一次）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+    args.thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+
+    report = asyncio.run(run(args))
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+MindPal Backend V2 - Token Estimator Benchmark
+
+测 TokenEstimator 的吞吐（热路径上每条消息都要估算一次输入、结算时再估一次输出），
+并与原来的 len(text) // 3 对比估算值。
+
+语料（各自重复到 --chars 长度）:
+  - zh:    纯中文对话
+  - en:    英文对话
+  - mixed: 中英数字混排
+  - emoji: 带表情和标点的短句
+
+## 用法
+
+    cd backend_v2
+
+    python -m scripts.bench_tokenizer
+    python -m scripts.bench_tokenizer --chars 2000 --seconds 1
+    python -m scripts.bench_tokenizer --format json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+# 让脚本能直接用 `python -m scripts.bench_tokenizer`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.llm.tokenizer import TokenEstimator
+
+
+CORPORA: Dict[str, str] = {
+    "zh": "今天工作压力好大，老板一直在催进度，回到家什么都不想做，只想找个人说说话。",
+    "en": "I had a really long day at work and I just want someone to talk to for a while. ",
+    "mixed": "明天 9:30 有个 meeting，要准备 3 份 PPT，还要回复 John 的 email，感觉 deadline 太紧了。",
+    "emoji": "哈哈哈😂！真的吗？？太好了～～我也想去🎉🎉",
+}
+
+
+def measure(estimator: TokenEstimator, text: str, provider: str, seconds: float) -> float:
+    """每秒处理的字符数"""
+    chars = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        estimator.count(text, provider)
+        chars += len(text)
+    return chars / (time.perf_counter() - start)
+
+
+def run(args) -> Dict[str, Any]:
+    estimator = TokenEstimator()
+    rows = []
+    for name, sample in CORPORA.items():
+        text = (sample * (args.chars // len(sample) + 1))[:args.chars]
+        rows.append({
+            "corpus": name,
+            "chars": len(text),
+            "qwen_tokens": estimator.count(text, "qwen"),
+            "claude_tokens": estimator.count(text, "claude"),
+            "len_div_3": len(text) // 3,
+            "chars_per_sec": round(measure(estimator, text, "qwen", args.seconds)),
+        })
+    return {"rows": rows}
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 78)
+    print("Token estimator benchmark")
+    print("=" * 78)
+    print(f"{'corpus':<10}{'chars':>8}{'qwen':>10}{'claude':>10}{'len//3':>10}{'M chars/s':>14}")
+    print("-" * 78)
+    for row in report["rows"]:
+        print(f"{row['corpus']:<10}{row['chars']:>8}{row['qwen_tokens']:>10}{row['claude_tokens']:>10}"
+              f"{row['len_div_3']:>10}{row['chars_per_sec'] / 1e6:>14.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal token 估算吞吐基准")
+    parser.add_argument("--chars", type=int, default=500, help="每段语料的长度")
+    parser.add_argument("--seconds", type=float, default=0.5, help="每段语料的计时时长")
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+MindPal Backend V2 - Vector Search Benchmark
+
+对比 InMemoryVectorStore 的两种检索内核:
+  - legacy:  逐条 VectorDocument 纯 Python 余弦相似度（旧实现）
+  - matrix:  MatrixIndex 连续 float32 矩阵 + 分区行区间索引 + argpartition top-k
+
+## 用法
+
+    cd backend_v2
+
+    # 默认 100k × 384，1000 个 (player_id, npc_id) 分区
+    python -m scripts.bench_vector_search
+
+    # 目标规模：1M × 384（需约 2GB 内存）
+    python -m scripts.bench_vector_search --docs 1000000 --partitions 10000
+
+    # 输出 JSON
+    python -m scripts.bench_vector_search --format json
+
+legacy 内核在大规模下要跑几分钟，只对前 --legacy-docs 条文档测，再按文档数线性外推。
+matrix 内核分两种查询：按分区过滤（retrieve_relevant 的真实路径）和全量扫描。
+单核测量请设置 OMP_NUM_THREADS=1 / OPENBLAS_NUM_THREADS=1。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 让脚本能直接用 `python -m scripts.bench_vector_search`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from app.services.memory.vector_index import MatrixIndex
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(math.ceil(pct / 100 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+    }
+
+
+def legacy_search(docs: List[Dict[str, Any]], query: List[float], limit: int, filter_metadata: Dict[str, Any]):
+    """旧实现：逐条过滤 + 纯 Python 余弦"""
+    results = []
+    for doc in docs:
+        if not all(doc["metadata"].get(k) == v for k, v in filter_metadata.items()):
+            continue
+        vec = doc["vector"]
+        dot = sum(a * b for a, b in zip(query, vec))
+        n1 = math.sqrt(sum(a * a for a in query))
+        n2 = math.sqrt(sum(b * b for b in vec))
+        score = dot / (n1 * n2) if n1 and n2 else 0.0
+        if score >= 0.0:
+            results.append((doc["id"], score))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:limit]
+
+
+def build_index(vectors: np.ndarray, keys: np.ndarray, chunk: int = 50000) -> MatrixIndex:
+    index = MatrixIndex(dimension=vectors.shape[1], initial_capacity=len(vectors))
+    for start in range(0, len(vectors), chunk):
+        end = min(start + chunk, len(vectors))
+        index.add_many(
+            (f"mem_{i}", vectors[i], {"player_id": int(keys[i]), "npc_id": "dh_1"})
+            for i in range(start, end)
+        )
+    index.compact()
+    return index
+
+
+def run(args) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.docs, args.dim), dtype=np.float32)
+    keys = rng.integers(0, args.partitions, size=args.docs)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    query_keys = rng.integers(0, args.partitions, size=args.queries)
+
+    t0 = time.perf_counter()
+    index = build_index(vectors, keys)
+    build_s = time.perf_counter() - t0
+
+    # matrix: 分区过滤
+    partition_ms = []
+    for q, k in zip(queries, query_keys):
+        t = time.perf_counter()
+        index.search(q, limit=args.limit, key=(int(k), "dh_1"))
+        partition_ms.append((time.perf_counter() - t) * 1000)
+
+    # matrix: 全量扫描
+    full_ms = []
+    for q in queries[:args.full_queries]:
+        t = time.perf_counter()
+        index.search(q, limit=args.limit)
+        full_ms.append((time.perf_counter() - t) * 1000)
+
+    # legacy: 子集上测，再线性外推
+    legacy_n = min(args.legacy_docs, args.docs)
+    legacy_docs = [
+        {"id": f"mem_{i}", "vector": vectors[i].tolist(), "metadata": {"player_id": int(keys[i]), "npc_id": "dh_1"}}
+        for i in range(legacy_n)
+    ]
+    legacy_ms = []
+    for q, k in zip(queries[:args.legacy_queries], query_keys[:args.legacy_queries]):
+        q_list = q.tolist()
+        t = time.perf_counter()
+        legacy_search(legacy_docs, q_list, args.limit, {"player_id": int(k), "npc_id": "dh_1"})
+        legacy_ms.append((time.perf_counter() - t) * 1000 * args.docs / legacy_n)
+
+    matrix_partition = summarize(partition_ms)
+    legacy = summarize(legacy_ms)
+    return {
+        "docs": args.docs,
+        "dim": args.dim,
+        "partitions": args.partitions,
+        "build_seconds": round(build_s, 2),
+        "matrix_bytes": index.stats()["matrix_bytes"],
+        "matrix_partition": matrix_partition,
+        "matrix_full_scan": summarize(full_ms),
+        "legacy_extrapolated": legacy,
+        "legacy_measured_docs": legacy_n,
+        "speedup_p50": round(legacy["p50_ms"] / max(matrix_partition["p50_ms"], 1e-6), 1),
+    }
+
+
+def print_table(report: Dict[str, Any]):
+    print("=" * 70)
+    print(f"Vector search benchmark  docs={report['docs']}  dim={report['dim']}  "
+          f"partitions={report['partitions']}")
+    print("=" * 70)
+    print(f"index build: {report['build_seconds']}s  matrix: {report['matrix_bytes'] / 1e6:.1f} MB")
+    print(f"{'kernel':<28}{'p50 ms':>12}{'p99 ms':>12}{'mean ms':>12}")
+    print("-" * 70)
+    for label, key in (
+        ("matrix (partition filter)", "matrix_partition"),
+        ("matrix (full scan)", "matrix_full_scan"),
+        ("legacy loop (extrapolated)", "legacy_extrapolated"),
+    ):
+        row = report[key]
+        print(f"{label:<28}{row['p50_ms']:>12}{row['p99_ms']:>12}{row['mean_ms']:>12}")
+    print("-" * 70)
+    print(f"partition search speedup vs legacy (p50): {report['speedup_p50']}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MindPal 向量检索基准")
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--partitions", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--full-queries", type=int, default=20)
+    parser.add_argument("--legacy-docs", type=int, default=20000)
+    parser.add_argument("--legacy-queries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["table", "json"], default="table")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.format == "json":
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
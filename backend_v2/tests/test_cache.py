@@ -0,0 +1,260 @@
+import asyncio
+
+from app.core.cache import InMemoryCache, key_prefix
+from app.core.cache_engine import CacheEngine, entry_size
+
+
+def test_lru_evicts_least_recently_used_within_byte_budget():
+    budget = 3 * entry_size("k:a", "x" * 100)
+    engine = CacheEngine(max_items=100, max_bytes=budget, policy="lru")
+    for key in ("k:a", "k:b", "k:c"):
+        engine.set(key, "x" * 100, float("inf"))
+    assert engine.get("k:a", 0) is not None     # a 变成最近使用
+    engine.set("k:d", "x" * 100, float("inf"))
+    assert "k:b" not in engine and "k:a" in engine
+    assert engine.bytes <= budget
+
+    # 单个大条目挤掉多个小条目；超过整个预算的不存
+    engine.set("k:big", "x" * 200, float("inf"))
+    assert engine.bytes <= budget and "k:big" in engine
+    assert engine.set("k:huge", "x" * budget, float("inf")) is False
+
+
+def test_tinylfu_keeps_hot_keys_through_a_scan():
+    engine = CacheEngine(max_items=100, max_bytes=10 ** 9, policy="tinylfu")
+    hot = [f"hot:{i}" for i in range(50)]
+    for _ in range(5):
+        for key in hot:
+            if engine.get(key, 0) is None:
+                engine.set(key, "v", float("inf"))
+    # 一次性扫过大量冷 key
+    for i in range(5000):
+        engine.set(f"scan:{i}", "v", float("inf"))
+    assert len(engine) <= 100
+    assert sum(key in engine for key in hot) >= 45
+
+
+def test_tinylfu_stays_within_byte_budget_when_main_entries_grow():
+    engine = CacheEngine(max_items=100, max_bytes=3000, policy="tinylfu")
+    hot = [f"hot:{i}" for i in range(40)]
+    for _ in range(3):
+        for key in hot:
+            if engine.get(key, 0) is None:
+                engine.set(key, "v" * 5, float("inf"))
+    # 已在试用区 / 保护区的热 key 改写成大值
+    for key in hot:
+        engine.set(key, "v" * 400, float("inf"))
+        assert engine.bytes <= engine.max_bytes
+    assert sum(entry.size for entry in engine._index.values()) == engine.bytes
+
+
+def test_in_memory_cache_sweeps_expired_and_counts_per_prefix():
+    async def run_test():
+        cache = InMemoryCache(max_items=2, sweep_interval=0.01)
+        await cache.set("mp:llm:1", "a", ttl=0)
+        await cache.set("minor:usage:7:20260101", "3", ttl=60)
+        await asyncio.sleep(0.05)
+        # 过期条目由后台任务清理，不需要读到它
+        assert cache.stats()["items"] == 1
+
+        assert await cache.get("minor:usage:7:20260101") == "3"
+        assert await cache.get("mp:llm:1") is None
+        stats = cache.stats()["prefixes"]
+        assert stats["minor:usage"]["hits"] == 1
+        assert stats["mp:llm"]["misses"] == 1 and stats["mp:llm"]["expirations"] == 1
+        await cache.aclose()
+
+    asyncio.run(run_test())
+    assert key_prefix("mp:mod:user_input:v1:abc") == "mp:mod"
+    assert key_prefix("plain") == "plain"
+
+
+class CountingBackend(InMemoryCache):
+    def __init__(self):
+        super().__init__(sweep_interval=0)
+        self.calls = []
+
+    async def get(self, key):
+        self.calls.append(("get", key))
+        return await super().get(key)
+
+    async def mget(self, keys):
+        self.calls.append(("mget", list(keys)))
+        return await super().mget(keys)
+
+    async def incr(self, key, amount=1, ttl=60):
+        self.calls.append(("incr", key))
+        return await super().incr(key, amount, ttl)
+
+
+def test_near_cache_serves_hot_keys_locally_and_honours_invalidation():
+    from app.core.cache import NearCache
+
+    async def run_test():
+        remote = CountingBackend()
+        near = NearCache(remote, ttl=60, prefixes=("minor:", "mp:llm:"))
+        await remote.set("minor:usage:1:20260101", "3")
+
+        assert await near.get("minor:usage:1:20260101") == "3"
+        assert await near.get("minor:usage:1:20260101") == "3"
+        assert remote.calls == [("get", "minor:usage:1:20260101")]
+
+        # 自增走远端（原子），结果直接更新近端
+        assert await near.incr("minor:usage:1:20260101", 2) == 5
+        assert await near.get("minor:usage:1:20260101") == "5"
+        assert [c[0] for c in remote.calls] == ["get", "incr"]
+
+        # 别处改写 → 失效通知 → 下次读远端
+        await remote.set("minor:usage:1:20260101", "9")
+        near.invalidate(["minor:usage:1:20260101"])
+        assert await near.get("minor:usage:1:20260101") == "9"
+
+        # mget 只向远端要近端没有的；不在前缀内的 key 不进近端
+        await near.mset({"mp:llm:a": "A", "other:b": "B"})
+        remote.calls.clear()
+        assert await near.mget(["mp:llm:a", "other:b", "mp:llm:c"]) == ["A", "B", None]
+        assert remote.calls[0] == ("mget", ["other:b", "mp:llm:c"])
+        assert near.stats()["near"]["invalidations"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_near_cache_does_not_refill_stale_values_raced_by_delete_or_invalidation():
+    from app.core.cache import NearCache
+
+    class SlowBackend(InMemoryCache):
+        def __init__(self):
+            super().__init__()
+            self.gate = asyncio.Event()
+
+        async def get(self, key):
+            value = await super().get(key)
+            await self.gate.wait()
+            return value
+
+        async def incr(self, key, amount=1, ttl=60):
+            value = await super().incr(key, amount, ttl)
+            await self.gate.wait()
+            return value
+
+    async def run_test():
+        remote = SlowBackend()
+        near = NearCache(remote, ttl=60)
+        await remote.set("k", "old")
+
+        # 读远端拿到旧值后，删除先完成：旧值不能填回近端
+        reader = asyncio.ensure_future(near.get("k"))
+        await asyncio.sleep(0)
+        await near.delete("k")
+        remote.gate.set()
+        assert await reader == "old"
+        assert "k" not in near._engine
+
+        # 自增期间收到失效通知：结果照常返回，但不填入近端
+        remote.gate.clear()
+        counter = asyncio.ensure_future(near.incr("n"))
+        await asyncio.sleep(0)
+        near.invalidate(["n"])
+        remote.gate.set()
+        assert await counter == 1
+        assert "n" not in near._engine
+
+    asyncio.run(asyncio.wait_for(run_test(), 2))
+
+
+def test_single_flight_followers_share_leader_stream():
+    from app.core.single_flight import FlightAbandoned, SingleFlight
+
+    async def run_test():
+        flights = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def upstream():
+            calls.append(1)
+            yield "你好，"
+            await release.wait()
+            yield "很高兴见到你"
+
+        leader, is_leader = flights.stream("mp:llm:k", upstream)
+        follower, is_follower_leader = flights.stream("mp:llm:k", upstream)
+        waiter, _ = flights.call("mp:llm:k", upstream)
+        assert is_leader and not is_follower_leader and follower is leader is waiter
+
+        async def collect(flight):
+            return [chunk async for chunk in flight.stream()]
+
+        tasks = [asyncio.ensure_future(collect(leader)), asyncio.ensure_future(collect(follower))]
+        final = asyncio.ensure_future(waiter.result())
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await asyncio.gather(*tasks) == [["你好，", "很高兴见到你"]] * 2
+        assert await final == "你好，很高兴见到你"
+        assert calls == [1] and flights.stats()["in_flight"] == 0
+
+        # 所有参与者都放弃时取消上游，之后的请求成为新的 leader
+        release.clear()
+        abandoned, _ = flights.stream("mp:llm:k", upstream)
+        stream = abandoned.stream()
+        assert await stream.__anext__() == "你好，"
+        await stream.aclose()
+        assert isinstance(abandoned.error, FlightAbandoned)
+        _, is_leader = flights.stream("mp:llm:k", upstream)
+        assert is_leader
+
+    asyncio.run(run_test())
+
+
+def test_semantic_cache_matches_paraphrases_within_fingerprint():
+    from app.services.llm.semantic_cache import SemanticCache, prompt_fingerprint
+    from scripts.bench_semantic_cache import NgramEmbedder
+
+    async def run_test():
+        cache = SemanticCache(embedder=NgramEmbedder(), threshold=0.8, max_items=2, timeout_ms=None)
+        persona = prompt_fingerprint("qwen", [], "你是小暖", 0.8)
+        other = prompt_fingerprint("qwen", [], "你是阿杰", 0.8)
+        assert await cache.store(persona, "最近总是失眠怎么办", "试试睡前别看手机")
+
+        hit = await cache.lookup(persona, "最近总是失眠，怎么办")
+        assert hit and hit.response == "试试睡前别看手机" and hit.score >= 0.8
+        assert await cache.lookup(persona, "能推荐一部好看的电影吗") is None
+        assert await cache.lookup(other, "最近总是失眠怎么办") is None
+
+        # 超出条数上限淘汰最早写入的
+        await cache.store(persona, "能推荐一部好看的电影吗", "《海蒂》")
+        await cache.store(other, "最近总是失眠怎么办", "数羊")
+        assert await cache.lookup(persona, "最近总是失眠怎么办") is None
+        assert (await cache.lookup(other, "最近总是失眠怎么办")).response == "数羊"
+        assert cache.stats()["evictions"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_cached_stream_replay_strategies():
+    from app.core.cache import (
+        StreamRecorder, decode_timings, encode_timings, replay_cached_stream, select_replay_strategy,
+    )
+
+    async def collect(*args, **kwargs):
+        return [chunk async for chunk in replay_cached_stream(*args, **kwargs)]
+
+    async def run_test():
+        text = "缓存里的回复" * 20  # 120 字
+        assert await collect(text, "instant") == [text]
+
+        adaptive = await collect(text, "adaptive", chunk_delay_ms=0, paced_chunks=3)
+        assert len(adaptive) == 4 and "".join(adaptive) == text
+
+        recorder = StreamRecorder()
+        for chunk in ("缓存里", "的回复" + text[6:]):
+            recorder.record(chunk)
+        timings = decode_timings(encode_timings(recorder.timings))
+        assert timings == [(n, gap) for n, gap in recorder.timings] and timings[0][1] == 0
+        recorded = await collect(text, "recorded", [(3, 0), (117, 5000)], max_seconds=0.01)
+        assert recorded == ["缓存里", text[3:]]
+        # 时序对不上文本时按 adaptive
+        assert "".join(await collect(text, "recorded", [(3, 0)], chunk_delay_ms=0)) == text
+
+    asyncio.run(run_test())
+    assert select_replay_strategy("INSTANT") == "instant"
+    assert select_replay_strategy("bogus") == select_replay_strategy(None)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.services.dialogue import enhanced_processor
+from app.services.dialogue.enhanced_processor import EnhancedDialogueProcessor
+from app.services.lexicon import get_lexicon_scanner
+
+
+class SlowRetriever:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def retrieve_relevant(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return [SimpleNamespace(summary="上次聊到猫", emotion="joy", relevance_score=0.9)]
+
+
+class SlowProfiles:
+    async def get_player_profile(self, player_id):
+        await asyncio.sleep(0.1)
+        return SimpleNamespace(nickname="小明", interests=["猫"], communication_style="", recent_topics=[])
+
+
+def make_processor(memory_delay):
+    processor = EnhancedDialogueProcessor()
+    processor.memory_retriever = SlowRetriever(memory_delay)
+    processor.memory_manager = SlowProfiles()
+    return processor
+
+
+def test_memory_and_profile_stages_run_concurrently():
+    async def run_test():
+        processor = make_processor(memory_delay=0.1)
+        get_lexicon_scanner()  # 全局词表的一次性构建不计入阶段耗时
+        start = time.perf_counter()
+        context = await processor.process_message(1, "dh_1", "s1", "今天好开心")
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.18
+        assert context.relevant_memories[0]["summary"] == "上次聊到猫"
+        assert context.player_profile["interests"] == ["猫"]
+        assert {"analysis", "memory", "profile"} <= set(context.stage_timings)
+        assert context.degraded_stages == []
+
+    asyncio.run(run_test())
+
+
+def test_slow_memory_stage_degrades(monkeypatch):
+    monkeypatch.setitem(enhanced_processor.STAGE_TIMEOUTS, "memory", 0.05)
+
+    async def run_test():
+        processor = make_processor(memory_delay=1.0)
+        processor.prefetch_memories(1, "dh_1", "今天好开心")
+        context = await processor.process_message(1, "dh_1", "s1", "今天好开心")
+
+        assert context.relevant_memories == []
+        assert context.player_profile["nickname"] == "小明"
+        assert context.degraded_stages == ["memory:timeout"]
+        assert processor.get_response_metadata(context)["pipeline"]["degraded"] == ["memory:timeout"]
+
+    asyncio.run(run_test())
+
+
+def test_speculative_budget_tags_context_path():
+    async def run_test():
+        fast = await make_processor(memory_delay=0.0).process_message(
+            1, "dh_1", "s1", "今天好开心", memory_budget_ms=200)
+        assert fast.context_path == "speculative_with_memory"
+        assert fast.relevant_memories
+
+        slow = await make_processor(memory_delay=1.0).process_message(
+            1, "dh_1", "s1", "今天好开心", memory_budget_ms=20)
+        assert slow.context_path == "speculative_without_memory"
+        assert slow.relevant_memories == []
+
+        full = await make_processor(memory_delay=0.0).process_message(1, "dh_1", "s1", "今天好开心")
+        assert full.context_path == "full"
+
+    asyncio.run(run_test())
+
+
+def test_prefetched_stream_starts_before_iteration():
+    from app.services.llm.streaming import PrefetchedStream
+
+    async def run_test():
+        started = []
+
+        async def source():
+            started.append(True)
+            yield "你"
+            yield "好"
+            raise RuntimeError("boom")
+
+        stream = PrefetchedStream(source())
+        await asyncio.sleep(0)
+        assert started == [True]
+
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+        except RuntimeError:
+            chunks.append("error")
+        assert chunks == ["你", "好", "error"]
+
+    asyncio.run(run_test())
+
+
+def test_unclaimed_prefetch_is_bounded_and_expires(monkeypatch):
+    monkeypatch.setattr(enhanced_processor, "MEMORY_PREFETCH_MAX", 2)
+
+    async def run_test():
+        processor = make_processor(memory_delay=1.0)
+        for message in ("a", "b", "c"):  # 被拒绝的请求不会来认领
+            processor.prefetch_memories(1, "dh_1", message)
+            await asyncio.sleep(0)
+        assert [k[2] for k in processor._memory_prefetch] == ["b", "c"]
+
+        monkeypatch.setattr(enhanced_processor, "MEMORY_PREFETCH_TTL_SECONDS", 0.0)
+        tasks = [entry[0] for entry in processor._memory_prefetch.values()]
+        processor.prefetch_memories(1, "dh_1", "d")
+        await asyncio.sleep(0)
+        assert list(processor._memory_prefetch) == [(1, "dh_1", "d")]
+        await asyncio.sleep(0)
+        assert all(task.cancelled() for task in tasks)
+        processor._drop_prefetch((1, "dh_1", "d"))
+
+    asyncio.run(run_test())
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+
+import numpy as np
+
+from app.core.cache import InMemoryCache
+from app.services.memory.embedding import EmbeddingService, SimpleHashEmbedding
+from app.services.memory.embedding_batcher import EmbeddingBatcher
+from app.services.memory.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedding(SimpleHashEmbedding):
+    def __init__(self):
+        super().__init__(dimension=8)
+        self.calls = []
+
+    async def encode_batch(self, texts):
+        self.calls.append(list(texts))
+        return await super().encode_batch(texts)
+
+
+def make_service(provider, cache):
+    service = object.__new__(EmbeddingService)
+    service._service = provider
+    service._cache = cache
+    service._batcher = EmbeddingBatcher(provider, max_batch_size=4)
+    return service
+
+
+def test_encode_batch_dedups_and_caches():
+    async def run_test():
+        provider = CountingEmbedding()
+        service = make_service(provider, EmbeddingCache(max_items=16))
+
+        first = await service.encode_batch(["a", "b", "a"])
+        assert provider.calls == [["a", "b"]]
+        assert np.array_equal(first[0], first[2])
+
+        assert np.array_equal(await service.encode("b"), first[1])
+        assert provider.calls == [["a", "b"]]
+        stats = service.cache_stats()
+        assert stats["local_hits"] == 1 and stats["misses"] == 3
+
+    asyncio.run(run_test())
+
+
+def test_shared_tier_round_trips_float16():
+    async def run_test():
+        shared = InMemoryCache()
+        provider = CountingEmbedding()
+        await make_service(provider, EmbeddingCache(max_items=0, shared=shared)).encode("hello")
+
+        # 另一个进程：L1 为空，从共享层取回
+        other = make_service(CountingEmbedding(), EmbeddingCache(max_items=16, shared=shared))
+        vector = await other.encode("hello")
+        expected = await provider.encode("hello")
+        assert other._service.calls == []
+        assert max(abs(a - b) for a, b in zip(vector, expected)) < 1e-3
+        assert other.cache_stats()["shared_hits"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_concurrent_encodes_are_coalesced_and_split_by_batch_size():
+    async def run_test():
+        provider = CountingEmbedding()
+        service = make_service(provider, EmbeddingCache(max_items=0))
+
+        async def slow_batch(texts):
+            provider.calls.append(list(texts))
+            await asyncio.sleep(0.01)
+            return await SimpleHashEmbedding.encode_batch(provider, texts)
+
+        provider.encode_batch = slow_batch
+        texts = [f"t{i % 7}" for i in range(12)]
+        vectors = await asyncio.gather(*(service.encode(t) for t in texts))
+
+        expected = [await SimpleHashEmbedding(8).encode(t) for t in texts]
+        assert all(
+            max(abs(a - b) for a, b in zip(got, want)) < 1e-6
+            for got, want in zip(vectors, expected)
+        )
+        assert all(len(call) <= 4 for call in provider.calls)
+        assert len(provider.calls) < len(texts)
+        assert service.batch_stats()["deduped"] > 0
+
+    asyncio.run(run_test())
+
+
+def test_simple_hash_embedding_matches_scalar_definition():
+    async def run_test():
+        embedding = SimpleHashEmbedding(dimension=100)
+        batch = await embedding.encode_batch(["你好", "hello"])
+        assert batch.shape == (2, 100) and batch.dtype == np.float32
+
+        digest = hashlib.sha512("你好".encode()).digest()
+        scalar = [(digest[i % len(digest)] / 127.5) - 1.0 for i in range(100)]
+        norm = sum(v ** 2 for v in scalar) ** 0.5
+        assert np.allclose(batch[0], [v / norm for v in scalar], atol=1e-6)
+        assert np.array_equal(await embedding.encode("hello"), batch[1])
+
+    asyncio.run(run_test())
@@ -0,0 +1,106 @@
+import asyncio
+
+import httpx
+
+from app.core.http_pool import HTTPPool, parse_host_limits
+
+
+async def start_server(delay: float = 0.05):
+    """最小的 HTTP/1.1 keep-alive 服务：每个请求等待 delay 后回 200"""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                await asyncio.sleep(delay)
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}", connections
+
+
+def test_pool_shares_connections_and_reports_wait():
+    async def run_test():
+        server, url, connections = await start_server()
+        pool = HTTPPool(
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+            host_limits={},
+        )
+        try:
+            client = pool.client(url + "/a")
+            assert pool.client(url + "/b") is client
+
+            responses = await asyncio.gather(*(client.get(url) for _ in range(3)))
+            assert [r.text for r in responses] == ["ok"] * 3
+            # 上限 1 个连接：三个请求排队复用同一连接
+            assert len(connections) == 1
+
+            stats = pool.stats()["upstreams"][url]
+            assert stats["requests"] == 3
+            assert stats["new_connections"] == 1
+            assert stats["connections"] == 1 and stats["idle"] == 1 and stats["in_use"] == 0
+            assert stats["in_flight"] == 0 and stats["waiting"] == 0
+            # 第三个请求要等前两个各 50ms
+            assert stats["wait_ms"]["max"] >= 80
+            assert stats["http_versions"] == {"HTTP/1.1": 3}
+        finally:
+            await pool.aclose()
+            server.close()
+
+    asyncio.run(run_test())
+
+
+def test_streaming_response_holds_connection_until_closed():
+    async def run_test():
+        server, url, _ = await start_server(delay=0)
+        pool = HTTPPool(host_limits={})
+        try:
+            client = pool.client(url)
+            async with client.stream("GET", url) as response:
+                assert pool.stats()["upstreams"][url]["in_flight"] == 1
+                await response.aread()
+            stats = pool.stats()["upstreams"][url]
+            assert stats["in_flight"] == 0
+        finally:
+            await pool.aclose()
+            server.close()
+
+    asyncio.run(run_test())
+
+
+def test_warm_up_opens_connection_and_tolerates_failures():
+    async def run_test():
+        server, url, connections = await start_server(delay=0)
+        pool = HTTPPool(host_limits={})
+        try:
+            warmed = await pool.warm_up([url + "/x", url + "/y", "http://127.0.0.1:1/"], timeout=1)
+            assert warmed == {url: True, "http://127.0.0.1:1": False}
+            assert len(connections) == 1
+            assert pool.stats()["upstreams"][url]["idle"] == 1
+        finally:
+            await pool.aclose()
+            server.close()
+
+    asyncio.run(run_test())
+
+
+def test_parse_host_limits():
+    limits = parse_host_limits("Dashscope.aliyuncs.com=128:32, api.anthropic.com=8, bad, x=y")
+    assert limits["dashscope.aliyuncs.com"].max_connections == 128
+    assert limits["dashscope.aliyuncs.com"].max_keepalive_connections == 32
+    assert limits["api.anthropic.com"].max_connections == 8
+    assert set(limits) == {"dashscope.aliyuncs.com", "api.anthropic.com"}
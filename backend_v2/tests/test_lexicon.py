@@ -0,0 +1,58 @@
+from app.services.crisis.detector import CrisisDetector
+from app.services.emotion.analyzer import EmotionAnalyzer, EmotionType
+from app.services.lexicon import LexiconScanner
+from app.services.moderation.filters import LocalFilter
+
+from scripts.bench_lexicon import outcome, pipeline, separate_scan
+
+
+MESSAGES = [
+    "",
+    "今天天气不错",
+    "我非常难过，真的好想死，活着没意思",
+    "超级开心!!! 哈哈哈，谢谢你",
+    "好烦好烦，讨厌死了，他一直骂我",
+    "最近有点焦虑，睡不着，觉得自己是个累赘",
+    "想聊聊援交和卖号的事，加我vx",
+    "SO HAPPY 开心 好开心",
+]
+
+
+def test_scanner_matches_separate_keyword_passes():
+    local = LocalFilter()
+    scanner = LexiconScanner(local)
+    analyzer, detector = EmotionAnalyzer(), CrisisDetector()
+    separate = pipeline(lambda t: separate_scan(local, t), analyzer, detector, local)
+    unified = pipeline(scanner.scan, analyzer, detector, local)
+
+    for text in MESSAGES:
+        assert outcome(*unified(text)) == outcome(*separate(text)), text
+
+    scan = scanner.scan("我非常难过，好想死")
+    assert scan.emotion_crisis and scan.crisis["high"] == ["想死"]
+    assert analyzer.analyze("我非常难过，好想死", scan=scan).dominant == EmotionType.SADNESS
+
+
+def test_lexicon_words_do_not_hold_back_stream():
+    local = LocalFilter()
+    LexiconScanner(local)
+    stream = local.stream()
+    # "好" / "难" 是情感词开头，但不是审核词：流式输出不应为它们扣留字符
+    stream.feed("今天真好")
+    assert stream.holdback == 0
+    stream.feed("，聊聊援")
+    assert stream.holdback == 1
+    assert not local.check("今天好难过").is_blocked
+
+
+def test_scanner_rebinds_to_new_wordlist_snapshot():
+    local = LocalFilter()
+    scanner = LexiconScanner(local)
+    before = local.snapshot()
+    assert scanner.scan("卖号").version == before.version
+
+    local.add_lexicon(["新辅助词"])
+    assert local.snapshot() is not before and local.snapshot().version == before.version
+    scan = scanner.scan("我非常难过，想聊卖号")
+    assert [h.pattern for h in scan.moderation_hits] == ["卖号"]
+    assert scan.emotion_hits and scan.emotion_hits[0][0] == EmotionType.SADNESS
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core.cache import InMemoryCache
+from app.services.ai import router as router_module
+from app.services.ai import limiter as limiter_module
+from app.services.ai.cluster_health import SharedHealth
+from app.services.ai.health import LLMHealthChecker
+from app.services.ai.limiter import AdmissionController, AdmissionPriority, ModelLimiter
+from app.services.ai.router import LLMRouter
+from app.services.llm import qwen as qwen_module
+
+
+class FakeRouter(LLMRouter):
+    def __init__(self, delays, limiter=None):
+        super().__init__(health_checker=LLMHealthChecker(), limiter=limiter)
+        self.delays = delays
+        self.closed = []
+
+    async def _call_llm(self, config, messages, system_prompt, temperature):
+        try:
+            await asyncio.sleep(self.delays[config.name])
+            yield config.name
+            yield "!"
+        finally:
+            self.closed.append(config.name)
+
+
+def test_slow_first_token_is_hedged_and_loser_cancelled(monkeypatch):
+    monkeypatch.setattr(router_module, "HEDGE_DEFAULT_TTFT_MS", 20)
+    monkeypatch.setattr(router_module, "HEDGE_MIN_TTFT_MS", 0)
+    router = FakeRouter({"qwen.plus": 5.0, "volcengine.pro": 0.01, "claude.haiku": 0.01})
+
+    async def run_test():
+        chunks = [c async for c in router.route_request("default", [], "")]
+        assert chunks == ["volcengine.pro", "!"]
+        assert "qwen.plus" in router.closed  # 慢的一路被取消，不会等满 5 秒
+        assert router._stats == {"hedged": 1, "hedge_wins": 1}
+        # 被取消的一路记了截尾首包样本，胜者记了成功
+        assert len(router.health.get_service("qwen.plus").ttft_samples) == 1
+        assert router.health.get_service("volcengine.pro").successful_requests == 1
+
+    asyncio.run(asyncio.wait_for(run_test(), 2))
+
+
+def test_best_service_weighs_latency_tail():
+    health = LLMHealthChecker()
+    for _ in range(90):
+        health.record_success("steady", 900)
+        health.record_success("spiky", 500)
+    for _ in range(10):
+        health.record_success("steady", 900)
+        health.record_success("spiky", 9000)
+    # 平均差不多，但 spiky 的 p95 长尾明显
+    assert health.get_best_service(["spiky", "steady"]) == "steady"
+    assert health.get_service("spiky").latency_percentile(95) == 9000
+
+
+def test_admission_queue_serves_crisis_then_paid_then_free():
+    limiter = ModelLimiter("m", rpm=600)  # 每 0.1 秒回填一个
+    limiter.requests.tokens = 0
+    order = []
+
+    async def request(name, priority):
+        assert await limiter.acquire(0, priority, max_wait=2)
+        order.append(name)
+
+    async def run_test():
+        tasks = [asyncio.ensure_future(request("free", AdmissionPriority.FREE))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("paid", AdmissionPriority.PAID)))
+        tasks.append(asyncio.ensure_future(request("crisis", AdmissionPriority.CRISIS)))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queue_depth"] == {"crisis": 1, "paid": 1, "free": 1}
+        await asyncio.gather(*tasks)
+
+    asyncio.run(asyncio.wait_for(run_test(), 2))
+    assert order == ["crisis", "paid", "free"]
+    assert limiter.stats()["queued"] == 3
+
+
+def test_exhausted_model_overflows_to_fallback(monkeypatch):
+    monkeypatch.setattr(limiter_module, "MAX_WAIT_SECONDS", {p: 0.05 for p in AdmissionPriority})
+    router = FakeRouter(
+        {"qwen.plus": 0.0, "volcengine.pro": 0.0, "claude.haiku": 0.0},
+        limiter=AdmissionController({"qwen.plus": {"rpm": 1}}),
+    )
+
+    async def run_test():
+        first = [c async for c in router.route_request("default", [], "")]
+        second = [c async for c in router.route_request("default", [], "")]
+        return first, second
+
+    first, second = asyncio.run(asyncio.wait_for(run_test(), 2))
+    assert first == ["qwen.plus", "!"]
+    assert second == ["volcengine.pro", "!"]  # qwen.plus 额度用完，排队超时后溢出
+    admission = router.get_routing_status()["admission"]["qwen.plus"]
+    assert admission["admitted"] == 1 and admission["timeouts"] == 1
+
+
+def test_tpm_bucket_debits_the_quota_token_estimate(monkeypatch):
+    from app.services.llm.tokenizer import get_token_estimator
+
+    monkeypatch.setenv("LLM_TPM_QWEN_PLUS", "5000")
+    assert limiter_module.tpm_limit("qwen.plus", 120000) == 5000
+    assert all(config.rate_limit_tpm > 0 for config in router_module.MODEL_CONFIGS.values())
+
+    router = FakeRouter({"qwen.plus": 0.0}, limiter=AdmissionController({"qwen.plus": {"rpm": 60, "tpm": 5000}}))
+    messages = [{"role": "user", "content": "最近总是失眠，脑子停不下来 so tired"}]
+
+    async def run_test():
+        return [c async for c in router.route_request("default", messages, "你是温柔的倾听者")]
+
+    assert asyncio.run(asyncio.wait_for(run_test(), 2)) == ["qwen.plus", "!"]
+    expected = get_token_estimator().count_messages(messages, "你是温柔的倾听者", "qwen")
+    bucket = router.limiter.get("qwen.plus").token_budget
+    assert 5000 - bucket.tokens == pytest.approx(expected + limiter_module.RESERVED_OUTPUT_TOKENS, abs=10)
+
+
+def test_shared_circuit_opens_cluster_wide_and_single_worker_probes():
+    now = [1000.0]
+    backend = InMemoryCache()
+    probes = []
+
+    async def probe(name):
+        probes.append(name)
+        return True
+
+    workers = []
+    for _ in range(2):
+        shared = SharedHealth(backend, probe=probe, min_requests=4, error_rate=0.5,
+                              open_seconds=30, clock=lambda: now[0])
+        health = LLMHealthChecker()
+        health.register_service("qwen.plus")
+        health.attach_shared(shared)
+        workers.append((shared, health))
+    (shared_a, health_a), (shared_b, health_b) = workers
+
+    async def run_test():
+        for _ in range(3):
+            health_a.record_failure("qwen.plus", "timeout")
+        health_b.record_failure("qwen.plus", "timeout")
+        health_b.record_success("qwen.plus", 800)
+        for _ in range(2):  # B 的同步打开熔断，A 在下一个同步周期看到
+            for shared, _ in workers:
+                await shared.sync()
+        # 聚合 4/5 失败 → 两个 worker 都熔断（B 本地只失败过 1 次）
+        assert not health_a.is_available("qwen.plus")
+        assert not health_b.is_available("qwen.plus")
+
+        now[0] += 31  # 半开：仍不放真实流量，只有一个 worker 发探测
+        for shared, _ in workers:
+            await shared.sync()
+        assert not health_b.is_available("qwen.plus")
+        await asyncio.gather(*(t for s, _ in workers for t in s._probes.values()))
+        assert probes == ["qwen.plus"]
+
+        for shared, _ in workers:
+            await shared.sync()
+        assert health_a.is_available("qwen.plus") and health_b.is_available("qwen.plus")
+        await backend.aclose()
+
+    asyncio.run(asyncio.wait_for(run_test(), 2))
+
+
+def test_upstream_429_pauses_model_instead_of_counting_as_success(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "7"}, json={"code": "Throttling"})
+        body = 'data: {"output": {"choices": [{"message": {"content": "你好"}}]}}\n\n'
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(qwen_module, "get_http_pool", lambda: SimpleNamespace(client=lambda url: client))
+    monkeypatch.setattr(qwen_module.settings, "DASHSCOPE_API_KEY", "test-key")
+    router = LLMRouter(
+        health_checker=LLMHealthChecker(),
+        limiter=AdmissionController({"qwen.plus": {"rpm": 60}}),
+    )
+
+    async def run_test():
+        chunks = [c async for c in router.route_request("default", [], "")]
+        await client.aclose()
+        return chunks
+
+    assert asyncio.run(asyncio.wait_for(run_test(), 5)) == ["你好"]
+    # 429 不算成功也不算熔断失败：暂停该模型的准入，请求降级到下一个模型
+    qwen_plus = router.health.get_service("qwen.plus")
+    assert qwen_plus.successful_requests == 0 and qwen_plus.failed_requests == 0
+    assert router.limiter.get("qwen.plus").stats()["throttled"] == 1
+    assert router.health.get_service("volcengine.pro").successful_requests == 1
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import random
+
+from app.services.moderation import automaton as automaton_module
+from app.services.moderation.automaton import AhoCorasick
+from app.services.moderation.filters import LocalFilter, ModerationCategory
+
+
+def brute_force(keywords, text):
+    return sorted(
+        (i, i + len(k), kid)
+        for kid, k in enumerate(keywords)
+        for i in range(len(text))
+        if text.startswith(k, i)
+    )
+
+
+def test_automaton_matches_brute_force_and_resumes_across_chunks():
+    rng = random.Random(7)
+    for _ in range(500):
+        keywords = sorted({"".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(6)})
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 40)))
+        ac = AhoCorasick(keywords)
+        expected = brute_force(keywords, text)
+        assert sorted(ac.iter_matches(text)) == expected
+
+        cut = rng.randint(0, len(text))
+        head, state = ac.scan(text[:cut])
+        tail, _ = ac.scan(text[cut:], state, cut)
+        assert sorted(head + tail) == expected
+
+
+def test_automaton_disk_cache_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setattr(automaton_module, "MIN_CACHED_KEYWORDS", 1)
+    keywords = ["援交", "交易", "he", "she"]
+    built = AhoCorasick.load_or_build(keywords, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    loaded = AhoCorasick._load(str(next(tmp_path.iterdir())), AhoCorasick.digest(keywords))
+    assert loaded is not None
+    text = "ushers 援交易"
+    assert list(loaded.iter_matches(text)) == list(built.iter_matches(text))
+    # 词库变了摘要就不同，旧缓存不会被误用
+    assert AhoCorasick._load(str(next(tmp_path.iterdir())), AhoCorasick.digest(keywords[:2])) is None
+    assert tmp_path.stat().st_mode & 0o777 == 0o700
+
+    # 被篡改（状态越界）的缓存不会被加载
+    path = next(tmp_path.iterdir())
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    payload["fail"][1] = 10 ** 6
+    path.write_text(json.dumps(payload), encoding="utf-8")
+    assert AhoCorasick._load(str(path), AhoCorasick.digest(keywords)) is None
+
+
+def test_local_filter_keeps_first_occurrence_offsets():
+    local = LocalFilter(extra_words={ModerationCategory.PORN: {"ABC"}, ModerationCategory.ILLEGAL: {"abc"}})
+    text = "xx abc ABC 卖号 卖号"
+    result = local.check(text)
+
+    words = [(h.category, h.pattern, h.matched_text, h.start, h.end) for h in result.hits]
+    assert (ModerationCategory.PORN, "ABC", "abc", 3, 6) in words
+    assert (ModerationCategory.ILLEGAL, "abc", "abc", 3, 6) in words
+    assert (ModerationCategory.ILLEGAL, "卖号", "卖号", 11, 13) in words
+    # 每个 (类别, 词) 只报第一次出现；顺序按类别（PORN 先于 ILLEGAL）
+    assert len(words) == 3
+    assert result.dominant_category == ModerationCategory.PORN
+    assert local.check("今天天气不错").is_blocked is False
+
+
+def make_moderator():
+    from app.services.moderation.aliyun import AliyunModeration
+    from app.services.moderation.moderator import Moderator
+    return Moderator(local_filter=LocalFilter(), aliyun=AliyunModeration())
+
+
+def test_stream_moderator_cuts_before_keyword_is_shown():
+    async def run_test():
+        guard = make_moderator().stream()
+        shown = ""
+        # "援交" 被拆在两个 chunk 里
+        for chunk in ["你好，今天想聊", "聊援", "交的事", "后面的内容"]:
+            shown += guard.feed(chunk)
+            if guard.blocked:
+                break
+        tail, result = await guard.finish()
+
+        assert guard.blocked and result.blocked
+        assert result.category == ModerationCategory.PORN
+        assert tail == ""
+        assert shown == "你好，今天想聊聊"
+        assert "援" not in shown
+
+    asyncio.run(run_test())
+
+
+def test_stream_moderator_releases_held_back_prefix():
+    async def run_test():
+        guard = make_moderator().stream()
+        shown = ""
+        for chunk in ["我们聊聊", "援", "助别人的故事"]:
+            shown += guard.feed(chunk)
+        # "援" 可能是敏感词开头，后续 chunk 证明无害后放出
+        tail, result = await guard.finish()
+        assert not result.blocked
+        assert shown + tail == "我们聊聊援助别人的故事"
+
+        guard = make_moderator().stream()
+        assert guard.feed("结尾是援") == "结尾是"
+        tail, result = await guard.finish()
+        assert tail == "援" and not result.blocked
+
+    asyncio.run(run_test())
+
+
+def test_filter_stream_matches_full_text_check():
+    local = LocalFilter()
+    text = "请加我微信 vx: abc_12345 聊聊卖号和枪支代购的事"
+    # 正则在流中一满足最短匹配就报告（更早截断），所以只比较起点，不比较匹配长度
+    expected = {(h.category, h.pattern, h.start) for h in local.check(text).hits}
+
+    for size in (1, 3, 7, len(text)):
+        stream = local.stream()
+        for i in range(0, len(text), size):
+            stream.feed(text[i:i + size])
+        got = {(h.category, h.pattern, h.start) for h in stream.hits}
+        assert got == expected, size
+
+
+
+def test_check_batch_matches_single_checks_and_batches_cloud_calls(monkeypatch):
+    from app.services.moderation.aliyun import AliyunModeration, AliyunModerationResult
+    from app.services.moderation.moderator import Moderator
+
+    monkeypatch.setenv("ALIYUN_MODERATION_BATCH_SIZE", "2")
+    monkeypatch.setenv("ALIYUN_MODERATION_CONCURRENCY", "2")
+    monkeypatch.setattr(AliyunModeration, "usable", property(lambda self: True))
+    aliyun = AliyunModeration()
+
+    calls, in_flight, peak = [], [0], [0]
+
+    async def fake_scan(texts):
+        calls.append(list(texts))
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return [AliyunModerationResult(is_blocked="赌" in t, suggestion="block" if "赌" in t else "pass")
+                for t in texts]
+
+    async def fake_check_text(text):
+        return (await fake_scan([text]))[0]
+
+    aliyun._scan_tasks = fake_scan
+    aliyun.check_text = fake_check_text
+    moderator = Moderator(local_filter=LocalFilter(), aliyun=aliyun)
+    texts = ["你好", "", "援交", "一起去赌", "你好", "今天天气不错", "聊聊电影", "  ", "晚安"]
+
+    async def run_test():
+        batch = await moderator.check_batch(texts)
+        batch_calls = list(calls)
+        single = [await moderator.check(t) for t in texts]
+        return batch, batch_calls, single
+
+    batch, batch_calls, single = asyncio.run(run_test())
+    assert batch == single
+    assert [r.blocked for r in batch] == [False, False, True, True, False, False, False, False, False]
+    assert batch[2].cloud_suggestion == "skipped" and batch[3].cloud_blocked
+    # 去重 + 跳过空白和高风险命中后剩 5 条，按 2 条一批合并请求，最多 2 批同时在途
+    assert sorted(batch_calls, key=len) == [["晚安"], ["你好", "一起去赌"], ["今天天气不错", "聊聊电影"]]
+    assert peak[0] == 2
+
+
+def test_verdict_cache_hits_normalized_text_and_skips_errors(monkeypatch):
+    from app.core.cache import InMemoryCache
+    from app.services.moderation.aliyun import AliyunModeration, AliyunModerationResult
+    from app.services.moderation.cache import VerdictCache
+    from app.services.moderation.moderator import Moderator, ModerationResult
+
+    monkeypatch.setattr(AliyunModeration, "usable", property(lambda self: True))
+    aliyun = AliyunModeration()
+    calls = []
+
+    async def fake_check_text(text):
+        calls.append(text)
+        if "故障" in text:
+            raise RuntimeError("cloud down")
+        return AliyunModerationResult(is_blocked=False, suggestion="pass")
+
+    aliyun.check_text = fake_check_text
+    moderator = Moderator(local_filter=LocalFilter(), aliyun=aliyun)
+    shared = InMemoryCache()
+    moderator.cache = VerdictCache(ModerationResult.to_dict, ModerationResult.from_dict, backend=shared)
+
+    async def run_test():
+        first = await moderator.check("你好")
+        again = await moderator.check("  你好 ")
+        assert again == first and calls == ["你好"]
+        # 场景不同不共用
+        await moderator.check("你好", scene="profile")
+        assert len(calls) == 2
+
+        # 云审故障不缓存，下次还会重试
+        assert (await moderator.check("故障")).cloud_suggestion == "error"
+        await moderator.check("故障")
+        assert calls.count("故障") == 2
+
+        # 进程内缓存清掉后从共享后端取回
+        moderator.cache.clear()
+        assert await moderator.check("你好") == first
+        assert len(calls) == 4 and moderator.cache.stats()["shared_hits"] == 1
+
+    asyncio.run(run_test())
+
+
+def test_verdict_cache_invalidates_when_wordlist_file_changes(tmp_path, monkeypatch):
+    from app.services.moderation import filters as filters_module
+
+    wordlist = tmp_path / "wordlist.txt"
+    wordlist.write_text("[ILLEGAL]\n", encoding="utf-8")
+    monkeypatch.setenv("MODERATION_WORDLIST_PATH", str(wordlist))
+    monkeypatch.setattr(filters_module, "WORDLIST_CHECK_SECONDS", 0)
+    moderator = make_moderator()
+
+    async def run_test():
+        assert not (await moderator.check("来买点小蓝瓶")).blocked
+        version = moderator.local.version
+        wordlist.write_text("[ILLEGAL]\n小蓝瓶\n", encoding="utf-8")
+        result = await moderator.check("来买点小蓝瓶")
+        assert moderator.local.version != version
+        assert result.blocked and result.category == ModerationCategory.ILLEGAL
+
+    asyncio.run(run_test())
+
+
+def test_stream_moderator_holds_back_in_progress_regex_candidates():
+    async def run_test():
+        guard = make_moderator().stream()
+        shown = ""
+        for ch in "好的，加我微信：13800138000":  # 逐字输出
+            shown += guard.feed(ch)
+            if guard.blocked:
+                break
+        assert guard.blocked
+        assert shown == "好的，加我"  # "微信：" 和号码一个字符都没放出去
+
+        guard = make_moderator().stream()
+        shown = "".join(guard.feed(ch) for ch in "看这里 https://evil.example.com/x")
+        assert guard.blocked and "http" not in shown
+
+        # 触发前缀之后不再像候选的文本照常放出
+        guard = make_moderator().stream()
+        shown = "".join(guard.feed(ch) for ch in "加油哦，明天见")
+        tail, result = await guard.finish()
+        assert not result.blocked
+        assert shown == "加油哦，明天见"[:len(shown)] and len(shown) >= 5
+
+    asyncio.run(run_test())
+
+
+def test_stream_moderator_releases_benign_text_around_trigger_words():
+    def held(text):
+        guard = make_moderator().stream()
+        shown = "".join(guard.feed(ch) for ch in text)
+        assert not guard.blocked
+        return len(text) - len(shown)
+
+    # 英文触发词要独立成词，续写偏离规则形状就放行
+    assert held("Actually that is a fact, and I want to show you how the plan works out.") <= 1
+    assert held("Ignore the noise for a moment and breathe slowly with me, okay?") <= 1
+    assert held("你现在是不是觉得有点累？先休息一下，我们慢慢聊，好吗") <= 1
+    assert held("不要忽略自己的感受，哪怕只是一点点难过，也值得被认真对待。") <= 1
+    # 仍然可能成为命中的部分照常暂缓
+    assert held("please act as") == len("act as")
+    assert held("你现在是一个") == len("你现在是一个")
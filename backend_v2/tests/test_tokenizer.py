@@ -0,0 +1,92 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from app.services.ai.cost import CostTracker
+from app.services.llm import claude as claude_module
+from app.services.llm import qwen as qwen_module
+from app.services.llm.claude import ClaudeService
+from app.services.llm.qwen import QwenService
+from app.services.llm.tokenizer import TokenEstimator, TokenUsage
+
+
+class FakePool:
+    status_code = 200
+
+    def __init__(self, events):
+        self.lines = [f"data: {json.dumps(e)}" for e in events]
+
+    def client(self, url):
+        return self
+
+    @asynccontextmanager
+    async def stream(self, *args, **kwargs):
+        yield self
+
+    async def aiter_lines(self):
+        for line in self.lines:
+            yield line
+
+
+def collect(service, usage):
+    async def run():
+        return [c async for c in service.chat_stream([{"role": "user", "content": "hi"}], "", usage=usage)]
+    return asyncio.run(run())
+
+
+def test_stream_end_events_fill_usage(monkeypatch):
+    monkeypatch.setattr(qwen_module, "get_http_pool", lambda: FakePool([
+        {"output": {"choices": [{"message": {"content": "你好"}}]}, "usage": {"input_tokens": 12, "output_tokens": 1}},
+        {"output": {"choices": [{"message": {"content": "呀"}}]}, "usage": {"input_tokens": 12, "output_tokens": 2}},
+    ]))
+    qwen = QwenService()
+    qwen.api_key = "k"
+    usage = TokenUsage()
+    assert collect(qwen, usage) == ["你好", "呀"]
+    assert (usage.input_tokens, usage.output_tokens) == (12, 2)
+
+    monkeypatch.setattr(claude_module, "get_http_pool", lambda: FakePool([
+        {"type": "message_start", "message": {"usage": {"input_tokens": 30, "output_tokens": 1}}},
+        {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hi"}},
+        {"type": "message_delta", "usage": {"output_tokens": 7}},
+    ]))
+    claude = ClaudeService()
+    claude.api_key = "k"
+    usage = TokenUsage()
+    assert collect(claude, usage) == ["Hi"]
+    assert (usage.input_tokens, usage.output_tokens) == (30, 7)
+
+
+def test_estimator_counts_by_char_class_and_calibrates():
+    estimator = TokenEstimator()
+    assert estimator.count("今天好累啊", "qwen") == 4        # 5 × 0.7
+    assert estimator.count("今天好累啊", "claude") == 6      # 5 × 1.2
+    assert estimator.count("hello world", "qwen") == 2      # 每个常见单词约 1 个 token
+    assert estimator.count_messages([{"role": "user", "content": ""}], "", "qwen") == 7
+
+    text = "今天好累啊，什么都不想做" * 5
+    before = estimator.count(text, "qwen")
+    # 上游报告的用量一直比估算高一半：校准系数逐步靠过去，且只影响该服务商
+    for _ in range(30):
+        estimator.reconcile("qwen", TokenUsage(output_tokens=int(before * 1.5)), [], "", text)
+    assert abs(estimator.count(text, "qwen") / before - 1.5) < 0.05
+    assert estimator.count(text, "claude") == TokenEstimator().count(text, "claude")
+
+    # 没有报告用量时按估算结算
+    assert estimator.reconcile("claude", TokenUsage(), [], "", "") == (
+        estimator.count_messages([], "", "claude"), 0
+    )
+
+
+def test_reservation_counts_against_quota_until_settled():
+    tracker = CostTracker()
+    tracker.set_player_quota(1, "free")  # 50000 / 天
+    reservation = tracker.reserve(1, 40000)
+    assert not tracker.check_quota(1, estimated_tokens=20000)["allowed"]
+
+    tracker.settle(reservation, 1, "qwen.plus", input_tokens=800, output_tokens=200)
+    usage = tracker.get_player_usage(1)
+    assert usage["used_tokens"] == 1000 and usage["reserved_tokens"] == 0
+    assert tracker.check_quota(1, estimated_tokens=20000)["allowed"]
+    tracker.release(reservation)  # 重复释放无副作用
+    assert tracker.get_player_usage(1)["reserved_tokens"] == 0
@@ -0,0 +1,49 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.cache import InMemoryCache
+from app.models.usage import UsageDaily
+from app.services.ai.cost import CostTracker
+from app.services.ai.usage_store import UsageStore
+
+
+def test_workers_share_quota_and_flush_daily_totals(tmp_path):
+    async def run_test():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'usage.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(UsageDaily.metadata.create_all, tables=[UsageDaily.__table__])
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        backend = InMemoryCache()
+
+        def worker():
+            tracker = CostTracker()
+            tracker.attach_store(UsageStore(backend, session_factory=sessions))
+            return tracker
+
+        a, b = worker(), worker()
+        a.record_usage(7, "qwen", 20000, 10000)
+        b.record_usage(7, "qwen", 15000, 10000)
+        # 各自本地都没超免费额度（50000）
+        assert a.check_quota(7)["allowed"] and b.check_quota(7)["allowed"]
+
+        for tracker in (a, b, a):
+            await tracker.store.flush()
+        for tracker in (a, b):
+            assert tracker.get_player_usage(7)["used_tokens"] == 55000
+            assert tracker.check_quota(7)["reason"] == "daily_token_limit_exceeded"
+
+        report = await b.load_daily_report()
+        assert report["by_service"]["qwen"]["requests"] == 2
+        assert report["total_tokens"] == 55000
+
+        # 重启后的新 worker 一个周期内恢复当天用量
+        c = worker()
+        c.check_quota(7)
+        await c.store.flush()
+        assert c.get_player_usage(7)["used_tokens"] == 55000
+
+        await backend.aclose()
+        await engine.dispose()
+
+    asyncio.run(asyncio.wait_for(run_test(), 5))
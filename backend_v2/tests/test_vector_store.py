@@ -0,0 +1,252 @@
+import asyncio
+import math
+import random
+
+from app.services.memory.vector_log import SNAPSHOT_HEADER
+from app.services.memory.vector_store import InMemoryVectorStore, VectorDocument
+
+
+def make_doc(doc_id, vector, player_id=1, npc_id="dh_1", **metadata):
+    return VectorDocument(
+        id=doc_id,
+        text=f"text {doc_id}",
+        vector=vector,
+        metadata={"player_id": player_id, "npc_id": npc_id, **metadata},
+    )
+
+
+def brute_force(docs, query, limit, filter_metadata, threshold):
+    def cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        na = math.sqrt(sum(x * x for x in a))
+        nb = math.sqrt(sum(y * y for y in b))
+        return dot / (na * nb) if na and nb else 0.0
+
+    scored = [
+        (doc.id, cosine(query, doc.vector))
+        for doc in docs
+        if all(doc.metadata.get(k) == v for k, v in (filter_metadata or {}).items())
+    ]
+    scored = [item for item in scored if item[1] >= threshold]
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return [doc_id for doc_id, _ in scored[:limit]]
+
+
+def test_search_matches_brute_force_with_partition_filter():
+    async def run_test():
+        rng = random.Random(7)
+        store = InMemoryVectorStore()
+        docs = [
+            make_doc(
+                f"m{i}",
+                [rng.uniform(-1, 1) for _ in range(16)],
+                player_id=i % 3,
+                npc_id=f"dh_{i % 2}",
+                emotion="joy" if i % 4 == 0 else "sadness",
+            )
+            for i in range(200)
+        ]
+        await store.add_batch(docs[:150])
+        for doc in docs[150:]:
+            await store.add(doc)
+
+        query = [rng.uniform(-1, 1) for _ in range(16)]
+        for filter_metadata in (
+            None,
+            {"player_id": 1, "npc_id": "dh_0"},
+            {"player_id": 2, "npc_id": "dh_1", "emotion": "joy"},
+            {"emotion": "sadness"},
+        ):
+            results = await store.search(query, limit=5, filter_metadata=filter_metadata, score_threshold=0.1)
+            assert [r.id for r in results] == brute_force(docs, query, 5, filter_metadata, 0.1)
+
+    asyncio.run(run_test())
+
+
+def test_delete_and_overwrite_are_reflected_after_compaction():
+    async def run_test():
+        store = InMemoryVectorStore()
+        await store.add_batch([make_doc(f"m{i}", [1.0, float(i)]) for i in range(10)])
+
+        assert await store.delete("m9") is True
+        await store.add(make_doc("m0", [0.0, -1.0]))
+        store._index.compact()
+
+        results = await store.search([0.0, 1.0], limit=10, filter_metadata={"player_id": 1, "npc_id": "dh_1"})
+        ids = [r.id for r in results]
+        assert "m9" not in ids
+        assert "m0" not in ids  # 覆盖后的向量与查询反向，低于阈值 0
+        assert ids[0] == "m8"
+        assert await store.count({"player_id": 1, "npc_id": "dh_1"}) == 9
+
+    asyncio.run(run_test())
+
+
+def test_mismatched_dimension_scores_zero():
+    async def run_test():
+        store = InMemoryVectorStore()
+        await store.add(make_doc("a", [1.0, 0.0]))
+        await store.add(make_doc("b", [1.0, 0.0, 0.0]))
+
+        results = await store.search([1.0, 0.0], limit=5)
+        assert [(r.id, round(r.score, 3)) for r in results] == [("a", 1.0), ("b", 0.0)]
+
+        results = await store.search([1.0, 0.0], limit=5, score_threshold=0.5)
+        assert [r.id for r in results] == ["a"]
+
+    asyncio.run(run_test())
+
+
+def test_log_replay_and_snapshot_round_trip(tmp_path):
+    async def run_test():
+        path = str(tmp_path / "memory_store.json")
+        store = InMemoryVectorStore(persist_path=path)
+        assert list(tmp_path.iterdir()) == []  # 第一次写入前不创建日志段
+        await store.add_batch([make_doc(f"m{i}", [1.0, float(i)]) for i in range(5)])
+        await store.add(make_doc("odd", [1.0, 0.0, 0.0]))
+        await store.delete("m1")
+
+        reopened = InMemoryVectorStore(persist_path=path)
+        assert sorted(reopened._documents) == ["m0", "m2", "m3", "m4", "odd"]
+
+        reopened._log.compact(list(reopened._documents.values()), reopened._index.dimension, background=False)
+        await reopened.delete("m2")
+        reopened._log.close()
+
+        restored = InMemoryVectorStore(persist_path=path)
+        assert sorted(restored._documents) == ["m0", "m3", "m4", "odd"]
+        results = await restored.search([0.0, 1.0], limit=2, filter_metadata={"player_id": 1, "npc_id": "dh_1"})
+        assert [r.id for r in results] == ["m4", "m3"]
+        assert len(list(tmp_path.glob("memory_store.wal.*"))) == 1
+
+    asyncio.run(run_test())
+
+
+def test_torn_log_tail_is_discarded(tmp_path):
+    async def run_test():
+        path = str(tmp_path / "memory_store.json")
+        store = InMemoryVectorStore(persist_path=path)
+        await store.add(make_doc("a", [1.0, 0.0]))
+        await store.add(make_doc("b", [0.0, 1.0]))
+        store._log.close()
+
+        wal = next(tmp_path.glob("memory_store.wal.*"))
+        wal.write_bytes(wal.read_bytes()[:-3])
+
+        restored = InMemoryVectorStore(persist_path=path)
+        assert list(restored._documents) == ["a"]
+
+    asyncio.run(run_test())
+
+
+def test_legacy_json_store_is_migrated(tmp_path):
+    async def run_test():
+        import json
+
+        path = tmp_path / "memory_store.json"
+        path.write_text(json.dumps([
+            {"id": "legacy", "text": "hi", "vector": [0.6, 0.8],
+             "metadata": {"player_id": 1, "npc_id": "dh_1"}, "created_at": "2024-01-01T00:00:00"},
+        ]))
+
+        InMemoryVectorStore(persist_path=str(path))._log.close()
+        assert (tmp_path / "memory_store.snap").exists()
+
+        path.unlink()
+        restored = InMemoryVectorStore(persist_path=str(path))
+        doc = await restored.get("legacy")
+        assert doc.text == "hi"
+        assert [round(float(v), 3) for v in doc.vector] == [0.6, 0.8]
+
+    asyncio.run(run_test())
+
+
+def test_ivf_index_recall_and_partition_prefilter():
+    import numpy as np
+
+    from app.services.memory.vector_ann import IVFIndex
+    from app.services.memory.vector_index import MatrixIndex
+
+    rng = np.random.default_rng(3)
+    centers = rng.standard_normal((20, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, 20, 4000)] + 0.3 * rng.standard_normal((4000, 32)).astype(np.float32)
+    metas = [{"player_id": i % 2, "npc_id": "dh_1"} for i in range(4000)]
+
+    exact = MatrixIndex()
+    ivf = IVFIndex(nlist=32, nprobe=8, exact_rows=100, min_list_rows=32)
+    ids = [f"m{i}" for i in range(4000)]
+    exact.load_matrix(ids, vectors, metas)
+    ivf.load_matrix(ids, vectors, metas)
+    assert ivf.trained
+
+    # 训练后新写入 / 删除的行同样可见
+    ivf.add("late", centers[0], {"player_id": 1, "npc_id": "dh_1"})
+    exact.add("late", centers[0], {"player_id": 1, "npc_id": "dh_1"})
+    ivf.remove("m0")
+    exact.remove("m0")
+
+    hits = 0
+    for q in centers[:10] + 0.3 * rng.standard_normal((10, 32)).astype(np.float32):
+        truth = {doc_id for doc_id, _ in exact.search(q, limit=10, key=(1, "dh_1"))}
+        found = ivf.search(q, limit=10, key=(1, "dh_1"))
+        assert all(int(doc_id[1:]) % 2 == 1 for doc_id, _ in found if doc_id != "late")
+        hits += len(truth & {doc_id for doc_id, _ in found})
+    assert hits / 100 >= 0.9
+
+    assert ivf.search(centers[0], limit=1, key=(1, "dh_1"))[0][0] == "late"
+    assert "m0" not in {doc_id for doc_id, _ in ivf.search(vectors[0], limit=50)}
+
+
+def test_sharded_store_evicts_and_reloads_partitions(tmp_path):
+    async def run_test():
+        from app.services.memory.vector_shards import ShardedVectorStore
+
+        store = ShardedVectorStore(root=str(tmp_path), max_resident_shards=2)
+        for player_id in (1, 2, 3):
+            await store.add_batch([
+                make_doc(f"mem_{player_id}_dh_{npc}_{i:08x}", [1.0, float(i)], player_id=player_id, npc_id=f"dh_{npc}")
+                for npc in (1, 2) for i in range(3)
+            ])
+        assert store.stats()["resident_shards"] == 2
+        assert store.stats()["evictions"] == 4
+
+        # 冷分片按需从磁盘加载
+        results = await store.search([0.0, 1.0], limit=2, filter_metadata={"player_id": 1, "npc_id": "dh_1"})
+        assert [r.id for r in results] == ["mem_1_dh_1_00000002", "mem_1_dh_1_00000001"]
+
+        assert await store.count({"player_id": 2}) == 6
+        assert len(await store.list_by_metadata({"player_id": 3}, limit=10)) == 6
+        assert await store.count() == 18
+
+        assert await store.delete("mem_2_dh_1_00000000") is True
+        assert await store.get("mem_2_dh_1_00000000") is None
+        assert await store.delete_by_metadata({"player_id": 3, "npc_id": "dh_2"}) == 3
+
+        reopened = ShardedVectorStore(root=str(tmp_path))
+        assert await reopened.count() == 14
+        assert sorted(tmp_path.joinpath("shards").iterdir()) == [tmp_path / "shards" / p for p in ("1", "2", "3")]
+
+    asyncio.run(run_test())
+
+
+def test_sharded_store_migrates_unsharded_store(tmp_path):
+    async def run_test():
+        from app.services.memory.vector_shards import ShardedVectorStore
+
+        legacy = InMemoryVectorStore(persist_path=str(tmp_path / "memory_store.json"))
+        await legacy.add_batch([
+            make_doc(f"mem_{i % 2}_dh_1_{i:08x}", [1.0, float(i)], player_id=i % 2) for i in range(4)
+        ])
+        legacy._log.close()
+
+        store = ShardedVectorStore(root=str(tmp_path))
+        # 迁移出的分片快照用 float32 二进制块存向量
+        with open(tmp_path / "shards" / "1" / "dh_1" / "memory_store.snap", "rb") as f:
+            assert SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))[2] == 2
+        assert await store.count({"player_id": 0, "npc_id": "dh_1"}) == 2
+        assert (await store.get("mem_1_dh_1_00000003")).metadata["player_id"] == 1
+        # 不符合 id 格式的未知 id 不会把磁盘上的分片全部加载进来
+        assert await store.get("unknown") is None
+        assert store.stats()["resident_shards"] == 2
+
+    asyncio.run(run_test())